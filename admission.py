@@ -0,0 +1,162 @@
+"""
+Kontrola dopuszczania (admission control) dla kosztownych etapów wyceny
+
+Każdy etap (np. całe obliczenie trasy, zapytania do bazy giełd, AWS) ma
+limit równoległych wykonań w workerze i ograniczoną kolejkę oczekujących.
+Gdy limit i kolejka są pełne, wywołanie od razu dostaje `Overloaded`
+(API zwraca 503 z Retry-After) zamiast blokować wątek i połączenia z poola
+do timeoutu zapytania. Zadania w tle (prewarming, odświeżanie cache) używają
+`try_stage` - nie czekają i ustępują ruchowi użytkowników.
+
+Zależności: brak (tylko biblioteka standardowa)
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+
+class Overloaded(Exception):
+    """Etap jest nasycony (limit + kolejka pełne lub upłynął czas oczekiwania)"""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"Stage '{stage}' overloaded, retry after {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class Stage:
+    """Limit równoległych wykonań etapu z ograniczoną kolejką oczekujących"""
+
+    def __init__(self, name: str, limit: int, max_queue: int = 0, queue_timeout: float = 5.0):
+        """
+        Args:
+            name: Nazwa etapu (do metryk)
+            limit: Maksymalna liczba równoległych wykonań
+            max_queue: Maksymalna liczba oczekujących (0 = brak kolejki)
+            queue_timeout: Maksymalny czas oczekiwania w kolejce w sekundach
+        """
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._avg_duration = 1.0  # EWMA czasu wykonania (s) - do Retry-After
+
+    def retry_after(self) -> int:
+        """Szacowany czas (s), po którym etap przyjmie nowe wywołanie"""
+        rounds = (self.waiting + 1) / max(1, self.limit)
+        return max(1, min(60, math.ceil(self._avg_duration * rounds)))
+
+    def _acquire(self, wait: bool) -> None:
+        with self._cond:
+            if self.in_flight < self.limit and self.waiting == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return
+            if not wait or self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.name, self.retry_after())
+
+            self.waiting += 1
+            self.queued += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise Overloaded(self.name, self.retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+
+    def _release(self, duration: float) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self, wait: bool = True) -> Iterator[None]:
+        """Wykonanie w limicie etapu (czeka w kolejce lub rzuca Overloaded)"""
+        self._acquire(wait)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        """Metryki etapu (głębokość kolejki, odrzucenia)"""
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'queue_depth': self.waiting,
+                'max_queue': self.max_queue,
+                'max_queue_depth_seen': self.max_waiting,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_duration_ms': round(self._avg_duration * 1000)
+            }
+
+
+class AdmissionController:
+    """Zbiór etapów z limitami; nieznany etap nie jest ograniczany"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages: Dict[str, Stage] = {}
+
+    def add_stage(self, name: str, limit: int, max_queue: int = 0, queue_timeout: float = 5.0) -> Stage:
+        """Rejestruje etap z limitem równoległych wykonań"""
+        self.stages[name] = Stage(name, limit, max_queue, queue_timeout)
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Wykonanie w limicie etapu z oczekiwaniem w kolejce (ruch użytkowników)"""
+        stage = self.stages.get(name) if self.enabled else None
+        if stage is None:
+            yield
+            return
+        with stage.slot(wait=True):
+            yield
+
+    @contextmanager
+    def try_stage(self, name: str) -> Iterator[None]:
+        """Wykonanie tylko przy wolnym miejscu - bez kolejki (zadania w tle)"""
+        stage = self.stages.get(name) if self.enabled else None
+        if stage is None:
+            yield
+            return
+        with stage.slot(wait=False):
+            yield
+
+    def queue_depth(self) -> int:
+        """Łączna liczba oczekujących we wszystkich etapach"""
+        return sum(stage.waiting for stage in self.stages.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Metryki wszystkich etapów"""
+        return {
+            'enabled': self.enabled,
+            'queue_depth': self.queue_depth(),
+            'stages': {name: stage.stats() for name, stage in self.stages.items()}
+        }
+
@@ -2,7 +2,7 @@
 Pricing API - SECURED VERSION
 Wersja z zabezpieczeniami przed exploitami
 """
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, make_response
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -20,10 +20,30 @@ import re
 import logging
 import time
 import math
-from typing import Dict, Tuple, Optional, List
+import random
+import tempfile
+import hashlib
+from datetime import datetime, timezone
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, Optional, List, NamedTuple, Sequence
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), 'contractorDetails'))
-from aws_distance_calculator import get_aws_route_distance
+from aws_distance_calculator import get_aws_route_distance, get_aws_route_legs, get_routes_client, calculate_route_matrix
+from local_routing import get_local_route_distance, get_local_route_legs, get_local_router, local_route_matrix
+from quantile_sketch import QuantileSketch, percentile_spread
+from pricing_cache import MISSING, TTLCache, SWRCache, SingleFlight, RedisBackend, LanePopularity
+from pricing_matrix import PricingMatrix
+from distance_matrix import DistanceMatrix
+from freshness import FreshnessRegistry
+from admission import AdmissionController, Overloaded
+from deadline import Deadline, DeadlineExceeded, current_deadline, stage_budget
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from road_factor import RoadFactorModel
+from route_geometry import decode_polyline, encode_polyline, simplify_path
+from db_replicas import ReplicaPool, ReplicaRouter, parse_hosts
+from fast_json import FastJSONProvider, JSON_BACKEND, dumps as json_dumps
+from compression import ENCODERS, compress, negotiate_encoding, should_compress
 
 # Konfiguracja logowania
 logging.basicConfig(
@@ -37,6 +57,10 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 app = Flask(__name__)
+# Szybka serializacja odpowiedzi orjson - bez orjson zostaje domyślny provider Flask
+if JSON_BACKEND == 'orjson':
+    app.json = FastJSONProvider(app)
+logger.info(f"✅ JSON backend: {JSON_BACKEND}")
 
 # Konfiguruj Flask logger
 app.logger.setLevel(logging.INFO)
@@ -140,8 +164,9 @@ API_KEY = os.getenv('API_KEY', '')
 ENV = os.getenv('ENV', 'development')
 
 # Connection Pool - baza z danymi giełd (TimoCom, Trans.eu)
+# ThreadedConnectionPool - worker gunicorn (gthread) obsługuje requesty w kilku wątkach
 try:
-    connection_pool = pool.SimpleConnectionPool(
+    connection_pool = pool.ThreadedConnectionPool(
         minconn=1,
         maxconn=10,
         host=DB_HOST,
@@ -160,7 +185,7 @@ except Exception as e:
 
 # Connection Pool - baza ze zleceniami historycznymi
 try:
-    connection_pool_main = pool.SimpleConnectionPool(
+    connection_pool_main = pool.ThreadedConnectionPool(
         minconn=1,
         maxconn=10,
         host=DB_HOST,
@@ -180,6 +205,10 @@ except Exception as e:
 # Cache
 _TRANSEU_TO_TIMOCOM_MAPPING = None
 _POSTAL_CODE_MAPPING = None
+_MAPPING_VERSIONS = {}  # nazwa pliku mapowania -> skrót zawartości (składnik ETag)
+_SKETCH_TABLE_MISSING = {}  # Baza bez tabeli pricing_daily_sketches -> czas wykrycia (time.monotonic)
+# Co ile sekund ponownie sprawdzić brakującą tabelę szkiców (np. po pierwszym uruchomieniu build_daily_sketches.py)
+SKETCH_TABLE_RECHECK_SECONDS = float(os.getenv('SKETCH_TABLE_RECHECK_SECONDS', '600'))
 
 # Regex dla walidacji kodu pocztowego (2 litery + 1-5 cyfr)
 POSTAL_CODE_PATTERN = re.compile(r'^[A-Z]{2}\d{1,5}$')
@@ -187,6 +216,240 @@ POSTAL_CODE_PATTERN = re.compile(r'^[A-Z]{2}\d{1,5}$')
 # Stałe dla fuzzy matching
 DISTANCE_THRESHOLD_KM = 100  # próg odległości w km dla dopasowania
 
+# Okna czasowe (w dniach) - domyślne i limity dla parametru `windows`
+DEFAULT_EXCHANGE_WINDOWS = [30]
+DEFAULT_HISTORICAL_WINDOWS = [180]
+MAX_WINDOWS = 5
+MAX_WINDOW_DAYS = 365
+
+# Projekcja odpowiedzi - źródła, typy pojazdów / ładunków i sekcje opcjonalne
+PRICING_SOURCES = ('timocom', 'transeu', 'historical')
+SOURCE_VEHICLE_TYPES = {'timocom': ('trailer', '3_5t', '12t'), 'transeu': ('lorry',)}
+VEHICLE_TYPES = ('trailer', '3_5t', '12t', 'lorry')
+VEHICLE_TYPE_ALIASES = {'naczepa': 'trailer', 'bus': '3_5t', '3.5t': '3_5t', 'solo': '12t'}  # nazwy z RoutePricingClient
+CARGO_TYPES = ('FTL', 'LTL')
+
+
+# Format listy zleceń historycznych: wiersze (obiekt per zlecenie) lub kolumny (tablica per pole)
+ORDERS_FORMATS = ('rows', 'columnar')
+
+
+class PricingProjection(NamedTuple):
+    """Zakres odpowiedzi - pominięte elementy nie są liczone (zapytania, AWS)"""
+    sources: Tuple[str, ...] = PRICING_SOURCES
+    vehicle_types: Tuple[str, ...] = VEHICLE_TYPES
+    cargo_types: Tuple[str, ...] = CARGO_TYPES
+    include_orders: bool = False
+    include_top_carriers: bool = False
+    include_distance: bool = True
+    orders_format: str = 'rows'
+    include_geometry: bool = False
+    geometry_tolerance_m: Optional[float] = None  # None = ROUTE_GEOMETRY_TOLERANCE_M
+
+    def needs(self, source: str) -> bool:
+        """Czy źródło jest potrzebne (wybrane i z co najmniej jednym wybranym typem pojazdu)"""
+        if source not in self.sources:
+            return False
+        if source in SOURCE_VEHICLE_TYPES:
+            return any(vehicle in self.vehicle_types for vehicle in SOURCE_VEHICLE_TYPES[source])
+        return True
+
+
+DEFAULT_PROJECTION = PricingProjection()
+
+# Negative cache - trasy / źródła bez danych (krótki TTL, unieważniany po załadowaniu nowych danych)
+NEGATIVE_CACHE_TTL = int(os.getenv('NEGATIVE_CACHE_TTL', '300'))
+negative_cache = TTLCache('negative', ttl=NEGATIVE_CACHE_TTL)
+
+# Wersje danych - znaki wodne danych tabel źródłowych, sprawdzane co N sekund. Nie liczniki zmian
+# z pg_stat_user_tables - te rosną przy każdej aktualizacji wiersza (także pól bez wpływu na wycenę),
+# zerują się po resecie statystyk / failoverze i różnią się między replikami
+DATA_VERSION_CHECK_SECONDS = int(os.getenv('DATA_VERSION_CHECK_SECONDS', '60'))
+DATA_VERSION_TABLES = {
+    'exchanges': ('offers', 'OffersTransEU'),
+    'main': ('ZleceniaSpeed',)
+}
+# Wyrażenia znaku wodnego per tabela (wartości łączone w jeden znacznik):
+# - ZleceniaSpeed: MAX("id") - nowe zlecenia także w ciągu dnia; liczba zleceń zakończonych -
+#   zmiana statusu na 'Z' (zlecenie wchodzi do wyceny) zmienia wersję od razu
+# - offers / OffersTransEU: tabele dzienne bez ID i kolumny czasu ładowania - data najnowszych ofert
+#   zmienia się raz na dzień, więc ponowne załadowanie tego samego dnia bez NOTIFY (FRESHNESS_LISTEN_ENABLED)
+#   jest widoczne dopiero z kolejną datą (do doby nieaktualnego ETag / cache)
+DATA_VERSION_WATERMARKS = {
+    'offers': ('MAX(enlistment_date)',),
+    'OffersTransEU': ('MAX(enlistment_date)',),
+    'ZleceniaSpeed': ('MAX("id")', 'COUNT(*) FILTER (WHERE "status" = \'Z\')')
+}
+# Przy nasłuchu LISTEN/NOTIFY (loadery wysyłają nazwę tabeli po załadowaniu danych)
+# zmiany widać od razu, a okresowe sprawdzanie jest tylko zabezpieczeniem
+FRESHNESS_LISTEN_ENABLED = os.getenv('FRESHNESS_LISTEN_ENABLED', 'false').lower() == 'true'
+FRESHNESS_NOTIFY_CHANNEL = os.getenv('FRESHNESS_NOTIFY_CHANNEL', 'pricing_data_changed')
+FRESHNESS_LISTEN_POLL_SECONDS = int(os.getenv('FRESHNESS_LISTEN_POLL_SECONDS', '600'))
+
+# Cache wyników (stale-while-revalidate) i ostatnie dobre wartości źródeł (stale-on-error)
+PRICING_CACHE_FRESH_TTL = int(os.getenv('PRICING_CACHE_FRESH_TTL', '300'))
+PRICING_CACHE_REVALIDATE_TTL = int(os.getenv('PRICING_CACHE_REVALIDATE_TTL', '3600'))
+PRICING_CACHE_STALE_IF_ERROR_TTL = int(os.getenv('PRICING_CACHE_STALE_IF_ERROR_TTL', '86400'))
+
+# Opcjonalny backend współdzielony między workerami gunicorn (Redis)
+PRICING_CACHE_REDIS_URL = os.getenv('PRICING_CACHE_REDIS_URL')
+SINGLE_FLIGHT_LOCK_TTL = float(os.getenv('SINGLE_FLIGHT_LOCK_TTL', '30'))
+shared_cache_backend = None
+if PRICING_CACHE_REDIS_URL:
+    try:
+        shared_cache_backend = RedisBackend(PRICING_CACHE_REDIS_URL)
+        logger.info("✅ Shared pricing cache backend: Redis")
+    except Exception as e:
+        logger.warning(f"⚠️ Shared cache backend unavailable, using per-worker cache only: {e}")
+
+
+def is_cacheable_pricing(response_data: Dict) -> bool:
+    """Czy wynik wyceny jest pełny - bez nieaktualnych źródeł i etapów pominiętych (deadline / breaker)"""
+    return not response_data.get('stale_sources') and not response_data.get('partial')
+
+
+pricing_result_cache = SWRCache(
+    'pricing',
+    fresh_ttl=PRICING_CACHE_FRESH_TTL,
+    revalidate_ttl=PRICING_CACHE_REVALIDATE_TTL,
+    stale_if_error_ttl=PRICING_CACHE_STALE_IF_ERROR_TTL,
+    shared=shared_cache_backend,
+    cacheable=is_cacheable_pricing
+)
+last_good_cache = TTLCache('last_good', ttl=PRICING_CACHE_STALE_IF_ERROR_TTL, max_size=20000)
+
+# Cache wyników giełd per (źródło, zmapowane ID regionów, okno, wersja danych) - wspólny
+# dla wszystkich kodów pocztowych, które mapują się na te same regiony
+SOURCE_CACHE_TTL = int(os.getenv('SOURCE_CACHE_TTL', '3600'))
+source_result_cache = TTLCache('source', ttl=SOURCE_CACHE_TTL, max_size=50000)
+
+# Dystanse drogowe AWS per para kodów pocztowych (drogi zmieniają się rzadko - długi TTL);
+# zasilany pojedynczymi wywołaniami i zapytaniami route-matrix (prefetch_route_distances)
+DISTANCE_CACHE_TTL = int(os.getenv('DISTANCE_CACHE_TTL', '604800'))
+distance_cache = TTLCache('distance', ttl=DISTANCE_CACHE_TTL, max_size=50000)
+ROUTE_MATRIX_WORKERS = int(os.getenv('ROUTE_MATRIX_WORKERS', '4'))
+
+# Geometrie tras per para kodów pocztowych (obok dystansów, ten sam TTL) - trzymane uproszczone
+# z tolerancją ROUTE_GEOMETRY_MIN_TOLERANCE_M i zakodowane jako polyline (kilka KB zamiast MB)
+ROUTE_GEOMETRY_TOLERANCE_M = float(os.getenv('ROUTE_GEOMETRY_TOLERANCE_M', '50'))
+ROUTE_GEOMETRY_MIN_TOLERANCE_M = float(os.getenv('ROUTE_GEOMETRY_MIN_TOLERANCE_M', '5'))
+ROUTE_GEOMETRY_MAX_TOLERANCE_M = 5000
+ROUTE_GEOMETRY_PRECISION = int(os.getenv('ROUTE_GEOMETRY_PRECISION', '5'))
+geometry_cache = TTLCache('geometry', ttl=DISTANCE_CACHE_TTL, max_size=int(os.getenv('GEOMETRY_CACHE_SIZE', '5000')))
+
+# Silnik tras: 'aws' (AWS Location Service) lub 'local' (graf dróg z LOCAL_ROUTING_GRAPH_FILE,
+# contraction hierarchies - bez sieci, np. środowiska testowe bez dostępu do AWS)
+ROUTING_ENGINE = os.getenv('ROUTING_ENGINE', 'aws').lower()
+ROUTE_METHOD = 'local_truck_route' if ROUTING_ENGINE == 'local' else 'aws_truck_route'
+if ROUTING_ENGINE == 'local':
+    # Wczytanie gotowej hierarchii (build_local_routing.py) przy starcie workera, nie w pierwszym
+    # requeście - brak lub nieaktualny plik .ch przerywa start (HierarchyUnavailable), bez kontrakcji w workerze
+    get_local_router()
+
+# Współczynnik drogi per korytarz (para regionów / para krajów) uczony z dystansów AWS -
+# zaufane korytarze (p90 błędu <= ROAD_FACTOR_MAX_ERROR) nie wołają AWS, fallback
+# Haversine używa nauczonego współczynnika zamiast stałego 1.3. Część wycen zaufanych
+# korytarzy (ROAD_FACTOR_VERIFY_RATE) nadal idzie do AWS, żeby model się aktualizował
+ROAD_FACTOR_VERIFY_RATE = float(os.getenv('ROAD_FACTOR_VERIFY_RATE', '0.05'))
+road_factors = RoadFactorModel(
+    min_samples=int(os.getenv('ROAD_FACTOR_MIN_SAMPLES', '20')),
+    trust_max_error=float(os.getenv('ROAD_FACTOR_MAX_ERROR', '0.05')),
+    state_file=os.getenv(
+        'ROAD_FACTOR_STATE_FILE', os.path.join(tempfile.gettempdir(), 'pricing_road_factors.json')
+    )
+)
+
+# Zserializowane (i skompresowane) body odpowiedzi z cache - kompresja raz na zapis wpisu,
+# nie przy każdym trafieniu. Klucz: (klucz wyceny, czas zapisu wpisu, status cache, kodowanie)
+ENCODED_RESPONSE_CACHE_SIZE = int(os.getenv('ENCODED_RESPONSE_CACHE_SIZE', '2000'))
+encoded_response_cache = TTLCache('encoded_response', ttl=PRICING_CACHE_REVALIDATE_TTL,
+                                  max_size=ENCODED_RESPONSE_CACHE_SIZE)
+
+# Single-flight: równoległe identyczne requesty (cała trasa) i zapytania źródeł
+# współdzielą jedno wykonanie zamiast wielokrotnie obciążać bazę i AWS
+pricing_flight = SingleFlight('pricing', shared=shared_cache_backend, lock_ttl=SINGLE_FLIGHT_LOCK_TTL,
+                              wait_timeout=SINGLE_FLIGHT_LOCK_TTL)
+source_flight = SingleFlight('source')
+
+# Prewarming najpopularniejszych tras (po starcie workera i po każdej zmianie danych)
+PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'true').lower() == 'true'
+PREWARM_TOP_N = int(os.getenv('PREWARM_TOP_N', '50'))
+PREWARM_BUDGET_SECONDS = float(os.getenv('PREWARM_BUDGET_SECONDS', '60'))
+PREWARM_STARTUP_DELAY = float(os.getenv('PREWARM_STARTUP_DELAY', '5'))
+PREWARM_STATE_FILE = os.getenv(
+    'PREWARM_STATE_FILE', os.path.join(tempfile.gettempdir(), 'pricing_lane_popularity.json')
+)
+lane_popularity = LanePopularity(
+    half_life=float(os.getenv('PREWARM_HALF_LIFE_HOURS', '24')) * 3600,
+    state_file=PREWARM_STATE_FILE
+)
+_PREWARM_LOCK = threading.Lock()
+
+# Trasy wielopunktowe - odcinki wyceniane równolegle we wspólnej puli wątków workera
+MULTI_STOP_MAX_STOPS = int(os.getenv('MULTI_STOP_MAX_STOPS', '10'))
+MULTI_STOP_WORKERS = int(os.getenv('MULTI_STOP_WORKERS', '4'))
+_multi_stop_executor = ThreadPoolExecutor(max_workers=MULTI_STOP_WORKERS, thread_name_prefix='multi-stop-leg')
+
+# Admission control - limity równoległych kosztownych etapów na worker (wątki gthread),
+# ograniczona kolejka i szybkie 503 z Retry-After zamiast blokowania wątków i poola
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '4'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))
+admission = AdmissionController(enabled=ADMISSION_ENABLED)
+for _stage, _default_limit in (('pricing', '2'), ('exchanges', '4'), ('historical', '2'), ('aws', '4')):
+    admission.add_stage(
+        _stage,
+        limit=int(os.getenv(f'ADMISSION_{_stage.upper()}_LIMIT', _default_limit)),
+        max_queue=ADMISSION_QUEUE_SIZE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT
+    )
+
+# Budżet czasu requestu wyceny (poniżej timeoutu workera gunicorn = 30s) - etapy
+# dostają timeouty z pozostałego czasu, a etap bez budżetu jest pomijany (wynik częściowy)
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '25'))
+DEADLINE_MIN_STAGE_SECONDS = float(os.getenv('DEADLINE_MIN_STAGE_SECONDS', '0.25'))
+DEADLINE_SQL_RESERVE_SECONDS = float(os.getenv('DEADLINE_SQL_RESERVE_SECONDS', '0.2'))
+DEADLINE_AWS_SHARE = float(os.getenv('DEADLINE_AWS_SHARE', '0.4'))
+DB_STATEMENT_TIMEOUT_SECONDS = 30.0  # options statement_timeout poolów
+AWS_TIMEOUT_SECONDS = 15.0
+
+# Circuit breakery zależności - timeout z percentyla czasów udanych wywołań
+# i szybki fallback (bez czekania na timeout), gdy zależność kolejno zawodzi
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+CIRCUIT_TIMEOUT_PERCENTILE = float(os.getenv('CIRCUIT_TIMEOUT_PERCENTILE', '0.99'))
+CIRCUIT_TIMEOUT_MULTIPLIER = float(os.getenv('CIRCUIT_TIMEOUT_MULTIPLIER', '3'))
+aws_breaker, exchanges_db_breaker, main_db_breaker = (
+    CircuitBreaker(
+        name,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds=CIRCUIT_RESET_SECONDS,
+        min_timeout=float(os.getenv(f'CIRCUIT_{name.upper()}_MIN_TIMEOUT', default_min)),
+        max_timeout=max_timeout,
+        timeout_percentile=CIRCUIT_TIMEOUT_PERCENTILE,
+        timeout_multiplier=CIRCUIT_TIMEOUT_MULTIPLIER
+    )
+    for name, default_min, max_timeout in (
+        ('aws_routes', '1', AWS_TIMEOUT_SECONDS),
+        ('exchanges_db', '2', DB_STATEMENT_TIMEOUT_SECONDS),
+        ('main_db', '2', DB_STATEMENT_TIMEOUT_SECONDS)
+    )
+)
+
+# Macierz wycen giełd dla wszystkich par regionów (budowana nocą przez build_pricing_matrix.py)
+PRICING_MATRIX_FILE = os.getenv(
+    'PRICING_MATRIX_FILE', os.path.join(os.path.dirname(__file__), 'data', 'pricing_matrix.bin')
+)
+PRICING_MATRIX_MAX_AGE_HOURS = float(os.getenv('PRICING_MATRIX_MAX_AGE_HOURS', '36'))
+pricing_matrix = PricingMatrix(PRICING_MATRIX_FILE)
+
+# Macierz dystansów między kodami pocztowymi (budowana przez build_distance_matrix.py)
+DISTANCE_MATRIX_FILE = os.getenv(
+    'DISTANCE_MATRIX_FILE', os.path.join(os.path.dirname(__file__), 'data', 'distance_matrix.bin')
+)
+DISTANCE_MATRIX_MAX_AGE_HOURS = float(os.getenv('DISTANCE_MATRIX_MAX_AGE_HOURS', '720'))
+distance_matrix = DistanceMatrix(DISTANCE_MATRIX_FILE)
+
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -221,13 +484,38 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return distance
 
 
-def get_postal_code_coordinates(postal_code: str, conn) -> Optional[Tuple[float, float]]:
+def apply_statement_timeout(cur, breaker: Optional[CircuitBreaker] = None) -> None:
+    """
+    Ogranicza następne zapytanie transakcji do adaptacyjnego timeoutu breakera bazy
+    i budżetu requestu pozostałego w chwili wywołania (SET LOCAL statement_timeout -
+    reset przy rollback w putconn poola). Bez deadline i przy pełnym timeoucie nic nie zmienia.
+    """
+    cap = breaker.timeout() if breaker is not None else DB_STATEMENT_TIMEOUT_SECONDS
+    if current_deadline() is None and cap >= DB_STATEMENT_TIMEOUT_SECONDS:
+        return
+    budget = stage_budget(cap, reserve=DEADLINE_SQL_RESERVE_SECONDS)
+    timeout_ms = int(max(budget, DEADLINE_MIN_STAGE_SECONDS) * 1000)
+    cur.execute("SET LOCAL statement_timeout = %s;", (timeout_ms,))
+
+
+def execute_within_deadline(cur, query, params=None, breaker: Optional[CircuitBreaker] = None) -> None:
+    """
+    cur.execute() z timeoutem przeliczonym tuż przed zapytaniem - każde kolejne zapytanie
+    tej samej transakcji (percentyle, wycena, lista zleceń, fuzzy matching) dostaje tylko
+    to, co zostało z budżetu requestu, a nie budżet z chwili pobrania połączenia
+    """
+    apply_statement_timeout(cur, breaker)
+    cur.execute(query, params)
+
+
+def get_postal_code_coordinates(postal_code: str, conn, raise_errors: bool = False) -> Optional[Tuple[float, float]]:
     """
     Pobiera współrzędne geograficzne dla danego kodu pocztowego z tabeli PostalCodeCoordinates.
     
     Args:
         postal_code: Kod pocztowy (np. "PL20", "DE49")
         conn: Połączenie z bazą danych
+        raise_errors: Czy rzucać błędy bazy (np. dla circuit breakera) zamiast zwracać None
     
     Returns:
         Tuple (lat, lng) lub None jeśli nie znaleziono
@@ -239,24 +527,24 @@ def get_postal_code_coordinates(postal_code: str, conn) -> Optional[Tuple[float,
         
         with conn.cursor() as cur:
             # Najpierw spróbuj dokładnego dopasowania
-            cur.execute("""
+            execute_within_deadline(cur, """
                 SELECT lat, lng 
                 FROM "PostalCodeCoordinates"
                 WHERE country = %s AND postal_code = %s
                 LIMIT 1;
-            """, (country, code))
+            """, (country, code), main_db_breaker)
             
             result = cur.fetchone()
             if result:
                 return (result['lat'], result['lng'])
             
             # Jeśli nie znaleziono, spróbuj z LIKE (kod może mieć myślnik)
-            cur.execute("""
+            execute_within_deadline(cur, """
                 SELECT lat, lng 
                 FROM "PostalCodeCoordinates"
                 WHERE country = %s AND postal_code LIKE %s
                 LIMIT 1;
-            """, (country, f"{code}%"))
+            """, (country, f"{code}%"), main_db_breaker)
             
             result = cur.fetchone()
             if result:
@@ -266,6 +554,8 @@ def get_postal_code_coordinates(postal_code: str, conn) -> Optional[Tuple[float,
             
     except Exception as e:
         logger.error(f"❌ Error getting coordinates for {postal_code}: {e}")
+        if raise_errors:
+            raise
         return None
 
 
@@ -366,7 +656,7 @@ def find_nearest_historical_route(
                 JOIN coords_end ce ON ur.end_code = ce.end_code;
             """
             
-            cur.execute(query)
+            execute_within_deadline(cur, query, breaker=main_db_breaker)
             historical_routes = cur.fetchall()
             
             if not historical_routes:
@@ -440,6 +730,21 @@ def find_nearest_historical_route(
         return None
 
 
+@app.after_request
+def compress_response(response):
+    """Kompresuje duże odpowiedzi JSON wg Accept-Encoding (jeśli nie są już skompresowane)"""
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code == 204
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    body = response.get_data()
+    if encoding and should_compress(len(body)):
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
 @app.after_request
 def add_security_headers(response):
     """Dodaje security headers do każdej odpowiedzi"""
@@ -578,6 +883,125 @@ def _return_db_connection_main(conn):
         connection_pool_main.putconn(conn)
 
 
+# Repliki do odczytu (agregacje wycen, geocoding) - primary zostaje dla loaderów i znaków wodnych wersji danych
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '30'))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', '10'))
+REPLICA_RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+REPLICA_POOL_MAX = int(os.getenv('REPLICA_POOL_MAX', '10'))
+
+
+def _replica_pools(hosts_env: Optional[str], database: Optional[str]) -> List[ReplicaPool]:
+    """Poole replik bazy z listy 'host[:port],...'"""
+    return [
+        ReplicaPool(
+            f"{replica['host']}:{replica['port']}",
+            {
+                'host': replica['host'], 'port': replica['port'], 'user': DB_USER, 'password': DB_PASSWORD,
+                'database': database, 'connect_timeout': 5, 'options': '-c statement_timeout=30000'
+            },
+            maxconn=REPLICA_POOL_MAX,
+            lag_check_seconds=REPLICA_LAG_CHECK_SECONDS,
+            retry_seconds=REPLICA_RETRY_SECONDS
+        )
+        for replica in parse_hosts(hosts_env, DB_PORT)
+    ]
+
+
+exchanges_reader = ReplicaRouter(
+    'exchanges', _get_db_connection, _return_db_connection,
+    _replica_pools(os.getenv('POSTGRES_REPLICA_HOSTS'), DB_NAME),
+    max_lag_seconds=REPLICA_MAX_LAG_SECONDS
+)
+main_reader = ReplicaRouter(
+    'main', _get_db_connection_main, _return_db_connection_main,
+    _replica_pools(os.getenv('POSTGRES_REPLICA_HOSTS_MAIN', os.getenv('POSTGRES_REPLICA_HOSTS')), DB_NAME_MAIN),
+    max_lag_seconds=REPLICA_MAX_LAG_SECONDS
+)
+
+
+def _fetch_table_watermarks(db_label: str, tables: Tuple[str, ...]) -> Dict[str, Optional[str]]:
+    """
+    Znaki wodne danych tabel: wartości wyrażeń z DATA_VERSION_WATERMARKS złączone w jeden znacznik.
+    Zlecenia - nowe wiersze i zmiany statusu na 'Z' zmieniają znacznik od razu; giełdy - tylko
+    nowa data ofert (ponowne ładowanie tego samego dnia wykrywa dopiero NOTIFY)
+    """
+    if db_label == 'main':
+        get_conn, return_conn = _get_db_connection_main, _return_db_connection_main
+    else:
+        get_conn, return_conn = _get_db_connection, _return_db_connection
+    
+    conn = get_conn()
+    try:
+        watermarks = {}
+        with conn.cursor() as cur:
+            for table in tables:
+                expressions = DATA_VERSION_WATERMARKS[table]
+                columns = ', '.join(f'{expression} AS w{i}' for i, expression in enumerate(expressions))
+                cur.execute(f'SELECT {columns} FROM public."{table}";')
+                row = cur.fetchone()
+                values = [row[f'w{i}'] for i in range(len(expressions))]
+                if all(value is None for value in values):
+                    watermarks[table] = None
+                    continue
+                watermarks[table] = '/'.join(
+                    value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values
+                )
+        return watermarks
+    finally:
+        return_conn(conn)
+
+
+def _invalidate_caches(db_label: str, changed_tables: List[str]) -> None:
+    """
+    Unieważnia cache w procesie po zmianie danych bazy. Wpisy cache wyników
+    (SWR, per okno, współdzielony Redis) mają wersję danych w kluczu / wpisie,
+    więc przestają pasować same - tu zwalniana jest tylko pamięć.
+    """
+    negative_cache.clear()
+    if db_label == 'exchanges':
+        source_result_cache.clear()
+
+
+data_freshness = FreshnessRegistry(
+    DATA_VERSION_TABLES, _fetch_table_watermarks,
+    poll_seconds=DATA_VERSION_CHECK_SECONDS,
+    listen_poll_seconds=FRESHNESS_LISTEN_POLL_SECONDS
+)
+data_freshness.subscribe(_invalidate_caches)
+
+
+def _pin_reads_to_primary(db_label: str, changed_tables: List[str]) -> None:
+    """
+    Po wykryciu nowych danych odczyty bazy idą do primary, dopóki każda używana replika
+    nie musi ich już mieć (maks. opóźnienie + odstęp kontroli opóźnienia) - inaczej wynik
+    z opóźnionej repliki trafiłby do cache z nową wersją danych i ETag na cały TTL.
+    """
+    reader = main_reader if db_label == 'main' else exchanges_reader
+    reader.pin_primary(REPLICA_MAX_LAG_SECONDS + REPLICA_LAG_CHECK_SECONDS)
+
+
+data_freshness.subscribe(_pin_reads_to_primary)
+
+
+def get_data_version(db_label: str) -> Optional[str]:
+    """
+    Zwraca wersję danych bazy ('exchanges' / 'main') - zmienia się po każdym załadowaniu danych.
+    
+    Wersja to znaki wodne danych tabel źródłowych (DATA_VERSION_WATERMARKS, patrz `freshness.py`), odświeżane co DATA_VERSION_CHECK_SECONDS lub od razu
+    po powiadomieniu NOTIFY. Zmiana wersji czyści cache w procesie (_invalidate_caches).
+    
+    Returns:
+        Wersja danych lub None jeśli nie udało się jej ustalić
+    """
+    return data_freshness.version(db_label)
+
+
+def _remember_if_empty(cache_key, results_by_window: Dict[int, Optional[Dict]]) -> None:
+    """Zapisuje w negative cache źródło, które zwróciło pusty wynik (błędy zwracają {} i nie są cache'owane)"""
+    if cache_key is not None and results_by_window and not any(results_by_window.values()):
+        negative_cache.set(cache_key, True)
+
+
 def _load_transeu_timocom_mapping():
     """Ładuje mapowanie Trans.eu -> TimoCom z pliku JSON"""
     global _TRANSEU_TO_TIMOCOM_MAPPING
@@ -587,9 +1011,11 @@ def _load_transeu_timocom_mapping():
     
     try:
         mapping_path = os.path.join(os.path.dirname(__file__), 'data', 'transeu_to_timocom_mapping.json')
-        with open(mapping_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            _TRANSEU_TO_TIMOCOM_MAPPING = {int(k): v['timocom_id'] for k, v in data.items()}
+        with open(mapping_path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw)
+        _TRANSEU_TO_TIMOCOM_MAPPING = {int(k): v['timocom_id'] for k, v in data.items()}
+        _MAPPING_VERSIONS['transeu_to_timocom'] = hashlib.sha1(raw).hexdigest()[:12]
         logger.info(f"✅ Loaded Trans.eu->TimoCom mapping ({len(_TRANSEU_TO_TIMOCOM_MAPPING)} regions)")
     except Exception as e:
         logger.error(f"❌ Failed to load mapping: {e}")
@@ -604,26 +1030,187 @@ def map_transeu_to_timocom_id(transeu_id: int) -> int:
     return mapping.get(transeu_id, transeu_id)
 
 
+def get_lane_percentiles(conn, db_label: str, source: str, start_key, end_key, windows: List[int]) -> Dict[int, Dict[str, Dict]]:
+    """
+    Scala dzienne szkice kwantylowe (tabela pricing_daily_sketches) dla każdego okna
+    i zwraca percentyle per metryka - bez skanowania surowych wierszy.
+    Szkice pobierane są raz (dla najdłuższego okna) i scalane osobno dla każdego okna.
+
+    Args:
+        conn: Połączenie z bazą, w której leżą szkice danego źródła
+        db_label: Etykieta bazy ('exchanges' / 'main') - do zapamiętania braku tabeli i timeoutu breakera bazy
+        source: 'timocom' | 'transeu' | 'historical'
+        start_key, end_key: Klucze trasy (ID regionów lub kody regionów)
+        windows: Lista okien w dniach (np. [7, 30, 90])
+
+    Returns:
+        {days: {metric: {'p10': ..., 'p25': ..., 'p50': ..., 'p75': ..., 'p90': ...}}} lub {} jeśli brak szkiców
+    """
+    missing_since = _SKETCH_TABLE_MISSING.get(db_label)
+    if missing_since is not None and time.monotonic() - missing_since < SKETCH_TABLE_RECHECK_SECONDS:
+        return {}
+
+    try:
+        with conn.cursor() as cur:
+            breaker = exchanges_db_breaker if db_label == 'exchanges' else main_db_breaker
+            execute_within_deadline(cur, """
+                SELECT metric, sketch, CURRENT_DATE - day AS age_days
+                FROM public.pricing_daily_sketches
+                WHERE
+                    source = %(source)s
+                    AND start_key = %(start_key)s
+                    AND end_key = %(end_key)s
+                    AND day >= CURRENT_DATE - CAST(%(days)s AS INTEGER);
+            """, {
+                'source': source,
+                'start_key': str(start_key),
+                'end_key': str(end_key),
+                'days': max(windows)
+            }, breaker)
+            rows = cur.fetchall()
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        _SKETCH_TABLE_MISSING[db_label] = time.monotonic()
+        logger.warning(f"⚠️ Brak tabeli pricing_daily_sketches w bazie '{db_label}' - percentyle wyłączone "
+                       f"na {SKETCH_TABLE_RECHECK_SECONDS:.0f}s (uruchom build_daily_sketches.py)")
+        return {}
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"❌ Error loading sketches for {source} {start_key}->{end_key}: {e}")
+        return {}
+
+    if _SKETCH_TABLE_MISSING.pop(db_label, None) is not None:
+        logger.info(f"✅ Tabela pricing_daily_sketches dostępna w bazie '{db_label}' - percentyle włączone")
+
+    if not rows:
+        return {}
+
+    sketches = [(row['metric'], row['age_days'], QuantileSketch.from_dict(row['sketch'])) for row in rows]
+
+    percentiles_by_window = {}
+    for days in windows:
+        sketches_by_metric = {}
+        for metric, age_days, sketch in sketches:
+            if age_days <= days:
+                sketches_by_metric.setdefault(metric, []).append(sketch)
+        percentiles_by_window[days] = {
+            metric: QuantileSketch.merge_all(metric_sketches).percentiles()
+            for metric, metric_sketches in sketches_by_metric.items()
+        }
+
+    return percentiles_by_window
+
+
+def _apply_percentiles(stats: Dict, percentiles: Dict[str, Dict], metric_keys: Dict[str, str],
+                       replace_median: bool = True) -> None:
+    """
+    Dodaje do wyniku percentyle i rozrzut cen, a medianę zastępuje p50 ze szkicu.
+
+    Args:
+        stats: Słownik wyniku źródła (modyfikowany in-place)
+        percentiles: Percentyle jednego okna z get_lane_percentiles()
+        metric_keys: Mapowanie klucz w odpowiedzi -> metryka szkicu (np. {'client': 'FTL_client'})
+        replace_median: False - mediana policzona już dokładnie w SQL zostaje
+    """
+    if not percentiles:
+        return
+
+    stats['percentiles_price_per_km'] = {}
+    stats['price_spread'] = {}
+    for key, metric in metric_keys.items():
+        metric_percentiles = percentiles.get(metric)
+        stats['percentiles_price_per_km'][key] = metric_percentiles
+        stats['price_spread'][key] = percentile_spread(metric_percentiles) if metric_percentiles else None
+        if replace_median and metric_percentiles and metric_percentiles.get('p50') is not None:
+            stats['median_price_per_km'][key] = metric_percentiles['p50']
+
+
+def _sketch_covered_groups(percentiles: Dict[int, Dict[str, Dict]], cargo_types: Tuple[str, ...]) -> List[str]:
+    """Grupy 'okno:typ ładunku', dla których szkice mają percentyle klienta i przewoźnika (mediana bez SQL)"""
+    return [
+        f'{days}:{cargo_type}'
+        for days, window_percentiles in percentiles.items()
+        for cargo_type in cargo_types
+        if all((window_percentiles or {}).get(f'{cargo_type}_{side}') for side in ('client', 'carrier'))
+    ]
+
+
+def get_exchange_pricing_from_matrix(
+    start_region_id: int,
+    end_region_id: int,
+    windows: List[int]
+) -> Optional[Tuple[Dict[int, Optional[Dict]], Dict[int, Optional[Dict]]]]:
+    """
+    Pobiera wyniki TimoCom i Trans.eu z macierzy wycen (bez zapytań do bazy).
+    
+    Returns:
+        Tuple (timocom {days: ...}, transeu {days: ...}) lub None, jeśli macierz
+        jest niedostępna, za stara albo nie obejmuje pary regionów / okien
+    """
+    if not pricing_matrix.covers(start_region_id, end_region_id, windows):
+        return None
+    age = pricing_matrix.age_seconds()
+    if age is None or age > PRICING_MATRIX_MAX_AGE_HOURS * 3600:
+        return None
+    
+    blob = pricing_matrix.lookup(start_region_id, end_region_id) or {}
+    return tuple(
+        {days: blob.get(source, {}).get(days) for days in windows}
+        for source in ('timocom', 'transeu')
+    )
+
+
+def get_precomputed_distance(start_postal: str, end_postal: str) -> Optional[float]:
+    """
+    Dystans pary kodów z macierzy dystansów (bez geocodingu i AWS).
+    
+    Returns:
+        Dystans km lub None, jeśli macierz jest niedostępna, za stara albo nie zawiera pary
+    """
+    if not distance_matrix.maybe_reload():
+        return None
+    age = distance_matrix.age_seconds()
+    if age is None or age > DISTANCE_MATRIX_MAX_AGE_HOURS * 3600:
+        return None
+    cell = distance_matrix.lookup(start_postal, end_postal)
+    return cell[0] if cell else None
+
+
 def get_timocom_pricing(start_region_id: int, end_region_id: int, days: int = 7):
-    """Pobiera dane cenowe TimoCom z bazy danych PostgreSQL"""
+    """Pobiera dane cenowe TimoCom z bazy danych PostgreSQL (jedno okno)"""
+    return get_timocom_pricing_windows(start_region_id, end_region_id, [days]).get(days)
+
+
+def get_timocom_pricing_windows(start_region_id: int, end_region_id: int, windows: List[int]) -> Dict[int, Optional[Dict]]:
+    """
+    Pobiera dane cenowe TimoCom dla wielu okien (np. 7/30/90 dni) jednym zapytaniem.
+    Tabela offers jest skanowana raz (dla najdłuższego okna), a agregaty
+    dla każdego okna liczone są z tych samych wierszy.
+
+    Returns:
+        Słownik {days: wynik lub None}
+    """
     start_time = time.time()
-    
+
     timocom_start_id = map_transeu_to_timocom_id(start_region_id)
     timocom_end_id = map_transeu_to_timocom_id(end_region_id)
-    
+
     conn = None
     try:
         conn_start = time.time()
-        conn = _get_db_connection()
+        conn = exchanges_reader.getconn()
         logger.info(f"⏱️ Połączenie z bazą: {(time.time() - conn_start)*1000:.0f}ms")
-        
+
         with conn.cursor() as cur:
             # Próg dla outlierów - wartości powyżej 5 EUR/km są podejrzane
             OUTLIER_THRESHOLD = 5.0
 
-            # Zoptymalizowane zapytanie - 1 zamiast 2
+            # Zoptymalizowane zapytanie - 1 skan tabeli dla wszystkich okien
             query = """
-                WITH all_offers AS (
+                WITH windows AS (
+                    SELECT DISTINCT unnest(%(windows)s::int[]) AS days
+                ),
+                all_offers AS (
                     SELECT
                         *,
                         (trailer_avg_price_per_km > %(threshold)s OR
@@ -633,7 +1220,7 @@ def get_timocom_pricing(start_region_id: int, end_region_id: int, days: int = 7)
                     WHERE
                         starting_id = %(start_id)s
                         AND destination_id = %(end_id)s
-                        AND enlistment_date >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+                        AND enlistment_date >= CURRENT_DATE - CAST(%(max_days)s AS INTEGER)
                 ),
                 outliers AS (
                     SELECT
@@ -654,36 +1241,64 @@ def get_timocom_pricing(start_region_id: int, end_region_id: int, days: int = 7)
                 clean_offers AS (
                     SELECT * FROM all_offers WHERE is_outlier = FALSE
                 ),
-                aggregated_data AS (
+                bucketed_offers AS (
+                    -- Każdy wiersz raz, w najkrótszym obejmującym go oknie (okna są zagnieżdżone)
                     SELECT
-                        -- Średnie ważone
-                        SUM(trailer_avg_price_per_km * number_of_offers_trailer) / NULLIF(SUM(number_of_offers_trailer), 0) AS avg_trailer_price,
-                        SUM(vehicle_up_to_3_5_t_avg_price_per_km * number_of_offers_vehicle_up_to_3_5_t) / NULLIF(SUM(number_of_offers_vehicle_up_to_3_5_t), 0) AS avg_3_5t_price,
-                        SUM(vehicle_up_to_12_t_avg_price_per_km * number_of_offers_vehicle_up_to_12_t) / NULLIF(SUM(number_of_offers_vehicle_up_to_12_t), 0) AS avg_12t_price,
-                        
-                        -- Mediany i sumy
-                        AVG(trailer_median_price_per_km) AS median_trailer_price,
+                        (SELECT MIN(w.days) FROM windows w WHERE o.enlistment_date >= CURRENT_DATE - w.days) AS bucket,
+                        o.*
+                    FROM clean_offers o
+                ),
+                bucket_data AS (
+                    SELECT
+                        bucket,
+                        SUM(trailer_avg_price_per_km * number_of_offers_trailer) AS weighted_trailer_price,
+                        SUM(vehicle_up_to_3_5_t_avg_price_per_km * number_of_offers_vehicle_up_to_3_5_t) AS weighted_3_5t_price,
+                        SUM(vehicle_up_to_12_t_avg_price_per_km * number_of_offers_vehicle_up_to_12_t) AS weighted_12t_price,
+                        SUM(trailer_median_price_per_km) AS sum_median_trailer_price,
+                        COUNT(trailer_median_price_per_km) AS count_median_trailer_price,
                         SUM(number_of_offers_total) AS total_offers,
                         SUM(number_of_offers_trailer) AS total_offers_trailer,
                         SUM(number_of_offers_vehicle_up_to_3_5_t) AS total_offers_3_5t,
                         SUM(number_of_offers_vehicle_up_to_12_t) AS total_offers_12t,
                         COUNT(DISTINCT enlistment_date) AS days_count
-                    FROM clean_offers
+                    FROM bucketed_offers
+                    GROUP BY bucket
+                ),
+                aggregated_data AS (
+                    -- Okno = suma kubełków nie dłuższych od niego (maks. 5 x 5 wierszy zamiast k kopii ofert)
+                    SELECT
+                        w.days,
+                        -- Średnie ważone
+                        SUM(b.weighted_trailer_price) / NULLIF(SUM(b.total_offers_trailer), 0) AS avg_trailer_price,
+                        SUM(b.weighted_3_5t_price) / NULLIF(SUM(b.total_offers_3_5t), 0) AS avg_3_5t_price,
+                        SUM(b.weighted_12t_price) / NULLIF(SUM(b.total_offers_12t), 0) AS avg_12t_price,
+
+                        -- Mediany i sumy (dzień należy do jednego kubełka - liczby dni się sumują)
+                        SUM(b.sum_median_trailer_price) / NULLIF(SUM(b.count_median_trailer_price), 0) AS median_trailer_price,
+                        SUM(b.total_offers) AS total_offers,
+                        SUM(b.total_offers_trailer) AS total_offers_trailer,
+                        SUM(b.total_offers_3_5t) AS total_offers_3_5t,
+                        SUM(b.total_offers_12t) AS total_offers_12t,
+                        SUM(b.days_count) AS days_count
+                    FROM windows w
+                    JOIN bucket_data b ON b.bucket <= w.days
+                    GROUP BY w.days
                 )
                 SELECT
                     (SELECT json_agg(t) FROM aggregated_data t) AS aggregated,
                     (SELECT json_agg(o) FROM outliers o) AS outliers;
             """
-            
+
             query_start = time.time()
-            cur.execute(query, {
+            execute_within_deadline(cur, query, {
                 'start_id': timocom_start_id,
                 'end_id': timocom_end_id,
-                'days': days,
+                'windows': list(windows),
+                'max_days': max(windows),
                 'threshold': OUTLIER_THRESHOLD
-            })
+            }, exchanges_db_breaker)
             result = cur.fetchone()
-            logger.info(f"⏱️ Zapytanie SQL ({days}d): {(time.time() - query_start)*1000:.0f}ms")
+            logger.info(f"⏱️ Zapytanie SQL ({windows}d): {(time.time() - query_start)*1000:.0f}ms")
 
             # Logowanie outlierów
             if result and result['outliers']:
@@ -695,54 +1310,78 @@ def get_timocom_pricing(start_region_id: int, end_region_id: int, days: int = 7)
                                  f"3.5t: {outlier['vehicle_up_to_3_5_t_avg_price_per_km']}, "
                                  f"12t: {outlier['vehicle_up_to_12_t_avg_price_per_km']}")
 
+            pricing_by_window = {days: None for days in windows}
+
             # Przetwarzanie zagregowanych danych
             if not result or not result['aggregated']:
-                return None
+                return pricing_by_window
 
-            agg_data = result['aggregated'][0]
-            if not agg_data or (not agg_data.get('avg_trailer_price') and not agg_data.get('avg_3_5t_price') and not agg_data.get('avg_12t_price')):
-                return None
+            for agg_data in result['aggregated']:
+                if not agg_data or (not agg_data.get('avg_trailer_price') and not agg_data.get('avg_3_5t_price') and not agg_data.get('avg_12t_price')):
+                    continue
+
+                pricing_by_window[agg_data['days']] = {
+                    'avg_price_per_km': {
+                        'trailer': float(agg_data['avg_trailer_price']) if agg_data.get('avg_trailer_price') else None,
+                        '3_5t': float(agg_data['avg_3_5t_price']) if agg_data.get('avg_3_5t_price') else None,
+                        '12t': float(agg_data['avg_12t_price']) if agg_data.get('avg_12t_price') else None
+                    },
+                    'median_price_per_km': {
+                        'trailer': float(agg_data['median_trailer_price']) if agg_data.get('median_trailer_price') else None,
+                        '3_5t': None,
+                        '12t': None
+                    },
+                    'total_offers': int(agg_data['total_offers']) if agg_data.get('total_offers') else 0,
+                    'offers_by_vehicle_type': {
+                        'trailer': int(agg_data['total_offers_trailer']) if agg_data.get('total_offers_trailer') else 0,
+                        '3_5t': int(agg_data['total_offers_3_5t']) if agg_data.get('total_offers_3_5t') else 0,
+                        '12t': int(agg_data['total_offers_12t']) if agg_data.get('total_offers_12t') else 0
+                    },
+                    'days_with_data': int(agg_data['days_count']) if agg_data.get('days_count') else 0
+                }
+
+            # Percentyle ze scalonych dziennych szkiców
+            if any(pricing_by_window.values()):
+                percentiles = get_lane_percentiles(conn, 'exchanges', 'timocom', timocom_start_id, timocom_end_id, windows)
+                for days, pricing in pricing_by_window.items():
+                    if pricing:
+                        _apply_percentiles(pricing, percentiles.get(days), {'trailer': 'trailer', '3_5t': '3_5t', '12t': '12t'})
+
+            return pricing_by_window
 
-            return {
-                'avg_price_per_km': {
-                    'trailer': float(agg_data['avg_trailer_price']) if agg_data.get('avg_trailer_price') else None,
-                    '3_5t': float(agg_data['avg_3_5t_price']) if agg_data.get('avg_3_5t_price') else None,
-                    '12t': float(agg_data['avg_12t_price']) if agg_data.get('avg_12t_price') else None
-                },
-                'median_price_per_km': {
-                    'trailer': float(agg_data['median_trailer_price']) if agg_data.get('median_trailer_price') else None,
-                    '3_5t': None,
-                    '12t': None
-                },
-                'total_offers': int(agg_data['total_offers']) if agg_data.get('total_offers') else 0,
-                'offers_by_vehicle_type': {
-                    'trailer': int(agg_data['total_offers_trailer']) if agg_data.get('total_offers_trailer') else 0,
-                    '3_5t': int(agg_data['total_offers_3_5t']) if agg_data.get('total_offers_3_5t') else 0,
-                    '12t': int(agg_data['total_offers_12t']) if agg_data.get('total_offers_12t') else 0
-                },
-                'days_with_data': int(agg_data['days_count']) if agg_data.get('days_count') else 0
-            }
-            
     except Exception as exc:
         logger.error(f"❌ TimoCom query error: {exc}", exc_info=True)
-        return None
+        return {}
     finally:
         if conn:
-            _return_db_connection(conn)
-        logger.info(f"⏱️ CAŁKOWITY CZAS get_timocom_pricing ({days}d): {(time.time() - start_time)*1000:.0f}ms")
+            exchanges_reader.putconn(conn)
+        logger.info(f"⏱️ CAŁKOWITY CZAS get_timocom_pricing ({windows}d): {(time.time() - start_time)*1000:.0f}ms")
 
 
 def get_transeu_pricing(start_region_id: int, end_region_id: int, days: int = 7):
-    """Pobiera dane cenowe Trans.eu z bazy danych PostgreSQL"""
+    """Pobiera dane cenowe Trans.eu z bazy danych PostgreSQL (jedno okno)"""
+    return get_transeu_pricing_windows(start_region_id, end_region_id, [days]).get(days)
+
+
+def get_transeu_pricing_windows(start_region_id: int, end_region_id: int, windows: List[int]) -> Dict[int, Optional[Dict]]:
+    """
+    Pobiera dane cenowe Trans.eu dla wielu okien jednym zapytaniem (1 skan tabeli).
+
+    Returns:
+        Słownik {days: wynik lub None}
+    """
     conn = None
     try:
-        conn = _get_db_connection()
-        
+        conn = exchanges_reader.getconn()
+
         with conn.cursor() as cur:
             OUTLIER_THRESHOLD = 5.0
 
             query = '''
-                WITH all_offers AS (
+                WITH windows AS (
+                    SELECT DISTINCT unnest(%(windows)s::int[]) AS days
+                ),
+                all_offers AS (
                     SELECT
                         *,
                         (lorry_avg_price_per_km > %(threshold)s) AS is_outlier
@@ -750,7 +1389,7 @@ def get_transeu_pricing(start_region_id: int, end_region_id: int, days: int = 7)
                     WHERE
                         starting_id = %(start_id)s
                         AND destination_id = %(end_id)s
-                        AND enlistment_date >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+                        AND enlistment_date >= CURRENT_DATE - CAST(%(max_days)s AS INTEGER)
                 ),
                 outliers AS (
                     SELECT
@@ -765,25 +1404,47 @@ def get_transeu_pricing(start_region_id: int, end_region_id: int, days: int = 7)
                 clean_offers AS (
                     SELECT * FROM all_offers WHERE is_outlier = FALSE
                 ),
-                aggregated_data AS (
+                bucketed_offers AS (
+                    -- Każdy wiersz raz, w najkrótszym obejmującym go oknie (okna są zagnieżdżone)
+                    SELECT
+                        (SELECT MIN(w.days) FROM windows w WHERE o.enlistment_date >= CURRENT_DATE - w.days) AS bucket,
+                        o.*
+                    FROM clean_offers o
+                ),
+                bucket_data AS (
                     SELECT
-                        SUM(lorry_avg_price_per_km * number_of_offers) / NULLIF(SUM(number_of_offers), 0) AS avg_lorry_price,
-                        AVG(lorry_median_price_per_km) AS median_lorry_price,
+                        bucket,
+                        SUM(lorry_avg_price_per_km * number_of_offers) AS weighted_lorry_price,
+                        SUM(lorry_median_price_per_km) AS sum_median_lorry_price,
+                        COUNT(lorry_median_price_per_km) AS count_median_lorry_price,
                         SUM(number_of_offers) AS total_offers,
                         COUNT(DISTINCT enlistment_date) AS days_count
-                    FROM clean_offers
+                    FROM bucketed_offers
+                    GROUP BY bucket
+                ),
+                aggregated_data AS (
+                    SELECT
+                        w.days,
+                        SUM(b.weighted_lorry_price) / NULLIF(SUM(b.total_offers), 0) AS avg_lorry_price,
+                        SUM(b.sum_median_lorry_price) / NULLIF(SUM(b.count_median_lorry_price), 0) AS median_lorry_price,
+                        SUM(b.total_offers) AS total_offers,
+                        SUM(b.days_count) AS days_count
+                    FROM windows w
+                    JOIN bucket_data b ON b.bucket <= w.days
+                    GROUP BY w.days
                 )
                 SELECT
                     (SELECT json_agg(t) FROM aggregated_data t) AS aggregated,
                     (SELECT json_agg(o) FROM outliers o) AS outliers;
             '''
 
-            cur.execute(query, {
+            execute_within_deadline(cur, query, {
                 'start_id': start_region_id,
                 'end_id': end_region_id,
-                'days': days,
+                'windows': list(windows),
+                'max_days': max(windows),
                 'threshold': OUTLIER_THRESHOLD
-            })
+            }, exchanges_db_breaker)
             result = cur.fetchone()
 
             if result and result['outliers']:
@@ -794,93 +1455,248 @@ def get_transeu_pricing(start_region_id: int, end_region_id: int, days: int = 7)
                                  f"Lorry: {outlier['lorry_avg_price_per_km']}, "
                                  f"Oferty: {outlier['number_of_offers']}")
 
+            pricing_by_window = {days: None for days in windows}
+
             if not result or not result['aggregated']:
-                return None
+                return pricing_by_window
 
-            agg_data = result['aggregated'][0]
-            if not agg_data or not agg_data.get('avg_lorry_price'):
-                return None
+            for agg_data in result['aggregated']:
+                if not agg_data or not agg_data.get('avg_lorry_price'):
+                    continue
+
+                pricing_by_window[agg_data['days']] = {
+                    'avg_price_per_km': {
+                        'lorry': float(agg_data['avg_lorry_price']) if agg_data.get('avg_lorry_price') else None
+                    },
+                    'median_price_per_km': {
+                        'lorry': float(agg_data['median_lorry_price']) if agg_data.get('median_lorry_price') else None
+                    },
+                    'total_offers': int(agg_data['total_offers']) if agg_data.get('total_offers') else 0,
+                    'days_with_data': int(agg_data['days_count']) if agg_data.get('days_count') else 0
+                }
+
+            if any(pricing_by_window.values()):
+                percentiles = get_lane_percentiles(conn, 'exchanges', 'transeu', start_region_id, end_region_id, windows)
+                for days, pricing in pricing_by_window.items():
+                    if pricing:
+                        _apply_percentiles(pricing, percentiles.get(days), {'lorry': 'lorry'})
+
+            return pricing_by_window
 
-            return {
-                'avg_price_per_km': {
-                    'lorry': float(agg_data['avg_lorry_price']) if agg_data.get('avg_lorry_price') else None
-                },
-                'median_price_per_km': {
-                    'lorry': float(agg_data['median_lorry_price']) if agg_data.get('median_lorry_price') else None
-                },
-                'total_offers': int(agg_data['total_offers']) if agg_data.get('total_offers') else 0,
-                'days_with_data': int(agg_data['days_count']) if agg_data.get('days_count') else 0
-            }
-            
     except Exception as exc:
         logger.error(f"❌ Trans.eu query error: {exc}", exc_info=True)
-        return None
+        return {}
     finally:
         if conn:
-            _return_db_connection(conn)
+            exchanges_reader.putconn(conn)
+
+
+def _to_float(value) -> Optional[float]:
+    """Decimal z bazy -> float (None / 0 -> None)"""
+    return float(value) if value else None
+
+
+def _to_isoformat(value) -> Optional[str]:
+    """date / datetime -> ISO 8601 (domyślny provider Flask zapisałby datę w formacie HTTP)"""
+    return value.isoformat() if value is not None else None
+
+
+# Pola zlecenia w odpowiedzi: (nazwa, kolumna ZleceniaSpeed, konwersja wartości)
+ORDER_FIELDS = (
+    ('order_id', 'id', None),
+    # date / datetime - z orjson serializowane natywnie, bez niego isoformat() przy budowie listy
+    ('order_date', 'orderDate', None if JSON_BACKEND == 'orjson' else _to_isoformat),
+    ('cargo_type', 'cargoType', None),
+    ('client_amount', 'clientAmount', _to_float),
+    ('carrier_amount', 'carrierAmount', _to_float),
+    ('carrier_name', 'carrierName', None),
+    ('carrier_contact', 'carrierContact', None),
+    ('carrier_email', 'carrierEmail', None),
+    ('client_price_per_km', 'clientPricePerKm', _to_float),
+    ('carrier_price_per_km', 'carrierPricePerKm', _to_float),
+    ('route_distance', 'routeDistance', _to_float),
+    ('client_currency', 'clientCurrency', None),
+    ('carrier_currency', 'carrierCurrency', None)
+)
+ORDER_FIELD_NAMES = tuple(name for name, _, _ in ORDER_FIELDS)
+
+# Pola o małej liczbie różnych wartości - w formacie kolumnowym kodowane słownikiem
+ORDER_DICTIONARY_FIELDS = ('cargo_type', 'carrier_name', 'carrier_contact', 'carrier_email',
+                           'client_currency', 'carrier_currency')
+
+
+def _fetch_historical_orders_list(cur, match_metadata: Dict, max_days: int, cargo_types: Tuple[str, ...]) -> List[Tuple[Optional[int], Tuple]]:
+    """
+    Pobiera szczegółową listę zleceń dla (dopasowanej) trasy z najdłuższego okna.
+
+    Returns:
+        Lista (wiek zlecenia w dniach, krotka wartości w kolejności ORDER_FIELDS) - do filtrowania per okno
+    """
+    orders_list_query = """
+        SELECT
+            "id",
+            "orderDate",
+            CURRENT_DATE - DATE("orderDate") AS age_days,
+            "cargoType",
+            "clientAmount",
+            "carrierAmount",
+            "carrierName",
+            "carrierContact",
+            "carrierEmail",
+            "clientPricePerKm",
+            "carrierPricePerKm",
+            "routeDistance",
+            "clientCurrency",
+            "carrierCurrency"
+        FROM "ZleceniaSpeed"
+        WHERE
+            "loadingRegionCode" = %(start_code)s
+            AND "unloadingRegionCode" = %(end_code)s
+            AND "orderDate" >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+            AND "status" = 'Z'
+            AND "clientPricePerKm" IS NOT NULL
+            AND "clientPricePerKm" > 0
+            AND "cargoType" = ANY(%(cargo_types)s)
+            AND ("carrierName" IS NULL OR ("carrierName" NOT ILIKE '%%motiva%%' AND "carrierName" NOT ILIKE '%%ALB LOGISTICS%%'))
+        ORDER BY "orderDate" DESC;
+    """
+
+    logger.info(f"📋 Pobieranie listy zleceń dla: {match_metadata['matched_start']} -> {match_metadata['matched_end']}")
+    execute_within_deadline(cur, orders_list_query, {
+        'start_code': match_metadata['matched_start'],
+        'end_code': match_metadata['matched_end'],
+        'days': max_days,
+        'cargo_types': list(cargo_types)
+    }, main_db_breaker)
+    orders_raw = cur.fetchall()
+    logger.info(f"📋 Pobrano {len(orders_raw)} zleceń z bazy")
+
+    # Krotki wartości - obiekty (wiersze) lub kolumny budowane dopiero dla wybranego formatu
+    return [
+        (order['age_days'], tuple(
+            convert(order[column]) if convert else order[column]
+            for _, column, convert in ORDER_FIELDS
+        ))
+        for order in orders_raw
+    ]
+
+
+def _orders_as_rows(orders: List[Tuple]) -> List[Dict]:
+    """Lista zleceń jako obiekty {pole: wartość}"""
+    return [dict(zip(ORDER_FIELD_NAMES, values)) for values in orders]
+
+
+def _orders_as_columns(orders: List[Tuple]) -> Dict:
+    """
+    Lista zleceń w formacie kolumnowym: jedna tablica na pole, pola tekstowe
+    o powtarzalnych wartościach (przewoźnicy, waluty) jako indeksy do słownika.
+
+    Returns:
+        {'count': n, 'columns': {pole: [wartości lub indeksy]}, 'dictionaries': {pole: [wartości]}}
+    """
+    columns = dict(zip(ORDER_FIELD_NAMES, (list(column) for column in zip(*orders)))) if orders \
+        else {name: [] for name in ORDER_FIELD_NAMES}
+    dictionaries = {}
+    for name in ORDER_DICTIONARY_FIELDS:
+        positions = {}
+        columns[name] = [positions.setdefault(value, len(positions)) for value in columns[name]]
+        dictionaries[name] = list(positions)
+    return {'count': len(orders), 'columns': columns, 'dictionaries': dictionaries}
 
 
 def get_historical_orders_pricing(start_region_code: str, end_region_code: str, days: int = 180):
     """
-    Pobiera statystyki z tabeli zleceń historycznych (ZleceniaSpeed) z fuzzy matching.
-    
-    Algorytm:
-    1. Najpierw próbuje dokładnego dopasowania kodów pocztowych
-    2. Jeśli nie znajdzie, używa fuzzy matching (najbliższe punkty w promieniu 100km)
-    3. Zwraca dane ze wskaźnikiem dokładności dopasowania
-    
+    Pobiera statystyki z tabeli zleceń historycznych (ZleceniaSpeed) z fuzzy matching (jedno okno).
+
     Args:
         start_region_code: Kod regionu startu (np. "PL20")
         end_region_code: Kod regionu celu (np. "DE49")
         days: Liczba dni wstecz (domyślnie 180 - ostatnie pół roku)
-    
+
     Returns:
         Słownik ze statystykami (w tym top 4 przewoźników) oraz metadata o dopasowaniu
         lub None jeśli brak danych
     """
-    logger.info(f"🔍 get_historical_orders_pricing called: {start_region_code} → {end_region_code}")
-    start_time = time.time()
-    conn = None
-    try:
-        conn_start = time.time()
-        conn = _get_db_connection_main()
-        logger.info(f"⏱️ Połączenie z bazą (historical): {(time.time() - conn_start)*1000:.0f}ms")
-        
-        # Metadata o dopasowaniu (domyślnie exact match)
-        match_metadata = {
-            'matched_start': start_region_code,
+    return get_historical_orders_pricing_windows(start_region_code, end_region_code, [days]).get(days)
+
+
+def get_historical_orders_pricing_windows(
+    start_region_code: str,
+    end_region_code: str,
+    windows: List[int],
+    cargo_types: Tuple[str, ...] = ('FTL', 'LTL'),
+    include_orders: bool = True,
+    include_top_carriers: bool = True,
+    orders_format: str = 'rows'
+) -> Dict[int, Optional[Dict]]:
+    """
+    Pobiera statystyki z tabeli zleceń historycznych (ZleceniaSpeed) z fuzzy matching
+    dla wielu okien jednocześnie (1 skan tabeli dla najdłuższego okna).
+
+    Algorytm:
+    1. Najpierw próbuje dokładnego dopasowania kodów pocztowych
+    2. Jeśli nie znajdzie (w żadnym oknie), używa fuzzy matching (najbliższe punkty w promieniu 100km)
+    3. Zwraca dane ze wskaźnikiem dokładności dopasowania
+
+    Args:
+        start_region_code: Kod regionu startu (np. "PL20")
+        end_region_code: Kod regionu celu (np. "DE49")
+        windows: Lista okien w dniach (np. [90, 180])
+        cargo_types: Typy ładunku (FTL / LTL) - pozostałe nie są skanowane
+        include_orders: Czy pobrać listę zleceń (osobne zapytanie)
+        include_top_carriers: Czy liczyć top 4 przewoźników
+        orders_format: 'rows' (orders - lista obiektów) lub 'columnar' (orders_columnar - kolumny)
+
+    Returns:
+        Słownik {days: statystyki lub None}
+    """
+    logger.info(f"🔍 get_historical_orders_pricing called: {start_region_code} → {end_region_code} ({windows}d)")
+    start_time = time.time()
+    max_days = max(windows)
+    conn = None
+    try:
+        conn_start = time.time()
+        conn = main_reader.getconn()
+        logger.info(f"⏱️ Połączenie z bazą (historical): {(time.time() - conn_start)*1000:.0f}ms")
+
+        # Metadata o dopasowaniu (domyślnie exact match)
+        match_metadata = {
+            'matched_start': start_region_code,
             'matched_end': end_region_code,
             'accuracy': 'exact',
             'start_distance_km': 0.0,
             'end_distance_km': 0.0
         }
-        
+
         with conn.cursor() as cur:
             # Próg dla outlierów - analogiczny do giełd
             OUTLIER_THRESHOLD = 5.0
-            
-            # Zoptymalizowane zapytanie z podziałem na FTL i LTL oraz top 4 przewoźnikami
-            query = """
-                WITH all_orders AS (
+
+            # Zoptymalizowane zapytanie z podziałem na okna, FTL i LTL oraz top 4 przewoźnikami
+            query_template = """
+                WITH windows AS (
+                    SELECT DISTINCT unnest(%(windows)s::int[]) AS days
+                ),
+                all_orders AS (
                     SELECT
                         "orderDate",
                         "carrierId",
                         "carrierName",
                         "cargoType",
                         -- Przelicz PLN na EUR (kurs 4.25)
-                        CASE 
+                        CASE
                             WHEN "clientCurrency" = 'PLN' THEN "clientPricePerKm" / 4.25
                             ELSE "clientPricePerKm"
                         END AS "clientPricePerKm",
-                        CASE 
+                        CASE
                             WHEN "carrierCurrency" = 'PLN' THEN "carrierPricePerKm" / 4.25
                             ELSE "carrierPricePerKm"
                         END AS "carrierPricePerKm",
-                        CASE 
+                        CASE
                             WHEN "clientCurrency" = 'PLN' THEN "clientAmount" / 4.25
                             ELSE "clientAmount"
                         END AS "clientAmount",
-                        CASE 
+                        CASE
                             WHEN "carrierCurrency" = 'PLN' THEN "carrierAmount" / 4.25
                             ELSE "carrierAmount"
                         END AS "carrierAmount",
@@ -889,17 +1705,17 @@ def get_historical_orders_pricing(start_region_code: str, end_region_code: str,
                         "carrierCurrency",
                         "status",
                         -- Outlier: cena za km > 5 EUR (po przeliczeniu)
-                        (CASE WHEN "clientCurrency" = 'PLN' THEN "clientPricePerKm" / 4.25 ELSE "clientPricePerKm" END > %(threshold)s OR 
+                        (CASE WHEN "clientCurrency" = 'PLN' THEN "clientPricePerKm" / 4.25 ELSE "clientPricePerKm" END > %(threshold)s OR
                          CASE WHEN "carrierCurrency" = 'PLN' THEN "carrierPricePerKm" / 4.25 ELSE "carrierPricePerKm" END > %(threshold)s) AS is_outlier
                     FROM "ZleceniaSpeed"
                     WHERE
                         "loadingRegionCode" = %(start_code)s
                         AND "unloadingRegionCode" = %(end_code)s
-                        AND "orderDate" >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+                        AND "orderDate" >= CURRENT_DATE - CAST(%(max_days)s AS INTEGER)
                         AND "status" = 'Z'  -- Tylko zlecenia zakończone
                         AND "clientPricePerKm" IS NOT NULL
                         AND "clientPricePerKm" > 0
-                        AND "cargoType" IN ('FTL', 'LTL')  -- Tylko FTL i LTL
+                        AND "cargoType" = ANY(%(cargo_types)s)  -- Tylko FTL i LTL (lub wybrany typ)
                         AND ("carrierName" IS NULL OR ("carrierName" NOT ILIKE '%%motiva%%' AND "carrierName" NOT ILIKE '%%ALB LOGISTICS%%'))  -- Pomijamy Motiva i ALB LOGISTICS jako przewoźników
                         AND "clientCurrency" IN ('EUR', 'PLN')  -- Tylko EUR i PLN
                         AND "carrierCurrency" IN ('EUR', 'PLN')  -- Tylko EUR i PLN
@@ -920,66 +1736,147 @@ def get_historical_orders_pricing(start_region_code: str, end_region_code: str,
                 clean_orders AS (
                     SELECT * FROM all_orders WHERE is_outlier = FALSE
                 ),
-                aggregated_data AS (
+                bucketed_orders AS (
+                    -- Każde zlecenie raz, w najkrótszym obejmującym je oknie (okna są zagnieżdżone)
                     SELECT
+                        (SELECT MIN(w.days) FROM windows w WHERE o."orderDate" >= CURRENT_DATE - w.days) AS bucket,
+                        o.*
+                    FROM clean_orders o
+                ),
+                bucket_data AS (
+                    SELECT
+                        bucket,
                         "cargoType",
-                        -- Średnie ceny za km
-                        AVG("clientPricePerKm") AS avg_client_price_per_km,
-                        AVG("carrierPricePerKm") AS avg_carrier_price_per_km,
-                        
-                        -- Mediany
-                        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY "clientPricePerKm") AS median_client_price_per_km,
-                        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY "carrierPricePerKm") AS median_carrier_price_per_km,
-                        
-                        -- Średnie kwoty całkowite
-                        AVG("clientAmount") AS avg_client_amount,
-                        AVG("carrierAmount") AS avg_carrier_amount,
-                        
-                        -- Średni dystans
-                        AVG("routeDistance") AS avg_distance,
-                        
-                        -- Waluty (powinny być wszystkie EUR po filtrze)
+                        SUM("clientPricePerKm") AS sum_client_price_per_km,
+                        COUNT("clientPricePerKm") AS count_client_price_per_km,
+                        SUM("carrierPricePerKm") AS sum_carrier_price_per_km,
+                        COUNT("carrierPricePerKm") AS count_carrier_price_per_km,
+                        SUM("clientAmount") AS sum_client_amount,
+                        COUNT("clientAmount") AS count_client_amount,
+                        SUM("carrierAmount") AS sum_carrier_amount,
+                        COUNT("carrierAmount") AS count_carrier_amount,
+                        SUM("routeDistance") AS sum_distance,
+                        COUNT("routeDistance") AS count_distance,
                         MAX("clientCurrency") AS client_currency,
                         MAX("carrierCurrency") AS carrier_currency,
-                        
-                        -- Liczba zleceń
                         COUNT(*) AS total_orders,
                         COUNT(DISTINCT DATE("orderDate")) AS days_count
-                    FROM clean_orders
-                    GROUP BY "cargoType"
+                    FROM bucketed_orders
+                    GROUP BY bucket, "cargoType"
                 ),
-                top_carriers AS (
+                window_medians AS (
+                    -- PERCENTILE_CONT potrzebuje wszystkich wierszy okna (nie da się go złożyć z kubełków),
+                    -- więc złączenie z oknami zostaje - tylko dla grup bez szkiców
+                    SELECT
+                        w.days,
+                        o."cargoType",
+                        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY o."clientPricePerKm") AS median_client_price_per_km,
+                        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY o."carrierPricePerKm") AS median_carrier_price_per_km
+                    FROM windows w
+                    JOIN clean_orders o ON o."orderDate" >= CURRENT_DATE - w.days
+                    WHERE NOT (w.days || ':' || o."cargoType") = ANY(%(sketch_groups)s::text[])
+                    GROUP BY w.days, o."cargoType"
+                ),
+                aggregated_data AS (
+                    -- Okno = suma kubełków nie dłuższych od niego
+                    SELECT
+                        w.days,
+                        b."cargoType",
+                        -- Średnie ceny za km
+                        SUM(b.sum_client_price_per_km) / NULLIF(SUM(b.count_client_price_per_km), 0) AS avg_client_price_per_km,
+                        SUM(b.sum_carrier_price_per_km) / NULLIF(SUM(b.count_carrier_price_per_km), 0) AS avg_carrier_price_per_km,
+
+                        -- Średnie kwoty całkowite
+                        SUM(b.sum_client_amount) / NULLIF(SUM(b.count_client_amount), 0) AS avg_client_amount,
+                        SUM(b.sum_carrier_amount) / NULLIF(SUM(b.count_carrier_amount), 0) AS avg_carrier_amount,
+
+                        -- Średni dystans
+                        SUM(b.sum_distance) / NULLIF(SUM(b.count_distance), 0) AS avg_distance,
+
+                        -- Waluty (powinny być wszystkie EUR po filtrze)
+                        MAX(b.client_currency) AS client_currency,
+                        MAX(b.carrier_currency) AS carrier_currency,
+
+                        -- Liczba zleceń (dzień należy do jednego kubełka - liczby dni się sumują)
+                        SUM(b.total_orders) AS total_orders,
+                        SUM(b.days_count) AS days_count
+                    FROM windows w
+                    JOIN bucket_data b ON b.bucket <= w.days
+                    GROUP BY w.days, b."cargoType"
+                ),
+                bucket_carriers AS (
                     SELECT
+                        bucket,
                         "cargoType",
                         "carrierId",
                         "carrierName",
                         COUNT(*) AS order_count,
-                        AVG("clientPricePerKm") AS avg_client_price_per_km,
-                        AVG("carrierPricePerKm") AS avg_carrier_price_per_km,
-                        AVG("clientAmount") AS avg_client_amount,
-                        AVG("carrierAmount") AS avg_carrier_amount,
-                        ROW_NUMBER() OVER (PARTITION BY "cargoType" ORDER BY COUNT(*) DESC) AS rn
-                    FROM clean_orders
-                    WHERE "carrierId" IS NOT NULL 
+                        SUM("clientPricePerKm") AS sum_client_price_per_km,
+                        COUNT("clientPricePerKm") AS count_client_price_per_km,
+                        SUM("carrierPricePerKm") AS sum_carrier_price_per_km,
+                        COUNT("carrierPricePerKm") AS count_carrier_price_per_km,
+                        SUM("clientAmount") AS sum_client_amount,
+                        COUNT("clientAmount") AS count_client_amount,
+                        SUM("carrierAmount") AS sum_carrier_amount,
+                        COUNT("carrierAmount") AS count_carrier_amount
+                    FROM bucketed_orders
+                    WHERE %(include_top_carriers)s
+                        AND "carrierId" IS NOT NULL
                         AND "carrierName" IS NOT NULL
-                    GROUP BY "cargoType", "carrierId", "carrierName"
+                    GROUP BY bucket, "cargoType", "carrierId", "carrierName"
+                ),
+                top_carriers AS (
+                    SELECT
+                        w.days,
+                        c."cargoType",
+                        c."carrierId",
+                        c."carrierName",
+                        SUM(c.order_count) AS order_count,
+                        SUM(c.sum_client_price_per_km) / NULLIF(SUM(c.count_client_price_per_km), 0) AS avg_client_price_per_km,
+                        SUM(c.sum_carrier_price_per_km) / NULLIF(SUM(c.count_carrier_price_per_km), 0) AS avg_carrier_price_per_km,
+                        SUM(c.sum_client_amount) / NULLIF(SUM(c.count_client_amount), 0) AS avg_client_amount,
+                        SUM(c.sum_carrier_amount) / NULLIF(SUM(c.count_carrier_amount), 0) AS avg_carrier_amount,
+                        ROW_NUMBER() OVER (PARTITION BY w.days, c."cargoType" ORDER BY SUM(c.order_count) DESC) AS rn
+                    FROM windows w
+                    JOIN bucket_carriers c ON c.bucket <= w.days
+                    GROUP BY w.days, c."cargoType", c."carrierId", c."carrierName"
                 )
                 SELECT
-                    (SELECT json_agg(t) FROM aggregated_data t) AS aggregated,
+                    (SELECT json_agg(t) FROM (
+                        SELECT a.*, m.median_client_price_per_km, m.median_carrier_price_per_km
+                        FROM aggregated_data a
+                        LEFT JOIN window_medians m USING (days, "cargoType")
+                    ) t) AS aggregated,
                     (SELECT json_agg(o) FROM outliers o) AS outliers,
-                    (SELECT json_agg(c) FROM top_carriers c WHERE c.rn <= 4) AS top_carriers;
+                    (SELECT json_agg(c) FROM top_carriers c WHERE %(include_top_carriers)s AND c.rn <= 4) AS top_carriers;
             """
-            
-            query_start = time.time()
-            cur.execute(query, {
-                'start_code': start_region_code,
-                'end_code': end_region_code,
-                'days': days,
-                'threshold': OUTLIER_THRESHOLD
-            })
-            result = cur.fetchone()
-            logger.info(f"⏱️ Zapytanie SQL (historical {days}d): {(time.time() - query_start)*1000:.0f}ms")
-            
+
+            def run_query(start_code: str, end_code: str, label: str):
+                """
+                Jedno zapytanie na trasę - percentyle ze szkiców pobierane przed nim decydują,
+                dla których grup (okno, typ ładunku) mediana liczona jest w SQL (PERCENTILE_CONT)
+                """
+                percentiles = get_lane_percentiles(conn, 'main', 'historical', start_code, end_code, windows)
+                sketch_groups = _sketch_covered_groups(percentiles, cargo_types)
+                query_start = time.time()
+                execute_within_deadline(cur, query_template, {
+                    'start_code': start_code,
+                    'end_code': end_code,
+                    'windows': list(windows),
+                    'max_days': max_days,
+                    'threshold': OUTLIER_THRESHOLD,
+                    'cargo_types': list(cargo_types),
+                    'sketch_groups': sketch_groups,
+                    'include_top_carriers': include_top_carriers
+                }, main_db_breaker)
+                row = cur.fetchone()
+                logger.info(f"⏱️ Zapytanie SQL {label}(historical {windows}d, "
+                            f"mediana ze szkiców: {len(sketch_groups)} grup): {(time.time() - query_start)*1000:.0f}ms")
+                return row, percentiles, set(sketch_groups)
+
+            # Percentyle stawek ze scalonych dziennych szkiców - gdy są, mediana grupy nie jest liczona w SQL
+            result, percentiles, sketch_groups = run_query(start_region_code, end_region_code, '')
+
             # Logowanie outlierów
             if result and result['outliers']:
                 outliers = result['outliers']
@@ -988,21 +1885,23 @@ def get_historical_orders_pricing(start_region_code: str, end_region_code: str,
                     logger.warning(f"   #{idx} Data: {outlier['orderDate']}, "
                                  f"Client: {outlier['clientPricePerKm']} EUR/km, "
                                  f"Carrier: {outlier['carrierPricePerKm']} EUR/km")
-            
+
+            empty_result = {days: None for days in windows}
+
             # Przetwarzanie zagregowanych danych
             if not result or not result['aggregated']:
                 # BRAK DOKŁADNEGO DOPASOWANIA - spróbuj fuzzy matching
                 logger.info(f"ℹ️ Brak dokładnego dopasowania dla {start_region_code}->{end_region_code}, próbuję fuzzy matching...")
-                
+
                 fuzzy_match = find_nearest_historical_route(start_region_code, end_region_code, conn)
-                
+
                 if not fuzzy_match:
                     logger.info("ℹ️ Fuzzy matching nie znalazł dopasowania")
-                    return None
-                
+                    return empty_result
+
                 # Znaleziono fuzzy match - pobierz dane dla dopasowanej trasy
                 logger.info(f"🎯 Używam fuzzy match: {fuzzy_match['matched_start']}->{fuzzy_match['matched_end']}")
-                
+
                 # Aktualizuj metadata
                 match_metadata = {
                     'matched_start': fuzzy_match['matched_start'],
@@ -1011,36 +1910,27 @@ def get_historical_orders_pricing(start_region_code: str, end_region_code: str,
                     'start_distance_km': round(fuzzy_match['start_distance'], 2),
                     'end_distance_km': round(fuzzy_match['end_distance'], 2)
                 }
-                
-                # Wykonaj zapytanie ponownie z dopasowanymi kodami
-                query_start = time.time()
-                cur.execute(query, {
-                    'start_code': fuzzy_match['matched_start'],
-                    'end_code': fuzzy_match['matched_end'],
-                    'days': days,
-                    'threshold': OUTLIER_THRESHOLD
-                })
-                result = cur.fetchone()
-                logger.info(f"⏱️ Zapytanie SQL fuzzy match (historical {days}d): {(time.time() - query_start)*1000:.0f}ms")
-                
+
+                # Wykonaj zapytanie ponownie z dopasowanymi kodami (szkice dopasowanej trasy)
+                result, percentiles, sketch_groups = run_query(
+                    fuzzy_match['matched_start'], fuzzy_match['matched_end'], 'fuzzy match '
+                )
+
                 # Sprawdź czy są dane dla dopasowanej trasy
                 if not result or not result['aggregated']:
                     logger.warning("⚠️ Brak danych nawet dla dopasowanej trasy")
-                    return None
-            
-            # Sprawdź czy są jakiekolwiek dane
-            if not result['aggregated'] or len(result['aggregated']) == 0:
-                return None
-            
-            # Inicjalizacja struktur dla FTL i LTL
-            ftl_data = None
-            ltl_data = None
-            
-            # Przetwarzanie danych zagregowanych według cargoType
+                    return empty_result
+
+            # Inicjalizacja struktur {days: {'FTL': stats, 'LTL': stats}}
+            stats_by_window = {days: {} for days in windows}
+
+            # Przetwarzanie danych zagregowanych według okna i cargoType
             for agg_data in result['aggregated']:
                 cargo_type = agg_data.get('cargoType')
-                
-                stats = {
+                if cargo_type not in cargo_types:
+                    continue
+
+                stats_by_window[agg_data['days']][cargo_type] = {
                     'avg_price_per_km': {
                         'client': float(agg_data['avg_client_price_per_km']) if agg_data.get('avg_client_price_per_km') else None,
                         'carrier': float(agg_data['avg_carrier_price_per_km']) if agg_data.get('avg_carrier_price_per_km') else None
@@ -1059,20 +1949,18 @@ def get_historical_orders_pricing(start_region_code: str, end_region_code: str,
                         'carrier': agg_data.get('carrier_currency', 'EUR')
                     },
                     'total_orders': int(agg_data['total_orders']) if agg_data.get('total_orders') else 0,
-                    'days_with_data': int(agg_data['days_count']) if agg_data.get('days_count') else 0,
-                    'top_carriers': []
+                    'days_with_data': int(agg_data['days_count']) if agg_data.get('days_count') else 0
                 }
-                
-                if cargo_type == 'FTL':
-                    ftl_data = stats
-                elif cargo_type == 'LTL':
-                    ltl_data = stats
-            
-            # Przetwarzanie top przewoźników według cargoType
-            if result.get('top_carriers'):
+                if include_top_carriers:
+                    stats_by_window[agg_data['days']][cargo_type]['top_carriers'] = []
+
+            # Przetwarzanie top przewoźników według okna i cargoType
+            if include_top_carriers and result.get('top_carriers'):
                 for carrier in result['top_carriers']:
-                    cargo_type = carrier.get('cargoType')
-                    carrier_info = {
+                    cargo_data = stats_by_window[carrier['days']].get(carrier.get('cargoType'))
+                    if not cargo_data:
+                        continue
+                    cargo_data['top_carriers'].append({
                         'carrier_id': int(carrier['carrierId']) if carrier.get('carrierId') else None,
                         'carrier_name': carrier.get('carrierName'),
                         'order_count': int(carrier['order_count']) if carrier.get('order_count') else 0,
@@ -1080,123 +1968,1352 @@ def get_historical_orders_pricing(start_region_code: str, end_region_code: str,
                         'avg_carrier_price_per_km': float(carrier['avg_carrier_price_per_km']) if carrier.get('avg_carrier_price_per_km') else None,
                         'avg_client_amount': float(carrier['avg_client_amount']) if carrier.get('avg_client_amount') else None,
                         'avg_carrier_amount': float(carrier['avg_carrier_amount']) if carrier.get('avg_carrier_amount') else None
-                    }
-                    
-                    if cargo_type == 'FTL' and ftl_data:
-                        ftl_data['top_carriers'].append(carrier_info)
-                    elif cargo_type == 'LTL' and ltl_data:
-                        ltl_data['top_carriers'].append(carrier_info)
-            
-            # Zwróć dane tylko jeśli jest FTL lub LTL
-            if not ftl_data and not ltl_data:
-                return None
-            
-            # Pobierz szczegółową listę wszystkich zleceń dla tej trasy
-            orders_list_query = """
-                SELECT
-                    "id",
-                    "orderDate",
-                    "cargoType",
-                    "clientAmount",
-                    "carrierAmount",
-                    "carrierName",
-                    "carrierContact",
-                    "carrierEmail",
-                    "clientPricePerKm",
-                    "carrierPricePerKm",
-                    "routeDistance",
-                    "clientCurrency",
-                    "carrierCurrency"
-                FROM "ZleceniaSpeed"
-                WHERE
-                    "loadingRegionCode" = %(start_code)s
-                    AND "unloadingRegionCode" = %(end_code)s
-                    AND "orderDate" >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
-                    AND "status" = 'Z'
-                    AND "clientPricePerKm" IS NOT NULL
-                    AND "clientPricePerKm" > 0
-                    AND "cargoType" IN ('FTL', 'LTL')
-                    AND ("carrierName" IS NULL OR ("carrierName" NOT ILIKE '%%motiva%%' AND "carrierName" NOT ILIKE '%%ALB LOGISTICS%%'))
-                ORDER BY "orderDate" DESC;
-            """
-            
-            logger.info(f"📋 Pobieranie listy zleceń dla: {match_metadata['matched_start']} -> {match_metadata['matched_end']}")
-            cur.execute(orders_list_query, {
-                'start_code': match_metadata['matched_start'],
-                'end_code': match_metadata['matched_end'],
-                'days': days
-            })
-            orders_raw = cur.fetchall()
-            logger.info(f"📋 Pobrano {len(orders_raw)} zleceń z bazy")
-            
-            # Formatuj listę zleceń
+                    })
+
+            # Zwróć dane tylko jeśli jest FTL lub LTL (w którymkolwiek oknie)
+            if not any(stats_by_window.values()):
+                return empty_result
+
+            # Percentyle stawek ze szkiców; mediana z p50, chyba że policzył ją SQL (grupa bez szkiców)
+            for days, cargo_stats in stats_by_window.items():
+                for cargo_type, cargo_data in cargo_stats.items():
+                    _apply_percentiles(cargo_data, percentiles.get(days), {
+                        'client': f'{cargo_type}_client',
+                        'carrier': f'{cargo_type}_carrier'
+                    }, replace_median=f'{days}:{cargo_type}' in sketch_groups)
+
+            # Pobierz szczegółową listę wszystkich zleceń dla tej trasy (najdłuższe okno) - tylko na życzenie
             orders_list = []
-            for order in orders_raw:
-                orders_list.append({
-                    'order_id': order['id'],
-                    'order_date': order['orderDate'].isoformat() if order['orderDate'] else None,
-                    'cargo_type': order['cargoType'],
-                    'client_amount': float(order['clientAmount']) if order['clientAmount'] else None,
-                    'carrier_amount': float(order['carrierAmount']) if order['carrierAmount'] else None,
-                    'carrier_name': order['carrierName'],
-                    'carrier_contact': order['carrierContact'],
-                    'carrier_email': order['carrierEmail'],
-                    'client_price_per_km': float(order['clientPricePerKm']) if order['clientPricePerKm'] else None,
-                    'carrier_price_per_km': float(order['carrierPricePerKm']) if order['carrierPricePerKm'] else None,
-                    'route_distance': float(order['routeDistance']) if order['routeDistance'] else None,
-                    'client_currency': order['clientCurrency'],
-                    'carrier_currency': order['carrierCurrency']
-                })
+            if include_orders:
+                orders_list = _fetch_historical_orders_list(cur, match_metadata, max_days, cargo_types)
+
+            results_by_window = {}
+            for days, cargo_stats in stats_by_window.items():
+                if not cargo_stats:
+                    results_by_window[days] = None
+                    continue
+
+                result_data = {
+                    'match_info': match_metadata  # Informacja o dopasowaniu
+                }
+                if include_orders:
+                    # Lista zleceń z okna
+                    window_orders = [order for age_days, order in orders_list if age_days is None or age_days <= days]
+                    if orders_format == 'columnar':
+                        result_data['orders_columnar'] = _orders_as_columns(window_orders)
+                    else:
+                        result_data['orders'] = _orders_as_rows(window_orders)
+                    logger.info(f"📋 Zwracam {len(window_orders)} zleceń historycznych ({days}d, {orders_format})")
+                result_data.update(cargo_stats)
+                results_by_window[days] = result_data
+
+            return results_by_window
+
+    except Exception as exc:
+        logger.error(f"❌ Historical orders query error: {exc}", exc_info=True)
+        return {}
+    finally:
+        if conn:
+            main_reader.putconn(conn)
+        logger.info(f"⏱️ CAŁKOWITY CZAS get_historical_orders_pricing ({windows}d): {(time.time() - start_time)*1000:.0f}ms")
+
+
+def _load_postal_code_mapping():
+    """Ładuje mapowanie kodów pocztowych na regiony"""
+    global _POSTAL_CODE_MAPPING
+    
+    if _POSTAL_CODE_MAPPING is not None:
+        return _POSTAL_CODE_MAPPING
+    
+    try:
+        mapping_path = os.path.join(os.path.dirname(__file__), 'data', 'postal_code_to_region_transeu.json')
+        with open(mapping_path, 'rb') as f:
+            raw = f.read()
+        _POSTAL_CODE_MAPPING = json.loads(raw)
+        _MAPPING_VERSIONS['postal_code_to_region'] = hashlib.sha1(raw).hexdigest()[:12]
+        logger.info(f"✅ Loaded postal code mapping ({len(_POSTAL_CODE_MAPPING)} codes)")
+    except Exception as e:
+        logger.error(f"❌ Failed to load postal code mapping: {e}")
+        _POSTAL_CODE_MAPPING = {}
+    
+    return _POSTAL_CODE_MAPPING
+
+def postal_code_to_region_id(postal_code: str) -> Optional[int]:
+    """Konwertuje kod pocztowy (np. PL50) na region ID"""
+    mapping = _load_postal_code_mapping()
+    normalized = postal_code.upper().replace(' ', '').replace('-', '')
+    
+    if normalized in mapping:
+        return mapping[normalized]['region_id']
+    
+    return None
+
+
+def corridor_keys(start_postal: str, end_postal: str) -> Tuple[str, ...]:
+    """
+    Klucze korytarzy trasy dla modelu współczynnika drogi, od najbardziej szczegółowego:
+    para regionów (gdy oba kody są zmapowane), para krajów, globalnie ('*')
+    """
+    keys = []
+    start_region_id = postal_code_to_region_id(start_postal)
+    end_region_id = postal_code_to_region_id(end_postal)
+    if start_region_id is not None and end_region_id is not None:
+        keys.append(f"r{start_region_id}-{end_region_id}")
+    keys.append(f"{start_postal[:2].upper()}-{end_postal[:2].upper()}")
+    keys.append('*')
+    return tuple(keys)
+
+
+def parse_windows(raw_windows) -> Tuple[Optional[List[int]], Optional[str]]:
+    """
+    Waliduje parametr `windows` z requestu
+    
+    Args:
+        raw_windows: Wartość z JSON (lista liczb dni lub None)
+    
+    Returns:
+        Tuple (posortowana lista okien lub None, komunikat błędu lub None)
+    """
+    if raw_windows is None:
+        return None, None
+    
+    if not isinstance(raw_windows, list) or not raw_windows or len(raw_windows) > MAX_WINDOWS:
+        return None, 'Nieprawidłowy parametr windows'
+    
+    windows = set()
+    for value in raw_windows:
+        if isinstance(value, str) and value.endswith('d'):
+            value = value[:-1]
+        try:
+            days = int(value)
+        except (TypeError, ValueError):
+            return None, f'Nieprawidłowe okno: {value}'
+        if isinstance(value, bool) or not 1 <= days <= MAX_WINDOW_DAYS:
+            return None, f'Nieprawidłowe okno: {value}'
+        windows.add(days)
+    
+    return sorted(windows), None
+
+
+def _parse_choice_list(raw, allowed: Tuple[str, ...], name: str, aliases: Optional[Dict[str, str]] = None) -> Tuple[Optional[Tuple[str, ...]], Optional[str]]:
+    """Waliduje listę wartości z dozwolonego zbioru (np. źródła). Zwraca (krotka w kolejności `allowed`, błąd)"""
+    if isinstance(raw, str):
+        raw = [raw]
+    if not isinstance(raw, list) or not raw:
+        return None, f'Nieprawidłowy parametr {name}'
+    
+    selected = set()
+    for value in raw:
+        value = (aliases or {}).get(value, value) if isinstance(value, str) else value
+        if value not in allowed:
+            return None, f'Nieprawidłowa wartość {name}: {value} (dozwolone: {", ".join(allowed)})'
+        selected.add(value)
+    return tuple(value for value in allowed if value in selected), None
+
+
+def parse_projection(data: Dict) -> Tuple[Optional[PricingProjection], Optional[str]]:
+    """
+    Waliduje parametry projekcji z requestu: sources, vehicle_types (lub vehicle_type),
+    cargo_types, include_orders, include_top_carriers, include_distance, orders_format,
+    include_geometry, geometry_tolerance_m
+    
+    Returns:
+        Tuple (projekcja lub None, komunikat błędu lub None)
+    """
+    values = {}
+    raw_vehicle_types = data.get('vehicle_types', data.get('vehicle_type'))
+    for name, raw, allowed, aliases in (
+        ('sources', data.get('sources'), PRICING_SOURCES, None),
+        ('vehicle_types', raw_vehicle_types, VEHICLE_TYPES, VEHICLE_TYPE_ALIASES),
+        ('cargo_types', data.get('cargo_types'), CARGO_TYPES, None)
+    ):
+        if raw is None:
+            continue
+        values[name], error = _parse_choice_list(raw, allowed, name, aliases)
+        if error:
+            return None, error
+    
+    for name in ('include_orders', 'include_top_carriers', 'include_distance', 'include_geometry'):
+        raw = data.get(name)
+        if raw is None:
+            continue
+        if not isinstance(raw, bool):
+            return None, f'Nieprawidłowy parametr {name} (oczekiwano true / false)'
+        values[name] = raw
+    
+    orders_format = data.get('orders_format')
+    if orders_format is not None:
+        if orders_format not in ORDERS_FORMATS:
+            return None, f'Nieprawidłowy parametr orders_format (dozwolone: {", ".join(ORDERS_FORMATS)})'
+        values['orders_format'] = orders_format
+    
+    tolerance = data.get('geometry_tolerance_m')
+    if tolerance is not None:
+        if (isinstance(tolerance, bool) or not isinstance(tolerance, (int, float))
+                or not 0 <= tolerance <= ROUTE_GEOMETRY_MAX_TOLERANCE_M):
+            return None, f'Nieprawidłowy parametr geometry_tolerance_m (liczba 0-{ROUTE_GEOMETRY_MAX_TOLERANCE_M})'
+        values['geometry_tolerance_m'] = float(tolerance)
+    
+    projection = DEFAULT_PROJECTION._replace(**values)
+    if not any(projection.needs(source) for source in PRICING_SOURCES):
+        return None, 'Wybrane źródła nie obsługują wybranych typów pojazdów'
+    return projection, None
+
+
+def _project_vehicle_types(stats: Optional[Dict], vehicle_types: Tuple[str, ...]) -> Optional[Dict]:
+    """Zwraca kopię wyniku giełdy tylko z wybranymi typami pojazdów (w każdej sekcji per typ pojazdu)"""
+    if not stats:
+        return stats
+    projected = {}
+    for key, value in stats.items():
+        if isinstance(value, dict) and value and set(value) <= set(VEHICLE_TYPES):
+            value = {vehicle: item for vehicle, item in value.items() if vehicle in vehicle_types}
+        projected[key] = value
+    return projected
+
+
+def _format_windows(results_by_window: Dict[int, Optional[Dict]]) -> Dict[str, Dict]:
+    """Zamienia {30: wynik} na {'30d': wynik}, pomijając okna bez danych"""
+    return {f'{days}d': result for days, result in sorted(results_by_window.items()) if result}
+
+
+def _no_data_response(start_postal: str, end_postal: str):
+    """Odpowiedź 404 - brak danych cenowych dla trasy"""
+    return jsonify({
+        'success': False,
+        'error': f'Brak danych dla trasy {start_postal} -> {end_postal}',
+        'message': 'Nie znaleziono danych cenowych w bazie dla tej trasy'
+    }), 404
+
+
+def _with_total_price(stats: Dict, route_distance_km: float) -> Dict:
+    """Zwraca kopię statystyk z total_price (dystans × stawka) dla każdej stawki z avg_price_per_km"""
+    if not stats or 'avg_price_per_km' not in stats:
+        return stats
+    
+    total_price = {}
+    for key, rate in stats['avg_price_per_km'].items():
+        if rate is not None:
+            total_price[key] = round(rate * route_distance_km, 2)
+        else:
+            total_price[key] = None
+    return dict(stats, total_price=total_price)
+
+
+def get_pricing_data_version() -> Optional[str]:
+    """Łączna wersja danych obu baz (None jeśli którejkolwiek nie udało się ustalić)"""
+    exchange_version = get_data_version('exchanges')
+    main_version = get_data_version('main')
+    if exchange_version is None or main_version is None:
+        return None
+    return f"{exchange_version}|{main_version}"
+
+
+def get_mapping_versions() -> str:
+    """Wersje (skróty zawartości) załadowanych plików mapowań regionów"""
+    _load_postal_code_mapping()
+    _load_transeu_timocom_mapping()
+    return ','.join(f"{name}:{version}" for name, version in sorted(_MAPPING_VERSIONS.items()))
+
+
+def pricing_etag(cache_key: Tuple, data_version: Optional[str]) -> Optional[str]:
+    """
+    Słaby ETag wyniku wyceny: parametry requestu (klucz cache) + wersja danych obu baz
+    + wersje plików mapowań + wersje macierzy wycen i dystansów.
+    
+    Returns:
+        ETag (bez cudzysłowów) lub None, gdy wersja danych jest nieznana
+    """
+    if data_version is None:
+        return None
+    matrix_built_at = pricing_matrix.meta.get('built_at') if pricing_matrix.maybe_reload() else None
+    distances_built_at = distance_matrix.meta.get('built_at') if distance_matrix.maybe_reload() else None
+    return RedisBackend.digest(
+        (cache_key, data_version, get_mapping_versions(), matrix_built_at, distances_built_at)
+    )[:24]
+
+
+def _fetch_source(
+    label: str,
+    negative_key,
+    last_good_key,
+    fetch,
+    windows: List[int],
+    result_key: Optional[Tuple] = None,
+    stage: Optional[str] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    skipped: Optional[Dict[str, str]] = None
+) -> Tuple[Dict[int, Optional[Dict]], Optional[Dict]]:
+    """
+    Pobiera wynik źródła z uwzględnieniem negative cache, cache wyników per okno
+    i ostatniej dobrej wartości.
+    
+    Args:
+        label: Opis źródła do logów
+        negative_key: Klucz negative cache (None = bez negative cache)
+        last_good_key: Klucz ostatniej dobrej wartości (bez wersji danych)
+        fetch: Funkcja fetch(windows) pobierająca wynik {days: ...} ({} oznacza błąd źródła)
+        windows: Żądane okna (dni)
+        result_key: Prefiks klucza cache wyników per okno, np. (źródło, start_id, end_id, wersja danych)
+            - None = bez cache (np. nieznana wersja danych)
+        stage: Etap admission control dla zapytania (np. 'exchanges') - przy nasyceniu
+            zwracana jest ostatnia dobra wartość, a bez niej rzucane jest Overloaded
+        breaker: Circuit breaker bazy źródła - przy otwartym zwracana jest ostatnia dobra
+            wartość, a bez niej pusty wynik (źródło trafia do `skipped` jako 'circuit_open')
+        skipped: Etapy pominięte w requeście {źródło: powód} - błąd źródła bez ostatniej dobrej
+            wartości jako 'unavailable' (przerwanie przez budżet requestu oznacza wywołujący)
+    
+    Returns:
+        Tuple (wynik {days: ...}, znacznik nieaktualności lub None)
+    """
+    if negative_key is not None and negative_cache.get(negative_key, False):
+        logger.info(f"⚡ Negative cache hit: {label}")
+        return {}, None
+    
+    # Okna policzone już dla tych samych regionów (także przez inne kody pocztowe)
+    cached_by_window = {}
+    if result_key is not None:
+        for days in windows:
+            cached = source_result_cache.get(result_key + (days,))
+            if cached is not MISSING:
+                cached_by_window[days] = cached
+    missing_windows = [days for days in windows if days not in cached_by_window]
+    if not missing_windows:
+        logger.info(f"⚡ Source cache hit: {label}")
+        _remember_if_empty(negative_key, cached_by_window)
+        return cached_by_window, None
+    
+    def fetch_admitted():
+        if breaker is not None:
+            breaker.allow()
+        with admission.stage(stage):
+            started = time.monotonic()
+            fetched = fetch(missing_windows)
+        if breaker is not None:
+            if fetched:
+                breaker.record_success(time.monotonic() - started)
+            elif not _deadline_exhausted():
+                # Zapytanie przerwane przez budżet requestu nie świadczy o awarii bazy
+                breaker.record_failure(f"{label}: błąd / timeout zapytania")
+        return fetched
+    
+    # Równoległe zapytania o to samo źródło / trasę / okna - jedno wykonanie
+    overloaded = circuit_open = None
+    try:
+        fetched_by_window, coalesced = source_flight.do(last_good_key + (tuple(missing_windows),), fetch_admitted)
+    except Overloaded as e:
+        logger.warning(f"⚠️ {label}: {e}")
+        fetched_by_window, coalesced, overloaded = {}, False, e
+    except CircuitOpen as e:
+        logger.warning(f"⚡ {label}: {e} - fallback bez zapytania")
+        fetched_by_window, coalesced, circuit_open = {}, False, e
+    if coalesced:
+        logger.info(f"🔗 Single-flight: {label} (wynik współdzielony)")
+    if fetched_by_window:
+        if result_key is not None:
+            for days, result in fetched_by_window.items():
+                source_result_cache.set(result_key + (days,), result)
+        results_by_window = {**cached_by_window, **fetched_by_window}
+        _remember_if_empty(negative_key, results_by_window)
+        last_good_cache.set(last_good_key, (results_by_window, time.time()))
+        return results_by_window, None
+    
+    # Błąd / timeout źródła - zwróć ostatnią dobrą wartość z oznaczeniem nieaktualności
+    last_good = last_good_cache.get(last_good_key, None)
+    if last_good is None:
+        if overloaded is not None:
+            raise overloaded
+        if skipped is not None:
+            if circuit_open is not None:
+                skipped[last_good_key[0]] = 'circuit_open'
+            elif not _deadline_exhausted():
+                # Błąd bazy, a nie brak danych trasy - bez negative cache, odpowiedź 503 zamiast 404
+                skipped[last_good_key[0]] = 'unavailable'
+        return {}, None
+    
+    results_by_window, stored_at = last_good
+    age = time.time() - stored_at
+    logger.warning(f"⚠️ {label}: błąd źródła - zwracam ostatnią dobrą wartość sprzed {age:.0f}s")
+    return results_by_window, {'stale': True, 'age_seconds': round(age)}
+
+
+def _deadline_exhausted() -> bool:
+    """Czy budżet requestu (jeśli aktywny) nie wystarcza już na kolejny etap"""
+    deadline = current_deadline()
+    return deadline is not None and deadline.remaining() < DEADLINE_MIN_STAGE_SECONDS
+
+
+def _out_of_budget(stage: str, skipped: Dict[str, str]) -> bool:
+    """Czy budżet requestu nie wystarcza już na etap (pominięty etap trafia do `skipped`)"""
+    if not _deadline_exhausted():
+        return False
+    logger.warning(f"⏳ Deadline: etap {stage} bez budżetu (pozostało {current_deadline().remaining()*1000:.0f}ms)")
+    skipped.setdefault(stage, 'deadline')
+    return True
+
+
+def _routing_call(call, skipped: Optional[Dict[str, str]] = None):
+    """
+    Wywołanie silnika tras przez breaker `aws_routes` i etap 'aws' admission control.
+    
+    Timeout to adaptacyjny timeout breakera, ograniczony częścią pozostałego budżetu
+    requestu (DEADLINE_AWS_SHARE); bez budżetu, przy otwartym breakerze lub nasyceniu
+    etapu wywołanie jest pomijane.
+    
+    Args:
+        call: Funkcja call(timeout) zwracająca wynik lub None (błąd / timeout)
+        skipped: Etapy pominięte w requeście {etap: powód} (uzupełniane o 'aws')
+    
+    Returns:
+        Wynik wywołania lub None (pominięte / brak wyniku)
+    """
+    started = time.time()
+    breaker_timeout = aws_breaker.timeout()
+    timeout = min(breaker_timeout, stage_budget(AWS_TIMEOUT_SECONDS, share=DEADLINE_AWS_SHARE))
+    if timeout < DEADLINE_MIN_STAGE_SECONDS:
+        logger.warning(f"⏳ Deadline: pomijam AWS (budżet {timeout*1000:.0f}ms)")
+        if skipped is not None:
+            skipped['aws'] = 'deadline'
+        return None
+    try:
+        aws_breaker.allow()
+        with admission.try_stage('aws'):
+            result = call(timeout)
+        elapsed = time.time() - started
+        if result:
+            aws_breaker.record_success(elapsed)
+        elif timeout >= breaker_timeout or elapsed < timeout:
+            # Timeout skrócony przez budżet requestu nie świadczy o awarii AWS
+            aws_breaker.record_failure('brak wyniku AWS (błąd / timeout)')
+        return result
+    except CircuitOpen as e:
+        logger.warning(f"⚡ {e}")
+        if skipped is not None:
+            skipped['aws'] = 'circuit_open'
+    except Overloaded as e:
+        logger.warning(f"⚠️ {e}")
+    return None
+
+
+def geocode_postal_codes(
+    codes: Sequence[str],
+    skipped: Optional[Dict[str, str]] = None,
+    stage: str = 'distance'
+) -> Optional[Dict[str, Optional[Tuple[float, float]]]]:
+    """
+    Współrzędne kodów pocztowych z bazy zleceń przez breaker `main_db` - pobranie
+    połączenia i zapytania geocodingu liczą się do breakera jak zapytania wycen.
+    
+    Args:
+        codes: Kody pocztowe (powtórzenia pytane raz)
+        skipped: Etapy pominięte w requeście {etap: powód}
+        stage: Etap wpisywany do `skipped` przy otwartym breakerze / błędzie bazy
+    
+    Returns:
+        {kod: (lat, lng) lub None (nie znaleziono)} lub None (breaker otwarty / błąd bazy)
+    """
+    try:
+        main_db_breaker.allow()
+    except CircuitOpen as e:
+        logger.warning(f"⚡ {e} - pomijam geocoding ({stage})")
+        if skipped is not None:
+            skipped[stage] = 'circuit_open'
+        return None
+    
+    started = time.monotonic()
+    conn_main = None
+    try:
+        conn_main = main_reader.getconn()
+        coords = {code: get_postal_code_coordinates(code, conn_main, raise_errors=True) for code in dict.fromkeys(codes)}
+    except Exception as e:
+        logger.error(f"❌ Geocoding error ({stage}): {e}")
+        if _deadline_exhausted():
+            # Zapytanie przerwane przez budżet requestu nie świadczy o awarii bazy
+            if skipped is not None:
+                skipped.setdefault(stage, 'deadline')
+        else:
+            main_db_breaker.record_failure(f"geocoding: {e}")
+            if skipped is not None:
+                skipped[stage] = 'unavailable'
+        return None
+    finally:
+        if conn_main is not None:
+            main_reader.putconn(conn_main)
+    main_db_breaker.record_success(time.monotonic() - started)
+    return coords
+
+
+def compute_route_distance(
+    start_postal: str,
+    end_postal: str,
+    skipped: Optional[Dict[str, str]] = None
+) -> Tuple[Optional[float], Optional[str], float, float]:
+    """
+    Oblicza dystans drogowy dla ciężarówek (AWS Location Service lub lokalny silnik
+    tras - ROUTING_ENGINE; fallback Haversine × współczynnik drogi korytarza
+    z `road_factors`, domyślnie 1.3).
+    
+    Timeout AWS to adaptacyjny timeout breakera `aws_routes`, ograniczony częścią
+    pozostałego budżetu requestu (DEADLINE_AWS_SHARE); gdy budżet nie wystarcza
+    lub breaker jest otwarty, AWS jest pomijany na rzecz Haversine. Trasy zaufanych
+    korytarzy (poza częścią ROAD_FACTOR_VERIFY_RATE) są liczone modelem bez AWS.
+    
+    Args:
+        start_postal: Kod pocztowy startu
+        end_postal: Kod pocztowy celu
+        skipped: Etapy pominięte w requeście {etap: powód} (uzupełniane o 'aws')
+    
+    Returns:
+        Tuple (dystans km lub None, metoda lub None, czas geocodingu ms, czas AWS ms)
+    """
+    route_distance_km = None
+    distance_method = None
+    geocoding_time = 0
+    aws_time = 0
+    
+    # Dystans AWS policzony wcześniej (także przez route-matrix) - bez geocodingu i AWS
+    cached_distance = distance_cache.get((start_postal, end_postal))
+    if cached_distance is not MISSING:
+        logger.info(f"⚡ Distance cache hit: {start_postal} -> {end_postal} ({cached_distance} km)")
+        return cached_distance, ROUTE_METHOD, geocoding_time, aws_time
+    
+    # Dystans z macierzy dystansów (build_distance_matrix.py) - odczyt komórki mmap
+    matrix_distance = get_precomputed_distance(start_postal, end_postal)
+    if matrix_distance is not None:
+        logger.info(f"⚡ Distance matrix hit: {start_postal} -> {end_postal} ({matrix_distance} km)")
+        return matrix_distance, 'distance_matrix', geocoding_time, aws_time
+    
+    # Współrzędne kodów pocztowych (przy otwartym breakerze bazy zleceń - bez czekania na timeout)
+    geocoding_start = time.time()
+    coords = geocode_postal_codes((start_postal, end_postal), skipped, 'distance')
+    if coords is None:
+        return route_distance_km, distance_method, geocoding_time, aws_time
+    start_coords, end_coords = coords[start_postal], coords[end_postal]
+    geocoding_time = (time.time() - geocoding_start) * 1000
+    logger.info(f"⏱️ Geocoding: {geocoding_time:.0f}ms")
+    
+    if not start_coords or not end_coords:
+        logger.warning(f"⚠️ Could not get coordinates for distance calculation")
+        return route_distance_km, distance_method, geocoding_time, aws_time
+    
+    logger.info(f"📍 Coordinates: Start {start_postal} ({start_coords[0]:.5f}, {start_coords[1]:.5f}), End {end_postal} ({end_coords[0]:.5f}, {end_coords[1]:.5f})")
+    
+    haversine_dist = haversine_distance(start_coords[0], start_coords[1], end_coords[0], end_coords[1])
+    keys = corridor_keys(start_postal, end_postal)
+    estimate = road_factors.estimate(keys, haversine_dist)
+    # Zaufany korytarz regionów / krajów - dystans z modelu bez wywołania AWS
+    # (globalny współczynnik '*' nie wystarcza - nie zna objazdów i promów konkretnych tras)
+    if (ROUTING_ENGINE == 'aws' and estimate['trusted'] and estimate['corridor'] != '*'
+            and random.random() >= ROAD_FACTOR_VERIFY_RATE):
+        logger.info(f"📐 Road factor {estimate['factor']} ({estimate['corridor']}, p90 error "
+                    f"{estimate['error_p90']:.1%}): {estimate['distance_km']} km without AWS")
+        return estimate['distance_km'], 'road_factor_model', geocoding_time, aws_time
+    
+    # Wywołaj silnik tras - AWS lub lokalny (przy nasyceniu etapu 'aws', otwartym breakerze
+    # lub braku budżetu od razu fallback Haversine)
+    aws_start = time.time()
+    route_distance = get_local_route_distance if ROUTING_ENGINE == 'local' else get_aws_route_distance
+    aws_result = _routing_call(
+        lambda timeout: route_distance(
+            start_lat=start_coords[0],
+            start_lng=start_coords[1],
+            end_lat=end_coords[0],
+            end_lng=end_coords[1],
+            return_geometry=False,
+            timeout=timeout
+        ),
+        skipped
+    )
+    aws_time = (time.time() - aws_start) * 1000
+    if aws_result:
+        route_distance_km = aws_result['distance']
+        distance_method = ROUTE_METHOD
+        distance_cache.set((start_postal, end_postal), route_distance_km)
+        road_factors.observe((start_postal, end_postal), keys, haversine_dist, route_distance_km)
+        logger.info(f"⏱️ AWS Route Distance: {route_distance_km} km ({aws_time:.0f}ms)")
+    else:
+        # Fallback do Haversine × współczynnik drogi korytarza
+        route_distance_km = estimate['distance_km']
+        distance_method = 'haversine_fallback'
+        logger.info(f"⚠️ AWS failed ({aws_time:.0f}ms), using Haversine fallback: {route_distance_km} km "
+                    f"(factor {estimate['factor']}, {estimate['corridor'] or 'default'})")
+        aws_time = 0  # Reset for summary
+    
+    return route_distance_km, distance_method, geocoding_time, aws_time
+
+
+def prefetch_route_distances(pairs: List[Tuple[str, str]], timeout: float = 60) -> Dict[str, int]:
+    """
+    Dystanse AWS dla wielu par kodów pocztowych zapytaniami route-matrix (porcje
+    równolegle, ROUTE_MATRIX_WORKERS) - wyniki trafiają do distance_cache, więc
+    późniejsze wyceny tych tras nie wołają AWS.
+    
+    Liczona jest pełna macierz unikalnych startów x celów par bez dystansu w cache i w macierzy
+    (dodatkowe komórki też trafiają do cache i do modelu współczynnika drogi).
+    
+    Args:
+        pairs: Pary (kod startu, kod celu)
+        timeout: Łączny czas na zapytania route-matrix (s)
+    
+    Returns:
+        Statystyki: requested / cached / fetched / failed
+    """
+    unique_pairs = list(dict.fromkeys(pairs))
+    missing = [
+        pair for pair in unique_pairs
+        if distance_cache.get(pair) is MISSING and get_precomputed_distance(*pair) is None
+    ]
+    stats = {'requested': len(unique_pairs), 'cached': len(unique_pairs) - len(missing), 'fetched': 0, 'failed': 0}
+    if not missing:
+        return stats
+    coords = geocode_postal_codes([code for pair in missing for code in pair]) if aws_breaker.available else None
+    if coords is None:
+        stats['failed'] = len(missing)
+        return stats
+    
+    origins = [code for code in dict.fromkeys(start for start, _ in missing) if coords[code]]
+    destinations = [code for code in dict.fromkeys(end for _, end in missing) if coords[code]]
+    route_matrix = local_route_matrix if ROUTING_ENGINE == 'local' else calculate_route_matrix
+    matrix = route_matrix(
+        [coords[code] for code in origins], [coords[code] for code in destinations],
+        max_workers=ROUTE_MATRIX_WORKERS, timeout=timeout
+    )
+    for origin, row in zip(origins, matrix):
+        for destination, cell in zip(destinations, row):
+            if cell is not None:
+                distance_cache.set((origin, destination), cell['distance'])
+                road_factors.observe(
+                    (origin, destination), corridor_keys(origin, destination),
+                    haversine_distance(*coords[origin], *coords[destination]), cell['distance']
+                )
+    
+    stats['fetched'] = sum(1 for pair in missing if distance_cache.get(pair) is not MISSING)
+    stats['failed'] = len(missing) - stats['fetched']
+    logger.info(f"🧮 Route matrix prefetch: {stats}")
+    return stats
+
+
+def compute_leg_distances(
+    stops: List[str],
+    skipped: Optional[Dict[str, str]] = None
+) -> List[Optional[Tuple[float, str]]]:
+    """
+    Dystanse drogowe kolejnych odcinków trasy wielopunktowej.
+    
+    Odcinki z distance_cache lub macierzy dystansów nie wymagają wywołań; jeśli
+    brakuje któregokolwiek, cała trasa liczona jest jednym wywołaniem silnika tras
+    z punktami pośrednimi (Waypoints). Brakujące odcinki bez wyniku dostają
+    Haversine × współczynnik drogi korytarza.
+    
+    Args:
+        stops: Kody pocztowe przystanków w kolejności przejazdu (min. 2)
+        skipped: Etapy pominięte w requeście {etap: powód}
+    
+    Returns:
+        Lista (dystans km, metoda) per odcinek lub None (brak współrzędnych)
+    """
+    legs = list(zip(stops, stops[1:]))
+    distances: List[Optional[Tuple[float, str]]] = []
+    for start_postal, end_postal in legs:
+        cached_distance = distance_cache.get((start_postal, end_postal))
+        if cached_distance is not MISSING:
+            distances.append((cached_distance, ROUTE_METHOD))
+            continue
+        matrix_distance = get_precomputed_distance(start_postal, end_postal)
+        distances.append((matrix_distance, 'distance_matrix') if matrix_distance is not None else None)
+    
+    missing = [index for index, distance in enumerate(distances) if distance is None]
+    if not missing:
+        logger.info(f"⚡ Leg distances from cache / matrix: {' -> '.join(stops)}")
+        return distances
+    
+    coords = geocode_postal_codes(stops, skipped, 'distance')
+    if coords is None:
+        return distances
+    if not all(coords.values()):
+        logger.warning(f"⚠️ Could not get coordinates for: {', '.join(code for code, point in coords.items() if not point)}")
+        return distances
+    
+    # Jedno wywołanie dla całej trasy (także odcinków z cache - Waypoints wymagają ciągłości)
+    aws_start = time.time()
+    route_legs = get_local_route_legs if ROUTING_ENGINE == 'local' else get_aws_route_legs
+    routed = _routing_call(lambda timeout: route_legs([coords[code] for code in stops], timeout=timeout), skipped)
+    aws_time = (time.time() - aws_start) * 1000
+    for index in missing:
+        start_postal, end_postal = legs[index]
+        haversine_dist = haversine_distance(*coords[start_postal], *coords[end_postal])
+        keys = corridor_keys(start_postal, end_postal)
+        if routed:
+            distance_km = routed[index]['distance']
+            distances[index] = (distance_km, ROUTE_METHOD)
+            distance_cache.set((start_postal, end_postal), distance_km)
+            road_factors.observe((start_postal, end_postal), keys, haversine_dist, distance_km)
+        else:
+            distances[index] = (road_factors.estimate(keys, haversine_dist)['distance_km'], 'haversine_fallback')
+    logger.info(f"⏱️ Leg distances ({len(legs)} legs, {len(missing)} computed, "
+                f"{'route call' if routed else 'Haversine fallback'}): {aws_time:.0f}ms")
+    return distances
+
+
+def compute_route_geometry(
+    start_postal: str,
+    end_postal: str,
+    tolerance_m: Optional[float] = None,
+    skipped: Optional[Dict[str, str]] = None
+) -> Optional[Dict]:
+    """
+    Geometria trasy jako polyline (uproszczona algorytmem Douglasa-Peuckera) i czas przejazdu.
+    
+    Geometria pary kodów trafia do geometry_cache z tolerancją ROUTE_GEOMETRY_MIN_TOLERANCE_M,
+    a większe tolerancje są liczone z wpisu cache - mapy tras nie wołają silnika tras
+    ponownie. Wywołanie silnika zasila też distance_cache (dystans zgodny z geometrią).
+    
+    Args:
+        start_postal: Kod pocztowy startu
+        end_postal: Kod pocztowy celu
+        tolerance_m: Tolerancja uproszczenia w metrach (None = ROUTE_GEOMETRY_TOLERANCE_M)
+        skipped: Etapy pominięte w requeście {etap: powód}
+    
+    Returns:
+        {'polyline', 'precision', 'points', 'tolerance_m', 'duration_s', 'distance_km'} lub None
+    """
+    lane = (start_postal, end_postal)
+    cached = geometry_cache.get(lane)
+    if cached is MISSING:
+        coords = geocode_postal_codes((start_postal, end_postal), skipped, 'geometry')
+        if coords is None:
+            return None
+        start_coords, end_coords = coords[start_postal], coords[end_postal]
+        if not start_coords or not end_coords:
+            logger.warning(f"⚠️ Could not get coordinates for route geometry")
+            return None
+        
+        geometry_start = time.time()
+        route_distance = get_local_route_distance if ROUTING_ENGINE == 'local' else get_aws_route_distance
+        result = _routing_call(
+            lambda timeout: route_distance(
+                start_lat=start_coords[0],
+                start_lng=start_coords[1],
+                end_lat=end_coords[0],
+                end_lng=end_coords[1],
+                return_geometry=True,
+                timeout=timeout
+            ),
+            skipped
+        )
+        if not result or not result.get('geometry'):
+            return None
+        # Silniki tras zwracają [lng, lat], polyline koduje (lat, lng)
+        points = simplify_path([(lat, lng) for lng, lat in result['geometry']], ROUTE_GEOMETRY_MIN_TOLERANCE_M)
+        cached = {
+            'polyline': encode_polyline(points, ROUTE_GEOMETRY_PRECISION),
+            'points': len(points),
+            'duration_s': result.get('duration'),
+            'distance_km': result['distance']
+        }
+        geometry_cache.set(lane, cached)
+        distance_cache.set(lane, result['distance'])
+        road_factors.observe(lane, corridor_keys(start_postal, end_postal),
+                             haversine_distance(*start_coords, *end_coords), result['distance'])
+        logger.info(f"🗺️ Route geometry: {len(result['geometry'])} -> {len(points)} points, "
+                    f"{len(cached['polyline'])} B ({(time.time() - geometry_start) * 1000:.0f}ms)")
+    
+    tolerance_m = max(ROUTE_GEOMETRY_MIN_TOLERANCE_M,
+                      ROUTE_GEOMETRY_TOLERANCE_M if tolerance_m is None else tolerance_m)
+    polyline, points = cached['polyline'], cached['points']
+    if tolerance_m > ROUTE_GEOMETRY_MIN_TOLERANCE_M:
+        simplified = simplify_path(decode_polyline(polyline, ROUTE_GEOMETRY_PRECISION), tolerance_m)
+        polyline, points = encode_polyline(simplified, ROUTE_GEOMETRY_PRECISION), len(simplified)
+    return {
+        'polyline': polyline,
+        'precision': ROUTE_GEOMETRY_PRECISION,
+        'points': points,
+        'tolerance_m': tolerance_m,
+        'duration_s': cached['duration_s'],
+        'distance_km': cached['distance_km']
+    }
+
+
+def compute_route_pricing(
+    start_postal: str,
+    end_postal: str,
+    start_region_id: int,
+    end_region_id: int,
+    exchange_windows: List[int],
+    historical_windows: List[int],
+    projection: PricingProjection = DEFAULT_PROJECTION,
+    route_distance: Optional[Tuple[float, str]] = None
+) -> Optional[Dict]:
+    """
+    Wykonuje pełny pipeline wyceny trasy: dystans (AWS / Haversine), TimoCom,
+    Trans.eu i zlecenia historyczne. Nie zależy od kontekstu requestu Flask,
+    więc może być wywołany również w tle (odświeżanie cache).
+    
+    Źródła, zapytania i wywołania AWS spoza projekcji są pomijane. Przy aktywnym
+    deadline (budżet requestu) etapy bez budżetu są pomijane, a wynik zawiera
+    sekcję `partial` z listą pominiętych etapów.
+    
+    Args:
+        route_distance: Dystans (km, metoda) policzony wcześniej, np. odcinek trasy
+            wielopunktowej - bez geocodingu i wywołania silnika tras
+    
+    Returns:
+        Dane odpowiedzi (sekcja `data`) lub None jeśli brak danych dla trasy
+    
+    Raises:
+        DeadlineExceeded: Budżet wyczerpany, zanim którekolwiek źródło zwróciło dane
+    """
+    request_start = time.time()
+    
+    # Negative cache - trasa bez danych w żadnym źródle (przed geocodingiem, AWS i zapytaniami)
+    exchange_version = get_data_version('exchanges')
+    main_version = get_data_version('main')
+    lane_key = None
+    if exchange_version is not None and main_version is not None:
+        lane_key = ('lane', start_postal, end_postal, tuple(exchange_windows), tuple(historical_windows),
+                    tuple(projection), exchange_version, main_version)
+        if negative_cache.get(lane_key, False):
+            logger.info(f"⚡ Negative cache hit: {start_postal} -> {end_postal} (brak danych)")
+            return None
+    
+    # NOWE: Oblicz rzeczywisty dystans drogowy dla ciężarówek używając AWS Location Service
+    # (pomijany, gdy projekcja nie potrzebuje dystansu ani cen całkowitych)
+    route_distance_km = distance_method = None
+    geocoding_time = aws_time = 0
+    skipped_stages = {}  # Etapy pominięte w requeście: {etap: 'deadline' / 'circuit_open' / 'unavailable'}
+    # Geometria przed dystansem - jej wywołanie silnika tras zasila distance_cache
+    route_geometry = None
+    if projection.include_geometry and not _out_of_budget('geometry', skipped_stages):
+        route_geometry = compute_route_geometry(start_postal, end_postal, projection.geometry_tolerance_m, skipped_stages)
+        if route_geometry is None:
+            # Wynik bez żądanej geometrii jest częściowy - nie trafia do cache odpowiedzi
+            skipped_stages.setdefault('geometry', 'unavailable')
+    if projection.include_distance and route_distance is not None:
+        route_distance_km, distance_method = route_distance
+    elif projection.include_distance and not _out_of_budget('distance', skipped_stages):
+        route_distance_km, distance_method, geocoding_time, aws_time = compute_route_distance(
+            start_postal, end_postal, skipped_stages
+        )
+    
+    # OPTYMALIZACJA: Wszystkie okna danego źródła liczone jednym zapytaniem
+    # Klucze negative cache per źródło (None = wersja danych nieznana, bez cache)
+    timocom_lane = (map_transeu_to_timocom_id(start_region_id), map_transeu_to_timocom_id(end_region_id), tuple(exchange_windows))
+    transeu_lane = (start_region_id, end_region_id, tuple(exchange_windows))
+    historical_lane = (start_postal, end_postal, tuple(historical_windows),
+                       projection.cargo_types, projection.include_orders, projection.include_top_carriers,
+                       projection.orders_format)
+    timocom_key = transeu_key = historical_key = None
+    timocom_result_key = transeu_result_key = None
+    if exchange_version is not None:
+        timocom_key = ('timocom',) + timocom_lane + (exchange_version,)
+        transeu_key = ('transeu',) + transeu_lane + (exchange_version,)
+        # Cache wyników per okno - klucz bez kodów pocztowych (wspólny dla regionu)
+        timocom_result_key = ('timocom',) + timocom_lane[:2] + (exchange_version,)
+        transeu_result_key = ('transeu',) + transeu_lane[:2] + (exchange_version,)
+    if main_version is not None:
+        historical_key = ('historical',) + historical_lane + (main_version,)
+    stale_sources = {}
+    timocom_by_window = transeu_by_window = historical_by_window = {}
+    timocom_time = transeu_time = historical_time = 0
+    
+    # Macierz wycen par regionów - giełdy bez zapytań do Postgres
+    matrix_start = time.time()
+    matrix_result = None
+    if projection.needs('timocom') or projection.needs('transeu'):
+        matrix_result = get_exchange_pricing_from_matrix(start_region_id, end_region_id, exchange_windows)
+    if matrix_result is not None:
+        timocom_by_window, transeu_by_window = matrix_result
+        _remember_if_empty(timocom_key, timocom_by_window)
+        _remember_if_empty(transeu_key, transeu_by_window)
+        timocom_time = transeu_time = (time.time() - matrix_start) * 1000
+        logger.info(f"⚡ Giełdy z macierzy wycen {exchange_windows}d: {timocom_time:.1f}ms")
+    else:
+        if projection.needs('timocom') and not _out_of_budget('timocom', skipped_stages):
+            timocom_start = time.time()
+            timocom_by_window, stale_sources['timocom'] = _fetch_source(
+                f"TimoCom {start_region_id} -> {end_region_id}", timocom_key, ('timocom',) + timocom_lane,
+                lambda windows: get_timocom_pricing_windows(start_region_id, end_region_id, windows),
+                exchange_windows, timocom_result_key, stage='exchanges',
+                breaker=exchanges_db_breaker, skipped=skipped_stages
+            )
+            timocom_time = (time.time() - timocom_start) * 1000
+            if not timocom_by_window:
+                _out_of_budget('timocom', skipped_stages)  # zapytanie przerwane przez statement_timeout z budżetu
+            logger.info(f"⏱️ Zapytanie TimoCom {exchange_windows}d: {timocom_time:.0f}ms")
+        
+        if projection.needs('transeu') and not _out_of_budget('transeu', skipped_stages):
+            transeu_start = time.time()
+            transeu_by_window, stale_sources['transeu'] = _fetch_source(
+                f"Trans.eu {start_region_id} -> {end_region_id}", transeu_key, ('transeu',) + transeu_lane,
+                lambda windows: get_transeu_pricing_windows(start_region_id, end_region_id, windows),
+                exchange_windows, transeu_result_key, stage='exchanges',
+                breaker=exchanges_db_breaker, skipped=skipped_stages
+            )
+            transeu_time = (time.time() - transeu_start) * 1000
+            if not transeu_by_window:
+                _out_of_budget('transeu', skipped_stages)  # zapytanie przerwane przez statement_timeout z budżetu
+            logger.info(f"⏱️ Zapytanie Trans.eu {exchange_windows}d: {transeu_time:.0f}ms")
+    
+    # NOWE: Pobierz statystyki z zleceń historycznych (domyślnie ostatnie 6 miesięcy)
+    # Bez cache per okno - fuzzy matching zależy od całego zestawu okien
+    if projection.needs('historical') and not _out_of_budget('historical', skipped_stages):
+        logger.info(f"📊 Calling get_historical_orders_pricing({start_postal}, {end_postal}, {historical_windows})")
+        historical_start = time.time()
+        historical_by_window, stale_sources['historical'] = _fetch_source(
+            f"Historical {start_postal} -> {end_postal}", historical_key, ('historical',) + historical_lane,
+            lambda windows: get_historical_orders_pricing_windows(
+                start_postal, end_postal, windows,
+                cargo_types=projection.cargo_types,
+                include_orders=projection.include_orders,
+                include_top_carriers=projection.include_top_carriers,
+                orders_format=projection.orders_format
+            ),
+            historical_windows, stage='historical', breaker=main_db_breaker, skipped=skipped_stages
+        )
+        historical_time = (time.time() - historical_start) * 1000
+        if not historical_by_window:
+            _out_of_budget('historical', skipped_stages)
+        logger.info(f"⏱️ Zapytanie Historical Orders {historical_windows}d: {historical_time:.0f}ms")
+    
+    timocom_pricing = _format_windows(timocom_by_window) if projection.needs('timocom') else {}
+    transeu_pricing = _format_windows(transeu_by_window) if projection.needs('transeu') else {}
+    historical_pricing = _format_windows(historical_by_window)
+    
+    # Sprawdź czy są jakiekolwiek dane
+    if not timocom_pricing and not transeu_pricing and not historical_pricing:
+        skipped_sources = [source for source in ('timocom', 'transeu', 'historical') if source in skipped_stages]
+        if skipped_sources:
+            # Brak danych wynika z pominiętych źródeł, a nie z samej trasy
+            if 'deadline' in (skipped_stages[source] for source in skipped_sources):
+                raise DeadlineExceeded(skipped_sources[0])
+            breaker = main_db_breaker if skipped_sources[0] == 'historical' else exchanges_db_breaker
+            raise CircuitOpen(breaker.name, CIRCUIT_RESET_SECONDS)
+        logger.info(f"ℹ️ No data found for route: {start_postal} -> {end_postal}")
+        # Cache'ujemy tylko jeśli wszystkie wybrane źródła potwierdziły brak danych (a nie zwróciły błędu)
+        if lane_key is not None and all(
+            key is not None and negative_cache.get(key, False)
+            for source, key in (('timocom', timocom_key), ('transeu', transeu_key), ('historical', historical_key))
+            if projection.needs(source)
+        ):
+            negative_cache.set(lane_key, True)
+        return None
+    
+    # Tylko wybrane typy pojazdów (wyniki źródeł w cache pozostają pełne)
+    if projection.vehicle_types != VEHICLE_TYPES:
+        timocom_pricing = {period: _project_vehicle_types(stats, projection.vehicle_types) for period, stats in timocom_pricing.items()}
+        transeu_pricing = {period: _project_vehicle_types(stats, projection.vehicle_types) for period, stats in transeu_pricing.items()}
+
+    # ZAKOMENTOWANE: Obliczanie ceny całkowitej (dystans x stawka)
+    # calc_start = time.time()
+    # avg_rates = timocom_30d['avg_price_per_km']
+    # calculated_prices = {}
+    # for vehicle, rate in avg_rates.items():
+    #     # Zmieniamy klucze, aby pasowały do oczekiwań (bus, solo, naczepa)
+    #     vehicle_key = vehicle
+    #     if vehicle == 'trailer':
+    #         vehicle_key = 'naczepa'
+    #     elif vehicle == '3_5t':
+    #         vehicle_key = 'bus'
+    #     elif vehicle == '12t':
+    #         vehicle_key = 'solo'
+    #
+    #     if rate is not None:
+    #         calculated_prices[f'cena_{vehicle_key}'] = round(rate * float(distance), 2)
+    #     else:
+    #         calculated_prices[f'cena_{vehicle_key}'] = None
+    # logger.info(f"⏱️ Obliczenia cen: {(time.time() - calc_start)*1000:.0f}ms")
+    
+    total_time = (time.time() - request_start) * 1000
+    logger.info(f"")
+    logger.info(f"⏱️ ⭐ CAŁKOWITY CZAS REQUESTU: {total_time:.0f}ms")
+    logger.info(f"📊 BREAKDOWN:")
+    logger.info(f"   1️⃣ Geocoding:        {geocoding_time:6.0f}ms ({geocoding_time/total_time*100:5.1f}%)")
+    if aws_time > 0:
+        logger.info(f"   2️⃣ AWS Distance:     {aws_time:6.0f}ms ({aws_time/total_time*100:5.1f}%)")
+    logger.info(f"   3️⃣ TimoCom query:    {timocom_time:6.0f}ms ({timocom_time/total_time*100:5.1f}%)")
+    logger.info(f"   4️⃣ Trans.eu query:   {transeu_time:6.0f}ms ({transeu_time/total_time*100:5.1f}%)")
+    logger.info(f"   5️⃣ Historical query: {historical_time:6.0f}ms ({historical_time/total_time*100:5.1f}%)")
+    logger.info(f"")
+    logger.info(f"✅ Successfully returned pricing data for {start_postal} -> {end_postal}")
+
+    # Oblicz ceny całkowite (dystans × stawka) jeśli mamy dystans z AWS
+    # (na kopiach - wyniki źródeł są współdzielone z cache ostatnich dobrych wartości)
+    if route_distance_km is not None and route_distance_km > 0:
+        logger.info(f"💰 Calculating total prices with distance: {route_distance_km} km")
+        # TimoCom i Trans.eu - ceny całkowite dla różnych typów pojazdów
+        timocom_pricing = {period: _with_total_price(stats, route_distance_km) for period, stats in timocom_pricing.items()}
+        transeu_pricing = {period: _with_total_price(stats, route_distance_km) for period, stats in transeu_pricing.items()}
+        
+        # Historical - ceny całkowite dla FTL i LTL
+        historical_pricing = {
+            period: dict(window_data, **{
+                cargo_type: _with_total_price(window_data[cargo_type], route_distance_km)
+                for cargo_type in ['FTL', 'LTL'] if cargo_type in window_data
+            })
+            for period, window_data in historical_pricing.items()
+        }
+    
+    # Przygotuj response ze stawkami średnimi dla żądanych okien
+    response_data = {
+        'start_postal_code': start_postal,
+        'end_postal_code': end_postal,
+        'start_region_id': start_region_id,
+        'end_region_id': end_region_id,
+        'pricing': {
+            source: source_pricing
+            for source, source_pricing in (
+                ('timocom', timocom_pricing), ('transeu', transeu_pricing), ('historical', historical_pricing)
+            )
+            if projection.needs(source)
+        },
+        'currency': 'EUR',
+        'unit': 'EUR/km',
+        'data_sources': {
+            'timocom': bool(timocom_pricing),
+            'transeu': bool(transeu_pricing),
+            'historical': bool(historical_pricing)
+        }
+    }
+    
+    # Źródła, dla których zwrócono ostatnią dobrą wartość (błąd / timeout źródła)
+    stale_sources = {source: info for source, info in stale_sources.items() if info}
+    if stale_sources:
+        response_data['stale_sources'] = stale_sources
+    
+    # Etapy pominięte (budżet requestu / otwarty circuit breaker) - wynik częściowy
+    if skipped_stages:
+        response_data['partial'] = {'skipped': list(skipped_stages), 'reasons': skipped_stages}
+    
+    # Dodaj dystans drogowy jeśli został obliczony
+    if route_distance_km is not None:
+        response_data['route_distance'] = {
+            'distance_km': route_distance_km,
+            'method': distance_method
+        }
+    
+    # Geometria trasy (polyline) i czas przejazdu - tylko na żądanie (include_geometry)
+    if route_geometry is not None:
+        response_data['route_geometry'] = route_geometry
+    
+    return response_data
+
+
+def pricing_cache_key(
+    start_postal: str,
+    end_postal: str,
+    exchange_windows: List[int],
+    historical_windows: List[int],
+    projection: PricingProjection = DEFAULT_PROJECTION
+) -> Tuple:
+    """Klucz cache odpowiedzi dla trasy, okien i projekcji"""
+    return ('pricing', start_postal, end_postal, tuple(exchange_windows), tuple(historical_windows), tuple(projection))
+
+
+def compute_and_cache_pricing(
+    cache_key: Tuple,
+    start_postal: str,
+    end_postal: str,
+    start_region_id: int,
+    end_region_id: int,
+    exchange_windows: List[int],
+    historical_windows: List[int],
+    data_version: Optional[str],
+    projection: PricingProjection = DEFAULT_PROJECTION,
+    route_distance: Optional[Tuple[float, str]] = None
+) -> Optional[Dict]:
+    """Liczy wycenę trasy i zapisuje wynik w cache odpowiedzi (brak danych usuwa wpis)"""
+    response_data = compute_route_pricing(
+        start_postal, end_postal, start_region_id, end_region_id,
+        exchange_windows, historical_windows, projection, route_distance
+    )
+    if response_data is None:
+        pricing_result_cache.delete(cache_key)
+    elif is_cacheable_pricing(response_data):
+        # Wynik złożony z nieaktualnych danych źródeł lub częściowy (deadline) nie trafia do cache
+        pricing_result_cache.set(cache_key, response_data, data_version)
+    return response_data
+
+
+def compute_leg_pricing(
+    start_postal: str,
+    end_postal: str,
+    start_region_id: int,
+    end_region_id: int,
+    exchange_windows: List[int],
+    historical_windows: List[int],
+    data_version: Optional[str],
+    projection: PricingProjection = DEFAULT_PROJECTION,
+    route_distance: Optional[Tuple[float, str]] = None
+) -> Tuple[Optional[Dict], str]:
+    """
+    Wycena odcinka trasy wielopunktowej - ten sam cache odpowiedzi i single-flight
+    co pojedyncza trasa, z dystansem odcinka policzonym wcześniej.
+    
+    Returns:
+        Tuple (dane wyceny lub None, status cache: fresh / coalesced / miss)
+    """
+    cache_key = pricing_cache_key(start_postal, end_postal, exchange_windows, historical_windows, projection)
+    entry = pricing_result_cache.get(cache_key)
+    if entry is not None and pricing_result_cache.is_fresh(entry, data_version):
+        return entry.value, 'fresh'
+    
+    if route_distance is not None and route_distance[1] == 'haversine_fallback':
+        # Dystans przybliżony (brak wyniku silnika tras) - wynik nie trafia do cache
+        return compute_route_pricing(
+            start_postal, end_postal, start_region_id, end_region_id,
+            exchange_windows, historical_windows, projection, route_distance
+        ), 'miss'
+    
+    response_data, coalesced = pricing_flight.do(cache_key, lambda: compute_and_cache_pricing(
+        cache_key, start_postal, end_postal, start_region_id, end_region_id,
+        exchange_windows, historical_windows, data_version, projection, route_distance
+    ))
+    return response_data, 'coalesced' if coalesced else 'miss'
+
+
+def _leg_total_prices(pricing: Dict) -> Dict[Tuple, Optional[float]]:
+    """Ceny całkowite odcinka spłaszczone do {(źródło, okno[, ładunek], klucz): cena}"""
+    totals = {}
+    for source, periods in pricing.items():
+        for period, stats in periods.items():
+            groups = [((source, period), stats)]
+            groups += [((source, period, cargo_type), stats[cargo_type])
+                       for cargo_type in ('FTL', 'LTL') if isinstance(stats.get(cargo_type), dict)]
+            for path, group in groups:
+                for key, value in (group.get('total_price') or {}).items():
+                    totals[path + (key,)] = value
+    return totals
+
+
+def sum_leg_total_prices(legs_pricing: List[Optional[Dict]]) -> Dict:
+    """
+    Cena całkowita trasy wielopunktowej - suma cen odcinków per źródło, okno
+    (i typ ładunku) oraz typ pojazdu / strona zlecenia.
+    
+    Suma jest liczona tylko wtedy, gdy każdy odcinek ma cenę dla danego klucza
+    (inaczej None - cena trasy bez któregoś odcinka byłaby zaniżona).
+    
+    Args:
+        legs_pricing: Sekcje `pricing` odcinków (None = odcinek bez danych)
+    
+    Returns:
+        Zagnieżdżony słownik {źródło: {okno: {klucz: suma}}}, historical: {okno: {ładunek: {klucz: suma}}}
+    """
+    flat_legs = [_leg_total_prices(pricing or {}) for pricing in legs_pricing]
+    total_price = {}
+    for path in dict.fromkeys(path for flat in flat_legs for path in flat):
+        values = [flat.get(path) for flat in flat_legs]
+        node = total_price
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        node[path[-1]] = round(sum(values), 2) if all(value is not None for value in values) else None
+    return total_price
+
+
+def prewarm_hot_lanes(reason: str) -> Optional[Dict]:
+    """
+    Przelicza najpopularniejsze trasy (PREWARM_TOP_N), których wynik w cache
+    nie jest świeży - w limicie czasu PREWARM_BUDGET_SECONDS.
+    
+    Args:
+        reason: Powód prewarmingu (do logów), np. 'startup' / 'data-refresh'
+    
+    Returns:
+        Statystyki prewarmingu lub None jeśli prewarming już trwa
+    """
+    if not _PREWARM_LOCK.acquire(blocking=False):
+        return None
+    try:
+        started = time.monotonic()
+        data_version = get_pricing_data_version()
+        stats = {'warmed': 0, 'fresh': 0, 'empty': 0, 'failed': 0, 'skipped_budget': 0, 'skipped_load': 0}
+        
+        hot_lanes = lane_popularity.top(PREWARM_TOP_N)
+        
+        # Dystanse wszystkich tras naraz (route-matrix) zamiast osobnego wywołania AWS na trasę
+        distance_pairs = [
+            lane[:2] for lane, _ in hot_lanes
+            if (PricingProjection(*lane[4]) if len(lane) > 4 else DEFAULT_PROJECTION).include_distance
+        ]
+        if distance_pairs:
+            try:
+                stats['distances'] = prefetch_route_distances(distance_pairs, timeout=PREWARM_BUDGET_SECONDS / 2)
+            except Exception as e:
+                logger.warning(f"⚠️ Route matrix prefetch failed: {e}")
+        
+        for index, (lane, score) in enumerate(hot_lanes):
+            if time.monotonic() - started > PREWARM_BUDGET_SECONDS:
+                stats['skipped_budget'] = len(hot_lanes) - index
+                break
             
-            result_data = {
-                'match_info': match_metadata,  # Informacja o dopasowaniu
-                'orders': orders_list  # Lista wszystkich zleceń
-            }
+            start_postal, end_postal, exchange_windows, historical_windows = lane[:4]
+            projection = PricingProjection(*lane[4]) if len(lane) > 4 else DEFAULT_PROJECTION
+            cache_key = pricing_cache_key(start_postal, end_postal, exchange_windows, historical_windows, projection)
+            entry = pricing_result_cache.get(cache_key)
+            if entry is not None and pricing_result_cache.is_fresh(entry, data_version):
+                stats['fresh'] += 1
+                continue
             
-            if ftl_data:
-                result_data['FTL'] = ftl_data
-            if ltl_data:
-                result_data['LTL'] = ltl_data
+            start_region_id = postal_code_to_region_id(start_postal)
+            end_region_id = postal_code_to_region_id(end_postal)
+            if not start_region_id or not end_region_id:
+                continue
             
-            logger.info(f"📋 Zwracam {len(orders_list)} zleceń historycznych")
-            return result_data
+            def warm():
+                # Bez kolejki - przy nasyconym etapie prewarming ustępuje ruchowi użytkowników
+                with admission.try_stage('pricing'):
+                    return compute_and_cache_pricing(
+                        cache_key, start_postal, end_postal, start_region_id, end_region_id,
+                        list(exchange_windows), list(historical_windows), data_version, projection
+                    )
             
-    except Exception as exc:
-        logger.error(f"❌ Historical orders query error: {exc}", exc_info=True)
-        return None
+            try:
+                response_data, _ = pricing_flight.do(cache_key, warm)
+                stats['warmed' if response_data is not None else 'empty'] += 1
+            except Overloaded:
+                stats['skipped_load'] = len(hot_lanes) - index
+                break
+            except Exception as e:
+                stats['failed'] += 1
+                logger.warning(f"⚠️ Prewarm failed for {start_postal} -> {end_postal}: {e}")
+        
+        stats['seconds'] = round(time.monotonic() - started, 1)
+        logger.info(f"🔥 Prewarm ({reason}): {stats}")
+        return stats
     finally:
-        if conn:
-            _return_db_connection_main(conn)
-        logger.info(f"⏱️ CAŁKOWITY CZAS get_historical_orders_pricing ({days}d): {(time.time() - start_time)*1000:.0f}ms")
+        _PREWARM_LOCK.release()
 
 
-def _load_postal_code_mapping():
-    """Ładuje mapowanie kodów pocztowych na regiony"""
-    global _POSTAL_CODE_MAPPING
+def _prewarm_loop() -> None:
+    """
+    Wątek w tle: prewarm po starcie workera i po każdej zmianie wersji danych
+    oraz zapis pliku popularności tras (poza wątkami requestów).
+    """
+    time.sleep(PREWARM_STARTUP_DELAY)
+    last_version = get_pricing_data_version()
+    prewarm_hot_lanes('startup')
+    while True:
+        time.sleep(DATA_VERSION_CHECK_SECONDS)
+        try:
+            lane_popularity.save_if_due()
+            version = get_pricing_data_version()
+            if version is not None and version != last_version:
+                last_version = version
+                prewarm_hot_lanes('data-refresh')
+        except Exception as e:
+            logger.error(f"❌ Prewarm loop error: {e}")
+
+
+def _popularity_save_loop() -> None:
+    """Wątek w tle przy wyłączonym prewarmingu: tylko zapis pliku popularności tras"""
+    while True:
+        time.sleep(lane_popularity.save_interval)
+        lane_popularity.save_if_due()
+
+
+_BACKGROUND_LOCK = threading.Lock()
+_background_started = False
+
+
+def start_background_tasks() -> None:
+    """
+    Uruchamia wątki w tle workera: prewarm cache / zapis popularności tras
+    i nasłuch NOTIFY (FRESHNESS_LISTEN_ENABLED).
     
-    if _POSTAL_CODE_MAPPING is not None:
-        return _POSTAL_CODE_MAPPING
+    Wywoływane z hooka gunicorn `post_fork` (gunicorn_config.py) lub przy
+    uruchomieniu bezpośrednim - sam import modułu (joby build_*, skrypty)
+    nie startuje wątków. Kolejne wywołania w tym samym procesie nic nie robią.
+    """
+    global _background_started
+    with _BACKGROUND_LOCK:
+        if _background_started:
+            return
+        _background_started = True
     
-    try:
-        mapping_path = os.path.join(os.path.dirname(__file__), 'data', 'postal_code_to_region_transeu.json')
-        with open(mapping_path, 'r', encoding='utf-8') as f:
-            _POSTAL_CODE_MAPPING = json.load(f)
-        logger.info(f"✅ Loaded postal code mapping ({len(_POSTAL_CODE_MAPPING)} codes)")
-    except Exception as e:
-        logger.error(f"❌ Failed to load postal code mapping: {e}")
-        _POSTAL_CODE_MAPPING = {}
+    if PREWARM_ENABLED:
+        threading.Thread(target=_prewarm_loop, name='pricing-prewarm', daemon=True).start()
+    elif lane_popularity.state_file:
+        threading.Thread(target=_popularity_save_loop, name='lane-popularity-save', daemon=True).start()
     
-    return _POSTAL_CODE_MAPPING
+    if FRESHNESS_LISTEN_ENABLED:
+        for db_label, db_name in (('exchanges', DB_NAME), ('main', DB_NAME_MAIN)):
+            data_freshness.start_listener(
+                db_label,
+                lambda db_name=db_name: psycopg2.connect(
+                    host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD,
+                    database=db_name, connect_timeout=10
+                ),
+                FRESHNESS_NOTIFY_CHANNEL
+            )
+    logger.info(f"🧵 Background tasks started (pid {os.getpid()}): prewarm={PREWARM_ENABLED}, "
+                f"listen={FRESHNESS_LISTEN_ENABLED}")
 
-def postal_code_to_region_id(postal_code: str) -> Optional[int]:
-    """Konwertuje kod pocztowy (np. PL50) na region ID"""
-    mapping = _load_postal_code_mapping()
-    normalized = postal_code.upper().replace(' ', '').replace('-', '')
+
+def _encode_pricing_body(response_data: Dict, cache_status: str, created_at: float,
+                         encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Body odpowiedzi wyceny (JSON) i jego Content-Encoding (None gdy poniżej progu kompresji)"""
+    body = json_dumps({
+        'success': True,
+        'data': dict(response_data, cache={
+            'status': cache_status,
+            'cached_at': datetime.fromtimestamp(created_at, timezone.utc).isoformat(timespec='seconds')
+        })
+    })
+    if encoding and should_compress(len(body)):
+        return compress(body, encoding), encoding
+    return body, None
+
+
+def _pricing_response(response_data: Dict, cache_status: str, created_at: Optional[float] = None,
+                      cache_key: Optional[Tuple] = None, etag: Optional[str] = None):
+    """
+    Odpowiedź 200 z danymi wyceny i informacją o cache.
     
-    if normalized in mapping:
-        return mapping[normalized]['region_id']
+    Body nie zawiera wieku wyniku (jest w nagłówku Age), więc dla danego wpisu cache
+    jest stałe - zserializowane i skompresowane body trzymane jest w
+    `encoded_response_cache` i przy kolejnych trafieniach wysyłane bez ponownej pracy.
     
-    return None
+    Args:
+        response_data: Dane wyceny
+        cache_status: Status cache (miss / coalesced / fresh / stale-while-revalidate / stale-on-error)
+        created_at: Czas obliczenia wyniku (time.time()), domyślnie teraz
+        cache_key: Klucz wpisu w pricing_result_cache (None = body nie jest cache'owane)
+        etag: ETag wyniku (pricing_etag dla wersji danych, z której wynik obliczono)
+    """
+    created_at = time.time() if created_at is None else created_at
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    
+    body_key = (cache_key, created_at, cache_status, encoding)
+    encoded = encoded_response_cache.get(body_key) if cache_key is not None else MISSING
+    if encoded is MISSING:
+        encoded = _encode_pricing_body(response_data, cache_status, created_at, encoding)
+        if cache_key is not None:
+            encoded_response_cache.set(body_key, encoded)
+    body, content_encoding = encoded
+    
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.vary.add('Accept-Encoding')
+    response.headers['Age'] = str(max(0, int(time.time() - created_at)))
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    if etag and is_cacheable_pricing(response_data):
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _not_modified_response(etag: str):
+    """Odpowiedź 304 - wynik u klienta (If-None-Match) jest aktualny"""
+    response = make_response('', 304)
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _cached_entry_for(cache_key: Tuple, response_data: Dict):
+    """Wpis pricing_result_cache zawierający dokładnie ten wynik (None jeśli nie trafił do cache)"""
+    entry = pricing_result_cache.get(cache_key)
+    return entry if entry is not None and entry.value is response_data else None
 
 
 @app.route('/health', methods=['GET'])
@@ -1212,12 +3329,55 @@ def health_check():
             'monitoring': 'Performance metrics enabled',
             'data_sources': 'TimoCom + Trans.eu exchanges + Historical orders',
             'data': 'Weighted avg rates EUR/km from exchanges and real orders',
+            'serialization': JSON_BACKEND,
+            'compression': list(ENCODERS),
+            'data_freshness': 'LISTEN/NOTIFY' if FRESHNESS_LISTEN_ENABLED else 'polling',
             'data_quality': 'Outlier filtering (>5 EUR/km removed)',
             'fuzzy_matching': 'Intelligent route matching (±100km threshold) with accuracy levels'
         }
     })
 
 
+def _pool_stats(connection_pool_obj) -> Optional[Dict]:
+    """Zajętość poola połączeń (None jeśli pool nie został utworzony)"""
+    if connection_pool_obj is None:
+        return None
+    return {'in_use': len(connection_pool_obj._used), 'max': connection_pool_obj.maxconn}
+
+
+@app.route('/api/metrics', methods=['GET'])
+@require_api_key
+@limiter.exempt
+def metrics():
+    """Metryki workera: admission control (głębokość kolejek), cache, single-flight, poole połączeń, circuit breakery, współczynniki drogi
+    ---
+    tags:
+      - Monitoring
+    security:
+      - ApiKeyAuth: []
+    responses:
+      200:
+        description: Metryki bieżącego workera gunicorn (każdy worker ma własne liczniki)
+    """
+    return jsonify({
+        'pid': os.getpid(),
+        'admission': admission.stats(),
+        'caches': [cache.stats() for cache in (
+            pricing_result_cache, source_result_cache, negative_cache, last_good_cache, encoded_response_cache,
+            distance_cache, geometry_cache
+        )],
+        'single_flight': [pricing_flight.stats(), source_flight.stats()],
+        'pools': {'exchanges': _pool_stats(connection_pool), 'main': _pool_stats(connection_pool_main)},
+        'read_routing': [exchanges_reader.stats(), main_reader.stats()],
+        'circuit_breakers': {breaker.name: breaker.stats() for breaker in (aws_breaker, exchanges_db_breaker, main_db_breaker)},
+        'aws_routes_client': get_routes_client().stats(),
+        'local_routing': get_local_router().stats() if ROUTING_ENGINE == 'local' else None,
+        'road_factors': road_factors.stats(),
+        'distance_matrix': distance_matrix.stats(),
+        'data_freshness': data_freshness.stats()
+    })
+
+
 @app.route('/api/route-pricing', methods=['POST'])
 @require_api_key
 @limiter.limit("5 per minute")  # Max 5 requestów na minutę
@@ -1237,6 +3397,11 @@ def get_route_pricing():
     security:
       - ApiKeyAuth: []
     parameters:
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag z poprzedniej odpowiedzi - 304 bez liczenia wyceny, jeśli dane się nie zmieniły
       - in: body
         name: body
         required: true
@@ -1258,9 +3423,68 @@ def get_route_pricing():
               description: Kod pocztowy miejsca docelowego (format ISO 2-literowy kod kraju + cyfry, np. "DE49", "FR75")
               example: "DE49"
               pattern: '^[A-Z]{2}\d{1,5}$'
+            windows:
+              type: array
+              description: Opcjonalne okna czasowe w dniach (maks. 5, zakres 1-365) liczone jednym zapytaniem na źródło. Domyślnie giełdy 30d, zlecenia historyczne 180d. Odpowiedź zawiera klucz per okno (np. "7d", "30d", "90d")
+              items:
+                type: integer
+              example: [7, 30, 90]
+            sources:
+              type: array
+              description: Opcjonalne źródła (domyślnie wszystkie) - pozostałe nie są odpytywane
+              items:
+                type: string
+                enum: ["timocom", "transeu", "historical"]
+              example: ["timocom"]
+            vehicle_types:
+              type: array
+              description: Opcjonalne typy pojazdów (domyślnie wszystkie). "lorry" = Trans.eu, pozostałe = TimoCom. Akceptowane również pojedyncze pole vehicle_type (np. "naczepa")
+              items:
+                type: string
+                enum: ["trailer", "3_5t", "12t", "lorry"]
+              example: ["trailer"]
+            cargo_types:
+              type: array
+              description: Opcjonalne typy ładunku zleceń historycznych (domyślnie FTL i LTL)
+              items:
+                type: string
+                enum: ["FTL", "LTL"]
+              example: ["FTL"]
+            include_orders:
+              type: boolean
+              description: Czy zwrócić listę zleceń historycznych (domyślnie false)
+              example: false
+            include_top_carriers:
+              type: boolean
+              description: Czy zwrócić top 4 przewoźników (domyślnie false)
+              example: false
+            include_distance:
+              type: boolean
+              description: Czy liczyć dystans drogowy (AWS) i ceny całkowite (domyślnie true)
+              example: true
+            include_geometry:
+              type: boolean
+              description: Czy zwrócić geometrię trasy (polyline) i czas przejazdu (domyślnie false)
+              example: false
+            geometry_tolerance_m:
+              type: number
+              description: Tolerancja uproszczenia geometrii w metrach (0-5000, domyślnie ROUTE_GEOMETRY_TOLERANCE_M = 50)
+              example: 50
+            orders_format:
+              type: string
+              description: Format listy zleceń (z include_orders=true) - rows (orders) lub columnar (orders_columnar)
+              enum: ["rows", "columnar"]
+              example: "rows"
     responses:
       200:
         description: Sukces - średnie stawki z giełd (30 dni) i zleceń historycznych (180 dni z top przewoźnikami)
+        headers:
+          ETag:
+            type: string
+            description: Słaby ETag wyniku (wersja danych baz, plików mapowań i macierzy wycen); brak przy stale_sources / partial
+          Age:
+            type: integer
+            description: Wiek wyniku w sekundach
         schema:
           id: PricingResponse
           type: object
@@ -1324,6 +3548,22 @@ def get_route_pricing():
                                   type: number
                                   example: 1.55
                                   nullable: true
+                            percentiles_price_per_km:
+                              type: object
+                              description: Percentyle p10/p25/p50/p75/p90 EUR/km ze scalonych dziennych szkiców (tylko gdy istnieje tabela pricing_daily_sketches)
+                              properties:
+                                trailer:
+                                  type: object
+                                  example: {"p10": 1.21, "p25": 1.38, "p50": 1.55, "p75": 1.71, "p90": 1.88}
+                                  nullable: true
+                            price_spread:
+                              type: object
+                              description: Rozrzut cen - iqr (p75 - p25) oraz p10_p90 (p90 - p10)
+                              properties:
+                                trailer:
+                                  type: object
+                                  example: {"iqr": 0.33, "p10_p90": 0.67}
+                                  nullable: true
                             total_price:
                               type: object
                               description: Ceny całkowite (dystans × stawka) w EUR
@@ -1457,7 +3697,7 @@ def get_route_pricing():
                                   example: 28
                                 top_carriers:
                                   type: array
-                                  description: Top 4 przewoźników FTL
+                                  description: Top 4 przewoźników FTL (tylko z include_top_carriers=true)
                                   items:
                                     type: object
                                     properties:
@@ -1557,7 +3797,7 @@ def get_route_pricing():
                                   example: 25
                                 top_carriers:
                                   type: array
-                                  description: Top 4 przewoźników LTL
+                                  description: Top 4 przewoźników LTL (tylko z include_top_carriers=true)
                                   items:
                                     type: object
                                     properties:
@@ -1588,7 +3828,7 @@ def get_route_pricing():
                                         nullable: true
                             orders:
                               type: array
-                              description: Lista wszystkich zleceń historycznych dla tej trasy
+                              description: Lista wszystkich zleceń historycznych dla tej trasy (tylko z include_orders=true)
                               items:
                                 type: object
                                 properties:
@@ -1651,6 +3891,21 @@ def get_route_pricing():
                                   carrier_currency:
                                     type: string
                                     example: "EUR"
+                            orders_columnar:
+                              type: object
+                              description: Lista zleceń w formacie kolumnowym (tylko z include_orders=true i orders_format=columnar)
+                              properties:
+                                count:
+                                  type: integer
+                                  example: 2
+                                columns:
+                                  type: object
+                                  description: Tablica wartości per pole zlecenia (pola słownikowe jako indeksy do dictionaries)
+                                  example: {"order_id": [12345, 12346], "carrier_name": [0, 0], "client_currency": [0, 0]}
+                                dictionaries:
+                                  type: object
+                                  description: Wartości pól cargo_type, carrier_name, carrier_contact, carrier_email, client_currency, carrier_currency
+                                  example: {"carrier_name": ["TRANS-POL SP. Z O.O."], "client_currency": ["EUR"]}
                             match_info:
                               type: object
                               description: Informacje o dopasowaniu tras (fuzzy matching)
@@ -1695,8 +3950,37 @@ def get_route_pricing():
                     method:
                       type: string
                       description: Metoda obliczania dystansu
-                      enum: ["aws_truck_route", "haversine_fallback"]
+                      enum: ["aws_truck_route", "local_truck_route", "distance_matrix", "road_factor_model", "haversine_fallback"]
                       example: "aws_truck_route"
+                route_geometry:
+                  type: object
+                  description: Tylko z include_geometry=true - geometria trasy ciężarówki jako Encoded Polyline (lat, lng)
+                  properties:
+                    polyline:
+                      type: string
+                      description: Linia trasy w formacie Encoded Polyline (np. polyline.decode w Leaflet / Mapbox)
+                      example: "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+                    precision:
+                      type: integer
+                      description: Precyzja kodowania (5 = 1e-5 stopnia)
+                      example: 5
+                    points:
+                      type: integer
+                      description: Liczba punktów po uproszczeniu
+                      example: 412
+                    tolerance_m:
+                      type: number
+                      description: Tolerancja uproszczenia (Douglas-Peucker) w metrach
+                      example: 50
+                    duration_s:
+                      type: integer
+                      description: Czas przejazdu ciężarówki w sekundach
+                      example: 25200
+                      nullable: true
+                    distance_km:
+                      type: number
+                      description: Dystans trasy odpowiadającej geometrii (km)
+                      example: 587.45
                 data_sources:
                   type: object
                   description: Dostępność danych ze źródeł
@@ -1710,6 +3994,29 @@ def get_route_pricing():
                     historical:
                       type: boolean
                       example: true
+                cache:
+                  type: object
+                  description: Informacja o cache wyników (stale-while-revalidate)
+                  properties:
+                    status:
+                      type: string
+                      enum: ["miss", "coalesced", "fresh", "stale-while-revalidate", "stale-on-error"]
+                      example: "fresh"
+                    cached_at:
+                      type: string
+                      format: date-time
+                      description: Czas obliczenia wyniku (UTC) - wiek w sekundach zwraca nagłówek Age
+                      example: "2024-05-06T10:15:00+00:00"
+                stale_sources:
+                  type: object
+                  description: Tylko gdy źródło zwróciło błąd / timeout - zwrócono jego ostatnią dobrą wartość
+                  example: {"timocom": {"stale": true, "age_seconds": 1800}}
+                partial:
+                  type: object
+                  description: Tylko gdy część etapów pominięto - brak budżetu czasu requestu (deadline) lub otwarty circuit breaker zależności (circuit_open); wynik częściowy, np. dystans Haversine zamiast AWS
+                  example: {"skipped": ["aws", "historical"], "reasons": {"aws": "circuit_open", "historical": "deadline"}}
+      304:
+        description: Wynik się nie zmienił (If-None-Match zgodny z bieżącym ETag)
       400:
         description: Błąd zapytania - brakujące lub nieprawidłowe dane wejściowe
         schema:
@@ -1768,6 +4075,17 @@ def get_route_pricing():
             error:
               type: string
               example: "Rate limit exceeded"
+      504:
+        description: Budżet czasu requestu (REQUEST_DEADLINE_SECONDS) wyczerpany przed uzyskaniem danych z jakiegokolwiek źródła
+        schema:
+          type: object
+          properties:
+            success:
+              type: boolean
+              example: false
+            error:
+              type: string
+              example: "Przekroczono czas obliczania wyceny"
       500:
         description: Wewnętrzny błąd serwera
         schema:
@@ -1780,6 +4098,8 @@ def get_route_pricing():
               type: string
               example: "Wewnętrzny błąd serwera"
     """
+    # Budżet czasu requestu - etapy wyceny dostają timeouty z pozostałego czasu
+    deadline = Deadline(REQUEST_DEADLINE_SECONDS)
     try:
         # Próba parsowania JSON z bardziej szczegółową obsługą błędów
         try:
@@ -1823,6 +4143,26 @@ def get_route_pricing():
                 'message': 'Użyj formatu: KOD_KRAJU (2 litery) + cyfry (np. PL50, DE10)'
             }), 400
         
+        # Okna czasowe (opcjonalnie) - np. "windows": [7, 30, 90]
+        windows, windows_error = parse_windows(data.get('windows'))
+        if windows_error:
+            return jsonify({
+                'success': False,
+                'error': windows_error,
+                'message': f'Podaj listę maks. {MAX_WINDOWS} liczb dni z zakresu 1-{MAX_WINDOW_DAYS} (np. [7, 30, 90])'
+            }), 400
+        exchange_windows = windows or DEFAULT_EXCHANGE_WINDOWS
+        historical_windows = windows or DEFAULT_HISTORICAL_WINDOWS
+        
+        # Projekcja (opcjonalnie) - źródła, typy pojazdów / ładunków, lista zleceń, top przewoźnicy, dystans
+        projection, projection_error = parse_projection(data)
+        if projection_error:
+            return jsonify({
+                'success': False,
+                'error': projection_error,
+                'message': 'Źródła: timocom, transeu, historical; pojazdy: trailer, 3_5t, 12t, lorry; ładunki: FTL, LTL'
+            }), 400
+        
         # Konwertuj kody pocztowe na region IDs
         start_region_id = postal_code_to_region_id(start_postal)
         end_region_id = postal_code_to_region_id(end_postal)
@@ -1843,194 +4183,314 @@ def get_route_pricing():
         
         logger.info(f"📊 Processing pricing request: {start_postal}({start_region_id}) -> {end_postal}({end_region_id})")
         
-        request_start = time.time()
+        # Ranking popularności tras - steruje prewarmingiem cache
+        lane_popularity.record((start_postal, end_postal, tuple(exchange_windows), tuple(historical_windows), tuple(projection)))
         
-        # NOWE: Oblicz rzeczywisty dystans drogowy dla ciężarówek używając AWS Location Service
-        route_distance_km = None
-        distance_method = None
-        aws_time = 0
+        # Cache stale-while-revalidate dla całej odpowiedzi
+        cache_key = pricing_cache_key(start_postal, end_postal, exchange_windows, historical_windows, projection)
+        data_version = get_pricing_data_version()
         
-        # Pobierz współrzędne dla kodów pocztowych
-        geocoding_start = time.time()
-        conn_main = _get_db_connection_main()
-        try:
-            start_coords = get_postal_code_coordinates(start_postal, conn_main)
-            end_coords = get_postal_code_coordinates(end_postal, conn_main)
-            geocoding_time = (time.time() - geocoding_start) * 1000
-            logger.info(f"⏱️ Geocoding: {geocoding_time:.0f}ms")
+        # Żądanie warunkowe - klient ma wynik dla bieżącej wersji danych (przed jakimkolwiek liczeniem)
+        etag = pricing_etag(cache_key, data_version)
+        if etag and request.if_none_match.contains_weak(etag):
+            logger.info(f"✅ Not modified: {start_postal} -> {end_postal}")
+            return _not_modified_response(etag)
+        
+        def refresh():
+            # Odświeżenie w tle tylko przy wolnym miejscu (bez kolejki)
+            with admission.try_stage('pricing'):
+                return compute_route_pricing(
+                    start_postal, end_postal, start_region_id, end_region_id,
+                    exchange_windows, historical_windows, projection
+                )
+        
+        entry = pricing_result_cache.get(cache_key)
+        if entry is not None:
+            if pricing_result_cache.is_fresh(entry, data_version):
+                logger.info(f"⚡ Cache hit: {start_postal} -> {end_postal} (wiek {entry.age:.0f}s)")
+                return _pricing_response(entry.value, 'fresh', entry.created_at, cache_key, etag)
             
-            if start_coords and end_coords:
-                logger.info(f"📍 Coordinates: Start {start_postal} ({start_coords[0]:.5f}, {start_coords[1]:.5f}), End {end_postal} ({end_coords[0]:.5f}, {end_coords[1]:.5f})")
-                
-                # Wywołaj AWS API
-                aws_start = time.time()
-                aws_result = get_aws_route_distance(
-                    start_lat=start_coords[0],
-                    start_lng=start_coords[1],
-                    end_lat=end_coords[0],
-                    end_lng=end_coords[1],
-                    return_geometry=False
+            if pricing_result_cache.can_revalidate(entry):
+                logger.info(f"⚡ Cache stale: {start_postal} -> {end_postal} (wiek {entry.age:.0f}s) - odświeżam w tle")
+                pricing_result_cache.refresh_async(
+                    cache_key, lambda: (pricing_flight.do(cache_key, refresh)[0], data_version)
                 )
-                
-                aws_time = (time.time() - aws_start) * 1000
-                if aws_result:
-                    route_distance_km = aws_result['distance']
-                    distance_method = 'aws_truck_route'
-                    logger.info(f"⏱️ AWS Route Distance: {route_distance_km} km ({aws_time:.0f}ms)")
-                else:
-                    # Fallback do Haversine
-                    haversine_dist = haversine_distance(start_coords[0], start_coords[1], end_coords[0], end_coords[1])
-                    route_distance_km = round(haversine_dist * 1.3, 2)  # Współczynnik drogi 1.3
-                    distance_method = 'haversine_fallback'
-                    logger.info(f"⚠️ AWS failed ({aws_time:.0f}ms), using Haversine fallback: {route_distance_km} km")
-                    aws_time = 0  # Reset for summary
-            else:
-                logger.warning(f"⚠️ Could not get coordinates for distance calculation")
-        finally:
-            _return_db_connection_main(conn_main)
+                return _pricing_response(entry.value, 'stale-while-revalidate', entry.created_at, cache_key,
+                                         pricing_etag(cache_key, entry.version))
+        
+        def compute_and_store():
+            with admission.stage('pricing'):
+                return compute_and_cache_pricing(
+                    cache_key, start_postal, end_postal, start_region_id, end_region_id,
+                    exchange_windows, historical_windows, data_version, projection
+                )
+        
+        def computed_by_other_worker():
+            shared_entry = pricing_result_cache.get_shared(cache_key)
+            if shared_entry is not None and pricing_result_cache.is_fresh(shared_entry, data_version):
+                return shared_entry.value
+            return None
+        
+        # Single-flight: identyczne równoległe requesty czekają na jedno obliczenie
+        # (czekanie na wynik innego workera ograniczone budżetem requestu)
+        try:
+            with deadline.activate():
+                response_data, coalesced = pricing_flight.do(cache_key, compute_and_store, wait_for=computed_by_other_worker)
+        except Exception as e:
+            if entry is None:
+                raise
+            logger.error(f"❌ Pricing pipeline error, serving stale result (wiek {entry.age:.0f}s): {e}", exc_info=True)
+            return _pricing_response(entry.value, 'stale-on-error', entry.created_at, cache_key,
+                                     pricing_etag(cache_key, entry.version))
         
-        # OPTYMALIZACJA: Pobierz tylko dane z 30 dni z obu giełd
-        timocom_start = time.time()
-        timocom_30d = get_timocom_pricing(start_region_id, end_region_id, days=30)
-        timocom_time = (time.time() - timocom_start) * 1000
-        logger.info(f"⏱️ Zapytanie TimoCom 30d: {timocom_time:.0f}ms")
+        if response_data is None:
+            return _no_data_response(start_postal, end_postal)
         
-        transeu_start = time.time()
-        transeu_30d = get_transeu_pricing(start_region_id, end_region_id, days=30)
-        transeu_time = (time.time() - transeu_start) * 1000
-        logger.info(f"⏱️ Zapytanie Trans.eu 30d: {transeu_time:.0f}ms")
+        # Wynik zapisany w cache - body (skompresowane) też trafia do cache
+        stored = _cached_entry_for(cache_key, response_data)
+        created_at = stored.created_at if stored else None
+        body_cache_key = cache_key if stored else None
+        if coalesced:
+            logger.info(f"🔗 Single-flight: {start_postal} -> {end_postal} (wynik współdzielony)")
+            return _pricing_response(response_data, 'coalesced', created_at, body_cache_key, etag)
+        return _pricing_response(response_data, 'miss', created_at, body_cache_key, etag)
         
-        # NOWE: Pobierz statystyki z zleceń historycznych (ostatnie 6 miesięcy)
-        logger.info(f"📊 Calling get_historical_orders_pricing({start_postal}, {end_postal})")
-        historical_start = time.time()
-        historical_180d = get_historical_orders_pricing(start_postal, end_postal)  # domyślnie 180 dni
-        historical_time = (time.time() - historical_start) * 1000
-        logger.info(f"⏱️ Zapytanie Historical Orders 180d: {historical_time:.0f}ms")
+    except (Overloaded, CircuitOpen, DeadlineExceeded):
+        raise  # 503 / 504 - wspólne errorhandlery
+    except Exception as e:
+        logger.error(f"❌ Server error: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': 'Błąd serwera'
+        }), 500
+
+
+@app.route('/api/route-pricing/multi-stop', methods=['POST'])
+@require_api_key
+@limiter.limit("5 per minute")  # Max 5 requestów na minutę
+def get_multi_stop_route_pricing():
+    r"""Wycena trasy wielopunktowej (kilka miejsc załadunku / rozładunku)
+    Trasa przez kolejne kody pocztowe: dystans całej trasy jednym wywołaniem silnika
+    tras z punktami pośrednimi (lub z cache odcinków), a stawki giełd i zleceń
+    historycznych liczone równolegle dla każdego odcinka. Zwraca wyceny odcinków
+    i ceny całkowite całej trasy.
+    ---
+    tags:
+      - Pricing
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    security:
+      - ApiKeyAuth: []
+    parameters:
+      - in: body
+        name: body
+        required: true
+        description: Przystanki trasy oraz te same opcjonalne pola co /api/route-pricing (windows, sources, vehicle_types, cargo_types, include_orders, include_top_carriers, include_distance, orders_format)
+        schema:
+          id: MultiStopPricingRequest
+          type: object
+          required:
+            - postal_codes
+          properties:
+            postal_codes:
+              type: array
+              description: Kody pocztowe przystanków w kolejności przejazdu (2 - MULTI_STOP_MAX_STOPS, domyślnie 10)
+              items:
+                type: string
+                pattern: '^[A-Z]{2}\d{1,5}$'
+              example: ["PL20", "DE49", "FR75"]
+            windows:
+              type: array
+              items:
+                type: integer
+              example: [30]
+    responses:
+      200:
+        description: Sukces - wyceny odcinków i ceny całkowite trasy
+        schema:
+          id: MultiStopPricingResponse
+          type: object
+          properties:
+            success:
+              type: boolean
+              example: true
+            data:
+              type: object
+              properties:
+                stops:
+                  type: array
+                  items:
+                    type: string
+                  example: ["PL20", "DE49", "FR75"]
+                legs:
+                  type: array
+                  description: Wyceny odcinków (jak sekcja data z /api/route-pricing) z polem cache; odcinek bez danych ma pole error (no_data / deadline / circuit_open / overloaded / error)
+                  items:
+                    type: object
+                total_distance_km:
+                  type: number
+                  description: Dystans całej trasy (None, gdy któryś odcinek nie ma dystansu)
+                  example: 1642.3
+                  nullable: true
+                distance_methods:
+                  type: array
+                  description: Metoda wyznaczenia dystansu każdego odcinka
+                  items:
+                    type: string
+                    enum: ["aws_truck_route", "local_truck_route", "distance_matrix", "haversine_fallback"]
+                total_price:
+                  type: object
+                  description: Suma cen całkowitych odcinków per źródło i okno (historical - per typ ładunku); None, gdy któryś odcinek nie ma ceny
+                  example: {"timocom": {"30d": {"trailer": 2410.5, "3_5t": null}}}
+                complete:
+                  type: boolean
+                  description: Czy wszystkie odcinki mają dane (bez błędów, wyników częściowych i nieaktualnych źródeł)
+                  example: true
+                currency:
+                  type: string
+                  example: "EUR"
+      400:
+        description: Błąd zapytania - brakujące lub nieprawidłowe dane wejściowe
+      401:
+        description: Nieautoryzowany - brak klucza API
+      404:
+        description: Nie znaleziono regionu dla któregoś kodu lub brak danych dla wszystkich odcinków
+      429:
+        description: Przekroczono limit zapytań
+      503:
+        description: Serwer przeciążony lub źródła danych chwilowo niedostępne (Retry-After)
+      504:
+        description: Budżet czasu requestu wyczerpany przed uzyskaniem danych dla któregokolwiek odcinka
+      500:
+        description: Wewnętrzny błąd serwera
+    """
+    # Wspólny budżet czasu requestu - odcinki liczone równolegle dostają ten sam termin
+    deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+    try:
+        try:
+            data = request.get_json(force=True)
+        except Exception as json_error:
+            logger.warning(f"⚠️ JSON parsing error from {request.remote_addr}: {json_error}")
+            data = None
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': 'Brak danych JSON w request'
+            }), 400
+        
+        raw_stops = data.get('postal_codes')
+        if (not isinstance(raw_stops, list) or not 2 <= len(raw_stops) <= MULTI_STOP_MAX_STOPS
+                or not all(isinstance(code, str) for code in raw_stops)):
+            return jsonify({
+                'success': False,
+                'error': f'Pole postal_codes musi być listą 2-{MULTI_STOP_MAX_STOPS} kodów pocztowych',
+                'message': 'Podaj kody przystanków w kolejności przejazdu (np. ["PL20", "DE49", "FR75"])'
+            }), 400
+        stops = [code.strip().upper() for code in raw_stops]
+        
+        invalid = [code for code in stops if not validate_postal_code(code)]
+        if invalid:
+            logger.warning(f"⚠️ Invalid postal codes: {invalid}")
+            return jsonify({
+                'success': False,
+                'error': f'Nieprawidłowy format kodu pocztowego: {", ".join(invalid)}',
+                'message': 'Użyj formatu: KOD_KRAJU (2 litery) + cyfry (np. PL50, DE10)'
+            }), 400
+        
+        windows, windows_error = parse_windows(data.get('windows'))
+        if windows_error:
+            return jsonify({
+                'success': False,
+                'error': windows_error,
+                'message': f'Podaj listę maks. {MAX_WINDOWS} liczb dni z zakresu 1-{MAX_WINDOW_DAYS} (np. [7, 30, 90])'
+            }), 400
+        exchange_windows = windows or DEFAULT_EXCHANGE_WINDOWS
+        historical_windows = windows or DEFAULT_HISTORICAL_WINDOWS
+        
+        projection, projection_error = parse_projection(data)
+        if projection_error:
+            return jsonify({
+                'success': False,
+                'error': projection_error,
+                'message': 'Źródła: timocom, transeu, historical; pojazdy: trailer, 3_5t, 12t, lorry; ładunki: FTL, LTL'
+            }), 400
         
-        # Sprawdź czy są jakiekolwiek dane
-        if not timocom_30d and not transeu_30d and not historical_180d:
-            logger.info(f"ℹ️ No data found for route: {start_postal} -> {end_postal}")
+        region_ids = {code: postal_code_to_region_id(code) for code in dict.fromkeys(stops)}
+        missing = [code for code, region_id in region_ids.items() if not region_id]
+        if missing:
+            logger.info(f"ℹ️ Region not found for: {', '.join(missing)}")
             return jsonify({
                 'success': False,
-                'error': f'Brak danych dla trasy {start_postal} -> {end_postal}',
-                'message': 'Nie znaleziono danych cenowych w bazie dla tej trasy'
+                'error': f'Nie znaleziono regionu dla kodów: {", ".join(missing)}',
+                'message': 'Użyj formatu: KOD_KRAJU + 2 cyfry (np. PL50, DE10, FR75)'
             }), 404
-
-        # ZAKOMENTOWANE: Obliczanie ceny całkowitej (dystans x stawka)
-        # calc_start = time.time()
-        # avg_rates = timocom_30d['avg_price_per_km']
-        # calculated_prices = {}
-        # for vehicle, rate in avg_rates.items():
-        #     # Zmieniamy klucze, aby pasowały do oczekiwań (bus, solo, naczepa)
-        #     vehicle_key = vehicle
-        #     if vehicle == 'trailer':
-        #         vehicle_key = 'naczepa'
-        #     elif vehicle == '3_5t':
-        #         vehicle_key = 'bus'
-        #     elif vehicle == '12t':
-        #         vehicle_key = 'solo'
-        #
-        #     if rate is not None:
-        #         calculated_prices[f'cena_{vehicle_key}'] = round(rate * float(distance), 2)
-        #     else:
-        #         calculated_prices[f'cena_{vehicle_key}'] = None
-        # logger.info(f"⏱️ Obliczenia cen: {(time.time() - calc_start)*1000:.0f}ms")
         
-        total_time = (time.time() - request_start) * 1000
-        logger.info(f"")
-        logger.info(f"⏱️ ⭐ CAŁKOWITY CZAS REQUESTU: {total_time:.0f}ms")
-        logger.info(f"📊 BREAKDOWN:")
-        logger.info(f"   1️⃣ Geocoding:        {geocoding_time:6.0f}ms ({geocoding_time/total_time*100:5.1f}%)")
-        if aws_time > 0:
-            logger.info(f"   2️⃣ AWS Distance:     {aws_time:6.0f}ms ({aws_time/total_time*100:5.1f}%)")
-        logger.info(f"   3️⃣ TimoCom query:    {timocom_time:6.0f}ms ({timocom_time/total_time*100:5.1f}%)")
-        logger.info(f"   4️⃣ Trans.eu query:   {transeu_time:6.0f}ms ({transeu_time/total_time*100:5.1f}%)")
-        logger.info(f"   5️⃣ Historical query: {historical_time:6.0f}ms ({historical_time/total_time*100:5.1f}%)")
-        logger.info(f"")
-        logger.info(f"✅ Successfully returned pricing data for {start_postal} -> {end_postal}")
-
-        # Oblicz ceny całkowite (dystans × stawka) jeśli mamy dystans z AWS
-        if route_distance_km is not None and route_distance_km > 0:
-            logger.info(f"💰 Calculating total prices with distance: {route_distance_km} km")
-            # TimoCom - ceny całkowite dla różnych typów pojazdów
-            if timocom_30d and 'avg_price_per_km' in timocom_30d:
-                timocom_30d['total_price'] = {}
-                for vehicle_type, rate in timocom_30d['avg_price_per_km'].items():
-                    if rate is not None:
-                        timocom_30d['total_price'][vehicle_type] = round(rate * route_distance_km, 2)
-                    else:
-                        timocom_30d['total_price'][vehicle_type] = None
-                logger.info(f"   ✅ Added total_price to TimoCom: {timocom_30d['total_price']}")
-            
-            # Trans.eu - cena całkowita dla lorry
-            if transeu_30d and 'avg_price_per_km' in transeu_30d:
-                transeu_30d['total_price'] = {}
-                for vehicle_type, rate in transeu_30d['avg_price_per_km'].items():
-                    if rate is not None:
-                        transeu_30d['total_price'][vehicle_type] = round(rate * route_distance_km, 2)
-                    else:
-                        transeu_30d['total_price'][vehicle_type] = None
-            
-            # Historical - ceny całkowite dla FTL i LTL
-            if historical_180d:
-                for cargo_type in ['FTL', 'LTL']:
-                    if cargo_type in historical_180d and 'avg_price_per_km' in historical_180d[cargo_type]:
-                        historical_180d[cargo_type]['total_price'] = {}
-                        
-                        # Client price
-                        if historical_180d[cargo_type]['avg_price_per_km'].get('client') is not None:
-                            historical_180d[cargo_type]['total_price']['client'] = round(
-                                historical_180d[cargo_type]['avg_price_per_km']['client'] * route_distance_km, 2
-                            )
-                        else:
-                            historical_180d[cargo_type]['total_price']['client'] = None
-                        
-                        # Carrier price
-                        if historical_180d[cargo_type]['avg_price_per_km'].get('carrier') is not None:
-                            historical_180d[cargo_type]['total_price']['carrier'] = round(
-                                historical_180d[cargo_type]['avg_price_per_km']['carrier'] * route_distance_km, 2
-                            )
-                        else:
-                            historical_180d[cargo_type]['total_price']['carrier'] = None
+        legs = list(zip(stops, stops[1:]))
+        logger.info(f"📊 Processing multi-stop pricing request: {' -> '.join(stops)} ({len(legs)} legs)")
+        for start_postal, end_postal in legs:
+            lane_popularity.record((start_postal, end_postal, tuple(exchange_windows), tuple(historical_windows), tuple(projection)))
+        data_version = get_pricing_data_version()
+        
+        def price_leg(index: int):
+            start_postal, end_postal = legs[index]
+            with deadline.activate():
+                try:
+                    return compute_leg_pricing(
+                        start_postal, end_postal, region_ids[start_postal], region_ids[end_postal],
+                        exchange_windows, historical_windows, data_version, projection, leg_distances[index]
+                    ), None
+                except (CircuitOpen, DeadlineExceeded, Overloaded) as e:
+                    logger.warning(f"⚠️ Leg {start_postal} -> {end_postal}: {e}")
+                    return (None, None), e
+                except Exception as e:
+                    logger.error(f"❌ Leg {start_postal} -> {end_postal} failed: {e}", exc_info=True)
+                    return (None, None), e
+        
+        # Jedno miejsce etapu 'pricing' na całą trasę - odcinki dzielą je w puli wątków
+        skipped_stages = {}
+        with deadline.activate(), admission.stage('pricing'):
+            leg_distances = (compute_leg_distances(stops, skipped_stages) if projection.include_distance
+                             else [None] * len(legs))
+            results = list(_multi_stop_executor.map(price_leg, range(len(legs))))
+        
+        errors = {CircuitOpen: 'circuit_open', DeadlineExceeded: 'deadline', Overloaded: 'overloaded'}
+        legs_data = []
+        for (start_postal, end_postal), distance, ((leg_data, cache_status), error) in zip(legs, leg_distances, results):
+            if leg_data is not None:
+                legs_data.append(dict(leg_data, cache={'status': cache_status}))
+                continue
+            leg_data = {'start_postal_code': start_postal, 'end_postal_code': end_postal,
+                        'error': errors.get(type(error), 'error') if error else 'no_data'}
+            if distance is not None:
+                leg_data['route_distance'] = {'distance_km': distance[0], 'method': distance[1]}
+            legs_data.append(leg_data)
+        
+        if all('error' in leg for leg in legs_data):
+            # Brak danych wynika z błędów odcinków (503 / 504), a nie z samej trasy
+            leg_errors = [error for _, error in results if error]
+            if leg_errors:
+                raise leg_errors[0]
+            return _no_data_response(stops[0], stops[-1])
         
-        # Przygotuj response ze stawkami średnimi z 30 dni
         response_data = {
-            'start_postal_code': start_postal,
-            'end_postal_code': end_postal,
-            'start_region_id': start_region_id,
-            'end_region_id': end_region_id,
-            'pricing': {
-                'timocom': {
-                    '30d': timocom_30d
-                } if timocom_30d else {},
-                'transeu': {
-                    '30d': transeu_30d
-                } if transeu_30d else {},
-                'historical': {
-                    '180d': historical_180d
-                } if historical_180d else {}
-            },
-            'currency': 'EUR',
-            'unit': 'EUR/km',
-            'data_sources': {
-                'timocom': bool(timocom_30d),
-                'transeu': bool(transeu_30d),
-                'historical': bool(historical_180d)
-            }
+            'stops': stops,
+            'legs': legs_data,
+            'total_distance_km': (round(sum(distance[0] for distance in leg_distances), 2)
+                                  if all(leg_distances) else None),
+            'distance_methods': [distance[1] if distance else None for distance in leg_distances],
+            'total_price': sum_leg_total_prices([leg.get('pricing') for leg in legs_data]),
+            'complete': not any('error' in leg or leg.get('partial') or leg.get('stale_sources') for leg in legs_data),
+            'currency': 'EUR'
         }
+        if skipped_stages:
+            response_data['partial'] = {'skipped': list(skipped_stages), 'reasons': skipped_stages}
+        logger.info(f"✅ Successfully returned multi-stop pricing for {' -> '.join(stops)}")
+        return jsonify({'success': True, 'data': response_data})
         
-        # Dodaj dystans drogowy jeśli został obliczony
-        if route_distance_km is not None:
-            response_data['route_distance'] = {
-                'distance_km': route_distance_km,
-                'method': distance_method
-            }
-
-        return jsonify({
-            'success': True,
-            'data': response_data
-        })
-        
+    except (Overloaded, CircuitOpen, DeadlineExceeded):
+        raise  # 503 / 504 - wspólne errorhandlery
     except Exception as e:
         logger.error(f"❌ Server error: {e}", exc_info=True)
         return jsonify({
@@ -2039,6 +4499,50 @@ def get_route_pricing():
         }), 500
 
 
+def _overloaded_response(error: Overloaded):
+    """Odpowiedź 503 - etap wyceny nasycony (admission control)"""
+    logger.warning(f"⚠️ Load shedding: {error}")
+    response = jsonify({
+        'success': False,
+        'error': 'Serwer przeciążony',
+        'message': f'Spróbuj ponownie za {error.retry_after}s'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@app.errorhandler(Overloaded)
+def overloaded_handler(e):
+    """Handler dla Overloaded (etap wyceny nasycony) - 503 z Retry-After"""
+    return _overloaded_response(e)
+
+
+@app.errorhandler(CircuitOpen)
+def circuit_open_handler(e):
+    """Handler dla CircuitOpen (breaker zależności otwarty, brak danych zastępczych) - 503 z Retry-After"""
+    logger.warning(f"⚡ {e}")
+    response = jsonify({
+        'success': False,
+        'error': 'Źródło danych chwilowo niedostępne',
+        'message': f'Spróbuj ponownie za {math.ceil(e.retry_after)}s'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+    return response
+
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded_handler(e):
+    """Handler dla DeadlineExceeded (budżet czasu requestu wyczerpany) - 504"""
+    logger.warning(f"⏳ {e}")
+    return jsonify({
+        'success': False,
+        'error': 'Przekroczono czas obliczania wyceny',
+        'message': 'Spróbuj ponownie za chwilę'
+    }), 504
+
+
 @app.errorhandler(429)
 def ratelimit_handler(e):
     """Handler dla rate limit errors"""
@@ -2051,6 +4555,7 @@ def ratelimit_handler(e):
 
 
 if __name__ == '__main__':
+    start_background_tasks()
     port = int(os.environ.get('PORT', 5003))
     logger.info(f"🚀 Starting Pricing API (Secured) on port {port}")
     logger.info(f"🔒 Environment: {ENV}")
@@ -0,0 +1,125 @@
+"""
+Benchmark klienta AWS Routes API względem lokalnego zamiennika usługi
+
+Lokalny serwer HTTP/1.1 (keep-alive, `fake_aws_routes.py`) odpowiada jak /v2/routes
+i /v2/route-matrix, z opcjonalnym opóźnieniem i odsetkiem odpowiedzi 503. Porównuje:
+- requests.post            - dotychczasowa ścieżka: nowe połączenie na każde wywołanie
+- AwsRoutesClient          - sesja z pulą połączeń keep-alive (sekwencyjnie i z wątków)
+- route-matrix             - dystanse wielu par: osobne /v2/routes vs porcje macierzy równolegle
+
+Lokalny serwer bez TLS pokazuje tylko koszt TCP - na produkcji (DNS + TLS do
+routes.geo.<region>.amazonaws.com) zysk z ponownego użycia połączeń jest większy.
+
+Uruchomienie:
+    python benchmark_aws_routes.py
+    python benchmark_aws_routes.py --calls 500 --threads 8 --latency-ms 5 --error-rate 0.05
+    python benchmark_aws_routes.py --matrix 40x60 --latency-ms 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'contractorDetails'))
+from aws_distance_calculator import AwsRoutesClient, calculate_route_matrix
+from fake_aws_routes import start_fake_server
+
+
+def _points(count: int, seed: int):
+    """Losowe punkty (lat, lng) w Europie"""
+    rng = random.Random(seed)
+    return [(round(rng.uniform(43.0, 55.0), 4), round(rng.uniform(-1.0, 24.0), 4)) for _ in range(count)]
+
+
+def _benchmark_matrix(server: ThreadingHTTPServer, client: AwsRoutesClient, shape: str, threads: int):
+    """Dystanse wszystkich par start x cel: osobne wywołania /v2/routes vs route-matrix"""
+    origin_count, destination_count = (int(value) for value in shape.lower().split('x'))
+    origins, destinations = _points(origin_count, 1), _points(destination_count, 2)
+    pairs = [(origin, destination) for origin in origins for destination in destinations]
+    print(f"\n🧮 Macierz {origin_count} x {destination_count} ({len(pairs)} par), wątków: {threads}")
+
+    requests_before = server.requests
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        single = list(executor.map(lambda pair: client.route_distance(*pair[0], *pair[1]), pairs))
+    single_seconds = time.perf_counter() - started
+    print(f"  {'/v2/routes per para':<28} {single_seconds * 1000:9.0f} ms   zapytań {server.requests - requests_before:5d}   "
+          f"wyników {sum(result is not None for result in single)}")
+
+    requests_before = server.requests
+    started = time.perf_counter()
+    matrix = calculate_route_matrix(origins, destinations, client=client, max_workers=threads)
+    matrix_seconds = time.perf_counter() - started
+    print(f"  {'route-matrix (porcje)':<28} {matrix_seconds * 1000:9.0f} ms   zapytań {server.requests - requests_before:5d}   "
+          f"wyników {sum(cell is not None for row in matrix for cell in row)}")
+    print(f"  {'':<28} x{single_seconds / matrix_seconds:.1f} vs /v2/routes per para")
+
+
+def _legacy_call(base_url: str) -> bool:
+    """Dotychczasowa ścieżka: requests.post bez sesji"""
+    response = requests.post(
+        f"{base_url}/v2/routes?key=bench",
+        json={'Origin': [21.0122, 52.2297], 'Destination': [19.9450, 50.0647], 'TravelMode': 'Truck'},
+        headers={'Content-Type': 'application/json'}, timeout=15
+    )
+    return response.status_code == 200
+
+
+def _measure(label: str, server: ThreadingHTTPServer, call, calls: int, threads: int):
+    connections_before = server.connections
+    timings = []
+    failures = 0
+
+    def timed():
+        start = time.perf_counter()
+        ok = call()
+        return (time.perf_counter() - start) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for elapsed, ok in executor.map(lambda _: timed(), range(calls)):
+            timings.append(elapsed)
+            failures += 0 if ok else 1
+    total = time.perf_counter() - started
+
+    timings.sort()
+    median = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"  {label:<28} median {median:7.2f} ms   p95 {p95:7.2f} ms   {calls / total:7.0f} req/s   "
+          f"połączeń {server.connections - connections_before:4d}   błędów {failures}")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark klienta AWS Routes API (lokalny zamiennik usługi)')
+    parser.add_argument('--calls', type=int, default=300, help='Liczba wywołań na wariant')
+    parser.add_argument('--threads', type=int, default=4, help='Liczba wątków (wariant równoległy)')
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='Opóźnienie odpowiedzi serwera')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Odsetek odpowiedzi 503 (ponawianych)')
+    parser.add_argument('--matrix', default='20x30', help='Rozmiar macierzy startów x celów (np. 40x60)')
+    args = parser.parse_args()
+
+    server = start_fake_server(args.latency_ms, args.error_rate)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = AwsRoutesClient(api_key='bench', base_url=base_url, pool_size=args.threads, backoff_base=0.01)
+    route = lambda: client.route_distance(52.2297, 21.0122, 50.0647, 19.9450) is not None
+
+    print(f"🌐 Zamiennik /v2/routes: {base_url} (opóźnienie {args.latency_ms:.0f} ms, 503: {args.error_rate:.0%})")
+    for threads in (1, args.threads):
+        print(f"\n🧵 Wątków: {threads}")
+        baseline = _measure('requests.post (bez sesji)', server, lambda: _legacy_call(base_url), args.calls, threads)
+        pooled = _measure('AwsRoutesClient (keep-alive)', server, route, args.calls, threads)
+        print(f"  {'':<28} x{baseline / pooled:.1f} vs requests.post")
+    _benchmark_matrix(server, client, args.matrix, args.threads)
+    print(f"\n📊 Klient: {client.stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark lokalnego silnika tras (contraction hierarchies)
+
+Bez pliku grafu generowana jest syntetyczna sieć dróg Europy (siatka z losowymi
+przesunięciami węzłów, wyciętymi obszarami i "autostradami" co kilka linii).
+Mierzy:
+- preprocessing (budowa hierarchii) i wczytanie z pliku `.ch`
+- pojedyncze zapytania CH dla tysięcy losowych par (mediana / p95 / p99)
+- zwykły Dijkstra na pełnym grafie dla części par (porównanie czasu i poprawności)
+- macierz start x cel metodą kubełkową
+
+Uruchomienie:
+    python benchmark_local_routing.py
+    python benchmark_local_routing.py --spacing 0.25 --pairs 5000 --verify 300
+    python benchmark_local_routing.py --graph data/roads.graph
+"""
+
+import argparse
+import heapq
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'contractorDetails'))
+from local_routing import LocalRouter, read_graph, _haversine_km
+
+
+def generate_graph(path: str, spacing: float, seed: int) -> int:
+    """Syntetyczna sieć dróg (lat 36-60, lng -9-30) w formacie pliku grafu. Zwraca liczbę węzłów"""
+    rng = random.Random(seed)
+    rows, cols = int(24 / spacing) + 1, int(39 / spacing) + 1
+    nodes = {}
+    for i in range(rows):
+        for j in range(cols):
+            # Wycięte obszary (morza / góry) wymuszają objazdy
+            if rng.random() < 0.12:
+                continue
+            nodes[(i, j)] = (36 + i * spacing + rng.uniform(-0.3, 0.3) * spacing,
+                             -9 + j * spacing + rng.uniform(-0.3, 0.3) * spacing)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('# Syntetyczna sieć dróg (benchmark_local_routing.py)\n')
+        for (i, j), (lat, lng) in nodes.items():
+            f.write(f"N {i}_{j} {lat:.5f} {lng:.5f}\n")
+        for (i, j), (lat, lng) in nodes.items():
+            for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                neighbour = nodes.get((i + di, j + dj))
+                if neighbour is None:
+                    continue
+                meters = _haversine_km(lat, lng, *neighbour) * 1000 * rng.uniform(1.05, 1.3)
+                motorway = (di == 0 and i % 5 == 0) or (dj == 0 and j % 5 == 0)
+                kmh = 110 if motorway else (50 if di and dj else 70)
+                f.write(f"E {i}_{j} {i + di}_{j + dj} {meters:.0f} {meters / kmh * 3.6:.1f}\n")
+    return len(nodes)
+
+
+def dijkstra(adjacency, source: int, target: int) -> float:
+    """Zwykły Dijkstra (czas) na pełnym grafie - punkt odniesienia"""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u == target:
+            return d
+        if d > dist[u]:
+            continue
+        for v, w in adjacency[u]:
+            nd = d + w
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return math.inf
+
+
+def _summary(label: str, timings_ms):
+    timings_ms = sorted(timings_ms)
+    pick = lambda q: timings_ms[min(len(timings_ms) - 1, int(len(timings_ms) * q))]
+    print(f"  {label:<26} n={len(timings_ms):5d}   median {pick(0.5):8.3f} ms   p95 {pick(0.95):8.3f} ms   "
+          f"p99 {pick(0.99):8.3f} ms")
+    return pick(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark lokalnego silnika tras (contraction hierarchies)')
+    parser.add_argument('--graph', help='Plik grafu dróg (domyślnie: syntetyczna sieć Europy)')
+    parser.add_argument('--spacing', type=float, default=0.4, help='Rozstaw siatki syntetycznej sieci (stopnie)')
+    parser.add_argument('--pairs', type=int, default=2000, help='Liczba losowych par (zapytania CH)')
+    parser.add_argument('--verify', type=int, default=200, help='Liczba par porównywanych ze zwykłym Dijkstrą')
+    parser.add_argument('--matrix', type=int, default=50, help='Rozmiar macierzy N x N (metoda kubełkowa)')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    graph_path = args.graph
+    if graph_path is None:
+        graph_path = os.path.join(tempfile.mkdtemp(prefix='local_routing_'), 'europe.graph')
+        count = generate_graph(graph_path, args.spacing, args.seed)
+        print(f"🗺️ Syntetyczna sieć: {count} węzłów ({graph_path})")
+
+    ch_path = f"{graph_path}.ch"
+    if os.path.exists(ch_path) and args.graph is None:
+        os.remove(ch_path)
+    started = time.perf_counter()
+    router = LocalRouter(graph_path, build_missing=True)
+    print(f"🛣️ Preprocessing / wczytanie: {time.perf_counter() - started:.1f}s")
+    started = time.perf_counter()
+    router = LocalRouter(graph_path)
+    print(f"📂 Wczytanie z {os.path.basename(ch_path)}: {time.perf_counter() - started:.2f}s")
+
+    rng = random.Random(args.seed)
+    n = len(router.lat)
+    pairs = [(rng.randrange(n), rng.randrange(n)) for _ in range(args.pairs)]
+    points = lambda node: (router.lat[node], router.lng[node])
+
+    print(f"\n⏱️ Zapytania ({args.pairs} losowych par)")
+    timings, failures = [], 0
+    for source, target in pairs:
+        start = time.perf_counter()
+        failures += router.route(*points(source), *points(target)) is None
+        timings.append((time.perf_counter() - start) * 1000)
+    ch_median = _summary('CH (z dociąganiem punktu)', timings)
+    print(f"  {'':<26} brak trasy: {failures}")
+
+    _, _, edges = read_graph(graph_path)
+    adjacency = [[] for _ in range(n)]
+    for (u, v), (w, _) in edges.items():
+        adjacency[u].append((v, w))
+    timings, mismatches = [], 0
+    for source, target in pairs[:args.verify]:
+        start = time.perf_counter()
+        expected = dijkstra(adjacency, source, target)
+        timings.append((time.perf_counter() - start) * 1000)
+        result = router._query(source, target)
+        actual = result[0] if result else math.inf
+        mismatches += not (actual == expected or abs(actual - expected) <= 1e-6 * max(1.0, expected))
+    dijkstra_median = _summary('Dijkstra (pełny graf)', timings)
+    print(f"  {'':<26} x{dijkstra_median / ch_median:.0f} vs Dijkstra, niezgodnych czasów: {mismatches}/{len(timings)}")
+
+    size = min(args.matrix, n)
+    origins = [points(rng.randrange(n)) for _ in range(size)]
+    destinations = [points(rng.randrange(n)) for _ in range(size)]
+    started = time.perf_counter()
+    matrix = router.matrix(origins, destinations)
+    elapsed = (time.perf_counter() - started) * 1000
+    cells = sum(cell is not None for row in matrix for cell in row)
+    print(f"\n🧮 Macierz {size} x {size}: {elapsed:.0f} ms ({elapsed / (size * size):.3f} ms / para, wyników {cells})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Benchmark serializacji odpowiedzi /api/route-pricing
+
+Porównuje serializację realistycznej odpowiedzi (3 źródła x kilka okien,
+lista zleceń historycznych z datami, kwotami i danymi przewoźników):
+- jsonify (stdlib)  - dotychczasowa ścieżka: isoformat() per zlecenie + json.dumps(sort_keys, ensure_ascii)
+- fast_json (json)  - body wyceny bez orjson (json ze ścieżką C: ensure_ascii, kompaktowe separatory)
+- fast_json (orjson) - natywne daty, bez isoformat() per wiersz
+
+Uruchomienie:
+    python benchmark_serialization.py
+    python benchmark_serialization.py --orders 10000 --iterations 50
+"""
+
+import argparse
+import datetime
+import json
+import random
+import time
+
+import fast_json
+
+CARRIERS = [
+    ('TRANS-POL SP. Z O.O.', 'Jan Kowalski', 'biuro@trans-pol.pl'),
+    ('Spedycja Łódź Sp. j.', 'Agnieszka Wiśniewska', 'zlecenia@spedycja-lodz.pl'),
+    ('Müller Logistik GmbH', 'Jürgen Müller', 'dispo@mueller-logistik.de'),
+    ('Transports Lefèvre SARL', 'Étienne Lefèvre', 'contact@lefevre-transports.fr'),
+    ('Nordic Freight AB', 'Lars Öberg', 'booking@nordicfreight.se')
+]
+
+
+def _rates(rng: random.Random, keys):
+    return {key: round(rng.uniform(0.8, 2.2), 4) for key in keys}
+
+
+def _exchange_window(rng: random.Random, vehicle_keys):
+    return {
+        'avg_price_per_km': _rates(rng, vehicle_keys),
+        'median_price_per_km': _rates(rng, vehicle_keys),
+        'percentiles_price_per_km': {key: _rates(rng, ('p10', 'p25', 'p50', 'p75', 'p90')) for key in vehicle_keys},
+        'price_spread': {key: _rates(rng, ('iqr', 'p10_p90')) for key in vehicle_keys},
+        'total_price': {key: round(rng.uniform(500, 2500), 2) for key in vehicle_keys},
+        'total_offers': rng.randint(100, 30000),
+        'offers_by_vehicle_type': {key: rng.randint(10, 10000) for key in vehicle_keys},
+        'days_with_data': rng.randint(1, 90)
+    }
+
+
+def build_payload(orders_count: int, windows=(7, 30, 90), seed: int = 42):
+    """Odpowiedź o strukturze /api/route-pricing z `orders_count` zleceniami historycznymi (daty jako date)"""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+
+    orders = []
+    for order_id in range(orders_count):
+        carrier_name, contact, email = rng.choice(CARRIERS)
+        client_rate = round(rng.uniform(0.9, 2.0), 4)
+        distance = round(rng.uniform(300, 1500), 1)
+        orders.append({
+            'order_id': 100000 + order_id,
+            'order_date': today - datetime.timedelta(days=rng.randint(0, max(windows))),
+            'cargo_type': rng.choice(('FTL', 'LTL')),
+            'client_amount': round(client_rate * distance, 2),
+            'carrier_amount': round(client_rate * 0.85 * distance, 2),
+            'carrier_name': carrier_name,
+            'carrier_contact': contact,
+            'carrier_email': email,
+            'client_price_per_km': client_rate,
+            'carrier_price_per_km': round(client_rate * 0.85, 4),
+            'route_distance': distance,
+            'client_currency': 'EUR',
+            'carrier_currency': 'EUR'
+        })
+
+    historical = {}
+    for days in windows:
+        cargo = {}
+        for cargo_type in ('FTL', 'LTL'):
+            cargo[cargo_type] = {
+                'avg_price_per_km': _rates(rng, ('client', 'carrier')),
+                'median_price_per_km': _rates(rng, ('client', 'carrier')),
+                'avg_amounts': {'client': 1500.0, 'carrier': 1300.0},
+                'avg_distance': 900.5,
+                'currency': {'client': 'EUR', 'carrier': 'EUR'},
+                'total_orders': orders_count,
+                'days_with_data': days,
+                'top_carriers': [
+                    {'carrier_id': i, 'carrier_name': CARRIERS[i][0], 'order_count': 10 - i,
+                     'avg_client_price_per_km': 1.2, 'avg_carrier_price_per_km': 1.0,
+                     'avg_client_amount': 1500.0, 'avg_carrier_amount': 1300.0}
+                    for i in range(4)
+                ]
+            }
+        historical[f'{days}d'] = dict(
+            cargo,
+            match_info={'matched_start': 'PL20', 'matched_end': 'DE49', 'accuracy': 'exact',
+                        'start_distance_km': 0.0, 'end_distance_km': 0.0},
+            orders=[order for order in orders if (today - order['order_date']).days <= days]
+        )
+
+    return {
+        'success': True,
+        'data': {
+            'start_postal_code': 'PL20',
+            'end_postal_code': 'DE49',
+            'start_region_id': 135,
+            'end_region_id': 98,
+            'pricing': {
+                'timocom': {f'{days}d': _exchange_window(rng, ('trailer', '3_5t', '12t')) for days in windows},
+                'transeu': {f'{days}d': _exchange_window(rng, ('lorry',)) for days in windows},
+                'historical': historical
+            },
+            'currency': 'EUR',
+            'unit': 'EUR/km',
+            'route_distance': {'distance_km': 587.45, 'method': 'aws_truck_route'},
+            'cache': {'status': 'miss', 'cached_at': '2024-05-06T10:15:00+00:00'}
+        }
+    }
+
+
+def _legacy_jsonify(payload):
+    """Dotychczasowa ścieżka: isoformat() przy budowie odpowiedzi + json.dumps jak w Flask jsonify"""
+    for window in payload['data']['pricing']['historical'].values():
+        window['orders'] = [dict(order, order_date=order['order_date'].isoformat()) for order in window['orders']]
+    return json.dumps(payload, sort_keys=True, ensure_ascii=True).encode('utf-8')
+
+
+def _copy(obj):
+    """Głęboka kopia dict / list (bez kopiowania obiektów date)"""
+    if isinstance(obj, dict):
+        return {key: _copy(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_copy(value) for value in obj]
+    return obj
+
+
+def _measure(label: str, func, payload_factory, iterations: int):
+    timings = []
+    size = 0
+    for _ in range(iterations):
+        payload = payload_factory()
+        start = time.perf_counter()
+        body = func(payload)
+        timings.append((time.perf_counter() - start) * 1000)
+        size = len(body)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"  {label:<22} median {median:8.2f} ms   p95 {p95:8.2f} ms   {size / 1024:8.0f} KB")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark serializacji odpowiedzi pricing API')
+    parser.add_argument('--orders', type=int, nargs='+', default=[100, 1000, 5000], help='Liczby zleceń w odpowiedzi')
+    parser.add_argument('--iterations', type=int, default=30, help='Liczba powtórzeń na wariant')
+    args = parser.parse_args()
+
+    print(f"orjson: {'dostępny' if fast_json.orjson is not None else 'brak (pip install orjson)'}")
+    for orders_count in args.orders:
+        print(f"\n📦 Odpowiedź z {orders_count} zleceniami (okna 7/30/90d):")
+        template = build_payload(orders_count)
+
+        # Świeża kopia struktury na każde powtórzenie (legacy modyfikuje listy zleceń)
+        factory = lambda: _copy(template)
+
+        baseline = _measure('jsonify (stdlib)', _legacy_jsonify, factory, args.iterations)
+        fallback = _measure('fast_json (json)', lambda p: fast_json.dumps(p, backend='json'), factory, args.iterations)
+        print(f"  {'':<22} x{baseline / fallback:.1f} vs jsonify")
+        if fast_json.orjson is not None:
+            fast = _measure('fast_json (orjson)', lambda p: fast_json.dumps(p, backend='orjson'), factory, args.iterations)
+            print(f"  {'':<22} x{baseline / fast:.1f} vs jsonify")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Job budujący dzienne szkice kwantylowe (t-digest) per trasa
+
+Uruchamiać raz dziennie (np. cron) po załadowaniu danych giełd i zleceń:
+    python build_daily_sketches.py            # wczoraj + dziś
+    python build_daily_sketches.py --days 180 # backfill ostatnich 180 dni
+
+Szkice trafiają do tabeli `pricing_daily_sketches`:
+- baza giełd (POSTGRES_DB): TimoCom ('trailer', '3_5t', '12t') i Trans.eu ('lorry')
+- baza główna (POSTGRES_DB_MAIN): zlecenia historyczne ('FTL_client', 'FTL_carrier', 'LTL_client', 'LTL_carrier')
+
+Giełdy przechowują tylko dzienne agregaty (średnia / mediana + liczba ofert),
+więc dzienny szkic giełdy to centroid w medianie dnia (lub średniej, gdy brak
+mediany) z wagą = liczba ofert. Scalony szkic daje ważone percentyle
+z dziennych median - w odróżnieniu od dotychczasowego AVG(median).
+Dla zleceń historycznych szkic budowany jest z pojedynczych zleceń.
+"""
+
+import argparse
+import logging
+import os
+from collections import defaultdict
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from dotenv import load_dotenv
+
+from quantile_sketch import QuantileSketch, SKETCH_TABLE_DDL
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('build_daily_sketches')
+
+# Próg dla outlierów - taki sam jak w app_secure.py
+OUTLIER_THRESHOLD = 5.0
+# Kurs przeliczenia PLN -> EUR - taki sam jak w app_secure.py
+PLN_TO_EUR = 4.25
+
+
+def _connect(database: str):
+    return psycopg2.connect(
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        database=database,
+        cursor_factory=RealDictCursor,
+        connect_timeout=10
+    )
+
+
+def build_timocom_sketches(cur, days: int):
+    """Szkice TimoCom: trailer (mediana), 3_5t i 12t (średnia - brak mediany w danych)"""
+    cur.execute("""
+        SELECT
+            starting_id, destination_id, enlistment_date,
+            trailer_avg_price_per_km, trailer_median_price_per_km, number_of_offers_trailer,
+            vehicle_up_to_3_5_t_avg_price_per_km, number_of_offers_vehicle_up_to_3_5_t,
+            vehicle_up_to_12_t_avg_price_per_km, number_of_offers_vehicle_up_to_12_t
+        FROM public.offers
+        WHERE enlistment_date >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+    """, {'days': days})
+
+    sketches = defaultdict(QuantileSketch)
+    for row in cur.fetchall():
+        prices = (
+            row['trailer_avg_price_per_km'],
+            row['vehicle_up_to_3_5_t_avg_price_per_km'],
+            row['vehicle_up_to_12_t_avg_price_per_km']
+        )
+        # Cały wiersz jest outlierem jeśli którakolwiek stawka > próg (jak w get_timocom_pricing)
+        if any(p is not None and p > OUTLIER_THRESHOLD for p in prices):
+            continue
+
+        lane = ('timocom', str(row['starting_id']), str(row['destination_id']))
+        day = row['enlistment_date']
+        trailer_value = row['trailer_median_price_per_km'] or row['trailer_avg_price_per_km']
+        for metric, value, weight in (
+            ('trailer', trailer_value, row['number_of_offers_trailer']),
+            ('3_5t', row['vehicle_up_to_3_5_t_avg_price_per_km'], row['number_of_offers_vehicle_up_to_3_5_t']),
+            ('12t', row['vehicle_up_to_12_t_avg_price_per_km'], row['number_of_offers_vehicle_up_to_12_t'])
+        ):
+            if value is not None and weight:
+                sketches[lane + (metric, day)].add(float(value), float(weight))
+
+    return sketches
+
+
+def build_transeu_sketches(cur, days: int):
+    """Szkice Trans.eu: lorry (mediana dnia z wagą liczby ofert)"""
+    cur.execute("""
+        SELECT
+            starting_id, destination_id, enlistment_date,
+            lorry_avg_price_per_km, lorry_median_price_per_km, number_of_offers
+        FROM public."OffersTransEU"
+        WHERE enlistment_date >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+            AND lorry_avg_price_per_km <= %(threshold)s
+    """, {'days': days, 'threshold': OUTLIER_THRESHOLD})
+
+    sketches = defaultdict(QuantileSketch)
+    for row in cur.fetchall():
+        value = row['lorry_median_price_per_km'] or row['lorry_avg_price_per_km']
+        if value is None or not row['number_of_offers']:
+            continue
+        key = ('transeu', str(row['starting_id']), str(row['destination_id']), 'lorry', row['enlistment_date'])
+        sketches[key].add(float(value), float(row['number_of_offers']))
+
+    return sketches
+
+
+def build_historical_sketches(cur, days: int):
+    """Szkice zleceń historycznych: stawka klienta i przewoźnika per typ ładunku"""
+    cur.execute("""
+        SELECT
+            "loadingRegionCode" AS start_code,
+            "unloadingRegionCode" AS end_code,
+            DATE("orderDate") AS day,
+            "cargoType",
+            CASE WHEN "clientCurrency" = 'PLN' THEN "clientPricePerKm" / %(rate)s ELSE "clientPricePerKm" END AS client_price,
+            CASE WHEN "carrierCurrency" = 'PLN' THEN "carrierPricePerKm" / %(rate)s ELSE "carrierPricePerKm" END AS carrier_price
+        FROM "ZleceniaSpeed"
+        WHERE
+            "orderDate" >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+            AND "status" = 'Z'
+            AND "clientPricePerKm" IS NOT NULL
+            AND "clientPricePerKm" > 0
+            AND "cargoType" IN ('FTL', 'LTL')
+            AND ("carrierName" IS NULL OR ("carrierName" NOT ILIKE '%%motiva%%' AND "carrierName" NOT ILIKE '%%ALB LOGISTICS%%'))
+            AND "clientCurrency" IN ('EUR', 'PLN')
+            AND "carrierCurrency" IN ('EUR', 'PLN')
+    """, {'days': days, 'rate': PLN_TO_EUR})
+
+    sketches = defaultdict(QuantileSketch)
+    for row in cur.fetchall():
+        client_price = float(row['client_price']) if row['client_price'] is not None else None
+        carrier_price = float(row['carrier_price']) if row['carrier_price'] is not None else None
+        # Outlier: cena za km > próg (jak w get_historical_orders_pricing)
+        if (client_price or 0) > OUTLIER_THRESHOLD or (carrier_price or 0) > OUTLIER_THRESHOLD:
+            continue
+
+        lane = ('historical', row['start_code'], row['end_code'])
+        cargo_type = row['cargoType']
+        if client_price is not None:
+            sketches[lane + (f'{cargo_type}_client', row['day'])].add(client_price)
+        if carrier_price is not None:
+            sketches[lane + (f'{cargo_type}_carrier', row['day'])].add(carrier_price)
+
+    return sketches
+
+
+def store_sketches(conn, sketches) -> int:
+    """Zapisuje (upsert) szkice do tabeli pricing_daily_sketches"""
+    rows = [
+        (source, start_key, end_key, metric, day, Json(sketch.to_dict()))
+        for (source, start_key, end_key, metric, day), sketch in sketches.items()
+    ]
+    with conn.cursor() as cur:
+        cur.execute(SKETCH_TABLE_DDL)
+        execute_values(cur, """
+            INSERT INTO public.pricing_daily_sketches (source, start_key, end_key, metric, day, sketch)
+            VALUES %s
+            ON CONFLICT (source, start_key, end_key, metric, day)
+            DO UPDATE SET sketch = EXCLUDED.sketch
+        """, rows, page_size=1000)
+    conn.commit()
+    return len(rows)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Buduje dzienne szkice kwantylowe per trasa')
+    parser.add_argument('--days', type=int, default=1, help='Liczba dni wstecz do przebudowania (domyślnie: wczoraj + dziś)')
+    args = parser.parse_args()
+
+    conn = _connect(os.getenv("POSTGRES_DB"))
+    try:
+        with conn.cursor() as cur:
+            exchange_sketches = build_timocom_sketches(cur, args.days)
+            exchange_sketches.update(build_transeu_sketches(cur, args.days))
+        count = store_sketches(conn, exchange_sketches)
+        logger.info(f"✅ Zapisano {count} szkiców giełdowych")
+    finally:
+        conn.close()
+
+    conn_main = _connect(os.getenv("POSTGRES_DB_MAIN"))
+    try:
+        with conn_main.cursor() as cur:
+            historical_sketches = build_historical_sketches(cur, args.days)
+        count = store_sketches(conn_main, historical_sketches)
+        logger.info(f"✅ Zapisano {count} szkiców zleceń historycznych")
+    finally:
+        conn_main.close()
+
+
+if __name__ == '__main__':
+    main()
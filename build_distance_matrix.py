@@ -0,0 +1,132 @@
+"""
+Job budujący macierz dystansów drogowych między kodami pocztowymi
+
+Zbiór kodów (prefiksów) z `data/postal_code_to_region_transeu.json` jest
+skończony, więc dystanse ciężarówki dla wszystkich par można policzyć z góry.
+Drogi zmieniają się rzadko - uruchamiać np. raz w tygodniu lub po zmianie mapowania:
+    python build_distance_matrix.py                          # wszystkie kody z mapowania
+    python build_distance_matrix.py --countries PL DE CZ     # tylko wybrane kraje
+    python build_distance_matrix.py --hot-lanes 500          # kody z najpopularniejszych tras
+    python build_distance_matrix.py --incremental            # tylko brakujące komórki
+
+Dystanse liczone są zapytaniami route-matrix AWS (`calculate_route_matrix` -
+porcje w limitach usługi, równolegle) lub lokalnym silnikiem tras (`--engine local`,
+graf z LOCAL_ROUTING_GRAPH_FILE). Pełna macierz wszystkich kodów to
+ok. 5 mln par - `--incremental` przenosi komórki z poprzedniego pliku i liczy
+tylko brakujące. Plik zapisywany jest atomowo - workery API podmieniają
+mapowanie przy następnym sprawdzeniu mtime (patrz `distance_matrix.py`).
+"""
+
+import argparse
+import logging
+import math
+import os
+import time
+
+import app_secure
+from aws_distance_calculator import calculate_route_matrix
+from local_routing import local_route_matrix
+from distance_matrix import DistanceMatrix, empty_cells, normalize_code, write_distance_matrix
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', force=True)
+logger = logging.getLogger('build_distance_matrix')
+
+
+def aws_engine(origins, destinations, workers: int, timeout: float):
+    """Macierz [{'distance' km, 'duration' s} | None] z AWS route-matrix"""
+    return calculate_route_matrix(origins, destinations, max_workers=workers, timeout=timeout)
+
+
+def local_engine(origins, destinations, workers: int, timeout: float):
+    """Macierz z lokalnego grafu dróg (LOCAL_ROUTING_GRAPH_FILE) - bez wywołań sieciowych"""
+    return local_route_matrix(origins, destinations)
+
+
+ENGINES = {'aws': aws_engine, 'local': local_engine}
+
+
+def get_codes(countries=None, hot_lanes: int = 0):
+    """Kody z mapowania (opcjonalnie tylko wybrane kraje) lub z najpopularniejszych tras"""
+    if hot_lanes:
+        lanes = app_secure.lane_popularity.top(hot_lanes)
+        codes = {normalize_code(code) for lane, _ in lanes for code in lane[:2]}
+    else:
+        codes = set(app_secure._load_postal_code_mapping())
+    if countries:
+        prefixes = tuple(country.upper() for country in countries)
+        codes = {code for code in codes if code.startswith(prefixes)}
+    return sorted(codes)
+
+
+def geocode(codes):
+    """Współrzędne kodów z PostalCodeCoordinates (kody bez współrzędnych są pomijane)"""
+    conn = app_secure.main_reader.getconn()
+    try:
+        coords = {code: app_secure.get_postal_code_coordinates(code, conn) for code in codes}
+    finally:
+        app_secure.main_reader.putconn(conn)
+    return {code: point for code, point in coords.items() if point}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Buduje macierz dystansów drogowych między kodami pocztowymi')
+    parser.add_argument('--countries', nargs='+', help='Tylko kody z podanych krajów (np. PL DE CZ)')
+    parser.add_argument('--hot-lanes', type=int, default=0,
+                        help='Tylko kody z N najpopularniejszych tras (PREWARM_STATE_FILE)')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default=app_secure.ROUTING_ENGINE,
+                        help='Silnik wyznaczania tras (domyślnie ROUTING_ENGINE)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Przenieś komórki z istniejącego pliku i licz tylko brakujące')
+    parser.add_argument('--block', type=int, default=60, help='Liczba startów na jedno wywołanie macierzy')
+    parser.add_argument('--workers', type=int, default=app_secure.ROUTE_MATRIX_WORKERS,
+                        help='Równoległe zapytania route-matrix')
+    parser.add_argument('--block-timeout', type=float, default=600, help='Limit czasu bloku startów (s)')
+    parser.add_argument('--output', default=app_secure.DISTANCE_MATRIX_FILE, help='Ścieżka pliku macierzy')
+    args = parser.parse_args()
+
+    # Logi per zapytanie z app_secure są zbyt szczegółowe dla joba
+    logging.getLogger('app_secure').setLevel(logging.WARNING)
+
+    requested = get_codes(args.countries, args.hot_lanes)
+    coords = geocode(requested)
+    codes = [code for code in requested if code in coords]
+    n = len(codes)
+    logger.info(f"📊 {len(requested)} kodów, {n} ze współrzędnymi ({n * n} par), silnik {args.engine}")
+
+    distances, durations = empty_cells(n), empty_cells(n)
+    if args.incremental:
+        previous = DistanceMatrix(args.output)
+        if previous.maybe_reload() and previous.meta.get('engine') == args.engine:
+            reused = 0
+            for i, start in enumerate(codes):
+                for j, end in enumerate(codes):
+                    cell = previous.lookup(start, end)
+                    if cell is not None:
+                        distances[i * n + j], durations[i * n + j] = cell
+                        reused += 1
+            logger.info(f"♻️ Przeniesiono {reused} komórek z {args.output}")
+
+    engine = ENGINES[args.engine]
+    started = time.monotonic()
+    for block_start in range(0, n, args.block):
+        rows = range(block_start, min(n, block_start + args.block))
+        # Tylko cele z brakującą komórką w którymś wierszu bloku
+        columns = [j for j in range(n) if any(math.isnan(distances[i * n + j]) for i in rows)]
+        if not columns:
+            continue
+        matrix = engine([coords[codes[i]] for i in rows], [coords[codes[j]] for j in columns],
+                        args.workers, args.block_timeout)
+        for i, row in zip(rows, matrix):
+            for j, cell in zip(columns, row):
+                if cell is not None and math.isnan(distances[i * n + j]):
+                    distances[i * n + j] = cell['distance']
+                    durations[i * n + j] = cell['duration'] if cell.get('duration') is not None else math.nan
+        logger.info(f"⏳ {rows.stop}/{n} startów ({time.monotonic() - started:.0f}s)")
+
+    written = write_distance_matrix(args.output, codes, distances, durations, meta={'engine': args.engine})
+    logger.info(f"✅ Zapisano macierz {args.output}: {written}/{n * n} par z dystansem "
+                f"({os.path.getsize(args.output) / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Job budujący contraction hierarchies lokalnego silnika tras (`<graf>.ch`)
+
+Kontrakcja grafu dróg kraju / Europy trwa minuty, więc nie jest wykonywana przy
+starcie API - workery z `ROUTING_ENGINE=local` tylko wczytują gotowy plik `.ch`
+i nie startują, gdy go brakuje lub jest nieaktualny (zmieniony plik grafu lub
+LOCAL_ROUTING_TRUCK_MAX_KMH). Uruchamiać po każdej zmianie grafu, przed
+wdrożeniem / restartem API:
+    python build_local_routing.py                      # graf z LOCAL_ROUTING_GRAPH_FILE
+    python build_local_routing.py data/roads.graph
+    python build_local_routing.py --check              # tylko sprawdzenie (kod wyjścia 1 = do przebudowy)
+    python build_local_routing.py --force              # przebudowa także aktualnego pliku
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'contractorDetails'))
+from local_routing import LocalRouter, build_hierarchy, hierarchy_status
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', force=True)
+logger = logging.getLogger('build_local_routing')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Buduje contraction hierarchies lokalnego silnika tras')
+    parser.add_argument('graph', nargs='?', default=os.getenv('LOCAL_ROUTING_GRAPH_FILE', 'data/roads.graph'),
+                        help='Plik grafu dróg (domyślnie LOCAL_ROUTING_GRAPH_FILE)')
+    parser.add_argument('--truck-max-kmh', type=float, default=float(os.getenv('LOCAL_ROUTING_TRUCK_MAX_KMH', '80')),
+                        help='Maksymalna prędkość ciężarówki (domyślnie LOCAL_ROUTING_TRUCK_MAX_KMH)')
+    parser.add_argument('--settle-limit', type=int, default=200, help='Limit węzłów witness search')
+    parser.add_argument('--check', action='store_true', help='Tylko sprawdź, czy plik .ch jest aktualny')
+    parser.add_argument('--force', action='store_true', help='Przebuduj także aktualny plik .ch')
+    args = parser.parse_args()
+
+    problem = hierarchy_status(args.graph, args.truck_max_kmh)
+    if args.check:
+        if problem is not None:
+            logger.error(f"❌ {args.graph}.ch: {problem}")
+            sys.exit(1)
+        logger.info(f"✅ {args.graph}.ch aktualny")
+        return
+    if problem is None and not args.force:
+        logger.info(f"✅ {args.graph}.ch aktualny - bez przebudowy (--force wymusza)")
+        return
+
+    logger.info(f"🛠️ Budowa hierarchii {args.graph} ({problem or 'wymuszona'})")
+    stats = build_hierarchy(args.graph, args.truck_max_kmh, args.settle_limit)
+    logger.info(f"✅ Zapisano {stats['ch']}: {stats['nodes']} węzłów, {stats['edges']} krawędzi "
+                f"({stats['seconds']}s, {os.path.getsize(stats['ch']) / 1024 / 1024:.1f} MB)")
+
+    # Kontrola: plik wczytuje się tak jak w workerze API
+    router = LocalRouter(args.graph, truck_max_kmh=args.truck_max_kmh)
+    logger.info(f"📂 Wczytanie: {router.load_seconds:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Job budujący macierz wycen giełd (TimoCom + Trans.eu) dla wszystkich par regionów
+
+Uruchamiać raz dziennie (np. cron) po załadowaniu danych giełd, po
+`build_daily_sketches.py` (percentyle w macierzy pochodzą ze szkiców):
+    python build_pricing_matrix.py
+    python build_pricing_matrix.py --windows 7 30 90 --workers 4
+
+Wyniki liczone są tymi samymi funkcjami co API (`get_timocom_pricing_windows`,
+`get_transeu_pricing_windows`), tylko dla par regionów, które mają oferty
+w najdłuższym oknie. Plik zapisywany jest atomowo - workery API podmieniają
+mapowanie przy następnym sprawdzeniu mtime (patrz `pricing_matrix.py`).
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import app_secure
+from pricing_matrix import write_matrix
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', force=True)
+logger = logging.getLogger('build_pricing_matrix')
+
+
+def get_region_ids():
+    """ID regionów Trans.eu, do których mapowane są kody pocztowe"""
+    return sorted({entry['region_id'] for entry in app_secure._load_postal_code_mapping().values()})
+
+
+def get_pairs_with_data(region_ids, max_days: int):
+    """Pary regionów Trans.eu z ofertami TimoCom lub Trans.eu w oknie max_days"""
+    conn = app_secure.exchanges_reader.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT starting_id, destination_id FROM public.offers
+                WHERE enlistment_date >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+            """, {'days': max_days})
+            timocom_pairs = {(row['starting_id'], row['destination_id']) for row in cur.fetchall()}
+            cur.execute("""
+                SELECT DISTINCT starting_id, destination_id FROM public."OffersTransEU"
+                WHERE enlistment_date >= CURRENT_DATE - CAST(%(days)s AS INTEGER)
+            """, {'days': max_days})
+            transeu_pairs = {(row['starting_id'], row['destination_id']) for row in cur.fetchall()}
+    finally:
+        app_secure.exchanges_reader.putconn(conn)
+
+    timocom_ids = {region_id: app_secure.map_transeu_to_timocom_id(region_id) for region_id in region_ids}
+    return [
+        (start_id, end_id)
+        for start_id in region_ids
+        for end_id in region_ids
+        if (start_id, end_id) in transeu_pairs or (timocom_ids[start_id], timocom_ids[end_id]) in timocom_pairs
+    ]
+
+
+def build_pair(pair, windows):
+    """Blob pary regionów lub None (brak danych / błąd zapytania)"""
+    start_id, end_id = pair
+    timocom = app_secure.get_timocom_pricing_windows(start_id, end_id, windows)
+    transeu = app_secure.get_transeu_pricing_windows(start_id, end_id, windows)
+    if timocom == {} or transeu == {}:
+        raise RuntimeError(f"Błąd zapytania dla pary {start_id} -> {end_id}")
+
+    blob = {}
+    for source, results_by_window in (('timocom', timocom), ('transeu', transeu)):
+        with_data = {days: result for days, result in results_by_window.items() if result}
+        if with_data:
+            blob[source] = with_data
+    return blob or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Buduje macierz wycen giełd dla wszystkich par regionów')
+    parser.add_argument('--windows', type=int, nargs='+', default=[7, 30, 90],
+                        help='Okna (dni) zapisywane w macierzy (domyślnie: 7 30 90)')
+    parser.add_argument('--workers', type=int, default=4, help='Liczba równoległych zapytań (maks. rozmiar poola)')
+    parser.add_argument('--output', default=app_secure.PRICING_MATRIX_FILE, help='Ścieżka pliku macierzy')
+    args = parser.parse_args()
+
+    windows = sorted(set(args.windows) | set(app_secure.DEFAULT_EXCHANGE_WINDOWS))
+    # Logi per zapytanie z app_secure są zbyt szczegółowe dla joba
+    logging.getLogger('app_secure').setLevel(logging.WARNING)
+
+    region_ids = get_region_ids()
+    data_version = app_secure.get_data_version('exchanges')
+    pairs = get_pairs_with_data(region_ids, max(windows))
+    logger.info(f"📊 {len(region_ids)} regionów, {len(pairs)} par z danymi, okna {windows}")
+
+    blobs = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for count, (pair, blob) in enumerate(zip(pairs, executor.map(lambda p: build_pair(p, windows), pairs)), 1):
+            if blob:
+                blobs[pair] = blob
+            if count % 1000 == 0:
+                logger.info(f"⏳ {count}/{len(pairs)} par")
+
+    written = write_matrix(args.output, region_ids, windows, blobs, meta={'data_version': data_version})
+    logger.info(f"✅ Zapisano macierz {args.output}: {written} par z danymi ({os.path.getsize(args.output) / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()
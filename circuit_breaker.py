@@ -0,0 +1,155 @@
+"""
+Circuit breakery z adaptacyjnymi timeoutami dla zależności zewnętrznych
+
+Każda zależność (AWS Location Service, baza giełd, baza zleceń) ma breaker:
+
+- closed    - wywołania normalnie; `failure_threshold` kolejnych błędów otwiera breaker
+- open      - wywołania od razu dostają `CircuitOpen` (fallback bez czekania na timeout)
+- half_open - po `reset_seconds` przepuszczana jest jedna próba; sukces zamyka
+              breaker, błąd otwiera go ponownie
+
+Timeout wywołania wynika z obserwowanych czasów udanych wywołań:
+percentyl `timeout_percentile` z ostatnich `window` próbek × `timeout_multiplier`,
+w granicach [min_timeout, max_timeout]. Przed zebraniem `min_samples` próbek
+obowiązuje max_timeout.
+
+Zależności: brak (tylko biblioteka standardowa)
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def _percentile(ordered, q: float) -> float:
+    """Percentyl q z posortowanej niepustej listy (metoda najbliższej rangi)"""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class CircuitOpen(Exception):
+    """Breaker zależności jest otwarty - wywołanie odrzucone bez próby"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' open, next probe in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Breaker jednej zależności z adaptacyjnym timeoutem"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 min_timeout: float = 1.0, max_timeout: float = 15.0,
+                 timeout_percentile: float = 0.99, timeout_multiplier: float = 2.0,
+                 window: int = 200, min_samples: int = 20):
+        """
+        Args:
+            name: Nazwa zależności (do logów i metryk)
+            failure_threshold: Liczba kolejnych błędów otwierająca breaker
+            reset_seconds: Czas otwarcia przed próbą (half-open)
+            min_timeout: Dolna granica adaptacyjnego timeoutu (s)
+            max_timeout: Górna granica / timeout przed zebraniem próbek (s)
+            timeout_percentile: Percentyl czasów udanych wywołań
+            timeout_multiplier: Mnożnik percentyla
+            window: Liczba ostatnich próbek czasu
+            min_samples: Minimalna liczba próbek dla adaptacyjnego timeoutu
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._timeout = max_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0  # Otwarcie breakera / start próby half-open (time.monotonic())
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self.last_error: Optional[str] = None
+
+    def _recompute_timeout(self) -> None:
+        if len(self._latencies) < self.min_samples:
+            self._timeout = self.max_timeout
+            return
+        latency = _percentile(sorted(self._latencies), self.timeout_percentile)
+        self._timeout = min(self.max_timeout, max(self.min_timeout, latency * self.timeout_multiplier))
+
+    def timeout(self) -> float:
+        """Bieżący adaptacyjny timeout wywołania (s)"""
+        return self._timeout
+
+    @property
+    def available(self) -> bool:
+        """Czy wywołanie ma szansę przejść (bez zajmowania próby half-open)"""
+        return self.state == CLOSED or time.monotonic() - self._opened_at >= self.reset_seconds
+
+    def allow(self) -> None:
+        """
+        Dopuszcza wywołanie (po nim wymagane record_success / record_failure).
+
+        Raises:
+            CircuitOpen: Breaker otwarty lub próba half-open już trwa
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            waited = now - self._opened_at
+            if waited < self.reset_seconds:
+                self.rejected += 1
+                raise CircuitOpen(self.name, self.reset_seconds - waited)
+            # Próba half-open (kolejna, jeśli poprzednia nie została rozliczona w reset_seconds)
+            self.state = HALF_OPEN
+            self._opened_at = now
+
+    def record_success(self, duration: float) -> None:
+        """Udane wywołanie trwające `duration` sekund"""
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self._latencies.append(duration)
+            self._recompute_timeout()
+            self.state = CLOSED
+
+    def record_failure(self, error: Optional[str] = None) -> None:
+        """Nieudane wywołanie (błąd / timeout)"""
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """Stan breakera i adaptacyjny timeout (do /api/metrics)"""
+        with self._lock:
+            ordered = sorted(self._latencies)
+            return {
+                'state': self.state,
+                'timeout_seconds': round(self._timeout, 3),
+                'consecutive_failures': self.consecutive_failures,
+                'successes': self.successes,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'opened': self.opened,
+                'last_error': self.last_error,
+                'samples': len(ordered),
+                'p50_ms': round(_percentile(ordered, 0.5) * 1000, 1) if ordered else None,
+                'p99_ms': round(_percentile(ordered, 0.99) * 1000, 1) if ordered else None
+            }
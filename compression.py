@@ -0,0 +1,98 @@
+"""
+Kompresja odpowiedzi HTTP negocjowana przez Accept-Encoding
+
+Obsługiwane kodowania (w kolejności preferencji serwera):
+- zstd (opcjonalnie - pakiet zstandard)
+- br   (opcjonalnie - pakiet brotli)
+- gzip (biblioteka standardowa)
+
+Odpowiedzi mniejsze niż próg (COMPRESSION_MIN_SIZE) nie są kompresowane -
+narzut nagłówków i CPU przewyższa zysk.
+
+Zależności: brak (tylko biblioteka standardowa)
+Opcjonalnie: brotli, zstandard
+"""
+
+import gzip
+import os
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', '3'))
+
+
+def _zstd_compress(body: bytes) -> bytes:
+    # ZstdCompressor nie jest thread-safe - osobny obiekt na wywołanie (tani)
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+
+# Kodowanie -> funkcja kompresji (tylko dostępne), w kolejności preferencji serwera
+ENCODERS = {}
+if zstandard is not None:
+    ENCODERS['zstd'] = _zstd_compress
+if brotli is not None:
+    ENCODERS['br'] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+ENCODERS['gzip'] = lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parsuje nagłówek Accept-Encoding do {kodowanie: q}"""
+    accepted = {}
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Wybiera kodowanie odpowiedzi na podstawie nagłówka Accept-Encoding.
+
+    Returns:
+        'zstd' / 'br' / 'gzip' lub None (bez kompresji)
+    """
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+
+    accepted = _parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoding in ENCODERS:
+        q = accepted.get(encoding, wildcard)
+        # Przy równym q wygrywa kolejność preferencji serwera (ENCODERS)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Kompresuje body wybranym kodowaniem"""
+    return ENCODERS[encoding](body)
+
+
+def should_compress(body_size: int) -> bool:
+    """Czy odpowiedź jest wystarczająco duża do kompresji"""
+    return COMPRESSION_ENABLED and body_size >= COMPRESSION_MIN_SIZE
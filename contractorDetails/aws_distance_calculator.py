@@ -4,18 +4,449 @@ AWS Location Service Distance Calculator for Trucks
 Moduł do obliczania rzeczywistych dystansów drogowych dla ciężarówek 
 wykorzystując AWS Location Service Routes API v2.
 
+`AwsRoutesClient` trzyma sesję HTTP z pulą połączeń keep-alive (jedna na
+proces / worker), więc kolejne wywołania nie płacą za DNS, TCP i TLS do
+`routes.geo.<region>.amazonaws.com`. Odpowiedzi 429 / 5xx i błędy połączenia
+są ponawiane z losowym opóźnieniem (full jitter) w granicach timeoutu wywołania.
+HTTP/2 jest opcjonalne (AWS_ROUTES_HTTP2=true, wymaga: pip install httpx[http2]).
+
 Wymagane zmienne środowiskowe:
 - AWS_LOCATION_API_KEY: API key z AWS Location Service
 - AWS_REGION: Region AWS (domyślnie 'eu-central-1')
 
+Opcjonalne:
+- AWS_ROUTES_POOL_SIZE: Maksymalna liczba połączeń keep-alive (domyślnie 10)
+- AWS_ROUTES_MAX_RETRIES: Liczba ponowień przy 429 / 5xx (domyślnie 2)
+- AWS_ROUTES_HTTP2: HTTP/2 przez httpx (domyślnie false)
+- AWS_ROUTE_MATRIX_MAX_ORIGINS / AWS_ROUTE_MATRIX_MAX_DESTINATIONS: Limity jednego
+  zapytania route-matrix (domyślnie 15 x 100)
+
 Zależności:
 - requests
 - python-dotenv (opcjonalnie, do ładowania .env)
+- httpx[http2] (opcjonalnie, dla HTTP/2)
 """
 
+import logging
 import os
+import random
+import threading
+import time
 import requests
-from typing import Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Statusy ponawiane z opóźnieniem (limit zapytań / chwilowe błędy AWS)
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Limity jednego zapytania CalculateRouteMatrix (macierz dzielona jest na porcje)
+ROUTE_MATRIX_MAX_ORIGINS = int(os.getenv("AWS_ROUTE_MATRIX_MAX_ORIGINS", "15"))
+ROUTE_MATRIX_MAX_DESTINATIONS = int(os.getenv("AWS_ROUTE_MATRIX_MAX_DESTINATIONS", "100"))
+
+_TRANSPORT_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx is not None else ())
+_TIMEOUT_ERRORS = (requests.exceptions.Timeout,) + ((httpx.TimeoutException,) if httpx is not None else ())
+
+
+class AwsRoutesClient:
+    """Klient AWS Routes API v2 z sesją keep-alive i ponawianiem z jitterem (thread-safe)"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        region: Optional[str] = None,
+        base_url: Optional[str] = None,
+        pool_size: int = 10,
+        max_retries: int = 2,
+        backoff_base: float = 0.1,
+        backoff_max: float = 2.0,
+        http2: bool = False
+    ):
+        """
+        Args:
+            api_key: AWS API Key (None = AWS_LOCATION_API_KEY)
+            region: Region AWS (None = AWS_REGION, domyślnie 'eu-central-1')
+            base_url: Adres usługi (np. lokalny zamiennik w benchmarku / testach)
+            pool_size: Maksymalna liczba połączeń keep-alive
+            max_retries: Liczba ponowień przy 429 / 5xx i błędach połączenia
+            backoff_base: Bazowe opóźnienie ponowienia (s), rośnie wykładniczo
+            backoff_max: Maksymalne opóźnienie ponowienia (s)
+            http2: HTTP/2 przez httpx (bez httpx[http2] - HTTP/1.1 przez requests)
+        """
+        self.api_key = api_key or os.getenv("AWS_LOCATION_API_KEY")
+        self.region = region or os.getenv("AWS_REGION", "eu-central-1")
+        self.base_url = (base_url or f"https://routes.geo.{self.region}.amazonaws.com").rstrip('/')
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.http_version = 'HTTP/1.1'
+        self._session = self._create_session(http2)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.avg_ms: Optional[float] = None  # EWMA czasu udanego wywołania (z ponowieniami)
+
+    def _create_session(self, http2: bool):
+        if http2:
+            if httpx is None:
+                logger.warning("⚠️ AWS routes: HTTP/2 requires httpx[http2] - using HTTP/1.1")
+            else:
+                try:
+                    client = httpx.Client(
+                        http2=True,
+                        limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                        headers={"Content-Type": "application/json"}
+                    )
+                    self.http_version = 'HTTP/2'
+                    return client
+                except ImportError as e:
+                    logger.warning(f"⚠️ AWS routes: HTTP/2 unavailable ({e}) - using HTTP/1.1")
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers["Content-Type"] = "application/json"
+        return session
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        """Opóźnienie przed ponowieniem: Retry-After lub full jitter"""
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, path: str, payload: Dict[str, Any], timeout: float = 15) -> Optional[Dict]:
+        """
+        POST do Routes API z ponawianiem w granicach łącznego timeoutu.
+
+        Args:
+            path: Ścieżka endpointu (np. '/v2/routes')
+            payload: Body żądania (JSON)
+            timeout: Łączny czas na wywołanie z ponowieniami (s)
+
+        Returns:
+            Odpowiedź JSON lub None w przypadku błędu
+        """
+        if not self.api_key:
+            logger.error("❌ AWS routes: missing API key (AWS_LOCATION_API_KEY)")
+            return None
+
+        url = f"{self.base_url}{path}"
+        started = time.monotonic()
+        deadline = started + timeout
+        attempt = 0
+        with self._lock:
+            self.calls += 1
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            with self._lock:
+                self.attempts += 1
+            retry_after = None
+            try:
+                response = self._session.post(url, params={"key": self.api_key}, json=payload, timeout=remaining)
+            except _TIMEOUT_ERRORS:
+                logger.warning(f"⚠️ AWS routes timeout: path={path} attempt={attempt + 1} timeout_s={remaining:.1f}")
+                break
+            except _TRANSPORT_ERRORS as e:
+                logger.warning(f"⚠️ AWS routes connection error: path={path} attempt={attempt + 1} error={type(e).__name__}: {e}")
+                status = None
+            else:
+                status = response.status_code
+                if status == 200:
+                    try:
+                        data = response.json()
+                    except ValueError as e:
+                        # Ucięta / niepoprawna odpowiedź (np. proxy) - błąd wywołania, a nie wyjątek w wątku requestu
+                        logger.error(f"❌ AWS routes invalid JSON: path={path} error={e} body={response.text[:200]}")
+                        break
+                    elapsed_ms = (time.monotonic() - started) * 1000
+                    with self._lock:
+                        self.avg_ms = elapsed_ms if self.avg_ms is None else 0.8 * self.avg_ms + 0.2 * elapsed_ms
+                    logger.debug(f"🌐 AWS routes: path={path} status=200 attempts={attempt + 1} elapsed_ms={elapsed_ms:.0f}")
+                    return data
+                if status not in RETRY_STATUSES:
+                    logger.error(f"❌ AWS routes API error: path={path} status={status} body={response.text[:500]}")
+                    break
+                retry_after = response.headers.get("Retry-After")
+                logger.warning(f"⚠️ AWS routes retryable status: path={path} status={status} attempt={attempt + 1}")
+
+            if attempt >= self.max_retries:
+                break
+            delay = self._backoff(attempt, retry_after)
+            if time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+
+        with self._lock:
+            self.failures += 1
+        logger.error(f"❌ AWS routes failed: path={path} attempts={attempt + 1} elapsed_ms={(time.monotonic() - started) * 1000:.0f}")
+        return None
+
+    def route_distance(
+        self,
+        start_lat: float,
+        start_lng: float,
+        end_lat: float,
+        end_lng: float,
+        return_geometry: bool = False,
+        timeout: float = 15
+    ) -> Optional[Dict]:
+        """Dystans drogowy dla ciężarówek (wynik jak get_aws_route_distance)"""
+        # UWAGA: AWS wymaga kolejności [longitude, latitude]!
+        payload = {
+            "Origin": [start_lng, start_lat],
+            "Destination": [end_lng, end_lat],
+            "TravelMode": "Truck",              # Tryb dla ciężarówek
+            "OptimizeRoutingFor": "FastestRoute",  # Najszybsza trasa
+            "LegGeometryFormat": "Simple"       # Format geometrii trasy
+        }
+        data = self.post("/v2/routes", payload, timeout)
+        if data is None:
+            return None
+        if not data.get('Routes'):
+            logger.warning(f"⚠️ AWS routes: no route for [{start_lng}, {start_lat}] -> [{end_lng}, {end_lat}]")
+            return None
+        return _parse_route(data['Routes'][0], return_geometry)
+
+    def route_legs(
+        self,
+        points: Sequence[Tuple[float, float]],
+        timeout: float = 15
+    ) -> Optional[List[Dict]]:
+        """
+        Trasa przez kolejne punkty jednym zapytaniem (punkty pośrednie jako Waypoints).
+
+        Args:
+            points: Punkty trasy [(lat, lng), ...] - start, punkty pośrednie, cel
+            timeout: Łączny timeout w sekundach, z ponowieniami
+
+        Returns:
+            Lista odcinków [{'distance' km, 'duration' s}, ...] (len(points) - 1) lub None
+        """
+        payload = {
+            "Origin": [points[0][1], points[0][0]],
+            "Destination": [points[-1][1], points[-1][0]],
+            "Waypoints": [{"Position": [lng, lat]} for lat, lng in points[1:-1]],
+            "TravelMode": "Truck",
+            "OptimizeRoutingFor": "FastestRoute"
+        }
+        data = self.post("/v2/routes", payload, timeout)
+        if data is None:
+            return None
+        legs = (data.get('Routes') or [{}])[0].get('Legs', [])
+        if len(legs) != len(points) - 1:
+            logger.warning(f"⚠️ AWS routes: expected {len(points) - 1} legs, got {len(legs)}")
+            return None
+        return [
+            dict(
+                _parse_route({'Legs': [leg]}, return_geometry=False),
+                duration=leg.get('VehicleLegDetails', {}).get('Summary', {}).get('Overview', {}).get('Duration')
+            )
+            for leg in legs
+        ]
+
+    def route_matrix(
+        self,
+        origins: Sequence[Tuple[float, float]],
+        destinations: Sequence[Tuple[float, float]],
+        timeout: float = 30
+    ) -> Optional[List[List[Optional[Dict]]]]:
+        """
+        Dystanse dla wszystkich par start x cel jednym zapytaniem route-matrix
+        (bez podziału na porcje - patrz calculate_route_matrix).
+
+        Args:
+            origins: Punkty startowe [(lat, lng), ...]
+            destinations: Punkty docelowe [(lat, lng), ...]
+            timeout: Łączny timeout w sekundach, z ponowieniami
+
+        Returns:
+            Macierz [start][cel] z {'distance' km, 'duration' s} lub None (brak trasy),
+            None w przypadku błędu zapytania
+        """
+        payload = {
+            "Origins": [{"Position": [lng, lat]} for lat, lng in origins],
+            "Destinations": [{"Position": [lng, lat]} for lat, lng in destinations],
+            "TravelMode": "Truck",
+            "OptimizeRoutingFor": "FastestRoute",
+            "RoutingBoundary": {"Unbounded": True}
+        }
+        data = self.post("/v2/route-matrix", payload, timeout)
+        if data is None:
+            return None
+        rows = data.get('RouteMatrix') or []
+        if len(rows) != len(origins):
+            logger.error(f"❌ AWS route matrix: expected {len(origins)} rows, got {len(rows)}")
+            return None
+        return [
+            [
+                {'distance': round(cell['Distance'] / 1000.0, 2), 'duration': cell.get('Duration', 0)}
+                if cell and 'Distance' in cell and not cell.get('Error') else None
+                for cell in row
+            ]
+            for row in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Liczniki klienta (do metryk)"""
+        with self._lock:
+            return {
+                'base_url': self.base_url,
+                'http_version': self.http_version,
+                'pool_size': self.pool_size,
+                'calls': self.calls,
+                'attempts': self.attempts,
+                'retries': self.retries,
+                'failures': self.failures,
+                'avg_ms': round(self.avg_ms, 1) if self.avg_ms is not None else None
+            }
+
+    def close(self) -> None:
+        """Zamyka sesję i połączenia z puli"""
+        self._session.close()
+
+
+def _parse_route(route: Dict, return_geometry: bool) -> Dict:
+    """Trasa z odpowiedzi Routes API -> {'distance' km, opcjonalnie 'geometry', 'duration'}"""
+    # Suma dystansów ze wszystkich legs i travel steps
+    total_distance = 0
+    for leg in route.get('Legs', []):
+        vehicle_details = leg.get('VehicleLegDetails', {})
+        travel_steps = vehicle_details.get('TravelSteps', [])
+        for step in travel_steps:
+            total_distance += step.get('Distance', 0)
+    
+    # Konwertuj metry na kilometry
+    distance_km = total_distance / 1000.0
+    result = {'distance': round(distance_km, 2)}
+    
+    # Dodaj geometrię jeśli żądana
+    if return_geometry:
+        geometry_points = []
+        for leg in route.get('Legs', []):
+            leg_geometry = leg.get('Geometry', {})
+            if 'LineString' in leg_geometry:
+                # LineString to lista punktów [lng, lat]
+                geometry_points.extend(leg_geometry['LineString'])
+        
+        result['geometry'] = geometry_points
+        result['duration'] = route.get('Summary', {}).get('Duration', 0)  # Czas w sekundach
+    return result
+
+
+# Klienci per proces (worker gunicorn) i konfiguracja (klucz API, region)
+_CLIENTS: Dict[tuple, AwsRoutesClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_routes_client(api_key: Optional[str] = None, region: Optional[str] = None) -> AwsRoutesClient:
+    """
+    Współdzielony klient bieżącego procesu (sesja nie jest dziedziczona po fork).
+
+    Args:
+        api_key: AWS API Key (None = AWS_LOCATION_API_KEY)
+        region: Region AWS (None = AWS_REGION)
+    """
+    api_key = api_key or os.getenv("AWS_LOCATION_API_KEY")
+    region = region or os.getenv("AWS_REGION", "eu-central-1")
+    key = (os.getpid(), api_key, region)
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                client = AwsRoutesClient(
+                    api_key=api_key,
+                    region=region,
+                    pool_size=int(os.getenv("AWS_ROUTES_POOL_SIZE", "10")),
+                    max_retries=int(os.getenv("AWS_ROUTES_MAX_RETRIES", "2")),
+                    http2=os.getenv("AWS_ROUTES_HTTP2", "false").lower() == "true"
+                )
+                _CLIENTS[key] = client
+                logger.info(f"✅ AWS routes client initialized: region={region} http={client.http_version} pool={client.pool_size}")
+    return client
+
+
+def calculate_route_matrix(
+    origins: Sequence[Tuple[float, float]],
+    destinations: Sequence[Tuple[float, float]],
+    client: Optional[AwsRoutesClient] = None,
+    max_origins: int = ROUTE_MATRIX_MAX_ORIGINS,
+    max_destinations: int = ROUTE_MATRIX_MAX_DESTINATIONS,
+    max_workers: int = 4,
+    timeout: float = 60
+) -> List[List[Optional[Dict]]]:
+    """
+    Macierz dystansów drogowych dla ciężarówek: porcje start x cel w limitach
+    jednego zapytania route-matrix, wysyłane równolegle (max_workers wątków).
+
+    Args:
+        origins: Punkty startowe [(lat, lng), ...]
+        destinations: Punkty docelowe [(lat, lng), ...]
+        client: Klient Routes API (None = get_routes_client())
+        max_origins: Maksymalna liczba startów w jednym zapytaniu
+        max_destinations: Maksymalna liczba celów w jednym zapytaniu
+        max_workers: Maksymalna liczba równoległych zapytań
+        timeout: Łączny czas na całą macierz (s) - porcje bez czasu są pomijane
+
+    Returns:
+        Macierz [start][cel] z {'distance' km, 'duration' s} lub None
+        (brak trasy / błąd porcji)
+    """
+    client = client or get_routes_client()
+    matrix: List[List[Optional[Dict]]] = [[None] * len(destinations) for _ in origins]
+    chunks = [
+        (origin_start, destination_start)
+        for origin_start in range(0, len(origins), max_origins)
+        for destination_start in range(0, len(destinations), max_destinations)
+    ]
+    if not chunks:
+        return matrix
+
+    started = time.monotonic()
+    deadline = started + timeout
+
+    def fetch_chunk(chunk: Tuple[int, int]) -> bool:
+        origin_start, destination_start = chunk
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        block = client.route_matrix(
+            origins[origin_start:origin_start + max_origins],
+            destinations[destination_start:destination_start + max_destinations],
+            timeout=remaining
+        )
+        if block is None:
+            return False
+        for row_offset, row in enumerate(block):
+            matrix[origin_start + row_offset][destination_start:destination_start + len(row)] = row
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        succeeded = sum(executor.map(fetch_chunk, chunks))
+
+    logger.info(f"🧮 AWS route matrix: origins={len(origins)} destinations={len(destinations)} "
+                f"chunks={len(chunks)} failed_chunks={len(chunks) - succeeded} "
+                f"elapsed_ms={(time.monotonic() - started) * 1000:.0f}")
+    return matrix
 
 
 def get_aws_route_distance(
@@ -25,11 +456,15 @@ def get_aws_route_distance(
     end_lng: float, 
     return_geometry: bool = False,
     aws_api_key: Optional[str] = None,
-    aws_region: Optional[str] = None
+    aws_region: Optional[str] = None,
+    timeout: float = 15
 ) -> Optional[Dict]:
     """
     Wywołuje AWS Location Service Routes API aby obliczyć rzeczywisty dystans drogowy dla ciężarówek.
     
+    Używa współdzielonego klienta procesu (get_routes_client) - połączenia keep-alive
+    i ponawianie 429 / 5xx w granicach timeoutu.
+    
     Args:
         start_lat (float): Szerokość geograficzna punktu startowego
         start_lng (float): Długość geograficzna punktu startowego
@@ -38,6 +473,7 @@ def get_aws_route_distance(
         return_geometry (bool): Czy zwrócić również geometrię trasy (dla mapy)
         aws_api_key (str, optional): AWS API Key. Jeśli None, pobiera z zmiennej środowiskowej AWS_LOCATION_API_KEY
         aws_region (str, optional): AWS Region. Jeśli None, pobiera z zmiennej środowiskowej AWS_REGION (domyślnie 'eu-central-1')
+        timeout (float): Łączny timeout w sekundach, z ponowieniami (np. z pozostałego budżetu requestu)
     
     Returns:
         Dict z kluczami:
@@ -59,95 +495,28 @@ def get_aws_route_distance(
         >>> if result:
         ...     print(f"Punkty trasy: {len(result['geometry'])}")
     """
-    # Pobierz konfigurację
-    api_key = aws_api_key or os.getenv("AWS_LOCATION_API_KEY")
-    region = aws_region or os.getenv("AWS_REGION", "eu-central-1")
-    
-    if not api_key:
-        print("[AWS] ❌ BŁĄD: Brak API key (AWS_LOCATION_API_KEY)")
-        return None
-    
-    try:
-        # AWS Location Service Routes API v2 endpoint
-        url = f"https://routes.geo.{region}.amazonaws.com/v2/routes?key={api_key}"
-        
-        print(f"[AWS] 🌐 URL: {url[:80]}...")
-        print(f"[AWS] 📍 Origin: [{start_lng}, {start_lat}]")
-        print(f"[AWS] 📍 Destination: [{end_lng}, {end_lat}]")
-        
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        # UWAGA: AWS wymaga kolejności [longitude, latitude]!
-        payload = {
-            "Origin": [start_lng, start_lat],
-            "Destination": [end_lng, end_lat],
-            "TravelMode": "Truck",              # Tryb dla ciężarówek
-            "OptimizeRoutingFor": "FastestRoute",  # Najszybsza trasa
-            "LegGeometryFormat": "Simple"       # Format geometrii trasy
-        }
-        
-        print(f"[AWS] 📤 Wysyłam request do AWS...")
-        response = requests.post(url, json=payload, headers=headers, timeout=15)
-        print(f"[AWS] 📥 Otrzymano odpowiedź: status={response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if 'Routes' in data and len(data['Routes']) > 0:
-                route = data['Routes'][0]
-                
-                # Suma dystansów ze wszystkich legs i travel steps
-                total_distance = 0
-                for leg in route.get('Legs', []):
-                    vehicle_details = leg.get('VehicleLegDetails', {})
-                    travel_steps = vehicle_details.get('TravelSteps', [])
-                    for step in travel_steps:
-                        total_distance += step.get('Distance', 0)
-                
-                # Konwertuj metry na kilometry
-                distance_km = total_distance / 1000.0
-                result = {'distance': round(distance_km, 2)}
-                
-                # Dodaj geometrię jeśli żądana
-                if return_geometry:
-                    geometry_points = []
-                    for leg in route.get('Legs', []):
-                        leg_geometry = leg.get('Geometry', {})
-                        if 'LineString' in leg_geometry:
-                            # LineString to lista punktów [lng, lat]
-                            geometry_points.extend(leg_geometry['LineString'])
-                    
-                    result['geometry'] = geometry_points
-                    result['duration'] = route.get('Summary', {}).get('Duration', 0)  # Czas w sekundach
-                    print(f"[AWS] ✓ Dystans: {distance_km:.2f} km, Punkty trasy: {len(geometry_points)}")
-                else:
-                    print(f"[AWS] ✓ Dystans AWS: {distance_km:.2f} km")
-                
-                return result
-            else:
-                print(f"[AWS] ❌ Brak tras w odpowiedzi")
-                return None
-        
-        print(f"[AWS] ❌ Błąd API: status={response.status_code}")
-        print(f"[AWS] Response body: {response.text[:500]}")
-        return None
-            
-    except requests.exceptions.Timeout:
-        print("[AWS] ❌ Timeout (15s) - brak odpowiedzi od AWS")
-        return None
-    except requests.exceptions.ConnectionError as e:
-        print(f"[AWS] ❌ ConnectionError: {e}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"[AWS] ❌ RequestException: {e}")
-        return None
-    except Exception as e:
-        print(f"[AWS] ❌ Nieoczekiwany błąd: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+    client = get_routes_client(aws_api_key, aws_region)
+    return client.route_distance(start_lat, start_lng, end_lat, end_lng, return_geometry, timeout)
+
+
+def get_aws_route_legs(
+    points: Sequence[Tuple[float, float]],
+    aws_api_key: Optional[str] = None,
+    aws_region: Optional[str] = None,
+    timeout: float = 15
+) -> Optional[List[Dict]]:
+    """
+    Dystanse odcinków trasy wielopunktowej jednym wywołaniem AWS (Waypoints).
+
+    Args:
+        points: Punkty trasy [(lat, lng), ...] w kolejności przejazdu
+        timeout: Łączny timeout w sekundach, z ponowieniami
+
+    Returns:
+        Lista odcinków [{'distance' km, 'duration' s}, ...] lub None w przypadku błędu
+    """
+    client = get_routes_client(aws_api_key, aws_region)
+    return client.route_legs(points, timeout)
 
 
 def calculate_haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -215,7 +584,7 @@ def get_route_distance_with_fallback(
         return aws_result
     
     # Fallback: Haversine
-    print("[AWS] ⚠️  Używam fallback (Haversine)")
+    logger.warning("⚠️ AWS routes unavailable - using Haversine fallback")
     haversine_dist = calculate_haversine_distance(start_lat, start_lng, end_lat, end_lng)
     road_distance = round(haversine_dist * road_factor, 2)
     
@@ -235,6 +604,7 @@ if __name__ == "__main__":
         load_dotenv()
     except ImportError:
         print("python-dotenv nie jest zainstalowane - używam zmiennych systemowych")
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     
     # Test 1: Warszawa -> Kraków
     print("\n" + "="*60)
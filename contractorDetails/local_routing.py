@@ -0,0 +1,628 @@
+"""
+Lokalny silnik tras ciężarówek (contraction hierarchies) - zamiennik AWS Routes API
+
+Graf dróg wczytywany jest z lokalnego pliku tekstowego (opcjonalnie .gz):
+
+    # komentarz
+    N <id> <lat> <lng>
+    E <od> <do> <metry> <sekundy> [1 = jednokierunkowa]
+
+Czas krawędzi jest ograniczony prędkością ciężarówki (`truck_max_kmh`), a trasa
+wyznaczana jest po najkrótszym czasie (dystans liczony wzdłuż tej trasy).
+
+Preprocessing buduje contraction hierarchies: węzły są kontraktowane w kolejności
+"edge difference" (leniwe aktualizacje priorytetu), a brakujące najkrótsze ścieżki
+zastępowane skrótami (witness search z limitem). Zapytanie to dwukierunkowy
+Dijkstra tylko "w górę" hierarchii - setki zamiast setek tysięcy odwiedzonych
+węzłów. Macierze (wiele startów x celów) liczone są metodą kubełkową: jedno
+przeszukanie wstecz na cel i jedno w przód na start.
+
+Preprocessing wykonywany jest offline (`build_local_routing.py`) i zapisywany obok
+grafu (`<graf>.ch`). API tylko wczytuje gotowy plik - brak pliku lub plik nieaktualny
+(zmieniony graf / prędkość ciężarówki) to `HierarchyUnavailable`, a nie kontrakcja
+w każdym workerze przy starcie.
+
+Interfejs jak AWS:
+- get_local_route_distance(...)  - jak get_aws_route_distance
+- get_local_route_legs(...)      - jak get_aws_route_legs
+- local_route_matrix(...)        - jak calculate_route_matrix
+
+Przygotowanie grafu (preprocessing bez uruchamiania API):
+    python build_local_routing.py data/roads.graph
+
+Zależności: brak (tylko biblioteka standardowa)
+"""
+
+import gzip
+import heapq
+import json
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LCH1'
+_HEADER = struct.Struct('<4sIII')
+EARTH_RADIUS_KM = 6371.0
+# Dojazd od punktu do najbliższego węzła grafu (prosta linia, km/h)
+ACCESS_SPEED_KMH = 30.0
+# Komórka siatki indeksu przestrzennego (stopnie)
+_GRID_CELL = 0.1
+
+
+def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _open_text(path: str):
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, 'r', encoding='utf-8')
+
+
+def read_graph(path: str, truck_max_kmh: float = 80.0):
+    """
+    Wczytuje graf dróg z pliku tekstowego.
+
+    Returns:
+        Tuple (lat, lng, krawędzie {(od, do): (czas s, dystans m)}) - węzły numerowane od 0
+    """
+    index: Dict[str, int] = {}
+    lat, lng = array('d'), array('d')
+    edges: Dict[Tuple[int, int], Tuple[float, float]] = {}
+    min_seconds_per_meter = 3.6 / truck_max_kmh
+
+    with _open_text(path) as f:
+        for line_no, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts or parts[0].startswith('#'):
+                continue
+            if parts[0] == 'N':
+                index[parts[1]] = len(lat)
+                lat.append(float(parts[2]))
+                lng.append(float(parts[3]))
+            elif parts[0] == 'E':
+                source, target = index[parts[1]], index[parts[2]]
+                meters, seconds = float(parts[3]), float(parts[4])
+                seconds = max(seconds, meters * min_seconds_per_meter)
+                oneway = len(parts) > 5 and parts[5] == '1'
+                for key in ((source, target),) if oneway else ((source, target), (target, source)):
+                    if key[0] != key[1] and (key not in edges or seconds < edges[key][0]):
+                        edges[key] = (seconds, meters)
+            else:
+                raise ValueError(f"{path}:{line_no}: nieznany typ wiersza '{parts[0]}'")
+    return lat, lng, edges
+
+
+def _witness_search(out_edges, source: int, excluded: int, max_weight: float, settle_limit: int) -> Dict[int, float]:
+    """Ograniczony Dijkstra w niekontraktowanym grafie z pominięciem węzła `excluded`"""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap and settled < settle_limit:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > max_weight:
+            break
+        settled += 1
+        for v, (w, _, _) in out_edges[u].items():
+            if v == excluded:
+                continue
+            nd = d + w
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def contract(n: int, edges: Dict[Tuple[int, int], Tuple[float, float]], settle_limit: int = 200):
+    """
+    Buduje contraction hierarchies.
+
+    Returns:
+        Tuple (forward_up, backward_up) - per węzeł lista (sąsiad wyżej w hierarchii,
+        czas, dystans, węzeł pośredni skrótu lub -1)
+    """
+    out_edges: List[Dict[int, Tuple[float, float, int]]] = [dict() for _ in range(n)]
+    in_edges: List[Dict[int, Tuple[float, float, int]]] = [dict() for _ in range(n)]
+    for (u, v), (w, d) in edges.items():
+        out_edges[u][v] = (w, d, -1)
+        in_edges[v][u] = (w, d, -1)
+
+    contracted = [False] * n
+    deleted_neighbours = [0] * n
+    level = [0] * n
+    forward_up: List[List[Tuple[int, float, float, int]]] = [[] for _ in range(n)]
+    backward_up: List[List[Tuple[int, float, float, int]]] = [[] for _ in range(n)]
+
+    def shortcuts_for(v: int, limit: int) -> List[Tuple[int, int, float, float]]:
+        shortcuts = []
+        if not out_edges[v]:
+            return shortcuts
+        max_out = max(w for w, _, _ in out_edges[v].values())
+        for u, (w_in, d_in, _) in in_edges[v].items():
+            witness = _witness_search(out_edges, u, v, w_in + max_out, limit)
+            for x, (w_out, d_out, _) in out_edges[v].items():
+                if x != u and witness.get(x, math.inf) > w_in + w_out:
+                    shortcuts.append((u, x, w_in + w_out, d_in + d_out))
+        return shortcuts
+
+    def priority(v: int) -> int:
+        edge_difference = len(shortcuts_for(v, settle_limit // 4)) - len(in_edges[v]) - len(out_edges[v])
+        return 2 * edge_difference + deleted_neighbours[v] + level[v]
+
+    heap = [(priority(v), v) for v in range(n)]
+    heapq.heapify(heap)
+    shortcut_count = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        if contracted[v]:
+            continue
+        # Leniwa aktualizacja - priorytet mógł wzrosnąć od wstawienia do kopca
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+
+        shortcuts = shortcuts_for(v, settle_limit)
+        forward_up[v] = [(x, w, d, mid) for x, (w, d, mid) in out_edges[v].items()]
+        backward_up[v] = [(u, w, d, mid) for u, (w, d, mid) in in_edges[v].items()]
+        contracted[v] = True
+        for x in out_edges[v]:
+            del in_edges[x][v]
+            deleted_neighbours[x] += 1
+            level[x] = max(level[x], level[v] + 1)
+        for u in in_edges[v]:
+            del out_edges[u][v]
+            deleted_neighbours[u] += 1
+            level[u] = max(level[u], level[v] + 1)
+        out_edges[v], in_edges[v] = {}, {}
+        for u, x, w, d in shortcuts:
+            if w < out_edges[u].get(x, (math.inf,))[0]:
+                out_edges[u][x] = (w, d, v)
+                in_edges[x][u] = (w, d, v)
+                shortcut_count += 1
+
+    logger.info(f"🛣️ Contraction hierarchies: {n} nodes, {len(edges)} edges, {shortcut_count} shortcuts")
+    return forward_up, backward_up
+
+
+def _write_ch(path: str, meta: Dict, lat: array, lng: array, forward_up, backward_up) -> None:
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(lat), 0, len(meta_bytes)))
+        f.write(meta_bytes)
+        f.write(lat.tobytes())
+        f.write(lng.tobytes())
+        for adjacency in (forward_up, backward_up):
+            offsets, targets, mids = array('I', [0]), array('I'), array('i')
+            weights, distances = array('d'), array('d')
+            for edges in adjacency:
+                for target, w, d, mid in edges:
+                    targets.append(target)
+                    weights.append(w)
+                    distances.append(d)
+                    mids.append(mid)
+                offsets.append(len(targets))
+            f.write(struct.pack('<I', len(targets)))
+            for column in (offsets, targets, weights, distances, mids):
+                f.write(column.tobytes())
+    os.replace(tmp_path, path)
+
+
+def _read_ch(path: str):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    magic, n, _, meta_len = _HEADER.unpack_from(raw, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Nieprawidłowy plik contraction hierarchies: {path}")
+    offset = _HEADER.size
+    meta = json.loads(raw[offset:offset + meta_len].decode('utf-8'))
+    offset += meta_len
+
+    def take(typecode: str, count: int) -> array:
+        nonlocal offset
+        column = array(typecode)
+        column.frombytes(raw[offset:offset + column.itemsize * count])
+        offset += column.itemsize * count
+        return column
+
+    lat, lng = take('d', n), take('d', n)
+    adjacencies = []
+    for _ in range(2):
+        m, = struct.unpack_from('<I', raw, offset)
+        offset += 4
+        offsets, targets = take('I', n + 1), take('I', m)
+        weights, distances, mids = take('d', m), take('d', m), take('i', m)
+        adjacencies.append([
+            [(targets[i], weights[i], distances[i], mids[i]) for i in range(offsets[v], offsets[v + 1])]
+            for v in range(n)
+        ])
+    return meta, lat, lng, adjacencies[0], adjacencies[1]
+
+
+class HierarchyUnavailable(RuntimeError):
+    """Brak aktualnego pliku contraction hierarchies grafu - wymagany build_local_routing.py"""
+
+
+def _hierarchy_meta(graph_path: str, truck_max_kmh: float) -> Dict:
+    """Parametry, z którymi zbudowano plik .ch (inne = plik nieaktualny)"""
+    return {'truck_max_kmh': truck_max_kmh, 'graph_mtime': os.stat(graph_path).st_mtime}
+
+
+def hierarchy_status(graph_path: str, truck_max_kmh: float = 80.0) -> Optional[str]:
+    """
+    Sprawdza plik `<graf>.ch` bez wczytywania hierarchii.
+
+    Returns:
+        None gdy plik jest aktualny, w przeciwnym razie powód ('brak pliku', 'nieaktualny ...')
+    """
+    ch_path = f"{graph_path}.ch"
+    if not os.path.exists(ch_path):
+        return 'brak pliku'
+    try:
+        with open(ch_path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            magic, _, _, meta_len = _HEADER.unpack(header)
+            if magic != MAGIC:
+                return 'nieprawidłowy plik'
+            meta = json.loads(f.read(meta_len).decode('utf-8'))
+    except (OSError, ValueError, struct.error) as e:
+        return f'nie można odczytać ({e})'
+    if meta != _hierarchy_meta(graph_path, truck_max_kmh):
+        return 'nieaktualny (zmieniony graf lub truck_max_kmh)'
+    return None
+
+
+def build_hierarchy(graph_path: str, truck_max_kmh: float = 80.0, settle_limit: int = 200) -> Dict:
+    """
+    Preprocessing offline: kontrakcja grafu i zapis `<graf>.ch` (atomowo).
+
+    Args:
+        graph_path: Ścieżka pliku grafu dróg (.graph / .graph.gz)
+        truck_max_kmh: Maksymalna prędkość ciężarówki (ogranicza czas krawędzi)
+        settle_limit: Limit węzłów witness search
+
+    Returns:
+        Statystyki: ch, nodes, edges, seconds
+    """
+    started = time.monotonic()
+    meta = _hierarchy_meta(graph_path, truck_max_kmh)
+    lat, lng, edges = read_graph(graph_path, truck_max_kmh)
+    forward_up, backward_up = contract(len(lat), edges, settle_limit)
+    ch_path = f"{graph_path}.ch"
+    _write_ch(ch_path, meta, lat, lng, forward_up, backward_up)
+    return {'ch': ch_path, 'nodes': len(lat), 'edges': len(edges), 'seconds': round(time.monotonic() - started, 1)}
+
+
+class LocalRouter:
+    """Zapytania o trasy ciężarówek w contraction hierarchies (thread-safe po załadowaniu)"""
+
+    def __init__(self, graph_path: str, truck_max_kmh: float = 80.0, max_snap_km: float = 25.0,
+                 settle_limit: int = 200, build_missing: bool = False):
+        """
+        Args:
+            graph_path: Ścieżka pliku grafu dróg (.graph / .graph.gz)
+            truck_max_kmh: Maksymalna prędkość ciężarówki (ogranicza czas krawędzi)
+            max_snap_km: Maksymalna odległość punktu od najbliższego węzła grafu
+            settle_limit: Limit węzłów witness search w preprocessingu (tylko build_missing)
+            build_missing: Czy zbudować brakującą / nieaktualną hierarchię (benchmarki, testy) -
+                domyślnie HierarchyUnavailable
+
+        Raises:
+            HierarchyUnavailable: Brak aktualnego pliku `<graf>.ch` (i build_missing=False)
+        """
+        self.graph_path = graph_path
+        self.max_snap_km = max_snap_km
+        self.queries = 0
+        self.failures = 0
+        started = time.monotonic()
+        ch_path = f"{graph_path}.ch"
+        problem = hierarchy_status(graph_path, truck_max_kmh)
+        built = problem is not None
+        if built:
+            if not build_missing:
+                raise HierarchyUnavailable(
+                    f"Contraction hierarchies {ch_path}: {problem} - uruchom: python build_local_routing.py {graph_path}"
+                )
+            logger.info(f"🛠️ Building contraction hierarchies {ch_path} ({problem})")
+            build_hierarchy(graph_path, truck_max_kmh, settle_limit)
+        _, self.lat, self.lng, self.forward_up, self.backward_up = _read_ch(ch_path)
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for node, (node_lat, node_lng) in enumerate(zip(self.lat, self.lng)):
+            self._grid.setdefault((int(node_lat // _GRID_CELL), int(node_lng // _GRID_CELL)), []).append(node)
+        self.load_seconds = time.monotonic() - started
+        logger.info(f"✅ Local router ready: {len(self.lat)} nodes ({'built' if built else 'loaded'} "
+                    f"in {self.load_seconds:.1f}s)")
+
+    def snap(self, lat: float, lng: float) -> Optional[Tuple[int, float]]:
+        """Najbliższy węzeł grafu i odległość do niego (km) lub None poza max_snap_km"""
+        cell_lat, cell_lng = int(lat // _GRID_CELL), int(lng // _GRID_CELL)
+        cell_km = _GRID_CELL * 111.0 * max(0.1, math.cos(math.radians(min(abs(lat), 85.0))))
+        best, best_km = None, math.inf
+        radius = 0
+        while radius * cell_km <= self.max_snap_km + cell_km:
+            for i in range(cell_lat - radius, cell_lat + radius + 1):
+                for j in range(cell_lng - radius, cell_lng + radius + 1):
+                    if max(abs(i - cell_lat), abs(j - cell_lng)) != radius:
+                        continue
+                    for node in self._grid.get((i, j), ()):
+                        km = _haversine_km(lat, lng, self.lat[node], self.lng[node])
+                        if km < best_km:
+                            best, best_km = node, km
+            # Węzeł w dalszym pierścieniu nie może być bliżej niż (radius) komórek
+            if best is not None and best_km <= radius * cell_km:
+                break
+            radius += 1
+        if best is None or best_km > self.max_snap_km:
+            return None
+        return best, best_km
+
+    @staticmethod
+    def _upward_search(adjacency, stall_adjacency, source: int):
+        """
+        Dijkstra w górę hierarchii ze "stall-on-demand": węzeł osiągalny krócej przez
+        wyższy węzeł (krawędź w dół z `stall_adjacency`) nie jest rozwijany ani zwracany.
+
+        Returns:
+            {węzeł: (czas, dystans, poprzednik, węzeł pośredni krawędzi)}
+        """
+        tentative = {source: 0.0}
+        settled = {}
+        heap = [(0.0, 0.0, source, -1, -1)]
+        while heap:
+            w, d, v, parent, mid = heapq.heappop(heap)
+            if v in settled or w > tentative[v]:
+                continue
+            if any(tentative.get(u, math.inf) + edge_w < w for u, edge_w, _, _ in stall_adjacency[v]):
+                continue
+            settled[v] = (w, d, parent, mid)
+            for target, edge_w, edge_d, edge_mid in adjacency[v]:
+                nw = w + edge_w
+                if nw < tentative.get(target, math.inf):
+                    tentative[target] = nw
+                    heapq.heappush(heap, (nw, d + edge_d, target, v, edge_mid))
+        return settled
+
+    def _query(self, source: int, target: int):
+        """Dwukierunkowe zapytanie CH: (czas s, dystans m, węzeł spotkania, drzewo w przód, drzewo wstecz)"""
+        heaps = ([(0.0, 0.0, source, -1, -1)], [(0.0, 0.0, target, -1, -1)])
+        tentative = ({source: 0.0}, {target: 0.0})
+        settled = ({}, {})
+        adjacencies = (self.forward_up, self.backward_up)
+        # Krawędzie z wyższych węzłów do v (stall-on-demand): w przód u -> v, wstecz v -> u
+        stall_adjacencies = (self.backward_up, self.forward_up)
+        best, best_node = math.inf, None
+        side = 0
+        while heaps[0] or heaps[1]:
+            if not heaps[side] or (heaps[1 - side] and heaps[1 - side][0][0] < heaps[side][0][0]):
+                side = 1 - side
+            heap = heaps[side]
+            # Oba kierunki nie poprawią już najlepszego spotkania
+            if min(h[0][0] if h else math.inf for h in heaps) >= best:
+                break
+            w, d, v, parent, mid = heapq.heappop(heap)
+            if v in settled[side] or w > tentative[side][v]:
+                continue
+            if any(tentative[side].get(u, math.inf) + edge_w < w for u, edge_w, _, _ in stall_adjacencies[side][v]):
+                continue
+            settled[side][v] = (w, d, parent, mid)
+            other = settled[1 - side].get(v)
+            if other is not None and w + other[0] < best:
+                best, best_node = w + other[0], v
+            for target_node, edge_w, edge_d, edge_mid in adjacencies[side][v]:
+                nw = w + edge_w
+                if nw < tentative[side].get(target_node, math.inf):
+                    tentative[side][target_node] = nw
+                    heapq.heappush(heap, (nw, d + edge_d, target_node, v, edge_mid))
+        if best_node is None:
+            return None
+        distance = settled[0][best_node][1] + settled[1][best_node][1]
+        return best, distance, best_node, settled[0], settled[1]
+
+    def _edge(self, u: int, v: int) -> Tuple[int, float]:
+        """Węzeł pośredni i czas krawędzi u -> v hierarchii (do rozwijania skrótów)"""
+        for target, w, _, mid in self.forward_up[u]:
+            if target == v:
+                return mid, w
+        for source, w, _, mid in self.backward_up[v]:
+            if source == u:
+                return mid, w
+        raise KeyError((u, v))
+
+    def _unpack(self, u: int, v: int, mid: int, out: List[int]) -> None:
+        """Rozwija krawędź u -> v (skrót przez mid) do węzłów oryginalnego grafu (bez u)"""
+        stack = [(u, v, mid)]
+        while stack:
+            a, b, m = stack.pop()
+            if m < 0:
+                out.append(b)
+                continue
+            stack.append((m, b, self._edge(m, b)[0]))
+            stack.append((a, m, self._edge(a, m)[0]))
+
+    def _path(self, source: int, meeting: int, forward, backward) -> List[int]:
+        chain = []
+        v = meeting
+        while v != source:
+            _, _, parent, mid = forward[v]
+            chain.append((parent, v, mid))
+            v = parent
+        nodes = [source]
+        for u, v, mid in reversed(chain):
+            self._unpack(u, v, mid, nodes)
+        v = meeting
+        while backward[v][2] != -1:
+            _, _, parent, mid = backward[v]
+            self._unpack(v, parent, mid, nodes)
+            v = parent
+        return nodes
+
+    def route(self, start_lat: float, start_lng: float, end_lat: float, end_lng: float,
+              return_geometry: bool = False) -> Optional[Dict]:
+        """
+        Trasa ciężarówki między punktami.
+
+        Returns:
+            {'distance' km, 'duration' s, opcjonalnie 'geometry' [[lng, lat], ...]} lub None
+            (punkt poza grafem / brak połączenia)
+        """
+        self.queries += 1
+        start, end = self.snap(start_lat, start_lng), self.snap(end_lat, end_lng)
+        result = self._query(start[0], end[0]) if start and end else None
+        if result is None:
+            self.failures += 1
+            return None
+        seconds, meters, meeting, forward, backward = result
+        access_km = start[1] + end[1]
+        route = {
+            'distance': round(meters / 1000.0 + access_km, 2),
+            'duration': int(round(seconds + access_km / ACCESS_SPEED_KMH * 3600))
+        }
+        if return_geometry:
+            nodes = self._path(start[0], meeting, forward, backward)
+            route['geometry'] = (
+                [[start_lng, start_lat]] + [[self.lng[v], self.lat[v]] for v in nodes] + [[end_lng, end_lat]]
+            )
+        return route
+
+    def route_legs(self, points: Sequence[Tuple[float, float]]) -> Optional[List[Dict]]:
+        """Odcinki trasy przez kolejne punkty [{'distance' km, 'duration' s}, ...] lub None"""
+        legs = [self.route(*start, *end) for start, end in zip(points, points[1:])]
+        return None if any(leg is None for leg in legs) else legs
+
+    def matrix(self, origins: Sequence[Tuple[float, float]],
+               destinations: Sequence[Tuple[float, float]]) -> List[List[Optional[Dict]]]:
+        """
+        Macierz tras metodą kubełkową: przeszukanie wstecz z każdego celu zapisuje
+        (cel, czas, dystans) w kubełkach węzłów, przeszukanie w przód z każdego startu
+        łączy się z kubełkami odwiedzonych węzłów.
+
+        Returns:
+            Macierz [start][cel] z {'distance' km, 'duration' s} lub None
+        """
+        matrix: List[List[Optional[Dict]]] = [[None] * len(destinations) for _ in origins]
+        snapped_destinations = [self.snap(lat, lng) for lat, lng in destinations]
+        buckets: Dict[int, List[Tuple[int, float, float]]] = {}
+        for column, snapped in enumerate(snapped_destinations):
+            if snapped is None:
+                continue
+            for v, (w, d, _, _) in self._upward_search(self.backward_up, self.forward_up, snapped[0]).items():
+                buckets.setdefault(v, []).append((column, w, d))
+
+        for row, (lat, lng) in enumerate(origins):
+            snapped = self.snap(lat, lng)
+            if snapped is None:
+                continue
+            best: Dict[int, Tuple[float, float]] = {}
+            for v, (w, d, _, _) in self._upward_search(self.forward_up, self.backward_up, snapped[0]).items():
+                for column, bucket_w, bucket_d in buckets.get(v, ()):
+                    if w + bucket_w < best.get(column, (math.inf,))[0]:
+                        best[column] = (w + bucket_w, d + bucket_d)
+            for column, (seconds, meters) in best.items():
+                access_km = snapped[1] + snapped_destinations[column][1]
+                matrix[row][column] = {
+                    'distance': round(meters / 1000.0 + access_km, 2),
+                    'duration': int(round(seconds + access_km / ACCESS_SPEED_KMH * 3600))
+                }
+        self.queries += len(origins) * len(destinations)
+        return matrix
+
+    def stats(self) -> Dict:
+        """Statystyki silnika (do /api/metrics)"""
+        return {
+            'graph': self.graph_path,
+            'nodes': len(self.lat),
+            'load_seconds': round(self.load_seconds, 2),
+            'queries': self.queries,
+            'failures': self.failures
+        }
+
+
+_ROUTERS: Dict[str, LocalRouter] = {}
+_ROUTERS_LOCK = threading.Lock()
+
+
+def get_local_router(graph_path: Optional[str] = None) -> LocalRouter:
+    """
+    Silnik procesu dla pliku grafu (gotowa hierarchia wczytywana raz).
+
+    Zmienne środowiskowe: LOCAL_ROUTING_GRAPH_FILE, LOCAL_ROUTING_TRUCK_MAX_KMH (80),
+    LOCAL_ROUTING_MAX_SNAP_KM (25)
+
+    Raises:
+        HierarchyUnavailable: Brak aktualnego pliku `<graf>.ch` (build_local_routing.py)
+    """
+    graph_path = graph_path or os.getenv('LOCAL_ROUTING_GRAPH_FILE', 'data/roads.graph')
+    router = _ROUTERS.get(graph_path)
+    if router is None:
+        with _ROUTERS_LOCK:
+            router = _ROUTERS.get(graph_path)
+            if router is None:
+                router = LocalRouter(
+                    graph_path,
+                    truck_max_kmh=float(os.getenv('LOCAL_ROUTING_TRUCK_MAX_KMH', '80')),
+                    max_snap_km=float(os.getenv('LOCAL_ROUTING_MAX_SNAP_KM', '25'))
+                )
+                _ROUTERS[graph_path] = router
+    return router
+
+
+def get_local_route_distance(
+    start_lat: float,
+    start_lng: float,
+    end_lat: float,
+    end_lng: float,
+    return_geometry: bool = False,
+    graph_path: Optional[str] = None,
+    timeout: float = 15
+) -> Optional[Dict]:
+    """
+    Dystans drogowy ciężarówki z lokalnego grafu - ten sam wynik co get_aws_route_distance.
+
+    Args:
+        start_lat, start_lng: Punkt startowy
+        end_lat, end_lng: Punkt końcowy
+        return_geometry: Czy zwrócić geometrię trasy [[lng, lat], ...]
+        graph_path: Plik grafu (None = LOCAL_ROUTING_GRAPH_FILE)
+        timeout: Bez znaczenia (zapytanie trwa milisekundy) - zgodność z get_aws_route_distance
+
+    Returns:
+        {'distance' km, 'duration' s, opcjonalnie 'geometry'} lub None
+    """
+    try:
+        return get_local_router(graph_path).route(start_lat, start_lng, end_lat, end_lng, return_geometry)
+    except Exception as e:
+        logger.error(f"❌ Local routing error: {e}")
+        return None
+
+
+def get_local_route_legs(
+    points: Sequence[Tuple[float, float]],
+    graph_path: Optional[str] = None,
+    timeout: float = 15
+) -> Optional[List[Dict]]:
+    """Odcinki trasy wielopunktowej z lokalnego grafu - ten sam wynik co get_aws_route_legs"""
+    try:
+        return get_local_router(graph_path).route_legs(points)
+    except Exception as e:
+        logger.error(f"❌ Local routing error: {e}")
+        return None
+
+
+def local_route_matrix(
+    origins: Sequence[Tuple[float, float]],
+    destinations: Sequence[Tuple[float, float]],
+    graph_path: Optional[str] = None,
+    **_ignored
+) -> List[List[Optional[Dict]]]:
+    """Macierz tras z lokalnego grafu - ten sam wynik co calculate_route_matrix"""
+    return get_local_router(graph_path).matrix(origins, destinations)
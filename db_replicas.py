@@ -0,0 +1,278 @@
+"""
+Routing zapytań tylko do odczytu na repliki Postgres
+
+`ReplicaRouter` ma to samo API co pool psycopg2 (`getconn` / `putconn`):
+zwraca połączenie z najmniej obciążonej zdrowej repliki, której opóźnienie
+replikacji nie przekracza progu, a w przeciwnym razie z poola primary.
+
+- Opóźnienie replikacji sprawdzane jest przy pobraniu połączenia, co
+  `lag_check_seconds` (zamiast zwykłego `SELECT 1`)
+- Replika z błędem połączenia lub nieudaną kontrolą jest pomijana przez
+  `retry_seconds` (wyczerpany pool repliki nie jest błędem - replika jest tylko zajęta)
+- Po zmianie wersji danych (`pin_primary`) odczyty idą przez chwilę do primary -
+  wynik z repliki sprzed załadowania danych nie trafia do cache z nową wersją
+- Pool repliki tworzony jest leniwie - niedostępna przy starcie replika
+  nie blokuje startu aplikacji
+
+Zapytania zależne od zapisu (np. znaki wodne wersji danych po NOTIFY loadera)
+powinny nadal używać poola primary.
+
+Zależności: psycopg2
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger(__name__)
+
+# Opóźnienie repliki w sekundach (0, gdy cały odebrany WAL jest odtworzony)
+_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag_seconds;
+"""
+
+
+def parse_hosts(value: Optional[str], default_port: Optional[str]) -> List[Dict[str, Optional[str]]]:
+    """'host1:5433,host2' -> [{'host': 'host1', 'port': '5433'}, {'host': 'host2', 'port': default_port}]"""
+    hosts = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(':')
+        hosts.append({'host': host, 'port': port or default_port})
+    return hosts
+
+
+class ReplicaPool:
+    """Pool połączeń jednej repliki ze statystykami zdrowia i opóźnień"""
+
+    def __init__(self, name: str, connect_kwargs: Dict[str, Any], maxconn: int = 10,
+                 lag_check_seconds: float = 10.0, retry_seconds: float = 30.0):
+        """
+        Args:
+            name: Nazwa repliki (host:port) - do logów i statystyk
+            connect_kwargs: Parametry psycopg2.connect (host, port, database, user, ...)
+            maxconn: Maksymalna liczba połączeń
+            lag_check_seconds: Co ile sekund sprawdzać opóźnienie replikacji
+            retry_seconds: Jak długo pomijać replikę po błędzie
+        """
+        self.name = name
+        self.connect_kwargs = connect_kwargs
+        self.maxconn = maxconn
+        self.lag_check_seconds = lag_check_seconds
+        self.retry_seconds = retry_seconds
+        self._pool = None
+        self._lock = threading.Lock()
+        self.lag_seconds: Optional[float] = None
+        self._lag_checked_at = float('-inf')
+        self._unhealthy_until = 0.0
+        self.last_error: Optional[str] = None
+        self.in_use = 0
+        self.checkouts = 0
+        self.errors = 0
+        self.exhausted = 0  # Pobrania przy wyczerpanym poolu repliki
+        self.avg_checkout_ms: Optional[float] = None  # EWMA pobrania połączenia (z kontrolą)
+        self.avg_hold_ms: Optional[float] = None  # EWMA czasu trzymania połączenia (zapytania)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self._unhealthy_until
+
+    @property
+    def lag_check_due(self) -> bool:
+        return time.monotonic() - self._lag_checked_at >= self.lag_check_seconds
+
+    def _mark_unhealthy(self, error: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+            self.last_error = str(error)
+            self._unhealthy_until = time.monotonic() + self.retry_seconds
+        logger.warning(f"⚠️ Replica {self.name} unavailable for {self.retry_seconds:.0f}s: {error}")
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pool.ThreadedConnectionPool(
+                        minconn=1, maxconn=self.maxconn, cursor_factory=RealDictCursor, **self.connect_kwargs
+                    )
+                    logger.info(f"✅ Replica pool initialized: {self.name}")
+        return self._pool
+
+    def getconn(self):
+        """
+        Połączenie z repliki. Rzuca wyjątek przy błędzie - replika jest oznaczana jako
+        niezdrowa tylko przy błędzie połączenia (OperationalError) lub nieudanej kontroli,
+        a nie przy wyczerpanym poolu (PoolError).
+        """
+        started = time.monotonic()
+        try:
+            conn = self._ensure_pool().getconn()
+        except pool.PoolError:
+            # Wszystkie połączenia repliki zajęte - replika zdrowa, router spróbuje następnej
+            with self._lock:
+                self.exhausted += 1
+            raise
+        except psycopg2.OperationalError as e:
+            self._mark_unhealthy(e)
+            raise
+
+        try:
+            with conn.cursor() as cur:
+                if started - self._lag_checked_at >= self.lag_check_seconds:
+                    cur.execute(_LAG_QUERY)
+                    self.lag_seconds = float(cur.fetchone()['lag_seconds'])
+                    self._lag_checked_at = started
+                else:
+                    cur.execute('SELECT 1')
+        except psycopg2.Error as e:
+            try:
+                self._pool.putconn(conn, close=True)
+            except Exception:
+                pass
+            self._mark_unhealthy(e)
+            raise
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self.avg_checkout_ms = elapsed_ms if self.avg_checkout_ms is None else 0.8 * self.avg_checkout_ms + 0.2 * elapsed_ms
+            self.in_use += 1
+            self.checkouts += 1
+        return conn
+
+    def putconn(self, conn, held_ms: Optional[float] = None) -> None:
+        """Zwraca połączenie do poola repliki (held_ms - czas użycia, do statystyk)"""
+        with self._lock:
+            self.in_use -= 1
+            if held_ms is not None:
+                self.avg_hold_ms = held_ms if self.avg_hold_ms is None else 0.8 * self.avg_hold_ms + 0.2 * held_ms
+        self._pool.putconn(conn)
+
+    @property
+    def load(self) -> float:
+        """Zajętość poola repliki (0-1) - do wyboru najmniej obciążonej"""
+        with self._lock:
+            return self.in_use / max(1, self.maxconn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Zdrowie, opóźnienie replikacji i czasy repliki"""
+        return {
+            'replica': self.name,
+            'healthy': self.healthy,
+            'lag_seconds': round(self.lag_seconds, 1) if self.lag_seconds is not None else None,
+            'in_use': self.in_use,
+            'max': self.maxconn,
+            'checkouts': self.checkouts,
+            'errors': self.errors,
+            'exhausted': self.exhausted,
+            'last_error': self.last_error,
+            'avg_checkout_ms': round(self.avg_checkout_ms, 1) if self.avg_checkout_ms is not None else None,
+            'avg_hold_ms': round(self.avg_hold_ms, 1) if self.avg_hold_ms is not None else None
+        }
+
+
+class ReplicaRouter:
+    """
+    Połączenia do odczytu: zdrowa replika z akceptowalnym opóźnieniem
+    (najmniej zajęta), a w przeciwnym razie primary.
+    """
+
+    def __init__(self, name: str, primary_getconn: Callable[[], Any], primary_putconn: Callable[[Any], None],
+                 replicas: Optional[List[ReplicaPool]] = None, max_lag_seconds: float = 30.0):
+        """
+        Args:
+            name: Nazwa bazy ('exchanges' / 'main')
+            primary_getconn: Pobranie połączenia z primary
+            primary_putconn: Zwrot połączenia do primary
+            replicas: Repliki bazy (pusta lista = zawsze primary)
+            max_lag_seconds: Maksymalne akceptowalne opóźnienie replikacji
+        """
+        self.name = name
+        self.primary_getconn = primary_getconn
+        self.primary_putconn = primary_putconn
+        self.replicas = replicas or []
+        self.max_lag_seconds = max_lag_seconds
+        self._owners: Dict[int, tuple] = {}  # id(conn) -> (replika lub None, czas pobrania)
+        self._lock = threading.Lock()
+        self._primary_until = 0.0
+        self.primary_reads = 0
+        self.fallbacks = 0
+        self.pinned_reads = 0
+
+    def pin_primary(self, seconds: float) -> None:
+        """
+        Kieruje odczyty do primary przez `seconds` (np. po wykryciu nowych danych -
+        repliki mogą ich jeszcze nie mieć, a wynik byłby oznaczony nową wersją danych).
+        """
+        if not self.replicas:
+            return
+        with self._lock:
+            self._primary_until = max(self._primary_until, time.monotonic() + seconds)
+        logger.info(f"📌 Reads '{self.name}' pinned to primary for {seconds:.0f}s (new data)")
+
+    def _candidates(self) -> List[ReplicaPool]:
+        usable = [
+            replica for replica in self.replicas
+            if replica.healthy and (replica.lag_seconds is None or replica.lag_seconds <= self.max_lag_seconds
+                                    or replica.lag_check_due)
+        ]
+        return sorted(usable, key=lambda replica: replica.load)
+
+    def getconn(self):
+        """Połączenie do zapytań tylko do odczytu"""
+        pinned = time.monotonic() < self._primary_until
+        for replica in ([] if pinned else self._candidates()):
+            try:
+                conn = replica.getconn()
+            except Exception:
+                continue
+            if replica.lag_seconds is not None and replica.lag_seconds > self.max_lag_seconds:
+                # Opóźnienie odczytane właśnie przy tym pobraniu - replika za daleko w tyle
+                logger.warning(f"⚠️ Replica {replica.name} lag {replica.lag_seconds:.0f}s > {self.max_lag_seconds:.0f}s")
+                replica.putconn(conn)
+                continue
+            with self._lock:
+                self._owners[id(conn)] = (replica, time.monotonic())
+            return conn
+
+        conn = self.primary_getconn()
+        with self._lock:
+            if pinned:
+                self.pinned_reads += 1
+            elif self.replicas:
+                self.fallbacks += 1
+            self.primary_reads += 1
+            self._owners[id(conn)] = (None, time.monotonic())
+        return conn
+
+    def putconn(self, conn) -> None:
+        """Zwraca połączenie do poola, z którego pochodzi"""
+        if conn is None:
+            return
+        with self._lock:
+            replica, taken_at = self._owners.pop(id(conn), (None, None))
+        if replica is None:
+            self.primary_putconn(conn)
+        else:
+            replica.putconn(conn, (time.monotonic() - taken_at) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        """Statystyki routingu i replik"""
+        return {
+            'database': self.name,
+            'max_lag_seconds': self.max_lag_seconds,
+            'primary_reads': self.primary_reads,
+            'fallbacks_to_primary': self.fallbacks,
+            'pinned_to_primary': self.pinned_reads,
+            'replicas': [replica.stats() for replica in self.replicas]
+        }
@@ -0,0 +1,83 @@
+"""
+Budżet czasu requestu (deadline) propagowany do etapów wyceny
+
+Request dostaje jeden budżet (REQUEST_DEADLINE_SECONDS), z którego każdy etap
+pobiera swój timeout: zapytania SQL ustawiają `SET LOCAL statement_timeout`,
+wywołania AWS dostają timeout HTTP z pozostałego czasu. Etap, na który budżet
+już nie wystarcza, jest pomijany - wynik jest częściowy (np. dystans Haversine
+zamiast AWS) zamiast przerwania całego requestu przez timeout workera.
+
+Deadline jest przypięty do wątku (`activate`), więc funkcje źródeł nie
+potrzebują dodatkowego parametru. Zadania w tle (prewarming, odświeżanie
+cache) działają bez deadline - z limitami poola / AWS.
+
+Zależności: brak (tylko biblioteka standardowa)
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """Budżet requestu wyczerpany, zanim udało się uzyskać jakikolwiek wynik"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded before stage '{stage}'")
+        self.stage = stage
+
+
+class Deadline:
+    """Termin zakończenia requestu liczony od utworzenia obiektu"""
+
+    def __init__(self, seconds: float):
+        """
+        Args:
+            seconds: Budżet czasu requestu w sekundach
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Pozostały budżet w sekundach (0 po upływie terminu)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    @contextmanager
+    def activate(self) -> Iterator['Deadline']:
+        """Deadline bieżącego wątku (current_deadline) na czas bloku"""
+        previous = getattr(_local, 'deadline', None)
+        _local.deadline = self
+        try:
+            yield self
+        finally:
+            _local.deadline = previous
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Aktywny deadline wątku lub None (np. zadania w tle)"""
+    return getattr(_local, 'deadline', None)
+
+
+def stage_budget(cap: float, share: float = 1.0, reserve: float = 0.0) -> float:
+    """
+    Timeout etapu z pozostałego budżetu requestu.
+
+    Args:
+        cap: Maksymalny timeout etapu (także bez aktywnego deadline)
+        share: Część pozostałego budżetu dostępna dla etapu
+        reserve: Czas zostawiany na dalszą część requestu (przed podziałem)
+
+    Returns:
+        min(cap, (pozostało - reserve) * share), nie mniej niż 0
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return cap
+    return max(0.0, min(cap, (deadline.remaining() - reserve) * share))
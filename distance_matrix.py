@@ -0,0 +1,206 @@
+"""
+Macierz dystansów drogowych między kodami pocztowymi (artefakt mapowany w pamięci)
+
+Job `build_distance_matrix.py` liczy dystanse i czasy przejazdu ciężarówki dla
+par kodów (prefiksów) z `data/postal_code_to_region_transeu.json` i zapisuje je
+jako macierze float32. Workery API otwierają plik przez mmap - dystans znanej
+pary to odczyt jednej komórki, bez geocodingu i wywołań AWS.
+
+Format pliku (little-endian):
+    nagłówek:  MAGIC (4B) | n_codes (u32) | codes_len (u32) | meta_len (u32)
+    kody:      codes_len bajtów JSON (lista kodów - wiersze / kolumny macierzy)
+    meta:      meta_len bajtów JSON (np. built_at, engine)
+    wyrównanie do 4 bajtów
+    dystanse:  n_codes^2 x float32 (km, NaN = brak)
+    czasy:     n_codes^2 x float32 (s, NaN = brak)
+
+Zależności: brak (tylko biblioteka standardowa)
+"""
+
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DMX1'
+_HEADER = struct.Struct('<4sIII')
+_CELL = struct.Struct('<f')
+
+
+def normalize_code(postal_code: str) -> str:
+    """Kod w postaci kluczy mapowania (np. 'pl-50' -> 'PL50')"""
+    return postal_code.upper().replace(' ', '').replace('-', '')
+
+
+def _data_offset(codes_len: int, meta_len: int) -> int:
+    offset = _HEADER.size + codes_len + meta_len
+    return offset + (-offset % 4)
+
+
+def empty_cells(n: int) -> array:
+    """Płaska macierz n x n float32 wypełniona NaN (brak wartości)"""
+    return array('f', [math.nan]) * (n * n)
+
+
+def write_distance_matrix(path: str, codes: Sequence[str], distances: array, durations: array,
+                          meta: Optional[Dict] = None) -> int:
+    """
+    Zapisuje macierz do pliku (atomowo - plik tymczasowy + os.replace).
+
+    Args:
+        path: Ścieżka pliku wynikowego
+        codes: Kody pocztowe (wiersze / kolumny, kolejność jak w tablicach)
+        distances: Płaska tablica array('f') n x n - dystanse km (NaN = brak)
+        durations: Płaska tablica array('f') n x n - czasy przejazdu s (NaN = brak)
+        meta: Dodatkowe metadane (JSON)
+
+    Returns:
+        Liczba par z dystansem
+    """
+    n = len(codes)
+    if len(distances) != n * n or len(durations) != n * n:
+        raise ValueError(f"Macierz musi mieć {n * n} komórek")
+    codes_bytes = json.dumps([normalize_code(code) for code in codes]).encode('utf-8')
+    meta_bytes = json.dumps(dict(meta or {}, built_at=time.time()), default=str).encode('utf-8')
+    padding = _data_offset(len(codes_bytes), len(meta_bytes)) - _HEADER.size - len(codes_bytes) - len(meta_bytes)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, n, len(codes_bytes), len(meta_bytes)))
+        f.write(codes_bytes)
+        f.write(meta_bytes)
+        f.write(b'\0' * padding)
+        for cells in (distances, durations):
+            if sys.byteorder != 'little':
+                cells = array('f', cells)
+                cells.byteswap()
+            f.write(cells.tobytes())
+    os.replace(tmp_path, path)
+    return sum(1 for value in distances if not math.isnan(value))
+
+
+class DistanceMatrix:
+    """
+    Odczyt macierzy dystansów przez mmap.
+
+    Plik jest podmieniany atomowo przez job, więc `maybe_reload()` co jakiś czas
+    sprawdza mtime i otwiera nową wersję (stare mapowanie pozostaje ważne do końca).
+    """
+
+    def __init__(self, path: str, reload_check_seconds: float = 60.0):
+        """
+        Args:
+            path: Ścieżka pliku macierzy
+            reload_check_seconds: Co ile sekund sprawdzać, czy plik został podmieniony
+        """
+        self.path = path
+        self.reload_check_seconds = reload_check_seconds
+        self._lock = threading.Lock()
+        self._state = None  # (mmap, position, n, data_start, codes, meta, mtime)
+        self._last_check = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, n, codes_len, meta_len = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC:
+            mapped.close()
+            raise ValueError(f"Nieprawidłowy plik macierzy dystansów: {self.path}")
+        offset = _HEADER.size
+        codes = json.loads(mapped[offset:offset + codes_len].decode('utf-8'))
+        offset += codes_len
+        meta = json.loads(mapped[offset:offset + meta_len].decode('utf-8'))
+        data_start = _data_offset(codes_len, meta_len)
+        if len(mapped) < data_start + 2 * 4 * n * n:
+            mapped.close()
+            raise ValueError(f"Niekompletny plik macierzy dystansów: {self.path}")
+        position = {code: i for i, code in enumerate(codes)}
+        return (mapped, position, n, data_start, codes, meta, mtime)
+
+    def maybe_reload(self) -> bool:
+        """Otwiera (ponownie) plik, jeśli się zmienił. Zwraca True jeśli macierz jest dostępna"""
+        now = time.monotonic()
+        if self._state is not None and now - self._last_check < self.reload_check_seconds:
+            return True
+
+        with self._lock:
+            if self._state is not None and now - self._last_check < self.reload_check_seconds:
+                return True
+            self._last_check = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                self._state = None
+                return False
+            if self._state is not None and self._state[6] == mtime:
+                return True
+            try:
+                self._state = self._open()
+                logger.info(f"✅ Loaded distance matrix {self.path} ({self._state[2]} codes, "
+                            f"engine {self._state[5].get('engine')})")
+            except Exception as e:
+                logger.error(f"❌ Failed to load distance matrix {self.path}: {e}")
+                self._state = None
+            return self._state is not None
+
+    @property
+    def codes(self) -> List[str]:
+        return self._state[4] if self._state else []
+
+    @property
+    def meta(self) -> Dict:
+        return self._state[5] if self._state else {}
+
+    def age_seconds(self) -> Optional[float]:
+        """Wiek macierzy (od zbudowania) w sekundach"""
+        built_at = self.meta.get('built_at')
+        return time.time() - built_at if built_at else None
+
+    def lookup(self, start_code: str, end_code: str) -> Optional[Tuple[float, float]]:
+        """
+        Zwraca (dystans km, czas przejazdu s) pary kodów lub None, jeśli kodu nie ma
+        w macierzy albo dystans nie został policzony (czas może być NaN).
+        """
+        state = self._state
+        if state is None:
+            return None
+        mapped, position, n, data_start = state[0], state[1], state[2], state[3]
+        start = position.get(normalize_code(start_code))
+        end = position.get(normalize_code(end_code))
+        if start is None or end is None:
+            self.misses += 1
+            return None
+        cell = start * n + end
+        distance, = _CELL.unpack_from(mapped, data_start + 4 * cell)
+        if math.isnan(distance):
+            self.misses += 1
+            return None
+        duration, = _CELL.unpack_from(mapped, data_start + 4 * (n * n + cell))
+        self.hits += 1
+        return round(distance, 2), duration
+
+    def stats(self) -> Dict:
+        """Stan macierzy (do /api/metrics)"""
+        available = self.maybe_reload()
+        return {
+            'path': self.path,
+            'available': available,
+            'codes': len(self.codes),
+            'engine': self.meta.get('engine'),
+            'built_at': self.meta.get('built_at'),
+            'hits': self.hits,
+            'misses': self.misses
+        }
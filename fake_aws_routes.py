@@ -0,0 +1,106 @@
+"""
+Lokalny zamiennik AWS Routes API (/v2/routes i /v2/route-matrix)
+
+Serwer HTTP/1.1 (keep-alive) na losowym porcie odpowiada w formacie AWS:
+dystans "drogowy" to Haversine x 1.3, czas 1 h na odcinek. Opcjonalnie
+opóźnienie odpowiedzi i odsetek odpowiedzi 503 (ponawianych przez klienta).
+Używany przez `benchmark_aws_routes.py` i testy klienta (`tests/`).
+
+Użycie:
+    server = start_fake_server(latency_ms=2, error_rate=0.05)
+    client = AwsRoutesClient(api_key='test', base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    ...
+    server.shutdown()
+
+Zależności: brak (tylko biblioteka standardowa)
+"""
+
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'contractorDetails'))
+from aws_distance_calculator import calculate_haversine_distance
+
+
+class FakeRoutesHandler(BaseHTTPRequestHandler):
+    """Zamiennik /v2/routes i /v2/route-matrix (HTTP/1.1 keep-alive)"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Nagłówki i body wysyłane osobno - bez NODELAY keep-alive czekałby na opóźniony ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with self.server.lock:
+            self.server.requests += 1
+            if self.path.startswith('/v2/route-matrix'):
+                self.server.matrix_shapes.append((len(request['Origins']), len(request['Destinations'])))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            status, body = 503, b'{"message": "Service unavailable"}'
+        elif self.path.startswith('/v2/route-matrix'):
+            status, body = 200, route_matrix_response(request)
+        else:
+            status, body = 200, route_response(request)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def road_meters(origin, destination) -> int:
+    """Dystans "drogowy" zamiennika: Haversine x 1.3 w metrach (punkty [lng, lat])"""
+    (origin_lng, origin_lat), (destination_lng, destination_lat) = origin, destination
+    return round(calculate_haversine_distance(origin_lat, origin_lng, destination_lat, destination_lng) * 1300)
+
+
+def route_response(request) -> bytes:
+    """Trasa Origin -> Waypoints -> Destination: jeden odcinek (leg) na parę kolejnych punktów"""
+    points = [request['Origin']] + [waypoint['Position'] for waypoint in request.get('Waypoints', [])]
+    points.append(request['Destination'])
+    legs = [
+        {'VehicleLegDetails': {'TravelSteps': [{'Distance': road_meters(start, end)}],
+                               'Summary': {'Overview': {'Duration': 3600}}}}
+        for start, end in zip(points, points[1:])
+    ]
+    return json.dumps({'Routes': [{'Legs': legs, 'Summary': {'Duration': 3600 * len(legs)}}]}).encode('utf-8')
+
+
+def route_matrix_response(request) -> bytes:
+    """Macierz dystansów (Haversine x 1.3, w metrach) dla Origins x Destinations"""
+    return json.dumps({
+        'RouteMatrix': [
+            [{'Distance': road_meters(origin['Position'], destination['Position']), 'Duration': 3600}
+             for destination in request['Destinations']]
+            for origin in request['Origins']
+        ]
+    }).encode('utf-8')
+
+
+def start_fake_server(latency_ms: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Uruchamia zamiennik usługi na losowym porcie (w wątku)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeRoutesHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = 0
+    server.matrix_shapes = []  # (liczba startów, liczba celów) każdego zapytania route-matrix
+    server.latency = latency_ms / 1000
+    server.error_rate = error_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
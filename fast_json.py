@@ -0,0 +1,81 @@
+"""
+Szybka serializacja JSON odpowiedzi API
+
+Flask domyślnie serializuje odpowiedzi przez json z biblioteki standardowej
+(sort_keys, ensure_ascii). Dla dużych odpowiedzi (lista zleceń historycznych)
+to zauważalny koszt CPU. Moduł dostarcza `FastJSONProvider` dla Flask, który:
+- używa orjson - natywnie serializuje date / datetime, więc zlecenia nie
+  potrzebują isoformat() per wiersz
+
+Bez orjson aplikacja zostaje przy domyślnym providerze Flask (instalowany jest
+tylko przy JSON_BACKEND == 'orjson'), a `dumps()` używa json ze ścieżką C
+(ensure_ascii) i kompaktowymi separatorami - ensure_ascii=False był wolniejszy
+od jsonify (benchmark_serialization.py).
+
+Backend wybierany zmienną JSON_BACKEND: auto (domyślnie) | orjson | json
+
+Zależności: brak (tylko biblioteka standardowa)
+Opcjonalnie: orjson
+"""
+
+import datetime
+import decimal
+import json
+import os
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_requested_backend = os.getenv('JSON_BACKEND', 'auto').lower()
+JSON_BACKEND = 'orjson' if orjson is not None and _requested_backend in ('auto', 'orjson') else 'json'
+
+
+def json_default(obj: Any) -> Any:
+    """Serializacja typów spoza JSON (daty, Decimal z bazy, krotki / zbiory)"""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any, backend: str = None) -> bytes:
+    """
+    Serializuje obiekt do JSON (UTF-8).
+
+    Args:
+        obj: Obiekt do serializacji
+        backend: 'orjson' / 'json' (domyślnie JSON_BACKEND)
+
+    Returns:
+        JSON jako bytes
+    """
+    if (backend or JSON_BACKEND) == 'orjson':
+        return orjson.dumps(obj, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=json_default, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Provider JSON dla Flask (app.json) z orjson - jsonify() korzysta z dumps() tego modułu"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # Wywołania z dodatkowymi opcjami (np. indent) obsługuje domyślny provider
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if orjson is not None and JSON_BACKEND == 'orjson' and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
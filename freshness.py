@@ -0,0 +1,223 @@
+"""
+Rejestr świeżości danych źródłowych (znaczniki wersji per tabela)
+
+Znacznik tabeli to znak wodny jej danych, np. MAX("id") z liczbą zleceń zakończonych,
+MAX(enlistment_date) lub ID partii ładowania - taki sam na primary i replikach
+i niezależny od resetu statystyk. Znacznik z samej daty (DATE) nie zmienia się przy
+ponownym ładowaniu tego samego dnia - takie zmiany wykrywa dopiero NOTIFY. Wersja bazy to złożenie
+znaczników jej tabel; cache z wersją w kluczu / wpisie (pricing_cache) przestają pasować
+natychmiast po zmianie danych, więc mogą mieć długie TTL.
+
+Znaczniki odświeżane są co `poll_seconds`. Opcjonalnie rejestr słucha kanału
+Postgres LISTEN/NOTIFY, na który loadery wysyłają nazwę zmienionej tabeli:
+
+    NOTIFY pricing_data_changed, 'offers';
+    -- lub z triggera / funkcji: SELECT pg_notify('pricing_data_changed', 'ZleceniaSpeed');
+
+Po powiadomieniu znaczniki bazy są odczytywane od razu (i ponawiane do
+`settle_seconds`, bo powiadomienie może wyprzedzić commit ładowania),
+a przy aktywnym nasłuchu okresowe sprawdzanie jest rzadkie (`listen_poll_seconds`).
+Każdy worker gunicorn ma własne połączenie LISTEN, więc powiadomienie trafia do
+wszystkich procesów; subskrybenci (`subscribe`) czyszczą cache w procesie.
+
+Zależności: psycopg2 (tylko dla nasłuchu LISTEN/NOTIFY)
+"""
+
+import logging
+import re
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_CHANNEL_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class FreshnessRegistry:
+    """
+    Znaczniki wersji tabel źródłowych pogrupowane per baza ('exchanges' / 'main').
+
+    Funkcja `fetch_watermarks(db_label, tables)` zwraca {tabela: znak wodny}
+    lub rzuca wyjątek - wtedy rejestr zachowuje poprzednią wersję.
+    """
+
+    def __init__(self, tables: Dict[str, Tuple[str, ...]],
+                 fetch_watermarks: Callable[[str, Tuple[str, ...]], Dict[str, Any]],
+                 poll_seconds: float = 60.0, listen_poll_seconds: float = 600.0,
+                 settle_seconds: float = 10.0):
+        """
+        Args:
+            tables: {db_label: (tabela, ...)}
+            fetch_watermarks: Odczyt znaków wodnych tabel bazy
+            poll_seconds: Co ile sekund sprawdzać znaczniki (bez nasłuchu)
+            listen_poll_seconds: Co ile sekund sprawdzać znaczniki przy aktywnym nasłuchu (zabezpieczenie)
+            settle_seconds: Jak długo po powiadomieniu ponawiać odczyt, jeśli znaczniki jeszcze się nie zmieniły
+        """
+        self.tables = {db_label: tuple(names) for db_label, names in tables.items()}
+        self._table_db = {table: db_label for db_label, names in self.tables.items() for table in names}
+        self.fetch_watermarks = fetch_watermarks
+        self.poll_seconds = poll_seconds
+        self.listen_poll_seconds = listen_poll_seconds
+        self.settle_seconds = settle_seconds
+
+        self._lock = threading.Lock()
+        self._watermarks: Dict[str, Any] = {}  # tabela -> znak wodny
+        self._versions: Dict[str, str] = {}  # db_label -> wersja
+        self._checked_at: Dict[str, float] = {}  # db_label -> time.monotonic() ostatniego odczytu
+        self._changed_at: Dict[str, float] = {}  # db_label -> time.time() ostatniej zmiany wersji
+        self._pending: Dict[str, float] = {}  # db_label -> termin ponawiania po powiadomieniu
+        self._listening: Dict[str, bool] = {}
+        self._subscribers: List[Callable[[str, List[str]], None]] = []
+        self._stop = threading.Event()
+        self.notifications = 0
+        self.invalidations = 0
+
+    def subscribe(self, callback: Callable[[str, List[str]], None]) -> None:
+        """Rejestruje funkcję wywoływaną po zmianie danych: callback(db_label, zmienione tabele)"""
+        self._subscribers.append(callback)
+
+    def _poll_interval(self, db_label: str) -> float:
+        if self._pending.get(db_label, 0) > time.monotonic():
+            return 1.0
+        return self.listen_poll_seconds if self._listening.get(db_label) else self.poll_seconds
+
+    def version(self, db_label: str) -> Optional[str]:
+        """
+        Wersja danych bazy (złożenie znaczników jej tabel).
+
+        Returns:
+            Wersja lub None, jeśli jeszcze nigdy nie udało się odczytać znaczników
+        """
+        now = time.monotonic()
+        if now - self._checked_at.get(db_label, float('-inf')) < self._poll_interval(db_label):
+            return self._versions.get(db_label)
+
+        with self._lock:
+            if now - self._checked_at.get(db_label, float('-inf')) < self._poll_interval(db_label):
+                return self._versions.get(db_label)
+            # Jeden odczyt naraz - pozostałe wątki dostają dotychczasową wersję
+            self._checked_at[db_label] = now
+
+        try:
+            watermarks = self.fetch_watermarks(db_label, self.tables[db_label])
+        except Exception as e:
+            logger.error(f"❌ Failed to read data watermarks ({db_label}): {e}")
+            return self._versions.get(db_label)
+        self._apply(db_label, watermarks)
+        return self._versions.get(db_label)
+
+    def _apply(self, db_label: str, watermarks: Dict[str, Any]) -> None:
+        """Zapisuje nowe znaczniki tabel bazy i powiadamia subskrybentów o zmianie"""
+        with self._lock:
+            changed = [table for table in self.tables[db_label]
+                       if table in self._watermarks and self._watermarks[table] != watermarks.get(table)]
+            first_read = db_label not in self._versions
+            for table in self.tables[db_label]:
+                self._watermarks[table] = watermarks.get(table)
+            self._versions[db_label] = ','.join(f"{table}:{watermarks[table]}" for table in sorted(watermarks))
+            if changed or first_read:
+                self._changed_at[db_label] = time.time()
+            if changed:
+                self._pending.pop(db_label, None)
+
+        if changed:
+            self.invalidations += 1
+            logger.info(f"🔄 Nowe dane w bazie '{db_label}' ({', '.join(changed)}) - unieważniam cache")
+            for callback in self._subscribers:
+                try:
+                    callback(db_label, changed)
+                except Exception as e:
+                    logger.error(f"❌ Cache invalidation callback failed: {e}")
+
+    def mark_changed(self, table_or_db: str) -> None:
+        """
+        Sygnał zmiany danych (powiadomienie NOTIFY / ręcznie): następny odczyt
+        wersji bazy nastąpi od razu i będzie ponawiany do `settle_seconds`.
+
+        Args:
+            table_or_db: Nazwa tabeli (np. 'offers') lub bazy ('exchanges' / 'main')
+        """
+        db_label = self._table_db.get(table_or_db, table_or_db)
+        if db_label not in self.tables:
+            logger.warning(f"⚠️ Unknown table in data change notification: {table_or_db}")
+            return
+        self.notifications += 1
+        with self._lock:
+            self._checked_at[db_label] = float('-inf')
+            self._pending[db_label] = time.monotonic() + self.settle_seconds
+
+    def start_listener(self, db_label: str, connect: Callable[[], Any], channel: str,
+                       reconnect_seconds: float = 5.0) -> threading.Thread:
+        """
+        Uruchamia wątek nasłuchu LISTEN/NOTIFY dla bazy (osobne połączenie, poza poolem).
+
+        Args:
+            db_label: Baza ('exchanges' / 'main')
+            connect: Funkcja tworząca nowe połączenie psycopg2 z tą bazą
+            channel: Nazwa kanału NOTIFY (payload = nazwa tabeli)
+            reconnect_seconds: Odstęp między próbami ponownego połączenia
+        """
+        if not _CHANNEL_NAME.match(channel):
+            raise ValueError(f"Nieprawidłowa nazwa kanału NOTIFY: {channel}")
+        thread = threading.Thread(
+            target=self._listen_loop, args=(db_label, connect, channel, reconnect_seconds),
+            name=f'freshness-listen-{db_label}', daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _listen_loop(self, db_label: str, connect: Callable[[], Any], channel: str,
+                     reconnect_seconds: float) -> None:
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{channel}";')
+                self._listening[db_label] = True
+                logger.info(f"✅ Listening for data changes on '{channel}' ({db_label})")
+                # Powiadomienia sprzed (ponownego) połączenia mogły przepaść
+                self.mark_changed(db_label)
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        self.mark_changed(notification.payload or db_label)
+            except Exception as e:
+                logger.warning(f"⚠️ Data change listener ({db_label}) disconnected: {e}")
+            finally:
+                self._listening[db_label] = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(reconnect_seconds)
+
+    def stop(self) -> None:
+        """Zatrzymuje wątki nasłuchu"""
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Znaczniki, wersje i stan nasłuchu (do /health / monitoringu)"""
+        with self._lock:
+            return {
+                'databases': {
+                    db_label: {
+                        'version': self._versions.get(db_label),
+                        'changed_at': self._changed_at.get(db_label),
+                        'listening': self._listening.get(db_label, False),
+                        'watermarks': {table: self._watermarks.get(table) for table in tables}
+                    }
+                    for db_label, tables in self.tables.items()
+                },
+                'notifications': self.notifications,
+                'invalidations': self.invalidations
+            }
+
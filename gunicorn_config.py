@@ -9,7 +9,10 @@ backlog = 2048
 
 # Worker processes
 workers = 4
-worker_class = 'sync'
+# gthread: wolne wątki obsługują health check i trasy z cache, gdy inne liczą wycenę
+# (limity kosztownych etapów - admission control w app_secure.py)
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
@@ -36,6 +39,23 @@ user = None
 group = None
 tmp_upload_dir = None
 
+
+
+# Server hooks
+def post_fork(server, worker):
+    """Wątki w tle aplikacji (prewarm cache, zapis popularności tras, nasłuch NOTIFY) - w każdym workerze"""
+    import app_secure
+    app_secure.start_background_tasks()
+
+
+def worker_exit(server, worker):
+    """Zapis popularności tras przed zakończeniem workera (max_requests, restart)"""
+    import sys
+    app_secure = sys.modules.get('app_secure')
+    if app_secure is not None:
+        app_secure.lane_popularity.save()
+
+
 # SSL (jeśli używasz certyfikatów)
 # keyfile = '/path/to/keyfile'
 # certfile = '/path/to/certfile'
@@ -0,0 +1,563 @@
+"""
+Cache wyników wyceny w pamięci procesu (per worker gunicorn)
+
+- TTLCache: prosty, thread-safe cache z TTL i limitem rozmiaru (wypychanie
+  najstarszych wpisów - LRU). Używany m.in. jako negative cache dla tras bez danych.
+- SWRCache: cache typu stale-while-revalidate - wpis "świeży" zwracany od razu,
+  "nieświeży" zwracany od razu z jednym odświeżeniem w tle, a po błędzie
+  źródła danych zwracany jako ostatnia dobra wartość (stale-on-error).
+- SingleFlight: łączy równoległe obliczenia tego samego klucza w jedno wykonanie.
+- RedisBackend: opcjonalny backend współdzielony między workerami (cache + lock).
+- LanePopularity: ranking popularności tras (sterowanie prewarmingiem cache).
+
+Zależności: brak (tylko biblioteka standardowa i deadline.py)
+Opcjonalnie: redis (dla RedisBackend)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+from deadline import stage_budget
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Znacznik braku wpisu (odróżnia "brak w cache" od zapisanego None)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe cache klucz -> wartość z czasem życia (TTL) wpisów.
+
+    Po przekroczeniu `max_size` usuwany jest najdawniej używany wpis.
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int = 10000):
+        """
+        Args:
+            name: Nazwa cache (do logów i statystyk)
+            ttl: Domyślny czas życia wpisu w sekundach
+            max_size: Maksymalna liczba wpisów
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Zwraca wartość dla klucza lub `default` jeśli brak / wygasła"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Zapisuje wartość z podanym (lub domyślnym) TTL"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Usuwa wpis (jeśli istnieje)"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Usuwa wszystkie wpisy (np. po załadowaniu nowych danych)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Statystyki cache (do logów / monitoringu)"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class CacheEntry(NamedTuple):
+    """Wpis SWRCache: wartość, czas zapisu (time.time()) i wersja danych"""
+    value: Any
+    created_at: float
+    version: Optional[str]
+
+    @property
+    def age(self) -> float:
+        """Wiek wpisu w sekundach"""
+        return time.time() - self.created_at
+
+
+class SWRCache:
+    """
+    Cache stale-while-revalidate z serwowaniem nieaktualnych danych przy błędzie.
+
+    Wiek wpisu:
+    - < fresh_ttl (i zgodna wersja danych): wpis świeży - zwracany bez obliczeń
+    - < revalidate_ttl: zwracany od razu + jedno odświeżenie w tle na klucz
+    - < stale_if_error_ttl: zwracany tylko gdy obliczenie zakończy się błędem
+    """
+
+    def __init__(self, name: str, fresh_ttl: float, revalidate_ttl: float,
+                 stale_if_error_ttl: float, max_size: int = 5000,
+                 shared: Optional['RedisBackend'] = None,
+                 cacheable: Optional[Callable[[Any], bool]] = None):
+        """
+        Args:
+            name: Nazwa cache (do logów i statystyk)
+            fresh_ttl: Czas (s), przez który wpis jest świeży
+            revalidate_ttl: Czas (s), przez który nieświeży wpis jest zwracany z odświeżeniem w tle
+            stale_if_error_ttl: Czas (s) przechowywania wpisu na wypadek błędów
+            max_size: Maksymalna liczba wpisów
+            shared: Opcjonalny backend współdzielony między workerami (wartości muszą być JSON)
+            cacheable: Opcjonalny warunek zapisu wyniku odświeżenia w tle (np. tylko wyniki pełne)
+        """
+        self.name = name
+        self.fresh_ttl = fresh_ttl
+        self.revalidate_ttl = max(revalidate_ttl, fresh_ttl)
+        self.shared = shared
+        self.cacheable = cacheable
+        self._store = TTLCache(name, ttl=max(stale_if_error_ttl, self.revalidate_ttl), max_size=max_size)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.background_refreshes = 0
+        self.refreshes_kept = 0
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Zwraca wpis (dowolnego wieku do stale_if_error_ttl) lub None"""
+        entry = self._store.get(key, None)
+        if entry is None and self.shared is not None:
+            entry = self.get_shared(key)
+        return entry
+
+    def get_shared(self, key: Hashable) -> Optional[CacheEntry]:
+        """Pobiera wpis z backendu współdzielonego (i zapisuje go lokalnie)"""
+        if self.shared is None:
+            return None
+        stored = self.shared.get(self._shared_key(key))
+        if not stored:
+            return None
+        entry = CacheEntry(stored['value'], stored['created_at'], stored.get('version'))
+        self._store.set(key, entry)
+        return entry
+
+    def set(self, key: Hashable, value: Any, version: Optional[str] = None) -> None:
+        """Zapisuje wartość z bieżącym czasem i wersją danych (lokalnie i we współdzielonym backendzie)"""
+        entry = CacheEntry(value, time.time(), version)
+        self._store.set(key, entry)
+        if self.shared is not None:
+            self.shared.set(
+                self._shared_key(key),
+                {'value': value, 'created_at': entry.created_at, 'version': version},
+                ttl=self._store.ttl
+            )
+
+    def delete(self, key: Hashable) -> None:
+        """Usuwa wpis"""
+        self._store.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"{self.name}:{RedisBackend.digest(key)}"
+
+    def clear(self) -> None:
+        """Usuwa wszystkie wpisy"""
+        self._store.clear()
+
+    def is_fresh(self, entry: CacheEntry, version: Optional[str] = None) -> bool:
+        """Czy wpis jest świeży (wiek < fresh_ttl i ta sama wersja danych, jeśli znana)"""
+        return entry.age < self.fresh_ttl and (version is None or entry.version == version)
+
+    def can_revalidate(self, entry: CacheEntry) -> bool:
+        """Czy nieświeży wpis można zwrócić od razu (z odświeżeniem w tle)"""
+        return entry.age < self.revalidate_ttl
+
+    def refresh_async(self, key: Hashable, compute: Callable[[], Tuple[Any, Optional[str]]]) -> bool:
+        """
+        Uruchamia odświeżenie wpisu w tle (maksymalnie jedno naraz na klucz).
+
+        Args:
+            key: Klucz wpisu
+            compute: Funkcja zwracająca (nowa wartość, wersja danych); wartość None lub
+                niespełniająca `cacheable` zostawia stary wpis (stale-on-error)
+
+        Returns:
+            True jeśli uruchomiono odświeżenie, False jeśli już trwa
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        thread = threading.Thread(
+            target=self._refresh, args=(key, compute), name=f'{self.name}-refresh', daemon=True
+        )
+        thread.start()
+        return True
+
+    def _refresh(self, key: Hashable, compute: Callable[[], Tuple[Any, Optional[str]]]) -> None:
+        try:
+            value, version = compute()
+            if value is None or (self.cacheable is not None and not self.cacheable(value)):
+                # Brak danych, błąd źródła lub wynik częściowy - stary wpis zostaje (stale-on-error)
+                self.refreshes_kept += 1
+                logger.info(f"ℹ️ Background refresh ({self.name}) for {key}: result not cacheable, keeping entry")
+                return
+            self.set(key, value, version)
+            self.background_refreshes += 1
+        except Exception as e:
+            # Stary wpis zostaje - będzie zwracany jako stale-on-error
+            logger.error(f"❌ Background refresh failed ({self.name}) for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Statystyki cache (do logów / monitoringu)"""
+        stats = self._store.stats()
+        with self._lock:
+            stats['refreshing'] = len(self._refreshing)
+        stats['background_refreshes'] = self.background_refreshes
+        stats['refreshes_kept'] = self.refreshes_kept
+        return stats
+
+
+class _Flight:
+    """Trwające obliczenie w SingleFlight"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalescing równoległych obliczeń: dla danego klucza w danej chwili działa
+    jedno obliczenie, a pozostałe wątki czekają na jego wynik (lub wyjątek).
+
+    Opcjonalnie (backend współdzielony) obliczenie jest dodatkowo chronione
+    lockiem między workerami - worker, który nie dostał locka, czeka aż wynik
+    pojawi się we współdzielonym cache (`wait_for`) zamiast liczyć go ponownie.
+    Czekanie jest ograniczone pozostałym budżetem requestu (deadline wątku).
+    """
+
+    def __init__(self, name: str, shared: Optional['RedisBackend'] = None,
+                 lock_ttl: float = 30.0, wait_timeout: float = 30.0):
+        """
+        Args:
+            name: Nazwa (do logów, statystyk i kluczy locka)
+            shared: Opcjonalny backend współdzielony (lock między workerami)
+            lock_ttl: Czas życia locka między workerami (s)
+            wait_timeout: Maksymalny czas oczekiwania na wynik innego workera (s) -
+                przy aktywnym deadline nie dłużej niż pozostały budżet requestu
+        """
+        self.name = name
+        self.shared = shared
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any],
+           wait_for: Optional[Callable[[], Any]] = None) -> Tuple[Any, bool]:
+        """
+        Wykonuje `fn` raz dla wszystkich równoległych wywołań z tym samym kluczem.
+
+        Args:
+            key: Klucz obliczenia (np. znormalizowana trasa)
+            fn: Funkcja licząca wynik
+            wait_for: Opcjonalna funkcja sprawdzająca, czy wynik policzył już inny
+                worker (zwraca wynik lub None) - używana tylko z backendem współdzielonym
+
+        Returns:
+            Tuple (wynik, shared) - shared=True jeśli wynik pochodzi z obliczenia innego wątku / workera
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1  # pod lockiem - liczniki zmieniane z wielu wątków
+                leader = False
+            else:
+                flight = _Flight()
+                self._flights[key] = flight
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        shared_result = False
+        try:
+            flight.result, shared_result = self._execute(key, fn, wait_for)
+            return flight.result, shared_result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _execute(self, key: Hashable, fn: Callable[[], Any],
+                 wait_for: Optional[Callable[[], Any]]) -> Tuple[Any, bool]:
+        if self.shared is None:
+            self._count_execution()
+            return fn(), False
+
+        lock_key = f"lock:{self.name}:{RedisBackend.digest(key)}"
+        if not self.shared.acquire_lock(lock_key, self.lock_ttl):
+            # Inny worker liczy ten sam klucz - poczekaj na jego wynik
+            wait_until = time.monotonic() + stage_budget(self.wait_timeout)
+            while time.monotonic() < wait_until:
+                time.sleep(0.05)
+                if wait_for is not None:
+                    result = wait_for()
+                    if result is not None:
+                        with self._lock:
+                            self.coalesced += 1
+                        return result, True
+                if not self.shared.is_locked(lock_key):
+                    break
+            # Lock zwolniony bez wyniku (lub timeout / koniec budżetu requestu) - licz samodzielnie
+            self._count_execution()
+            return fn(), False
+
+        try:
+            self._count_execution()
+            return fn(), False
+        finally:
+            self.shared.release_lock(lock_key)
+
+    def _count_execution(self) -> None:
+        with self._lock:
+            self.executions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Statystyki coalescingu (do logów / monitoringu)"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'in_flight': len(self._flights),
+                'executions': self.executions,
+                'coalesced': self.coalesced
+            }
+
+
+def _json_default(obj: Any) -> Any:
+    """Daty jako isoformat (jak w odpowiedzi API), pozostałe typy jako tekst"""
+    return obj.isoformat() if hasattr(obj, 'isoformat') else str(obj)
+
+
+class RedisBackend:
+    """
+    Backend współdzielony między workerami (Redis) - cache wartości JSON i locki.
+
+    Błędy Redis nie przerywają requestu - są logowane i traktowane jak brak wpisu.
+    """
+
+    def __init__(self, url: str, prefix: str = 'pricing-api:', socket_timeout: float = 0.5):
+        """
+        Args:
+            url: URL Redis (np. redis://localhost:6379/0)
+            prefix: Prefiks wszystkich kluczy
+            socket_timeout: Timeout operacji Redis (s)
+        """
+        if redis is None:
+            raise RuntimeError("Pakiet redis nie jest zainstalowany (pip install redis)")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout)
+        self._token = f"{id(self)}-{time.time()}"
+
+    @staticmethod
+    def digest(key: Hashable) -> str:
+        """Stabilny (między procesami) skrót klucza"""
+        return hashlib.sha1(json.dumps(key, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = self._client.get(self.prefix + key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"⚠️ Redis get failed: {e}")
+            return None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            self._client.set(self.prefix + key, json.dumps(value, default=_json_default), px=int(ttl * 1000))
+        except Exception as e:
+            logger.warning(f"⚠️ Redis set failed: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self._client.delete(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"⚠️ Redis delete failed: {e}")
+
+    def acquire_lock(self, key: str, ttl: float) -> bool:
+        """Próbuje założyć lock (SET NX PX). Przy błędzie Redis zwraca True (liczymy lokalnie)"""
+        try:
+            return bool(self._client.set(self.prefix + key, self._token, nx=True, px=int(ttl * 1000)))
+        except Exception as e:
+            logger.warning(f"⚠️ Redis lock failed: {e}")
+            return True
+
+    def is_locked(self, key: str) -> bool:
+        try:
+            return bool(self._client.exists(self.prefix + key))
+        except Exception:
+            return False
+
+    def release_lock(self, key: str) -> None:
+        """Zwalnia lock tylko jeśli należy do tego procesu"""
+        try:
+            full_key = self.prefix + key
+            if self._client.get(full_key) == self._token.encode('utf-8'):
+                self._client.delete(full_key)
+        except Exception as e:
+            logger.warning(f"⚠️ Redis unlock failed: {e}")
+
+
+class LanePopularity:
+    """
+    Licznik popularności tras z wygaszaniem wykładniczym (half-life).
+
+    Stan jest okresowo zapisywany do pliku JSON (wspólnego dla workerów -
+    przy zapisie wyniki są scalane maksimum), dzięki czemu ranking przeżywa
+    restart / recykling workera i może sterować prewarmingiem cache.
+    `record` nie zapisuje pliku - zapis (`save_if_due`) wywołuje wątek w tle,
+    a nie wątek requestu.
+    """
+
+    def __init__(self, max_lanes: int = 5000, half_life: float = 86400.0,
+                 state_file: Optional[str] = None, save_interval: float = 60.0):
+        """
+        Args:
+            max_lanes: Maksymalna liczba śledzonych tras (najmniej popularne są usuwane)
+            half_life: Czas (s), po którym waga requestu spada o połowę
+            state_file: Ścieżka pliku ze stanem (None = tylko w pamięci)
+            save_interval: Minimalny odstęp (s) między zapisami pliku
+        """
+        self.max_lanes = max_lanes
+        self.half_life = half_life
+        self.state_file = state_file
+        self.save_interval = save_interval
+        self._scores: Dict[Tuple, Tuple[float, float]] = {}  # lane -> (score, timestamp)
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self.load()
+
+    def _decayed(self, score: float, stamp: float, now: float) -> float:
+        return score * 0.5 ** (max(now - stamp, 0.0) / self.half_life)
+
+    def record(self, lane: Tuple) -> None:
+        """Rejestruje request dla trasy (krotka wartości JSON, np. kody i okna)"""
+        now = time.time()
+        with self._lock:
+            score, stamp = self._scores.get(lane, (0.0, now))
+            self._scores[lane] = (self._decayed(score, stamp, now) + 1.0, now)
+            if len(self._scores) > self.max_lanes * 1.1:
+                self._trim(now)
+
+    def save_if_due(self) -> bool:
+        """Zapisuje stan, jeśli od ostatniego zapisu minęło `save_interval` (wątek w tle)"""
+        if not self.state_file or time.monotonic() - self._last_save < self.save_interval:
+            return False
+        self.save()
+        return True
+
+    def _trim(self, now: float) -> None:
+        ranked = sorted(self._scores.items(), key=lambda item: self._decayed(*item[1], now), reverse=True)
+        self._scores = dict(ranked[:self.max_lanes])
+
+    def top(self, n: int) -> List[Tuple[Tuple, float]]:
+        """Zwraca n najpopularniejszych tras: [(lane, score), ...]"""
+        now = time.time()
+        with self._lock:
+            ranked = [(lane, self._decayed(score, stamp, now)) for lane, (score, stamp) in self._scores.items()]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked[:n]
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    @staticmethod
+    def _to_lane(value) -> Tuple:
+        return tuple(LanePopularity._to_lane(v) if isinstance(v, list) else v for v in value)
+
+    def _read_file(self) -> Dict[Tuple, Tuple[float, float]]:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return {self._to_lane(item['lane']): (float(item['score']), float(item['ts'])) for item in json.load(f)}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"⚠️ Nie udało się wczytać popularności tras ({self.state_file}): {e}")
+            return {}
+
+    def load(self) -> None:
+        """Wczytuje stan z pliku (scalając z bieżącym)"""
+        if not self.state_file:
+            return
+        stored = self._read_file()
+        now = time.time()
+        with self._lock:
+            for lane, (score, stamp) in stored.items():
+                current = self._scores.get(lane)
+                if current is None or self._decayed(*current, now) < self._decayed(score, stamp, now):
+                    self._scores[lane] = (score, stamp)
+
+    def save(self) -> None:
+        """Zapisuje stan do pliku (atomowo, po scaleniu z zapisem innych workerów)"""
+        if not self.state_file:
+            return
+        self._last_save = time.monotonic()
+        self.load()
+        now = time.time()
+        with self._lock:
+            self._trim(now)
+            items = [{'lane': list(lane), 'score': score, 'ts': stamp} for lane, (score, stamp) in self._scores.items()]
+        tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            logger.warning(f"⚠️ Nie udało się zapisać popularności tras ({self.state_file}): {e}")
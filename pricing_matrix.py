@@ -0,0 +1,188 @@
+"""
+Macierz wycen giełd dla wszystkich par regionów (artefakt mapowany w pamięci)
+
+Job `build_pricing_matrix.py` liczy co noc wynik TimoCom + Trans.eu dla każdej
+pary regionów Trans.eu z danymi i zapisuje go do jednego pliku binarnego.
+Workery API otwierają plik przez mmap - odczyt wyceny to indeks w tablicy
+(start, end) i dekodowanie jednego bloba JSON, bez zapytań do Postgres.
+
+Format pliku (little-endian):
+    nagłówek:  MAGIC (4B) | n_regions (u32) | n_windows (u32) | meta_len (u32)
+    okna:      n_windows x i32
+    regiony:   n_regions x i32 (posortowane ID regionów Trans.eu)
+    meta:      meta_len bajtów JSON (np. built_at, data_version)
+    indeks:    n_regions^2 x (offset u64, length u32) - length 0 = brak danych
+    bloby:     JSON {"timocom": {days: wynik}, "transeu": {days: wynik}}
+
+Zależności: brak (tylko biblioteka standardowa)
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PMX1'
+_HEADER = struct.Struct('<4sIII')
+_INDEX_ENTRY = struct.Struct('<QI')
+
+
+def write_matrix(path: str, region_ids: Iterable[int], windows: Iterable[int],
+                 blobs: Dict[Tuple[int, int], Dict], meta: Optional[Dict] = None) -> int:
+    """
+    Zapisuje macierz do pliku (atomowo - plik tymczasowy + os.replace).
+
+    Args:
+        path: Ścieżka pliku wynikowego
+        region_ids: ID regionów Trans.eu (wiersze / kolumny macierzy)
+        windows: Okna (dni) zapisane w blobach
+        blobs: {(start_id, end_id): {'timocom': {...}, 'transeu': {...}}} - tylko pary z danymi
+        meta: Dodatkowe metadane (JSON)
+
+    Returns:
+        Liczba zapisanych par
+    """
+    regions = sorted(set(int(r) for r in region_ids))
+    windows = sorted(set(int(w) for w in windows))
+    position = {region_id: i for i, region_id in enumerate(regions)}
+    n = len(regions)
+    meta_bytes = json.dumps(dict(meta or {}, built_at=time.time()), default=str).encode('utf-8')
+
+    data_start = _HEADER.size + 4 * len(windows) + 4 * n + len(meta_bytes) + _INDEX_ENTRY.size * n * n
+    index = bytearray(_INDEX_ENTRY.size * n * n)
+    payload = bytearray()
+    written = 0
+    for (start_id, end_id), blob in sorted(blobs.items()):
+        if start_id not in position or end_id not in position or not blob:
+            continue
+        encoded = json.dumps(blob, separators=(',', ':'), default=str).encode('utf-8')
+        cell = position[start_id] * n + position[end_id]
+        _INDEX_ENTRY.pack_into(index, cell * _INDEX_ENTRY.size, data_start + len(payload), len(encoded))
+        payload += encoded
+        written += 1
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, n, len(windows), len(meta_bytes)))
+        f.write(struct.pack(f'<{len(windows)}i', *windows))
+        f.write(struct.pack(f'<{n}i', *regions))
+        f.write(meta_bytes)
+        f.write(index)
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return written
+
+
+class PricingMatrix:
+    """
+    Odczyt macierzy wycen przez mmap.
+
+    Plik jest podmieniany atomowo przez job, więc `maybe_reload()` co jakiś czas
+    sprawdza mtime i otwiera nową wersję (stare mapowanie pozostaje ważne do końca).
+    """
+
+    def __init__(self, path: str, reload_check_seconds: float = 60.0):
+        """
+        Args:
+            path: Ścieżka pliku macierzy
+            reload_check_seconds: Co ile sekund sprawdzać, czy plik został podmieniony
+        """
+        self.path = path
+        self.reload_check_seconds = reload_check_seconds
+        self._lock = threading.Lock()
+        self._state = None  # (mmap, position, n, index_start, windows, meta, mtime)
+        self._last_check = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, n, n_windows, meta_len = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC:
+            mapped.close()
+            raise ValueError(f"Nieprawidłowy plik macierzy: {self.path}")
+        offset = _HEADER.size
+        windows = list(struct.unpack_from(f'<{n_windows}i', mapped, offset))
+        offset += 4 * n_windows
+        regions = struct.unpack_from(f'<{n}i', mapped, offset)
+        offset += 4 * n
+        meta = json.loads(mapped[offset:offset + meta_len].decode('utf-8'))
+        offset += meta_len
+        position = {region_id: i for i, region_id in enumerate(regions)}
+        return (mapped, position, n, offset, windows, meta, mtime)
+
+    def maybe_reload(self) -> bool:
+        """Otwiera (ponownie) plik, jeśli się zmienił. Zwraca True jeśli macierz jest dostępna"""
+        now = time.monotonic()
+        if self._state is not None and now - self._last_check < self.reload_check_seconds:
+            return True
+
+        with self._lock:
+            if self._state is not None and now - self._last_check < self.reload_check_seconds:
+                return True
+            self._last_check = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                self._state = None
+                return False
+            if self._state is not None and self._state[6] == mtime:
+                return True
+            try:
+                self._state = self._open()
+                logger.info(f"✅ Loaded pricing matrix {self.path} ({self._state[2]} regions, windows {self._state[4]})")
+            except Exception as e:
+                logger.error(f"❌ Failed to load pricing matrix {self.path}: {e}")
+                self._state = None
+            return self._state is not None
+
+    @property
+    def windows(self) -> List[int]:
+        return self._state[4] if self._state else []
+
+    @property
+    def meta(self) -> Dict:
+        return self._state[5] if self._state else {}
+
+    def age_seconds(self) -> Optional[float]:
+        """Wiek macierzy (od zbudowania) w sekundach"""
+        built_at = self.meta.get('built_at')
+        return time.time() - built_at if built_at else None
+
+    def covers(self, start_id: int, end_id: int, windows: Iterable[int]) -> bool:
+        """Czy macierz zawiera parę regionów i wszystkie żądane okna"""
+        if not self.maybe_reload():
+            return False
+        position = self._state[1]
+        return start_id in position and end_id in position and set(windows) <= set(self._state[4])
+
+    def lookup(self, start_id: int, end_id: int) -> Optional[Dict]:
+        """
+        Zwraca blob pary regionów: {'timocom': {days: wynik}, 'transeu': {days: wynik}}
+        lub None, jeśli para nie miała danych w chwili budowania macierzy.
+        """
+        state = self._state
+        if state is None:
+            return None
+        mapped, position, n, index_start = state[0], state[1], state[2], state[3]
+        cell = position[start_id] * n + position[end_id]
+        offset, length = _INDEX_ENTRY.unpack_from(mapped, index_start + cell * _INDEX_ENTRY.size)
+        if not length:
+            self.misses += 1
+            return None
+        self.hits += 1
+        blob = json.loads(mapped[offset:offset + length].decode('utf-8'))
+        # Klucze JSON są tekstowe - przywróć dni jako int
+        return {
+            source: {int(days): result for days, result in by_window.items()}
+            for source, by_window in blob.items()
+        }
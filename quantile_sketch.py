@@ -0,0 +1,194 @@
+"""
+Mergeable Quantile Sketch (uproszczony t-digest)
+
+Moduł do przechowywania rozkładu stawek EUR/km w postaci zwartego szkicu,
+który można scalać (merge) bez dostępu do surowych danych.
+
+Zastosowanie:
+- Job `build_daily_sketches.py` zapisuje szkic per trasa / dzień / metryka
+  do tabeli `pricing_daily_sketches` (obok dziennych agregatów giełd)
+- API scala szkice z wybranego okna (np. 30 dni) i zwraca p10/p25/p50/p75/p90
+  bez skanowania wierszy z ofertami / zleceniami
+
+Zależności: brak (tylko biblioteka standardowa)
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# Domyślne percentyle zwracane przez API
+DEFAULT_PERCENTILES = (0.10, 0.25, 0.50, 0.75, 0.90)
+
+# DDL tabeli ze szkicami (tworzona przez build_daily_sketches.py)
+SKETCH_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS public.pricing_daily_sketches (
+        source TEXT NOT NULL,          -- 'timocom' | 'transeu' | 'historical'
+        start_key TEXT NOT NULL,       -- ID regionu (giełdy) lub kod regionu (historical)
+        end_key TEXT NOT NULL,
+        metric TEXT NOT NULL,          -- np. 'trailer', 'lorry', 'FTL_client'
+        day DATE NOT NULL,
+        sketch JSONB NOT NULL,
+        PRIMARY KEY (source, start_key, end_key, metric, day)
+    );
+"""
+
+
+class QuantileSketch:
+    """
+    Szkic kwantylowy typu t-digest (wariant "merging digest").
+
+    Przechowuje listę centroidów (średnia, waga). Centroidy blisko ogonów
+    rozkładu są małe (dokładne p10/p90), w środku większe. Rozmiar szkicu
+    rośnie z `compression` i logarytmicznie z liczbą wartości - O(compression · log n),
+    np. ~540 centroidów dla 50 tys. wartości przy compression=100 (nie jest to twardy limit).
+    """
+
+    def __init__(self, compression: int = 100):
+        """
+        Args:
+            compression: Parametr kompresji (większy = dokładniej, więcej centroidów)
+        """
+        self.compression = compression
+        self._centroids: List[List[float]] = []  # [[mean, weight], ...] posortowane po mean
+        self._buffer: List[List[float]] = []
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        """Dodaje wartość (opcjonalnie z wagą, np. liczbą ofert)"""
+        if value is None or weight <= 0:
+            return
+        value = float(value)
+        self._buffer.append([value, float(weight)])
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Scala inny szkic do bieżącego (in-place) i zwraca self"""
+        if other.count <= 0:
+            return self
+        other._compress()
+        self._buffer.extend([c[0], c[1]] for c in other._centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    @classmethod
+    def merge_all(cls, sketches: Iterable['QuantileSketch'], compression: int = 100) -> 'QuantileSketch':
+        """Scala dowolną liczbę szkiców w jeden nowy szkic"""
+        merged = cls(compression)
+        for sketch in sketches:
+            merged.merge(sketch)
+        return merged
+
+    def _compress(self) -> None:
+        """Łączy bufor z centroidami z zachowaniem limitu wagi centroidu (skala k1)"""
+        if not self._buffer:
+            return
+
+        points = sorted(self._centroids + self._buffer, key=lambda c: c[0])
+        self._buffer = []
+        total = sum(c[1] for c in points)
+        if total <= 0:
+            self._centroids = []
+            return
+
+        compressed = [list(points[0])]
+        weight_so_far = 0.0
+        for mean, weight in points[1:]:
+            current = compressed[-1]
+            q = (weight_so_far + (current[1] + weight) / 2.0) / total
+            limit = 4.0 * total * q * (1.0 - q) / self.compression
+            if current[1] + weight <= max(limit, 1.0):
+                new_weight = current[1] + weight
+                current[0] += (mean - current[0]) * weight / new_weight
+                current[1] = new_weight
+            else:
+                weight_so_far += current[1]
+                compressed.append([mean, weight])
+
+        self._centroids = compressed
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Zwraca przybliżony kwantyl q (0..1) z interpolacją liniową
+        między środkami centroidów. None dla pustego szkicu.
+        """
+        self._compress()
+        if self.count <= 0 or not self._centroids:
+            return None
+
+        q = min(max(q, 0.0), 1.0)
+        centroids = self._centroids
+        if len(centroids) == 1:
+            # Jeden centroid - interpolacja pomiędzy min i max
+            return self.min + (self.max - self.min) * q if self.max > self.min else centroids[0][0]
+
+        target = q * self.count
+        cumulative = 0.0
+        prev_center, prev_mean = 0.0, self.min
+        for mean, weight in centroids:
+            center = cumulative + weight / 2.0
+            if target <= center:
+                span = center - prev_center
+                if span <= 0:
+                    return mean
+                return prev_mean + (mean - prev_mean) * (target - prev_center) / span
+            cumulative += weight
+            prev_center, prev_mean = center, mean
+
+        span = self.count - prev_center
+        if span <= 0:
+            return self.max
+        return prev_mean + (self.max - prev_mean) * (target - prev_center) / span
+
+    def percentiles(self, qs: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[str, Optional[float]]:
+        """Zwraca słownik {'p10': ..., 'p50': ..., ...} dla podanych kwantyli"""
+        return {f"p{int(round(q * 100))}": self.quantile(q) for q in qs}
+
+    def to_dict(self) -> Dict:
+        """Serializacja do JSON (kolumna JSONB w bazie)"""
+        self._compress()
+        return {
+            'c': [[round(m, 6), round(w, 6)] for m, w in self._centroids],
+            'n': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'k': self.compression
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'QuantileSketch':
+        """Deserializacja szkicu zapisanego przez to_dict()"""
+        sketch = cls(int(data.get('k', 100)))
+        sketch._centroids = [[float(m), float(w)] for m, w in data.get('c', [])]
+        sketch.count = float(data.get('n', sum(w for _, w in sketch._centroids)))
+        if data.get('min') is not None:
+            sketch.min = float(data['min'])
+        if data.get('max') is not None:
+            sketch.max = float(data['max'])
+        return sketch
+
+
+def percentile_spread(percentiles: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+    """
+    Oblicza rozrzut cen na podstawie percentyli.
+
+    Returns:
+        {'iqr': p75 - p25, 'p10_p90': p90 - p10} (None jeśli brak danych)
+    """
+    def _diff(high: str, low: str) -> Optional[float]:
+        if percentiles.get(high) is None or percentiles.get(low) is None:
+            return None
+        return percentiles[high] - percentiles[low]
+
+    return {
+        'iqr': _diff('p75', 'p25'),
+        'p10_p90': _diff('p90', 'p10')
+    }
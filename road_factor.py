@@ -0,0 +1,302 @@
+"""
+Model współczynnika drogi (dystans drogowy / Haversine) per korytarz
+
+Zamiast stałego `haversine × 1.3` model uczy się współczynnika z dystansów
+AWS (cache dystansów / route-matrix) dla korytarzy na kilku poziomach
+szczegółowości, np. para regionów -> para krajów -> globalnie ('*').
+Do szacowania używany jest najbardziej szczegółowy korytarz z co najmniej
+`min_samples` obserwacjami.
+
+Dla każdego korytarza model liczy medianę współczynnika (z obserwacji w zakresie)
+oraz błąd względny szacowania (p50 / p90) na wszystkich obserwacjach korytarza -
+promy, objazdy i krótkie dojazdy odrzucone z mediany też są szacowane tym
+współczynnikiem, więc liczą się do błędu. Błąd jest liczony poza próbą
+(k-fold, CROSS_VALIDATION_FOLDS): obserwację ocenia mediana korytarza dopasowana
+bez jej części danych, więc korytarz z kilkoma obserwacjami nie "przewiduje sam siebie".
+Korytarz z p90 błędu nie większym niż `trust_max_error` jest zaufany - wycena może
+wtedy pominąć wywołanie AWS.
+
+Dopasowanie jest wektorowe (numpy) po wszystkich obserwacjach naraz i
+wykonywane w wątku w tle co `refit_every` nowych obserwacji (razem z zapisem
+pliku - poza wątkiem requestu). Obserwacje są zapisywane do pliku JSON
+(wspólnego dla workerów - przy zapisie scalane), więc model przeżywa restart.
+
+Zależności: numpy
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Współczynniki spoza zakresu to błędy geokodowania / promy / objazdy - pomijane w medianie (nie w błędzie)
+MIN_FACTOR = 1.0
+MAX_FACTOR = 3.0
+# Poniżej tego dystansu Haversine współczynnik jest niestabilny (dojazdy lokalne)
+MIN_HAVERSINE_KM = 20.0
+# Liczba części do oceny błędu poza próbą (obserwacja i -> część i % k)
+CROSS_VALIDATION_FOLDS = 5
+
+
+def _group_quantiles(group_index: np.ndarray, values: np.ndarray, n_groups: int,
+                     quantiles: Sequence[float]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Kwantyle wartości w grupach (metoda najbliższej niższej rangi), wektorowo.
+
+    Returns:
+        Tuple (liczności grup, [kwantyl q dla każdej grupy, ...])
+    """
+    order = np.lexsort((values, group_index))
+    sorted_values = values[order]
+    counts = np.bincount(group_index, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    results = []
+    for q in quantiles:
+        offsets = np.floor(q * np.maximum(counts - 1, 0)).astype(np.int64)
+        results.append(np.where(counts > 0, sorted_values[np.minimum(starts + offsets, len(values) - 1)], np.nan))
+    return counts, results
+
+
+class RoadFactorModel:
+    """Współczynniki drogi per korytarz uczone z dystansów AWS"""
+
+    def __init__(self, default_factor: float = 1.3, min_samples: int = 20, trust_max_error: float = 0.05,
+                 max_samples: int = 50000, refit_every: int = 50, state_file: Optional[str] = None,
+                 save_interval: float = 300.0):
+        """
+        Args:
+            default_factor: Współczynnik bez wystarczających danych
+            min_samples: Minimalna liczba obserwacji korytarza
+            trust_max_error: Maksymalny p90 błędu względnego (poza próbą) zaufanego korytarza (0.05 = 5%)
+            max_samples: Maksymalna liczba obserwacji (najstarsze są usuwane)
+            refit_every: Co ile nowych obserwacji dopasowywać model
+            state_file: Ścieżka pliku z obserwacjami (None = tylko w pamięci)
+            save_interval: Minimalny odstęp (s) między zapisami pliku
+        """
+        self.default_factor = default_factor
+        self.min_samples = min_samples
+        self.trust_max_error = trust_max_error
+        self.max_samples = max_samples
+        self.refit_every = refit_every
+        self.state_file = state_file
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        # (start, end) -> (klucze korytarzy od najbardziej szczegółowego, haversine km, dystans drogowy km)
+        self._samples: 'OrderedDict[Tuple[str, str], Tuple[Tuple[str, ...], float, float]]' = OrderedDict()
+        self._corridors: Dict[str, Dict[str, Any]] = {}
+        self._pending = 0
+        self._refitting = False
+        self._last_save = time.monotonic()
+        self.fitted_at: Optional[float] = None
+        self.load()
+
+    def observe(self, pair: Tuple[str, str], keys: Sequence[str], haversine_km: float, road_km: float) -> None:
+        """
+        Dodaje obserwację dystansu AWS.
+
+        Args:
+            pair: Para (kod startu, kod celu) - nowa obserwacja pary zastępuje starą
+            keys: Klucze korytarzy od najbardziej szczegółowego (np. ('135-98', 'PL-DE', '*'))
+            haversine_km: Dystans Haversine
+            road_km: Dystans drogowy z AWS
+        """
+        if not haversine_km or not road_km:
+            return
+        with self._lock:
+            self._samples[tuple(pair)] = (tuple(keys), float(haversine_km), float(road_km))
+            self._samples.move_to_end(tuple(pair))
+            while len(self._samples) > self.max_samples:
+                self._samples.popitem(last=False)
+            self._pending += 1
+            if self._pending < self.refit_every or self._refitting:
+                return
+            self._refitting = True
+
+        thread = threading.Thread(target=self._refit, name='road-factor-refit', daemon=True)
+        thread.start()
+
+    def _refit(self) -> None:
+        """Dopasowanie i zapis pliku w tle (nie w wątku requestu)"""
+        try:
+            self.fit()
+            if self.state_file and time.monotonic() - self._last_save >= self.save_interval:
+                self.save()
+        except Exception as e:
+            logger.error(f"❌ Road factor refit failed: {e}")
+        finally:
+            with self._lock:
+                self._refitting = False
+
+    def fit(self) -> Dict[str, Any]:
+        """Dopasowuje współczynniki wszystkich korytarzy (wektorowo) i zwraca statystyki"""
+        with self._lock:
+            samples = list(self._samples.values())
+            self._pending = 0
+
+        corridors: Dict[str, Dict[str, Any]] = {}
+        if samples:
+            keys = [sample_keys for sample_keys, _, _ in samples]
+            haversine = np.fromiter((sample[1] for sample in samples), dtype=np.float64, count=len(samples))
+            road = np.fromiter((sample[2] for sample in samples), dtype=np.float64, count=len(samples))
+            ratio = road / np.maximum(haversine, 1e-9)
+            valid = (haversine >= MIN_HAVERSINE_KM) & (ratio >= MIN_FACTOR) & (ratio <= MAX_FACTOR)
+
+            # Każda obserwacja liczy się do wszystkich swoich poziomów korytarzy
+            rows = np.array([i for i, sample_keys in enumerate(keys) for _ in sample_keys], dtype=np.int64)
+            labels = [key for sample_keys in keys for key in sample_keys]
+            names, group_index = np.unique(np.array(labels, dtype=object), return_inverse=True)
+            rows_valid = valid[rows]
+            if rows_valid.any():
+                # Mediana tylko z obserwacji w zakresie (NaN dla korytarzy bez takich obserwacji)
+                counts, (median,) = _group_quantiles(
+                    group_index[rows_valid], ratio[rows[rows_valid]], len(names), (0.5,)
+                )
+                rejected = np.bincount(group_index, minlength=len(names)) - counts
+                # Błąd względny szacowania medianą korytarza - na wszystkich obserwacjach,
+                # odrzucone z mediany (prom, objazd, dojazd lokalny) to też błędy szacowania.
+                # Mediana bez części danych obserwacji (poza próbą); bez danych do oceny - błąd 100%
+                row_fold = rows % CROSS_VALIDATION_FOLDS
+                held_out_median = np.full(len(rows), np.nan)
+                for fold in range(CROSS_VALIDATION_FOLDS):
+                    train = rows_valid & (row_fold != fold)
+                    if not train.any():
+                        continue
+                    _, (fold_median,) = _group_quantiles(
+                        group_index[train], ratio[rows[train]], len(names), (0.5,)
+                    )
+                    test = row_fold == fold
+                    held_out_median[test] = fold_median[group_index[test]]
+                error = np.abs(haversine[rows] * held_out_median - road[rows]) / road[rows]
+                error = np.nan_to_num(error, nan=1.0)
+                _, (error_p50, error_p90) = _group_quantiles(group_index, error, len(names), (0.5, 0.9))
+                for i, name in enumerate(names):
+                    if not counts[i]:
+                        continue
+                    corridors[str(name)] = {
+                        'factor': round(float(median[i]), 4),
+                        'samples': int(counts[i]),
+                        'rejected': int(rejected[i]),
+                        'error_p50': round(float(error_p50[i]), 4),
+                        'error_p90': round(float(error_p90[i]), 4),
+                        'trusted': bool(counts[i] >= self.min_samples and error_p90[i] <= self.trust_max_error)
+                    }
+
+        with self._lock:
+            self._corridors = corridors
+            self.fitted_at = time.time()
+        stats = {
+            'samples': len(samples),
+            'corridors': len(corridors),
+            'trusted': sum(1 for corridor in corridors.values() if corridor['trusted'])
+        }
+        logger.info(f"📐 Road factor model fitted: {stats}")
+        return stats
+
+    def estimate(self, keys: Sequence[str], haversine_km: float) -> Dict[str, Any]:
+        """
+        Szacuje dystans drogowy współczynnikiem najbardziej szczegółowego korytarza
+        z co najmniej `min_samples` obserwacjami.
+
+        Args:
+            keys: Klucze korytarzy od najbardziej szczegółowego
+            haversine_km: Dystans Haversine
+
+        Returns:
+            {'distance_km', 'factor', 'corridor' (None = domyślny), 'trusted', 'error_p90'}
+        """
+        corridors = self._corridors
+        for key in keys:
+            corridor = corridors.get(key)
+            if corridor is not None and corridor['samples'] >= self.min_samples:
+                return {
+                    'distance_km': round(haversine_km * corridor['factor'], 2),
+                    'factor': corridor['factor'],
+                    'corridor': key,
+                    'trusted': corridor['trusted'],
+                    'error_p90': corridor['error_p90']
+                }
+        return {
+            'distance_km': round(haversine_km * self.default_factor, 2),
+            'factor': self.default_factor,
+            'corridor': None,
+            'trusted': False,
+            'error_p90': None
+        }
+
+    def corridors(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Korytarze posortowane malejąco po liczbie obserwacji"""
+        ranked = sorted(self._corridors.items(), key=lambda item: item[1]['samples'], reverse=True)
+        return [dict(corridor, corridor=key) for key, corridor in ranked[:limit]]
+
+    def _read_file(self) -> Dict[Tuple[str, str], Tuple[Tuple[str, ...], float, float]]:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return {
+                    tuple(item['pair']): (tuple(item['keys']), float(item['haversine_km']), float(item['road_km']))
+                    for item in json.load(f)
+                }
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to load road factor samples ({self.state_file}): {e}")
+            return {}
+
+    def load(self) -> None:
+        """Wczytuje obserwacje z pliku (scalając z bieżącymi) i dopasowuje model"""
+        if not self.state_file:
+            return
+        stored = self._read_file()
+        if not stored:
+            return
+        with self._lock:
+            for pair, sample in stored.items():
+                if pair not in self._samples:
+                    self._samples[pair] = sample
+                    self._samples.move_to_end(pair, last=False)
+            while len(self._samples) > self.max_samples:
+                self._samples.popitem(last=False)
+        self.fit()
+
+    def save(self) -> None:
+        """Zapisuje obserwacje do pliku (atomowo, po scaleniu z zapisem innych workerów)"""
+        if not self.state_file:
+            return
+        self._last_save = time.monotonic()
+        stored = self._read_file()
+        with self._lock:
+            for pair, sample in stored.items():
+                if pair not in self._samples:
+                    self._samples[pair] = sample
+                    self._samples.move_to_end(pair, last=False)
+            while len(self._samples) > self.max_samples:
+                self._samples.popitem(last=False)
+            items = [
+                {'pair': list(pair), 'keys': list(keys), 'haversine_km': haversine_km, 'road_km': road_km}
+                for pair, (keys, haversine_km, road_km) in self._samples.items()
+            ]
+        tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to save road factor samples ({self.state_file}): {e}")
+
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        """Statystyki modelu i najliczniejsze korytarze (do /api/metrics)"""
+        corridors = self._corridors
+        return {
+            'samples': len(self._samples),
+            'corridors': len(corridors),
+            'trusted_corridors': sum(1 for corridor in corridors.values() if corridor['trusted']),
+            'global_factor': corridors.get('*', {}).get('factor', self.default_factor),
+            'fitted_at': self.fitted_at,
+            'top_corridors': self.corridors(top)
+        }
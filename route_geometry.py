@@ -0,0 +1,128 @@
+"""
+Geometria trasy - upraszczanie i kodowanie jako polyline
+
+Geometria z AWS Routes (`LegGeometryFormat: Simple`) lub lokalnego silnika tras
+to lista punktów [lng, lat] - dla trasy przez Europę kilkadziesiąt tysięcy
+punktów, czyli megabajty JSON. Przed wysłaniem do klienta:
+- `simplify_path` - algorytm Douglasa-Peuckera z tolerancją w metrach
+  (odległość punktu od odcinka w lokalnym rzutowaniu równoodległościowym)
+- `encode_polyline` - Encoded Polyline Algorithm (Google, precyzja 1e-5 / 1e-6),
+  dekodowany przez Leaflet / Google Maps / Mapbox (`polyline.decode`)
+
+Upraszczanie jest wektorowe (numpy) - odległości wszystkich punktów odcinka
+liczone naraz, więc 50 tys. punktów to kilkadziesiąt milisekund.
+
+Zależności: numpy
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def simplify_path(points: Sequence[Sequence[float]], tolerance_m: float) -> List[Tuple[float, float]]:
+    """
+    Upraszcza linię algorytmem Douglasa-Peuckera (wersja iteracyjna, bez rekurencji).
+
+    Args:
+        points: Punkty linii [(lat, lng), ...]
+        tolerance_m: Maksymalne odchylenie uproszczonej linii od oryginału w metrach
+            (0 = tylko usunięcie powtórzonych punktów)
+
+    Returns:
+        Punkty uproszczonej linii [(lat, lng), ...] - zawsze z pierwszym i ostatnim punktem
+    """
+    coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(coords):
+        # Powtórzone kolejne punkty (np. styki odcinków trasy) nic nie wnoszą
+        keep_unique = np.concatenate(([True], np.any(np.diff(coords, axis=0) != 0, axis=1)))
+        coords = coords[keep_unique]
+    if len(coords) <= 2 or tolerance_m <= 0:
+        return [(float(lat), float(lng)) for lat, lng in coords]
+
+    # Rzutowanie równoodległościowe wokół środka trasy - metry na płaszczyźnie
+    lat0 = np.radians(coords[:, 0].mean())
+    xy = np.column_stack((
+        np.radians(coords[:, 1]) * np.cos(lat0) * EARTH_RADIUS_M,
+        np.radians(coords[:, 0]) * EARTH_RADIUS_M
+    ))
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = xy[first], xy[last]
+        segment = end - start
+        interior = xy[first + 1:last]
+        length_sq = float(segment @ segment)
+        if length_sq == 0.0:
+            distances = np.hypot(*(interior - start).T)
+        else:
+            # Odległość od odcinka (nie od prostej) - rzut ograniczony do [0, 1]
+            t = np.clip((interior - start) @ segment / length_sq, 0.0, 1.0)
+            distances = np.hypot(*(interior - (start + t[:, None] * segment)).T)
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance_m:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return [(float(lat), float(lng)) for lat, lng in coords[keep]]
+
+
+def _encode_value(value: int, chunks: List[str]) -> None:
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def encode_polyline(points: Sequence[Sequence[float]], precision: int = 5) -> str:
+    """
+    Koduje punkty [(lat, lng), ...] w formacie Encoded Polyline (różnice kolejnych punktów).
+
+    Args:
+        points: Punkty linii [(lat, lng), ...]
+        precision: Liczba miejsc po przecinku (5 - ok. 1 m, standard Google; 6 - OSRM / Valhalla)
+
+    Returns:
+        Zakodowana linia (ASCII)
+    """
+    factor = 10 ** precision
+    chunks: List[str] = []
+    previous_lat = previous_lng = 0
+    for lat, lng in points:
+        lat_e, lng_e = int(round(lat * factor)), int(round(lng * factor))
+        _encode_value(lat_e - previous_lat, chunks)
+        _encode_value(lng_e - previous_lng, chunks)
+        previous_lat, previous_lng = lat_e, lng_e
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    """Dekoduje Encoded Polyline do punktów [(lat, lng), ...]"""
+    factor = 10 ** precision
+    points: List[Tuple[float, float]] = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
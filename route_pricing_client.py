@@ -4,7 +4,54 @@ Prosty wrapper dla endpoint /api/route-pricing
 """
 
 import requests
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+
+# Mapowanie typu pojazdu -> (źródło, klucz stawki w avg_price_per_km)
+VEHICLE_TYPE_SOURCES = {
+    "naczepa": ("timocom", "trailer"),
+    "3.5t": ("timocom", "3_5t"),
+    "12t": ("timocom", "12t"),
+    "lorry": ("transeu", "lorry")
+}
+
+# Okna czasowe pobierane domyślnie (jednym requestem)
+DEFAULT_WINDOWS = [7, 30, 90]
+
+
+def decode_orders_columnar(orders_columnar: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Zamienia listę zleceń w formacie kolumnowym (orders_format=columnar) na listę obiektów"""
+    columns = dict(orders_columnar['columns'])
+    for name, values in orders_columnar.get('dictionaries', {}).items():
+        columns[name] = [values[index] for index in columns[name]]
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(columns[name] for name in names))]
+
+
+def _period_days(period: str) -> int:
+    """Zamienia okres '30d' na liczbę dni (30)"""
+    return int(period.rstrip('d'))
+
+
+def _extract_rate(pricing: Dict[str, Any], vehicle_type: str, period: str) -> Optional[float]:
+    """
+    Wyciąga średnią stawkę EUR/km dla typu pojazdu i okresu z sekcji `pricing`
+    
+    Args:
+        pricing: Sekcja data.pricing z odpowiedzi API
+        vehicle_type: Typ pojazdu (naczepa, 3.5t, 12t, lorry)
+        period: Okres (np. 7d, 30d, 90d)
+    
+    Returns:
+        Średnia stawka w EUR/km lub None jeśli brak danych
+    """
+    source, rate_key = VEHICLE_TYPE_SOURCES.get(vehicle_type, VEHICLE_TYPE_SOURCES["naczepa"])
+    window_data = pricing.get(source, {}).get(period)
+    
+    if not window_data:
+        return None
+    
+    return window_data.get('avg_price_per_km', {}).get(rate_key)
 
 
 class RoutePricingClient:
@@ -26,8 +73,12 @@ class RoutePricingClient:
         self,
         start_postal_code: str,
         end_postal_code: str,
-        vehicle_type: str = "naczepa",
-        timeout: int = 10
+        vehicle_type: Optional[str] = None,
+        timeout: int = 10,
+        windows: Optional[List[int]] = None,
+        include_distance: bool = True,
+        include_orders: bool = False,
+        orders_format: str = "rows"
     ) -> Dict[str, Any]:
         """
         Pobiera wycenę dla trasy
@@ -35,8 +86,12 @@ class RoutePricingClient:
         Args:
             start_postal_code: Kod pocztowy początku trasy
             end_postal_code: Kod pocztowy końca trasy
-            vehicle_type: Typ pojazdu (domyślnie: naczepa)
+            vehicle_type: Typ pojazdu (domyślnie: wszystkie) - serwer liczy tylko potrzebne źródło
             timeout: Timeout żądania w sekundach
+            windows: Okna czasowe w dniach (domyślnie: 7, 30, 90 - liczone jednym zapytaniem)
+            include_distance: Czy liczyć dystans drogowy i ceny całkowite (wywołanie AWS)
+            include_orders: Czy pobrać listę zleceń historycznych
+            orders_format: "rows" lub "columnar" (mniejsza odpowiedź - patrz decode_orders_columnar)
             
         Returns:
             Słownik z danymi odpowiedzi API
@@ -47,8 +102,13 @@ class RoutePricingClient:
         payload = {
             "start_postal_code": start_postal_code,
             "end_postal_code": end_postal_code,
-            "vehicle_type": vehicle_type
+            "windows": windows or DEFAULT_WINDOWS,
+            "include_distance": include_distance,
+            "include_orders": include_orders,
+            "orders_format": orders_format
         }
+        if vehicle_type:
+            payload["vehicle_type"] = vehicle_type
         
         response = requests.post(self.endpoint, json=payload, timeout=timeout)
         return response.json()
@@ -73,20 +133,15 @@ class RoutePricingClient:
             Średnia cena w EUR/km lub None jeśli brak danych
         """
         try:
-            result = self.get_route_pricing(start_postal_code, end_postal_code, vehicle_type)
+            result = self.get_route_pricing(
+                start_postal_code, end_postal_code, vehicle_type,
+                windows=[_period_days(period)], include_distance=False
+            )
             
             if not result.get('success'):
                 return None
             
-            pricing = result['data']['pricing']
-            
-            # Znajdź źródło danych (timocom lub transeu)
-            source = list(pricing.keys())[0] if pricing else None
-            
-            if not source:
-                return None
-            
-            return pricing[source].get(f'avg_{period}')
+            return _extract_rate(result['data']['pricing'], vehicle_type, period)
             
         except Exception as e:
             print(f"Błąd: {e}")
@@ -112,25 +167,20 @@ class RoutePricingClient:
             Całkowity koszt w EUR lub None jeśli brak danych
         """
         try:
-            result = self.get_route_pricing(start_postal_code, end_postal_code, vehicle_type)
+            result = self.get_route_pricing(
+                start_postal_code, end_postal_code, vehicle_type, windows=[_period_days(period)]
+            )
             
             if not result.get('success'):
                 return None
             
             data = result['data']
-            distance = data.get('distance_km')
-            pricing = data['pricing']
+            distance = (data.get('route_distance') or {}).get('distance_km')
             
             if not distance:
                 return None
             
-            # Znajdź źródło danych (timocom lub transeu)
-            source = list(pricing.keys())[0] if pricing else None
-            
-            if not source:
-                return None
-            
-            avg_price_per_km = pricing[source].get(f'avg_{period}')
+            avg_price_per_km = _extract_rate(data['pricing'], vehicle_type, period)
             
             if avg_price_per_km is None:
                 return None
@@ -191,9 +241,8 @@ if __name__ == '__main__':
     result = client.get_route_pricing("89", "50", "naczepa")
     if result.get('success'):
         print(f"   ✓ Trasa: {result['data']['start_postal_code']} -> {result['data']['end_postal_code']}")
-        print(f"   ✓ Dystans: {result['data']['distance_km']} km")
-        pricing = result['data']['pricing']['timocom']
-        print(f"   ✓ Średnia 7d: {pricing['avg_7d']} EUR/km")
+        print(f"   ✓ Dystans: {result['data'].get('route_distance', {}).get('distance_km')} km")
+        print(f"   ✓ Średnia 7d: {_extract_rate(result['data']['pricing'], 'naczepa', '7d')} EUR/km")
     else:
         print(f"   ✗ Błąd: {result.get('error')}")
     
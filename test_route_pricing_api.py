@@ -19,7 +19,8 @@ def test_api(start_postal, end_postal, vehicle_type="naczepa"):
     payload = {
         "start_postal_code": start_postal,
         "end_postal_code": end_postal,
-        "vehicle_type": vehicle_type
+        "vehicle_type": vehicle_type,
+        "windows": [7, 30, 90]
     }
     
     print(f"\n{'='*60}")
@@ -44,16 +45,13 @@ def test_api(start_postal, end_postal, vehicle_type="naczepa"):
             print(f"  Waluta: {route_data.get('currency')}")
             
             pricing = route_data.get('pricing', {})
-            for source, metrics in pricing.items():
+            for source, windows in pricing.items():
                 print(f"\n  {source.upper()}:")
-                if metrics.get('avg_7d'):
-                    print(f"    Średnia 7d:  {metrics['avg_7d']} EUR/km")
-                if metrics.get('avg_30d'):
-                    print(f"    Średnia 30d: {metrics['avg_30d']} EUR/km")
-                if metrics.get('avg_90d'):
-                    print(f"    Średnia 90d: {metrics['avg_90d']} EUR/km")
-                if metrics.get('offers_7d'):
-                    print(f"    Oferty 7d:   {metrics['offers_7d']}")
+                for period, metrics in windows.items():
+                    if metrics.get('avg_price_per_km'):
+                        print(f"    Średnia {period}: {metrics['avg_price_per_km']} EUR/km")
+                    if metrics.get('total_offers'):
+                        print(f"    Oferty {period}:  {metrics['total_offers']}")
         else:
             print(f"\n✗ BŁĄD: {data.get('error')}")
             
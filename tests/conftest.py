@@ -0,0 +1,136 @@
+"""
+Wspólna konfiguracja testów (pytest)
+
+Moduły aplikacji leżą w katalogu głównym repozytorium i w `contractorDetails/`
+(bez pakietu) - oba katalogi trafiają na sys.path, tak jak w benchmarkach.
+
+Fixture `pricing_api` uruchamia endpointy wyceny przez `app.test_client()` bez
+Postgres i AWS: zapytania źródeł, dystans i wersja danych są podmienione na
+kontrolowane przez test odpowiedniki, a cache / breakery są czyste w każdym teście.
+
+Uruchomienie:
+    python -m pytest -q
+"""
+
+import copy
+import os
+import sys
+import time
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'contractorDetails')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+API_KEY = 'test-api-key'
+
+TIMOCOM_STATS = {
+    'avg_price_per_km': {'trailer': 1.2, '3_5t': 0.8, '12t': 1.0},
+    'median_price_per_km': {'trailer': 1.1, '3_5t': None, '12t': None},
+    'total_offers': 40,
+    'offers_by_vehicle_type': {'trailer': 20, '3_5t': 10, '12t': 10},
+    'days_with_data': 12
+}
+TRANSEU_STATS = {
+    'avg_price_per_km': {'lorry': 1.15},
+    'median_price_per_km': {'lorry': 1.1},
+    'total_offers': 25,
+    'days_with_data': 10
+}
+HISTORICAL_STATS = {
+    'match_info': {'matched_start': 'PL20', 'matched_end': 'DE49', 'accuracy': 'exact',
+                   'start_distance_km': 0.0, 'end_distance_km': 0.0},
+    'FTL': {
+        'avg_price_per_km': {'client': 1.3, 'carrier': 1.05},
+        'median_price_per_km': {'client': 1.25, 'carrier': 1.0},
+        'total_orders': 8,
+        'days_with_data': 6
+    }
+}
+
+
+class PricingApi:
+    """Klient testowy API wyceny z podmienionymi źródłami danych"""
+
+    def __init__(self, app_secure):
+        self.app = app_secure
+        self.client = app_secure.app.test_client()
+        self.version = 'v1'
+        self.distance_km = 500.0
+        self.leg_km = {}  # Dystans odcinka trasy wielopunktowej {(start, cel): km}, domyślnie distance_km
+        # Wynik pojedynczego okna per źródło; None = brak danych, 'error' = błąd źródła ({})
+        self.stats = {'timocom': TIMOCOM_STATS, 'transeu': TRANSEU_STATS, 'historical': HISTORICAL_STATS}
+        self.calls = Counter()
+        self.fetch_kwargs = {}
+        self.delay = 0.0
+
+    def fetcher(self, source):
+        """Podmiana get_<źródło>_pricing_windows - wynik {days: statystyki} lub {} (błąd źródła)"""
+        def fetch(start, end, windows, **kwargs):
+            self.calls[source] += 1
+            self.fetch_kwargs[source] = kwargs
+            if self.delay:
+                time.sleep(self.delay)
+            stats = self.stats[source]
+            if stats == 'error':
+                return {}
+            return {days: copy.deepcopy(stats) for days in windows}
+        return fetch
+
+    def post(self, path='/api/route-pricing', headers=None, **payload):
+        """POST z kluczem API; domyślna trasa PL20 -> DE49"""
+        if path == '/api/route-pricing':
+            payload.setdefault('start_postal_code', 'PL20')
+            payload.setdefault('end_postal_code', 'DE49')
+        return self.client.post(path, json=payload, headers={'X-API-Key': API_KEY, **(headers or {})})
+
+    def wait_for_refresh(self, timeout=5.0):
+        """Czeka na zakończenie odświeżeń cache odpowiedzi w tle"""
+        deadline = time.monotonic() + timeout
+        while self.app.pricing_result_cache.stats()['refreshing'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+@pytest.fixture
+def pricing_api(monkeypatch):
+    """API wyceny bez Postgres / AWS: źródła, dystans i wersja danych sterowane przez test"""
+    import app_secure
+    from circuit_breaker import CircuitBreaker
+
+    api = PricingApi(app_secure)
+    monkeypatch.setattr(app_secure, 'API_KEY', API_KEY)
+    monkeypatch.setattr(app_secure.limiter, 'enabled', False)
+    monkeypatch.setattr(app_secure, 'get_data_version', lambda db_label: api.version)
+    monkeypatch.setattr(app_secure, 'get_exchange_pricing_from_matrix', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_secure, 'get_timocom_pricing_windows', api.fetcher('timocom'))
+    monkeypatch.setattr(app_secure, 'get_transeu_pricing_windows', api.fetcher('transeu'))
+    monkeypatch.setattr(app_secure, 'get_historical_orders_pricing_windows', api.fetcher('historical'))
+
+    def route_distance(start_postal, end_postal, skipped=None):
+        api.calls['distance'] += 1
+        return api.distance_km, app_secure.ROUTE_METHOD, 0, 0
+
+    monkeypatch.setattr(app_secure, 'compute_route_distance', route_distance)
+
+    def leg_distances(stops, skipped=None):
+        api.calls['leg_distances'] += 1
+        return [(api.leg_km.get(leg, api.distance_km), app_secure.ROUTE_METHOD) for leg in zip(stops, stops[1:])]
+
+    monkeypatch.setattr(app_secure, 'compute_leg_distances', leg_distances)
+    for name in ('aws_breaker', 'exchanges_db_breaker', 'main_db_breaker'):
+        breaker = getattr(app_secure, name)
+        monkeypatch.setattr(app_secure, name, CircuitBreaker(
+            breaker.name, failure_threshold=breaker.failure_threshold, reset_seconds=breaker.reset_seconds,
+            min_timeout=breaker.min_timeout, max_timeout=breaker.max_timeout
+        ))
+    caches = (app_secure.pricing_result_cache, app_secure.last_good_cache, app_secure.source_result_cache,
+              app_secure.negative_cache, app_secure.encoded_response_cache, app_secure.distance_cache)
+    for cache in caches:
+        cache.clear()
+    yield api
+    api.wait_for_refresh()
+    for cache in caches:
+        cache.clear()
@@ -0,0 +1,137 @@
+"""Testy kontroli dopuszczania (admission.py): limit, kolejka i czas oczekiwania"""
+
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def _hold(controller, name, release, entered=None):
+    """Wątek zajmujący miejsce w etapie do ustawienia `release`"""
+    def run():
+        with controller.stage(name):
+            if entered is not None:
+                entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not reached'
+        time.sleep(0.01)
+
+
+def test_rejects_immediately_without_queue():
+    controller = AdmissionController()
+    controller.add_stage('exchanges', limit=1, max_queue=0)
+    release, entered = threading.Event(), threading.Event()
+    holder = _hold(controller, 'exchanges', release, entered)
+    entered.wait(5)
+
+    with pytest.raises(Overloaded) as excinfo:
+        with controller.stage('exchanges'):
+            pass
+    release.set()
+    holder.join()
+
+    assert excinfo.value.stage == 'exchanges'
+    assert excinfo.value.retry_after >= 1
+    stats = controller.stats()['stages']['exchanges']
+    assert (stats['admitted'], stats['rejected'], stats['in_flight']) == (1, 1, 0)
+
+
+def test_queued_call_runs_after_slot_is_released():
+    controller = AdmissionController()
+    stage = controller.add_stage('route', limit=1, max_queue=1, queue_timeout=5)
+    release, entered = threading.Event(), threading.Event()
+    holder = _hold(controller, 'route', release, entered)
+    entered.wait(5)
+
+    done = threading.Event()
+
+    def run_queued():
+        with controller.stage('route'):
+            done.set()
+
+    queued = threading.Thread(target=run_queued)
+    queued.start()
+    _wait_until(lambda: stage.waiting == 1)
+    assert controller.queue_depth() == 1
+
+    # Kolejka pełna - kolejne wywołanie dostaje Overloaded bez czekania
+    with pytest.raises(Overloaded):
+        with controller.stage('route'):
+            pass
+
+    release.set()
+    holder.join()
+    queued.join(5)
+    assert done.is_set()
+    assert stage.in_flight == 0
+    assert stage.stats()['queued'] == 1
+    assert stage.stats()['rejected'] == 1
+    assert stage.stats()['max_queue_depth_seen'] == 1
+
+
+def test_queue_timeout():
+    controller = AdmissionController()
+    stage = controller.add_stage('aws', limit=1, max_queue=5, queue_timeout=0.1)
+    release, entered = threading.Event(), threading.Event()
+    holder = _hold(controller, 'aws', release, entered)
+    entered.wait(5)
+
+    started = time.monotonic()
+    with pytest.raises(Overloaded):
+        with controller.stage('aws'):
+            pass
+    waited = time.monotonic() - started
+    release.set()
+    holder.join()
+
+    assert 0.1 <= waited < 1.0
+    assert stage.timed_out == 1
+    assert stage.waiting == 0
+
+
+def test_try_stage_does_not_wait_in_queue():
+    controller = AdmissionController()
+    stage = controller.add_stage('route', limit=1, max_queue=10)
+    release, entered = threading.Event(), threading.Event()
+    holder = _hold(controller, 'route', release, entered)
+    entered.wait(5)
+
+    with pytest.raises(Overloaded):
+        with controller.try_stage('route'):
+            pass
+    release.set()
+    holder.join()
+
+    with controller.try_stage('route'):
+        assert stage.in_flight == 1
+    assert stage.in_flight == 0
+
+
+def test_slot_is_released_on_error():
+    controller = AdmissionController()
+    stage = controller.add_stage('route', limit=1)
+    with pytest.raises(ZeroDivisionError):
+        with controller.stage('route'):
+            1 / 0
+    assert stage.in_flight == 0
+    with controller.stage('route'):
+        pass
+
+
+def test_unknown_stage_and_disabled_controller_are_not_limited():
+    controller = AdmissionController(enabled=False)
+    controller.add_stage('route', limit=0)
+    with controller.stage('route'), controller.try_stage('route'), controller.stage('unknown'):
+        pass
+    assert controller.stages['route'].admitted == 0
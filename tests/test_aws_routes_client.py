@@ -0,0 +1,74 @@
+"""Testy klienta AWS Routes (aws_distance_calculator.py) na lokalnym zamienniku usługi"""
+
+import pytest
+
+from aws_distance_calculator import AwsRoutesClient, calculate_route_matrix
+from fake_aws_routes import road_meters, start_fake_server
+
+
+@pytest.fixture
+def fake_server():
+    server = start_fake_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, **kwargs):
+    return AwsRoutesClient(api_key='test', base_url=f"http://127.0.0.1:{server.server_address[1]}",
+                           backoff_base=0, **kwargs)
+
+
+def _points(n, lat0, lng0):
+    """n punktów (lat, lng) na siatce co 0.1°"""
+    return [(lat0 + (i // 10) * 0.1, lng0 + (i % 10) * 0.1) for i in range(n)]
+
+
+def test_route_matrix_is_split_into_chunks_within_limits(fake_server):
+    origins, destinations = _points(20, 50.0, 19.0), _points(130, 52.0, 13.0)
+    client = _client(fake_server, pool_size=4)
+
+    matrix = calculate_route_matrix(origins, destinations, client=client,
+                                    max_origins=15, max_destinations=100, max_workers=4)
+
+    assert sorted(fake_server.matrix_shapes) == [(5, 30), (5, 100), (15, 30), (15, 100)]
+    assert len(matrix) == 20 and all(len(row) == 130 for row in matrix)
+    for i in (0, 14, 15, 19):
+        for j in (0, 99, 100, 129):
+            (lat1, lng1), (lat2, lng2) = origins[i], destinations[j]
+            expected_km = round(road_meters([lng1, lat1], [lng2, lat2]) / 1000.0, 2)
+            assert matrix[i][j] == {'distance': expected_km, 'duration': 3600}
+    # Porcje wysyłane po połączeniach keep-alive z puli klienta
+    assert fake_server.connections <= 4
+    client.close()
+
+
+def test_failed_chunks_are_none_after_retries():
+    server = start_fake_server(error_rate=1.0)
+    try:
+        client = _client(server, max_retries=2)
+        matrix = calculate_route_matrix(_points(3, 50.0, 19.0), _points(4, 52.0, 13.0), client=client,
+                                        max_origins=2, max_destinations=100, max_workers=2)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert matrix == [[None] * 4] * 3
+    stats = client.stats()
+    assert (stats['calls'], stats['attempts'], stats['retries'], stats['failures']) == (2, 6, 4, 2)
+
+
+def test_empty_matrix_makes_no_requests(fake_server):
+    assert calculate_route_matrix([], _points(3, 52.0, 13.0), client=_client(fake_server)) == []
+    assert fake_server.requests == 0
+
+
+def test_route_legs_one_request_for_all_stops(fake_server):
+    client = _client(fake_server)
+    stops = [(52.23, 21.01), (51.11, 17.03), (52.52, 13.40)]
+
+    legs = client.route_legs(stops)
+
+    assert fake_server.requests == 1
+    assert [leg['duration'] for leg in legs] == [3600, 3600]
+    assert legs[0]['distance'] == pytest.approx(road_meters([21.01, 52.23], [17.03, 51.11]) / 1000, abs=0.01)
@@ -0,0 +1,89 @@
+"""Testy circuit breakera (circuit_breaker.py): stany i adaptacyjny timeout"""
+
+import time
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.allow()
+        breaker.record_failure('timeout')
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('aws', failure_threshold=3, reset_seconds=60)
+    breaker.record_failure('timeout')
+    breaker.record_failure('timeout')
+    breaker.record_success(0.1)  # Sukces zeruje licznik kolejnych błędów
+    breaker.record_failure('timeout')
+    breaker.record_failure('timeout')
+    assert breaker.state == CLOSED
+
+    breaker.record_failure('connection reset')
+    assert breaker.state == OPEN
+    assert not breaker.available
+    assert breaker.stats()['opened'] == 1
+    assert breaker.stats()['last_error'] == 'connection reset'
+
+
+def test_open_breaker_rejects_without_call():
+    breaker = CircuitBreaker('exchanges_db', failure_threshold=1, reset_seconds=60)
+    _open(breaker)
+    with pytest.raises(CircuitOpen) as excinfo:
+        breaker.allow()
+    assert excinfo.value.name == 'exchanges_db'
+    assert 0 < excinfo.value.retry_after <= 60
+    assert breaker.rejected == 1
+
+
+def test_half_open_success_closes():
+    breaker = CircuitBreaker('aws', failure_threshold=1, reset_seconds=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    assert breaker.available
+
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # W trakcie próby half-open pozostałe wywołania są odrzucane
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    breaker.record_success(0.2)
+    assert breaker.state == CLOSED
+    breaker.allow()
+
+
+def test_half_open_failure_reopens():
+    breaker = CircuitBreaker('aws', failure_threshold=3, reset_seconds=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record_failure('timeout')  # Jeden błąd próby wystarcza
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_timeout_is_max_until_enough_samples():
+    breaker = CircuitBreaker('aws', min_timeout=0.5, max_timeout=10, min_samples=5)
+    for _ in range(4):
+        breaker.record_success(0.1)
+    assert breaker.timeout() == 10
+    breaker.record_success(0.1)
+    assert breaker.timeout() == pytest.approx(0.5)  # 0.1 s × 2 < min_timeout
+
+
+def test_timeout_follows_latency_percentile():
+    breaker = CircuitBreaker('aws', min_timeout=0.1, max_timeout=10, timeout_percentile=0.9,
+                             timeout_multiplier=2.0, window=100, min_samples=10)
+    for i in range(1, 101):
+        breaker.record_success(i / 100)  # 0.01 .. 1.00 s
+    assert breaker.timeout() == pytest.approx(1.8)
+
+    for _ in range(100):
+        breaker.record_success(20.0)  # Okno pełne wolnych wywołań - górna granica
+    assert breaker.timeout() == 10
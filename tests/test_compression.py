@@ -0,0 +1,90 @@
+"""Testy kompresji odpowiedzi (compression.py) i cache zakodowanych body wyceny"""
+
+import gzip
+import json
+
+import pytest
+
+import compression
+from compression import negotiate_encoding, should_compress
+
+PREFERRED = next(iter(compression.ENCODERS))  # pierwsze dostępne kodowanie (preferencja serwera)
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('GZip', 'gzip'),
+    ('gzip;q=0', None),
+    ('gzip;q=abc', None),
+    ('deflate, identity;q=0.5', None),
+    ('*', PREFERRED),
+    ('*;q=0, gzip', 'gzip'),
+    ('gzip;q=0.2, *;q=0.1', 'gzip'),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+@pytest.mark.skipif(compression.brotli is None, reason='brotli nie jest zainstalowany')
+def test_highest_q_wins_over_server_preference():
+    assert negotiate_encoding('gzip;q=1.0, br;q=0.5') == 'gzip'
+    assert negotiate_encoding('gzip;q=0.5, br;q=0.9') == 'br'
+
+
+def test_disabled_compression(monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESSION_ENABLED', False)
+    assert negotiate_encoding('gzip') is None
+    assert not should_compress(10 ** 6)
+
+
+def test_small_bodies_are_not_compressed():
+    assert not should_compress(compression.COMPRESSION_MIN_SIZE - 1)
+    assert should_compress(compression.COMPRESSION_MIN_SIZE)
+
+
+def test_gzip_round_trip():
+    body = json.dumps({'orders': list(range(500))}).encode()
+    assert gzip.decompress(compression.compress(body, 'gzip')) == body
+
+
+def test_pricing_response_is_compressed_and_varies(pricing_api, monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESSION_MIN_SIZE', 100)
+    compressed = pricing_api.post(headers={'Accept-Encoding': 'gzip'})
+    plain = pricing_api.post()
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    assert 'Content-Encoding' not in plain.headers
+    assert json.loads(gzip.decompress(compressed.data))['data']['pricing'] == plain.get_json()['data']['pricing']
+
+
+def test_body_below_threshold_is_sent_uncompressed(pricing_api, monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESSION_MIN_SIZE', 10 ** 7)
+    response = pricing_api.post(headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.get_json()['success'] is True
+
+
+def test_encoded_body_is_reused_between_cache_hits(pricing_api, monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESSION_MIN_SIZE', 100)
+    app = pricing_api.app
+    encodings = []
+    encode = app._encode_pricing_body
+
+    def counting_encode(response_data, cache_status, created_at, encoding):
+        encodings.append((cache_status, encoding))
+        return encode(response_data, cache_status, created_at, encoding)
+
+    monkeypatch.setattr(app, '_encode_pricing_body', counting_encode)
+    responses = [pricing_api.post(headers={'Accept-Encoding': 'gzip'}) for _ in range(4)]
+    responses.append(pricing_api.post())
+
+    # miss + pierwsze trafienie 'fresh' (gzip) + pierwsze trafienie bez kompresji
+    assert encodings == [('miss', 'gzip'), ('fresh', 'gzip'), ('fresh', None)]
+    assert responses[1].data == responses[3].data
+    assert responses[1].headers['Content-Encoding'] == 'gzip'
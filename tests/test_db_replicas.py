@@ -0,0 +1,152 @@
+"""Testy routingu odczytów na repliki (db_replicas.py) - bez bazy, na poolach w pamięci"""
+
+import psycopg2
+from psycopg2 import pool
+
+from db_replicas import ReplicaPool, ReplicaRouter, parse_hosts
+
+
+class _Cursor:
+    def __init__(self, replica):
+        self.replica = replica
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        if self.replica.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+
+    def fetchone(self):
+        return {'lag_seconds': self.replica.lag}
+
+
+class _Connection:
+    def __init__(self, replica):
+        self.replica = replica
+
+    def cursor(self):
+        return _Cursor(self.replica)
+
+
+class _MemoryPool:
+    """Pool połączeń w pamięci z limitem jak ThreadedConnectionPool"""
+
+    def __init__(self, replica, maxconn):
+        self.replica = replica
+        self.maxconn = maxconn
+        self.used = 0
+
+    def getconn(self):
+        if self.used >= self.maxconn:
+            raise pool.PoolError('connection pool exhausted')
+        self.used += 1
+        return _Connection(self.replica)
+
+    def putconn(self, conn, close=False):
+        self.used -= 1
+
+
+class _Replica(ReplicaPool):
+    def __init__(self, name, lag=0.0, maxconn=2, **kwargs):
+        super().__init__(name, {}, maxconn=maxconn, **kwargs)
+        self.lag = lag
+        self.broken = False
+        self._pool = _MemoryPool(self, maxconn)
+
+
+def _router(*replicas, max_lag_seconds=30.0):
+    """Router z primary zapisującym wydane połączenia"""
+    primary = []
+
+    def primary_getconn():
+        primary.append(object())
+        return primary[-1]
+
+    router = ReplicaRouter('main', primary_getconn, lambda conn: None, list(replicas), max_lag_seconds=max_lag_seconds)
+    return router, primary
+
+
+def _owner(router, conn):
+    return router._owners[id(conn)][0]
+
+
+def test_parse_hosts():
+    assert parse_hosts('db1:5433, db2', '5432') == [{'host': 'db1', 'port': '5433'}, {'host': 'db2', 'port': '5432'}]
+    assert parse_hosts(None, '5432') == []
+
+
+def test_reads_go_to_least_loaded_replica():
+    first, second = _Replica('r1'), _Replica('r2')
+    router, primary = _router(first, second)
+
+    a = router.getconn()
+    b = router.getconn()
+    assert {_owner(router, a), _owner(router, b)} == {first, second}
+    router.putconn(a)
+    router.putconn(b)
+    assert (first.in_use, second.in_use) == (0, 0)
+    assert first.avg_hold_ms is not None
+    assert primary == []
+
+
+def test_lagging_replica_is_skipped():
+    router, primary = _router(_Replica('r1', lag=120.0), max_lag_seconds=30.0)
+    conn = router.getconn()
+    assert _owner(router, conn) is None
+    assert router.stats()['fallbacks_to_primary'] == 1
+    assert router.replicas[0].in_use == 0
+
+
+def test_exhausted_replica_is_busy_not_unhealthy():
+    replica = _Replica('r1', maxconn=1)
+    router, primary = _router(replica)
+    held = router.getconn()
+    assert _owner(router, held) is replica
+
+    conn = router.getconn()
+    assert _owner(router, conn) is None
+    assert replica.healthy
+    assert replica.stats()['exhausted'] == 1
+
+
+def test_failed_check_marks_replica_unhealthy():
+    replica = _Replica('r1', retry_seconds=60)
+    replica.broken = True
+    router, primary = _router(replica)
+
+    conn = router.getconn()
+    assert _owner(router, conn) is None
+    assert not replica.healthy
+    assert replica.errors == 1
+    assert replica._pool.used == 0  # Połączenie po nieudanej kontroli zamknięte
+
+    replica.broken = False
+    router.getconn()
+    assert len(primary) == 2  # Replika pomijana do końca retry_seconds
+
+
+def test_pin_primary_after_new_data():
+    replica = _Replica('r1')
+    router, primary = _router(replica)
+    router.pin_primary(60)
+
+    conn = router.getconn()
+    assert _owner(router, conn) is None
+    assert router.stats()['pinned_to_primary'] == 1
+    assert router.stats()['fallbacks_to_primary'] == 0
+
+    router._primary_until = 0.0
+    assert _owner(router, router.getconn()) is replica
+
+
+def test_without_replicas_all_reads_use_primary():
+    router, primary = _router()
+    router.pin_primary(60)
+    router.getconn()
+    assert router.stats()['primary_reads'] == 1
+    assert router.stats()['fallbacks_to_primary'] == 0
+    assert router.stats()['pinned_to_primary'] == 0
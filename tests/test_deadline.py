@@ -0,0 +1,127 @@
+"""Testy budżetu czasu requestu: statement_timeout per zapytanie, pomijanie etapów, 504, breaker AWS"""
+
+import time
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded, current_deadline, stage_budget
+
+
+class _RecordingCursor:
+    """Kursor zapisujący wykonane zapytania (bez bazy)"""
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+
+def _timeouts_ms(cur):
+    return [params[0] for query, params in cur.executed if 'statement_timeout' in query]
+
+
+def test_stage_budget_is_capped_by_remaining_time():
+    assert stage_budget(15.0) == 15.0
+
+    deadline = Deadline(10.0)
+    with deadline.activate():
+        assert current_deadline() is deadline
+        assert stage_budget(15.0, share=0.4) == pytest.approx(4.0, abs=0.05)
+        assert stage_budget(3.0, reserve=1.0) == 3.0
+        deadline.expires_at = time.monotonic() - 1
+        assert stage_budget(15.0) == 0.0
+    assert current_deadline() is None
+
+
+def test_statement_timeout_shrinks_between_statements(pricing_api):
+    app = pricing_api.app
+    cur = _RecordingCursor()
+    deadline = Deadline(10.0)
+
+    with deadline.activate():
+        app.execute_within_deadline(cur, 'SELECT 1', breaker=app.main_db_breaker)
+        # Pierwsze zapytanie zużyło 4s budżetu - kolejne dostaje tylko resztę
+        deadline.expires_at -= 4.0
+        app.execute_within_deadline(cur, 'SELECT 2', {'x': 1}, app.main_db_breaker)
+
+    first, second = _timeouts_ms(cur)
+    assert [query for query, _ in cur.executed if 'statement_timeout' not in query] == ['SELECT 1', 'SELECT 2']
+    assert first == pytest.approx((10.0 - app.DEADLINE_SQL_RESERVE_SECONDS) * 1000, abs=100)
+    assert second == pytest.approx((6.0 - app.DEADLINE_SQL_RESERVE_SECONDS) * 1000, abs=100)
+
+
+def test_statement_timeout_not_set_without_deadline(pricing_api):
+    cur = _RecordingCursor()
+    pricing_api.app.execute_within_deadline(cur, 'SELECT 1')
+    assert cur.executed == [('SELECT 1', None)]
+
+
+def test_out_of_budget_marks_skipped_stage(pricing_api):
+    out_of_budget = pricing_api.app._out_of_budget
+    skipped = {}
+    assert not out_of_budget('timocom', skipped)
+
+    with Deadline(0.1).activate():
+        assert out_of_budget('historical', skipped)
+    assert skipped == {'historical': 'deadline'}
+
+
+def test_source_cut_by_deadline_gives_partial_result(pricing_api, monkeypatch):
+    def transeu_statement_timeout(start, end, windows, **kwargs):
+        # Zapytanie przerwane przez statement_timeout z budżetu requestu
+        current_deadline().expires_at = time.monotonic()
+        return {}
+
+    monkeypatch.setattr(pricing_api.app, 'get_transeu_pricing_windows', transeu_statement_timeout)
+    response = pricing_api.post()
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert data['partial'] == {'skipped': ['transeu', 'historical'],
+                               'reasons': {'transeu': 'deadline', 'historical': 'deadline'}}
+    assert 'timocom' in data['pricing']
+    assert pricing_api.calls['historical'] == 0
+    # Wynik częściowy bez ETag, a przerwane zapytanie nie jest awarią bazy
+    assert response.headers.get('ETag') is None
+    assert pricing_api.app.exchanges_db_breaker.failures == 0
+
+
+def test_exhausted_budget_without_data_is_504(pricing_api, monkeypatch):
+    monkeypatch.setattr(pricing_api.app, 'REQUEST_DEADLINE_SECONDS', 0.1)
+
+    response = pricing_api.post()
+
+    assert response.status_code == 504
+    assert response.get_json()['success'] is False
+    assert sum(pricing_api.calls.values()) == 0
+
+
+def test_pricing_raises_deadline_exceeded_for_skipped_sources(pricing_api):
+    app = pricing_api.app
+    with Deadline(0.1).activate(), pytest.raises(DeadlineExceeded):
+        app.compute_route_pricing('PL20', 'DE49', 135, 98, [30], [30], app.DEFAULT_PROJECTION)
+
+
+def test_aws_call_shortened_by_budget_is_not_a_breaker_failure(pricing_api):
+    app = pricing_api.app
+    timeouts = []
+
+    def slow_call(timeout):
+        timeouts.append(timeout)
+        time.sleep(timeout)
+        return None
+
+    skipped = {}
+    with Deadline(0.8).activate():
+        assert app._routing_call(slow_call, skipped) is None
+
+    assert timeouts[0] < app.aws_breaker.timeout()
+    assert app.aws_breaker.failures == 0
+    assert skipped == {}
+
+
+def test_aws_error_within_full_timeout_is_a_breaker_failure(pricing_api):
+    app = pricing_api.app
+    assert app._routing_call(lambda timeout: None) is None
+    assert app.aws_breaker.failures == 1
@@ -0,0 +1,79 @@
+"""Testy macierzy dystansów (distance_matrix.py): zapis i odczyt przez mmap"""
+
+import math
+import os
+
+import pytest
+
+from distance_matrix import DistanceMatrix, empty_cells, normalize_code, write_distance_matrix
+
+
+def _write(path, codes, cells, meta=None):
+    n = len(codes)
+    distances, durations = empty_cells(n), empty_cells(n)
+    for (i, j), (distance, duration) in cells.items():
+        distances[i * n + j], durations[i * n + j] = distance, duration
+    return write_distance_matrix(path, codes, distances, durations, meta=meta)
+
+
+def test_normalize_code():
+    assert normalize_code('pl-50') == 'PL50'
+    assert normalize_code('DE 10') == 'DE10'
+
+
+def test_write_and_lookup_round_trip(tmp_path):
+    path = str(tmp_path / 'distance_matrix.bin')
+    written = _write(path, ['PL50', 'DE10', 'CZ11'], {
+        (0, 1): (345.67, 14400.0),
+        (1, 0): (350.0, math.nan),
+        (2, 2): (0.0, 0.0)
+    }, meta={'engine': 'local'})
+    assert written == 3
+
+    matrix = DistanceMatrix(path)
+    assert matrix.maybe_reload()
+    assert matrix.codes == ['PL50', 'DE10', 'CZ11']
+    assert matrix.meta['engine'] == 'local'
+    assert matrix.age_seconds() < 60
+
+    distance, duration = matrix.lookup('pl-50', 'DE10')
+    assert distance == 345.67
+    assert duration == pytest.approx(14400.0)
+    distance, duration = matrix.lookup('DE10', 'PL50')
+    assert distance == 350.0 and math.isnan(duration)
+    assert matrix.lookup('CZ11', 'CZ11') == (0.0, 0.0)
+
+    # Brak komórki i nieznany kod
+    assert matrix.lookup('PL50', 'CZ11') is None
+    assert matrix.lookup('PL50', 'FR75') is None
+    assert (matrix.hits, matrix.misses) == (3, 2)
+
+
+def test_cell_count_must_match_codes(tmp_path):
+    with pytest.raises(ValueError):
+        write_distance_matrix(str(tmp_path / 'm.bin'), ['PL50', 'DE10'], empty_cells(3), empty_cells(2))
+
+
+def test_missing_or_invalid_file(tmp_path):
+    path = tmp_path / 'distance_matrix.bin'
+    matrix = DistanceMatrix(str(path))
+    assert not matrix.maybe_reload()
+    assert matrix.lookup('PL50', 'DE10') is None
+
+    path.write_bytes(b'XXXX' + b'\0' * 12)
+    assert not DistanceMatrix(str(path)).maybe_reload()
+
+
+def test_reloads_replaced_file(tmp_path):
+    path = str(tmp_path / 'distance_matrix.bin')
+    _write(path, ['PL50', 'DE10'], {(0, 1): (100.0, 3600.0)})
+    matrix = DistanceMatrix(path, reload_check_seconds=0)
+    assert matrix.maybe_reload()
+    assert matrix.lookup('PL50', 'DE10')[0] == 100.0
+
+    _write(path, ['PL50', 'DE10', 'CZ11'], {(0, 1): (120.0, 3600.0), (0, 2): (200.0, 7200.0)})
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert matrix.maybe_reload()
+    assert matrix.lookup('PL50', 'DE10')[0] == 120.0
+    assert matrix.lookup('PL50', 'CZ11')[0] == 200.0
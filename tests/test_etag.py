@@ -0,0 +1,94 @@
+"""Testy ETag /api/route-pricing: 304 dla If-None-Match, zmiana ETag z wersją danych, znaki wodne tabel"""
+
+import datetime
+
+from freshness import FreshnessRegistry
+
+
+def test_matching_if_none_match_returns_304_without_computing(pricing_api):
+    first = pricing_api.post()
+    etag = first.headers['ETag']
+    calls = dict(pricing_api.calls)
+
+    response = pricing_api.post(headers={'If-None-Match': etag})
+
+    assert etag.startswith('W/"')
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+    assert pricing_api.calls == calls
+
+
+def test_etag_changes_with_data_version(pricing_api):
+    etag = pricing_api.post().headers['ETag']
+
+    pricing_api.version = 'v2'
+    stale = pricing_api.post(headers={'If-None-Match': etag})
+    pricing_api.wait_for_refresh()
+    fresh = pricing_api.post(headers={'If-None-Match': etag})
+
+    # Wynik sprzed zmiany danych (odświeżany w tle) ma ETag wersji, z której powstał
+    assert stale.status_code == 200
+    assert stale.get_json()['data']['cache']['status'] == 'stale-while-revalidate'
+    assert stale.headers['ETag'] == etag
+    assert fresh.status_code == 200
+    assert fresh.headers['ETag'] != etag
+    assert pricing_api.post(headers={'If-None-Match': fresh.headers['ETag']}).status_code == 304
+
+
+class _WatermarkCursor:
+    """Kursor zwracający kolejne wiersze znaków wodnych (RealDictCursor)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+
+class _WatermarkConnection:
+    def __init__(self, rows):
+        self.cur = _WatermarkCursor(rows)
+
+    def cursor(self):
+        return self.cur
+
+
+def _registry_with_rows(app, monkeypatch, rows):
+    conn = _WatermarkConnection(rows)
+    monkeypatch.setattr(app, '_get_db_connection_main', lambda: conn)
+    monkeypatch.setattr(app, '_return_db_connection_main', lambda c: None)
+    registry = FreshnessRegistry(app.DATA_VERSION_TABLES, app._fetch_table_watermarks, poll_seconds=0)
+    return registry, conn.cur
+
+
+def test_orders_watermark_changes_on_same_day_status_flip(pricing_api, monkeypatch):
+    rows = [{'w0': 1200, 'w1': 800}, {'w0': 1200, 'w1': 801}, {'w0': 1201, 'w1': 801}]
+    registry, cur = _registry_with_rows(pricing_api.app, monkeypatch, rows)
+
+    versions = [registry.version('main') for _ in range(3)]
+
+    assert versions[0] == 'ZleceniaSpeed:1200/800'
+    # Zlecenie zakończone ('Z') i nowe zlecenie tego samego dnia zmieniają wersję
+    assert len(set(versions)) == 3
+    assert 'MAX("id")' in cur.queries[0] and '"status" = \'Z\'' in cur.queries[0]
+
+
+def test_exchange_watermark_is_latest_offer_date(pricing_api, monkeypatch):
+    conn = _WatermarkConnection([{'w0': datetime.date(2026, 10, 19)}, {'w0': None}])
+    monkeypatch.setattr(pricing_api.app, '_get_db_connection', lambda: conn)
+    monkeypatch.setattr(pricing_api.app, '_return_db_connection', lambda c: None)
+
+    watermarks = pricing_api.app._fetch_table_watermarks('exchanges', ('offers', 'OffersTransEU'))
+
+    assert watermarks == {'offers': '2026-10-19', 'OffersTransEU': None}
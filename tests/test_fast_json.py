@@ -0,0 +1,41 @@
+"""Testy serializacji odpowiedzi (fast_json.py) i wyboru providera JSON aplikacji"""
+
+import datetime
+import decimal
+import json
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import fast_json
+
+PAYLOAD = {
+    'carrier_name': 'Müller Logistik GmbH',
+    'order_date': datetime.date(2024, 5, 6),
+    'amount': decimal.Decimal('1500.25'),
+    'windows': (7, 30)
+}
+EXPECTED = {'carrier_name': 'Müller Logistik GmbH', 'order_date': '2024-05-06', 'amount': 1500.25, 'windows': [7, 30]}
+
+
+def test_json_backend_is_compact_ascii_with_iso_dates():
+    body = fast_json.dumps(PAYLOAD, backend='json')
+    assert body.isascii()
+    assert b', ' not in body and b': ' not in body
+    assert json.loads(body) == EXPECTED
+
+
+@pytest.mark.skipif(fast_json.orjson is None, reason='orjson nie jest zainstalowany')
+def test_orjson_backend_matches_json_backend():
+    assert json.loads(fast_json.dumps(PAYLOAD, backend='orjson')) == EXPECTED
+
+
+def test_flask_default_provider_is_kept_without_orjson():
+    import app_secure
+    if fast_json.JSON_BACKEND == 'orjson':
+        assert isinstance(app_secure.app.json, fast_json.FastJSONProvider)
+        assert app_secure.ORDER_FIELDS[1][2] is None
+    else:
+        assert type(app_secure.app.json) is DefaultJSONProvider
+        # Domyślny provider zapisałby datę w formacie HTTP - zlecenia dostają isoformat() przy budowie
+        assert app_secure.ORDER_FIELDS[1][2](datetime.date(2024, 5, 6)) == '2024-05-06'
@@ -0,0 +1,140 @@
+"""Testy lokalnego silnika tras (local_routing.py): contraction hierarchies vs Dijkstra"""
+
+import heapq
+import math
+import os
+import random
+
+import pytest
+
+from local_routing import HierarchyUnavailable, LocalRouter, build_hierarchy, hierarchy_status, read_graph
+
+SIDE = 12
+STEP = 0.05  # Stopnie między węzłami siatki (ok. 3.5-5.5 km)
+
+
+@pytest.fixture(scope='module')
+def graph_path(tmp_path_factory):
+    """Siatka dróg z losowymi prędkościami, drogami jednokierunkowymi i usuniętymi odcinkami"""
+    rng = random.Random(42)
+    path = str(tmp_path_factory.mktemp('local_routing') / 'grid.graph')
+    lines = ['# siatka testowa']
+    for i in range(SIDE):
+        for j in range(SIDE):
+            lines.append(f"N n{i}_{j} {50.0 + i * STEP} {19.0 + j * STEP}")
+    for i in range(SIDE):
+        for j in range(SIDE):
+            for di, dj in ((0, 1), (1, 0)):
+                if i + di >= SIDE or j + dj >= SIDE or rng.random() < 0.1:
+                    continue
+                meters = 1000 * _km(i, j, i + di, j + dj) * rng.uniform(1.0, 1.4)
+                seconds = meters / (rng.uniform(40, 110) / 3.6)
+                oneway = ' 1' if rng.random() < 0.15 else ''
+                lines.append(f"E n{i}_{j} n{i + di}_{j + dj} {meters:.1f} {seconds:.2f}{oneway}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def _km(i1, j1, i2, j2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (50.0 + i1 * STEP, 19.0 + j1 * STEP, 50.0 + i2 * STEP, 19.0 + j2 * STEP))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def _dijkstra(edges, n, source):
+    """Referencyjny Dijkstra po czasie: {węzeł: (czas s, dystans m)}"""
+    out = [[] for _ in range(n)]
+    for (u, v), (seconds, meters) in edges.items():
+        out[u].append((v, seconds, meters))
+    best = {source: (0.0, 0.0)}
+    heap = [(0.0, 0.0, source)]
+    while heap:
+        seconds, meters, u = heapq.heappop(heap)
+        if seconds > best[u][0]:
+            continue
+        for v, edge_seconds, edge_meters in out[u]:
+            candidate = seconds + edge_seconds
+            if candidate < best.get(v, (math.inf,))[0]:
+                best[v] = (candidate, meters + edge_meters)
+                heapq.heappush(heap, (candidate, meters + edge_meters, v))
+    return best
+
+
+@pytest.fixture(scope='module')
+def router(graph_path):
+    build_hierarchy(graph_path, truck_max_kmh=80.0)
+    return LocalRouter(graph_path, truck_max_kmh=80.0)
+
+
+def test_missing_hierarchy_fails_fast(tmp_path, graph_path):
+    copy = str(tmp_path / 'copy.graph')
+    with open(graph_path, 'r', encoding='utf-8') as src, open(copy, 'w', encoding='utf-8') as dst:
+        dst.write(src.read())
+    assert hierarchy_status(copy) == 'brak pliku'
+    with pytest.raises(HierarchyUnavailable):
+        LocalRouter(copy)
+
+    build_hierarchy(copy, truck_max_kmh=80.0)
+    assert hierarchy_status(copy, truck_max_kmh=80.0) is None
+    # Inna prędkość lub zmieniony graf - plik nieaktualny
+    assert hierarchy_status(copy, truck_max_kmh=90.0) is not None
+    stat = os.stat(copy)
+    os.utime(copy, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert hierarchy_status(copy, truck_max_kmh=80.0) is not None
+    with pytest.raises(HierarchyUnavailable):
+        LocalRouter(copy, truck_max_kmh=80.0)
+
+
+def test_routes_match_dijkstra(router, graph_path):
+    lat, lng, edges = read_graph(graph_path, truck_max_kmh=80.0)
+    rng = random.Random(1)
+    checked = 0
+    for source in rng.sample(range(len(lat)), 12):
+        reference = _dijkstra(edges, len(lat), source)
+        for target in rng.sample(range(len(lat)), 12):
+            route = router.route(lat[source], lng[source], lat[target], lng[target])
+            if target not in reference:
+                assert route is None
+                continue
+            seconds, meters = reference[target]
+            assert route['duration'] == int(round(seconds))
+            assert route['distance'] == pytest.approx(meters / 1000.0, abs=0.01)
+            checked += 1
+    assert checked > 100
+
+
+def test_geometry_follows_graph_edges(router, graph_path):
+    lat, lng, edges = read_graph(graph_path, truck_max_kmh=80.0)
+    position = {(round(lat[v], 6), round(lng[v], 6)): v for v in range(len(lat))}
+    start, end = (lat[0], lng[0]), (lat[-1], lng[-1])
+
+    route = router.route(*start, *end, return_geometry=True)
+
+    nodes = [position[(round(point_lat, 6), round(point_lng, 6))] for point_lng, point_lat in route['geometry']]
+    assert nodes[0] == 0 and nodes[-1] == len(lat) - 1
+    path = [v for k, v in enumerate(nodes) if k == 0 or v != nodes[k - 1]]
+    assert all((u, v) in edges for u, v in zip(path, path[1:]))
+    assert sum(edges[(u, v)][1] for u, v in zip(path, path[1:])) / 1000.0 == pytest.approx(route['distance'], abs=0.01)
+
+
+def test_matrix_matches_single_routes(router, graph_path):
+    lat, lng, _ = read_graph(graph_path, truck_max_kmh=80.0)
+    rng = random.Random(2)
+    origins = [(lat[v], lng[v]) for v in rng.sample(range(len(lat)), 6)]
+    destinations = [(lat[v], lng[v]) for v in rng.sample(range(len(lat)), 8)]
+    destinations.append((10.0, 10.0))  # Poza grafem
+
+    matrix = router.matrix(origins, destinations)
+
+    for row, origin in enumerate(origins):
+        assert matrix[row][-1] is None
+        for column, destination in enumerate(destinations[:-1]):
+            assert matrix[row][column] == router.route(*origin, *destination)
+
+
+def test_snap_limits_distance_to_graph(router):
+    node, km = router.snap(50.0001, 19.0001)
+    assert node == 0 and km < 0.1
+    assert router.snap(51.5, 19.0) is None  # > max_snap_km od siatki
+    assert router.route(51.5, 19.0, 50.0, 19.0) is None
@@ -0,0 +1,92 @@
+"""Testy /api/route-pricing/multi-stop: wycena odcinków, suma cen, walidacja przystanków, przeciążenie"""
+
+import threading
+
+import pytest
+
+from admission import Overloaded
+
+MULTI_STOP = '/api/route-pricing/multi-stop'
+
+
+def test_legs_are_priced_in_executor_and_totals_are_summed(pricing_api, monkeypatch):
+    app = pricing_api.app
+    pricing_api.leg_km = {('PL20', 'DE49'): 500.0, ('DE49', 'FR75'): 300.0}
+    leg_threads = []
+    compute_leg_pricing = app.compute_leg_pricing
+
+    def recording_leg_pricing(*args, **kwargs):
+        leg_threads.append(threading.current_thread().name)
+        return compute_leg_pricing(*args, **kwargs)
+
+    monkeypatch.setattr(app, 'compute_leg_pricing', recording_leg_pricing)
+    response = pricing_api.post(MULTI_STOP, postal_codes=['pl20', 'DE49', 'FR75'])
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert data['stops'] == ['PL20', 'DE49', 'FR75']
+    assert [(leg['start_postal_code'], leg['end_postal_code']) for leg in data['legs']] == [
+        ('PL20', 'DE49'), ('DE49', 'FR75')
+    ]
+    assert len(leg_threads) == 2 and all(name.startswith('multi-stop-leg') for name in leg_threads)
+    assert pricing_api.calls['timocom'] == 2 and pricing_api.calls['leg_distances'] == 1
+
+    leg_totals = [leg['pricing']['timocom']['30d']['total_price']['trailer'] for leg in data['legs']]
+    assert leg_totals == [600.0, 360.0]
+    assert data['total_price']['timocom']['30d']['trailer'] == 960.0
+    assert data['total_distance_km'] == 800.0
+    assert data['complete'] is True
+
+
+def test_total_price_is_none_when_a_leg_has_no_data(pricing_api, monkeypatch):
+    app = pricing_api.app
+    compute_leg_pricing = app.compute_leg_pricing
+
+    def second_leg_overloaded(start_postal, end_postal, *args, **kwargs):
+        if start_postal == 'DE49':
+            raise Overloaded('pricing', 2)
+        return compute_leg_pricing(start_postal, end_postal, *args, **kwargs)
+
+    monkeypatch.setattr(app, 'compute_leg_pricing', second_leg_overloaded)
+    response = pricing_api.post(MULTI_STOP, postal_codes=['PL20', 'DE49', 'FR75'])
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert data['legs'][1]['error'] == 'overloaded'
+    assert data['total_price']['timocom']['30d']['trailer'] is None
+    assert data['complete'] is False
+
+
+@pytest.mark.parametrize('postal_codes', [
+    ['PL20'],
+    ['PL20', 'DE49'] * 5 + ['FR75'],
+    'PL20,DE49',
+    ['PL20', 49],
+    None,
+])
+def test_invalid_postal_codes_are_rejected(pricing_api, postal_codes):
+    response = pricing_api.post(MULTI_STOP, postal_codes=postal_codes)
+
+    assert response.status_code == 400
+    assert f'2-{pricing_api.app.MULTI_STOP_MAX_STOPS}' in response.get_json()['error']
+    assert sum(pricing_api.calls.values()) == 0
+
+
+def test_max_stops_are_accepted(pricing_api):
+    stops = ['PL20', 'DE49'] * (pricing_api.app.MULTI_STOP_MAX_STOPS // 2)
+
+    response = pricing_api.post(MULTI_STOP, postal_codes=stops)
+
+    assert response.status_code == 200
+    assert len(response.get_json()['data']['legs']) == len(stops) - 1
+
+
+def test_all_legs_overloaded_is_503(pricing_api, monkeypatch):
+    def overloaded(*args, **kwargs):
+        raise Overloaded('pricing', 3)
+
+    monkeypatch.setattr(pricing_api.app, 'compute_leg_pricing', overloaded)
+    response = pricing_api.post(MULTI_STOP, postal_codes=['PL20', 'DE49', 'FR75'])
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
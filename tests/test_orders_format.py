@@ -0,0 +1,55 @@
+"""Testy kolumnowego formatu listy zleceń (orders_format='columnar')"""
+
+import datetime
+import json
+from decimal import Decimal
+
+from app_secure import ORDER_DICTIONARY_FIELDS, ORDER_FIELDS, _orders_as_columns, _orders_as_rows
+from fast_json import dumps
+
+CARRIERS = [('TRANS-POL SP. Z O.O.', 'Jan Kowalski', 'biuro@trans-pol.pl'),
+            ('Müller Logistik GmbH', 'Jürgen Müller', 'dispo@mueller-logistik.de'),
+            (None, None, None)]
+
+
+def _order(i):
+    """Krotka wartości zlecenia w kolejności ORDER_FIELDS (jak z _fetch_historical_orders_list)"""
+    carrier, contact, email = CARRIERS[i % len(CARRIERS)]
+    raw = {
+        'id': 1000 + i, 'orderDate': datetime.date(2024, 5, 1) + datetime.timedelta(days=i % 20),
+        'cargoType': 'FTL' if i % 3 else 'LTL', 'clientAmount': Decimal('1500.50') + i,
+        'carrierAmount': Decimal('1300') if i % 4 else None, 'carrierName': carrier,
+        'carrierContact': contact, 'carrierEmail': email, 'clientPricePerKm': Decimal('1.25'),
+        'carrierPricePerKm': Decimal('1.05'), 'routeDistance': Decimal('1200.5'),
+        'clientCurrency': 'EUR', 'carrierCurrency': 'PLN' if i % 5 == 0 else 'EUR'
+    }
+    return tuple(convert(raw[column]) if convert else raw[column] for _, column, convert in ORDER_FIELDS)
+
+
+def _columns_to_rows(columnar):
+    """Dekodowanie po stronie klienta: indeksy słownikowe -> wartości, kolumny -> obiekty"""
+    columns = {
+        name: [columnar['dictionaries'][name][index] for index in values] if name in columnar['dictionaries'] else values
+        for name, values in columnar['columns'].items()
+    }
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def test_columnar_round_trips_to_rows():
+    orders = [_order(i) for i in range(50)]
+    rows = json.loads(dumps(_orders_as_rows(orders)))
+    columnar = json.loads(dumps(_orders_as_columns(orders)))
+
+    assert columnar['count'] == 50
+    assert _columns_to_rows(columnar) == rows
+    # Pola słownikowe - tylko różne wartości (w kolejności pierwszego wystąpienia)
+    assert columnar['dictionaries']['carrier_name'] == [carrier for carrier, _, _ in CARRIERS]
+    assert set(columnar['dictionaries']) == set(ORDER_DICTIONARY_FIELDS)
+
+
+def test_empty_orders():
+    columnar = _orders_as_columns([])
+    assert columnar['count'] == 0
+    assert all(values == [] for values in columnar['columns'].values())
+    assert all(values == [] for values in columnar['dictionaries'].values())
+    assert _columns_to_rows(columnar) == _orders_as_rows([]) == []
@@ -0,0 +1,149 @@
+"""Testy cache odpowiedzi /api/route-pricing: świeży wynik, stale-while-revalidate, stale-on-error, błędy źródeł"""
+
+import math
+
+import pytest
+
+
+@pytest.fixture
+def cache_key(pricing_api):
+    app = pricing_api.app
+    return app.pricing_cache_key('PL20', 'DE49', app.DEFAULT_EXCHANGE_WINDOWS, app.DEFAULT_HISTORICAL_WINDOWS,
+                                 app.DEFAULT_PROJECTION)
+
+
+def _cache_status(response):
+    return response.get_json()['data']['cache']['status']
+
+
+def test_second_request_is_served_fresh_without_queries(pricing_api):
+    first = pricing_api.post()
+    second = pricing_api.post()
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert _cache_status(first) == 'miss'
+    assert _cache_status(second) == 'fresh'
+    assert pricing_api.calls == {'timocom': 1, 'transeu': 1, 'historical': 1, 'distance': 1}
+    assert second.get_json()['data']['pricing'] == first.get_json()['data']['pricing']
+
+
+def test_stale_entry_is_served_and_refreshed_in_background(pricing_api, monkeypatch, cache_key):
+    cache = pricing_api.app.pricing_result_cache
+    monkeypatch.setattr(cache, 'fresh_ttl', 0)
+    pricing_api.post()
+    first_entry = cache.get(cache_key)
+    refreshes = cache.background_refreshes
+
+    response = pricing_api.post()
+    pricing_api.wait_for_refresh()
+
+    assert _cache_status(response) == 'stale-while-revalidate'
+    assert cache.background_refreshes == refreshes + 1
+    assert cache.get(cache_key).created_at > first_entry.created_at
+    # Giełdy z cache wyników per okno - ponownie pytane są tylko zlecenia historyczne
+    assert pricing_api.calls['historical'] == 2
+
+
+def test_pipeline_error_serves_stale_entry(pricing_api, monkeypatch, cache_key):
+    cache = pricing_api.app.pricing_result_cache
+    pricing_api.post()
+    monkeypatch.setattr(cache, 'fresh_ttl', 0)
+    monkeypatch.setattr(cache, 'revalidate_ttl', 0)
+
+    def pool_exhausted(*args, **kwargs):
+        raise RuntimeError('connection pool exhausted')
+
+    monkeypatch.setattr(pricing_api.app, 'compute_route_pricing', pool_exhausted)
+    response = pricing_api.post()
+
+    assert response.status_code == 200
+    assert _cache_status(response) == 'stale-on-error'
+    assert response.get_json()['data']['pricing']['timocom']['30d']['avg_price_per_km']['trailer'] == 1.2
+
+
+def test_pipeline_error_without_entry_is_server_error(pricing_api, monkeypatch):
+    def pool_exhausted(*args, **kwargs):
+        raise RuntimeError('connection pool exhausted')
+
+    monkeypatch.setattr(pricing_api.app, 'compute_route_pricing', pool_exhausted)
+    assert pricing_api.post().status_code == 500
+
+
+def test_source_error_serves_last_good_value_without_caching(pricing_api, cache_key):
+    pricing_api.post()
+    pricing_api.app.pricing_result_cache.clear()
+    # Nowa wersja danych (cache wyników źródeł nie pasuje), TimoCom zwraca błąd
+    pricing_api.version = 'v2'
+    pricing_api.stats['timocom'] = 'error'
+
+    response = pricing_api.post()
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert data['stale_sources']['timocom']['stale'] is True
+    assert data['pricing']['timocom']['30d']['avg_price_per_km']['trailer'] == 1.2
+    assert set(data['stale_sources']) == {'timocom'}
+    # Wynik z nieaktualnym źródłem nie trafia do cache odpowiedzi i nie ma ETag
+    assert pricing_api.app.pricing_result_cache.get(cache_key) is None
+    assert response.headers.get('ETag') is None
+
+
+def test_background_refresh_keeps_entry_when_result_is_stale(pricing_api, monkeypatch, cache_key):
+    cache = pricing_api.app.pricing_result_cache
+    pricing_api.post()
+    entry = cache.get(cache_key)
+    kept = cache.refreshes_kept
+
+    monkeypatch.setattr(cache, 'fresh_ttl', 0)
+    pricing_api.version = 'v2'
+    pricing_api.stats['timocom'] = 'error'
+    response = pricing_api.post()
+    pricing_api.wait_for_refresh()
+
+    assert _cache_status(response) == 'stale-while-revalidate'
+    assert cache.refreshes_kept == kept + 1
+    assert cache.get(cache_key) is entry
+
+
+def test_is_cacheable_pricing_rejects_partial_and_stale_results(pricing_api):
+    is_cacheable = pricing_api.app.is_cacheable_pricing
+    assert is_cacheable({'pricing': {}})
+    assert not is_cacheable({'pricing': {}, 'stale_sources': {'timocom': {'stale': True, 'age_seconds': 5}}})
+    assert not is_cacheable({'pricing': {}, 'partial': {'skipped': ['aws'], 'reasons': {'aws': 'deadline'}}})
+
+
+def test_source_errors_without_last_good_value_are_503(pricing_api):
+    pricing_api.stats = {source: 'error' for source in pricing_api.stats}
+
+    response = pricing_api.post()
+    pricing_api.post()
+
+    # Błąd bazy to nie brak danych trasy - 503 z Retry-After zamiast 404 i bez negative cache
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(math.ceil(pricing_api.app.CIRCUIT_RESET_SECONDS))
+    assert pricing_api.calls['timocom'] == 2
+
+
+@pytest.mark.parametrize('sources, breaker_name', [
+    (['timocom', 'transeu', 'historical'], 'exchanges_db'),
+    (['historical'], 'main_db'),
+])
+def test_source_errors_name_database_breaker(pricing_api, sources, breaker_name):
+    app = pricing_api.app
+    pricing_api.stats = {source: 'error' for source in pricing_api.stats}
+    projection, _ = app.parse_projection({'sources': sources})
+
+    with pytest.raises(app.CircuitOpen) as error:
+        app.compute_route_pricing('PL20', 'DE49', 135, 98, [30], [30], projection)
+    assert error.value.name == breaker_name
+
+
+def test_source_error_with_other_data_is_partial(pricing_api, cache_key):
+    pricing_api.stats['historical'] = 'error'
+
+    response = pricing_api.post()
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert data['partial']['reasons'] == {'historical': 'unavailable'}
+    assert pricing_api.app.pricing_result_cache.get(cache_key) is None
@@ -0,0 +1,121 @@
+"""Testy cache wyceny (pricing_cache.py): coalescing równoległych obliczeń"""
+
+import threading
+import time
+
+import pytest
+
+from deadline import Deadline
+from pricing_cache import SingleFlight
+
+
+def _run_parallel(n, target):
+    """Uruchamia `target(i)` w n wątkach startujących jednocześnie i czeka na koniec"""
+    barrier = threading.Barrier(n)
+    results, errors = [None] * n, [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results, errors
+
+
+def test_parallel_calls_share_one_execution():
+    flight = SingleFlight('test')
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'price': 1.5}
+
+    results, errors = _run_parallel(8, lambda i: flight.do(('PL50', 'DE10'), compute))
+
+    assert errors == [None] * 8
+    assert len(calls) == 1
+    assert all(value == {'price': 1.5} for value, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flight.stats() == {'name': 'test', 'in_flight': 0, 'executions': 1, 'coalesced': 7}
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight('test')
+    results, _ = _run_parallel(4, lambda i: flight.do(i, lambda: time.sleep(0.05) or i))
+    assert [value for value, _ in results] == [0, 1, 2, 3]
+    assert flight.executions == 4
+    assert flight.coalesced == 0
+
+
+def test_error_is_raised_in_all_waiters():
+    flight = SingleFlight('test')
+
+    def compute():
+        time.sleep(0.2)
+        raise RuntimeError('database down')
+
+    _, errors = _run_parallel(5, lambda i: flight.do('lane', compute))
+
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert flight.executions == 1
+
+
+def test_key_is_released_after_completion():
+    flight = SingleFlight('test')
+    assert flight.do('lane', lambda: 1) == (1, False)
+    with pytest.raises(ValueError):
+        flight.do('lane', lambda: int('x'))
+    # Kolejne wywołanie liczy od nowa - wynik ani błąd nie są cache'owane
+    assert flight.do('lane', lambda: 2) == (2, False)
+    assert flight.stats()['in_flight'] == 0
+    assert flight.executions == 3
+
+
+class _LockedElsewhere:
+    """Backend współdzielony, w którym lock trzyma inny worker (wynik nigdy się nie pojawia)"""
+
+    def acquire_lock(self, key, ttl):
+        return False
+
+    def is_locked(self, key):
+        return True
+
+
+def test_shared_wait_is_capped_by_request_deadline():
+    flight = SingleFlight('test', shared=_LockedElsewhere(), lock_ttl=30, wait_timeout=30)
+    polls = []
+
+    def wait_for():
+        polls.append(1)
+        return None
+
+    started = time.monotonic()
+    with Deadline(0.3).activate():
+        result = flight.do('lane', lambda: 'computed', wait_for=wait_for)
+    elapsed = time.monotonic() - started
+
+    # Bez deadline czekałby wait_timeout (30s) na wynik innego workera
+    assert result == ('computed', False)
+    assert elapsed < 2
+    assert polls
+    assert flight.stats()['executions'] == 1
+
+
+def test_shared_wait_returns_result_of_other_worker():
+    flight = SingleFlight('test', shared=_LockedElsewhere(), wait_timeout=5)
+    assert flight.do('lane', lambda: 'computed', wait_for=lambda: 'from other worker') == ('from other worker', True)
+    assert flight.stats() == {'name': 'test', 'in_flight': 0, 'executions': 0, 'coalesced': 1}
+
+
+def test_counters_are_exact_under_contention():
+    flight = SingleFlight('test')
+    _run_parallel(16, lambda i: [flight.do((i, n), lambda: n) for n in range(200)])
+    assert flight.stats()['executions'] == 16 * 200
@@ -0,0 +1,35 @@
+"""Testy macierzy wycen (pricing_matrix.py): zapis i odczyt przez mmap"""
+
+from pricing_matrix import PricingMatrix, write_matrix
+
+
+def test_write_and_lookup_round_trip(tmp_path):
+    path = str(tmp_path / 'pricing_matrix.bin')
+    blobs = {
+        (135, 98): {'timocom': {7: {'avg_price': 1.1}, 30: {'avg_price': 1.05}}, 'transeu': {7: None}},
+        (98, 135): {'timocom': {7: {'avg_price': 0.9}}},
+        (135, 999): {'timocom': {7: {'avg_price': 2.0}}},  # Region spoza listy - pomijany
+        (140, 98): {}  # Brak danych - pomijany
+    }
+    written = write_matrix(path, [140, 98, 135], [30, 7, 7], blobs, meta={'data_version': 'v1'})
+    assert written == 2
+
+    matrix = PricingMatrix(path)
+    assert matrix.maybe_reload()
+    assert matrix.windows == [7, 30]
+    assert matrix.meta['data_version'] == 'v1'
+
+    assert matrix.lookup(135, 98) == blobs[(135, 98)]
+    assert matrix.lookup(98, 135) == blobs[(98, 135)]
+    assert matrix.lookup(140, 98) is None
+    assert (matrix.hits, matrix.misses) == (2, 1)
+
+
+def test_covers_regions_and_windows(tmp_path):
+    path = str(tmp_path / 'pricing_matrix.bin')
+    write_matrix(path, [98, 135], [7, 30], {(135, 98): {'timocom': {7: {}}}})
+    matrix = PricingMatrix(path)
+    assert matrix.covers(135, 98, [7, 30])
+    assert not matrix.covers(135, 98, [7, 90])
+    assert not matrix.covers(135, 999, [7])
+    assert not PricingMatrix(str(tmp_path / 'missing.bin')).covers(135, 98, [7])
@@ -0,0 +1,115 @@
+"""Testy projekcji requestu wyceny (parse_projection, _project_vehicle_types)"""
+
+import pytest
+
+import app_secure
+from app_secure import DEFAULT_PROJECTION, parse_projection
+
+
+def test_defaults_skip_orders_and_top_carriers():
+    projection, error = parse_projection({})
+    assert error is None
+    assert projection == DEFAULT_PROJECTION
+    # Zmiana niekompatybilna (CHANGELOG) - lista zleceń i top przewoźnicy tylko na życzenie
+    assert projection.include_orders is False
+    assert projection.include_top_carriers is False
+    assert projection.include_distance is True
+    assert projection.orders_format == 'rows'
+
+
+@pytest.mark.parametrize('payload', [
+    {'sources': 'foo'},
+    {'sources': []},
+    {'sources': [1]},
+    {'vehicle_types': ['truck']},
+    {'cargo_types': 'PALLET'},
+    {'include_orders': 'yes'},
+    {'include_top_carriers': 1},
+    {'include_distance': 0},
+    {'orders_format': 'csv'},
+    {'geometry_tolerance_m': True},
+    {'geometry_tolerance_m': -1},
+    {'geometry_tolerance_m': '50'},
+])
+def test_invalid_values_are_rejected(payload):
+    projection, error = parse_projection(payload)
+    assert projection is None
+    assert error.startswith('Nieprawidłow')
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('naczepa', ('trailer',)),
+    (['bus', 'solo'], ('3_5t', '12t')),
+    (['3.5t', 'lorry', 'bus'], ('3_5t', 'lorry')),
+])
+def test_vehicle_type_aliases(raw, expected):
+    projection, error = parse_projection({'vehicle_type': raw})
+    assert error is None
+    assert projection.vehicle_types == expected
+
+
+def test_vehicle_types_take_precedence_over_vehicle_type():
+    projection, _ = parse_projection({'vehicle_types': ['lorry'], 'vehicle_type': 'naczepa'})
+    assert projection.vehicle_types == ('lorry',)
+
+
+def test_sources_without_selected_vehicle_types_are_rejected():
+    projection, error = parse_projection({'sources': ['transeu'], 'vehicle_types': ['trailer']})
+    assert projection is None
+    assert error == 'Wybrane źródła nie obsługują wybranych typów pojazdów'
+
+
+def test_historical_source_does_not_depend_on_vehicle_types():
+    projection, error = parse_projection({'sources': ['historical', 'transeu'], 'vehicle_types': ['trailer']})
+    assert error is None
+    assert projection.needs('historical')
+    assert not projection.needs('transeu')
+
+
+def test_project_vehicle_types_keeps_only_selected_vehicles():
+    stats = {
+        'avg_price_per_km': {'trailer': 1.2, '3_5t': 0.8, '12t': 1.0},
+        'offers_by_vehicle_type': {'trailer': 20, '3_5t': 10, '12t': 10},
+        'total_offers': 40,
+        'percentiles_price_per_km': {}
+    }
+    projected = app_secure._project_vehicle_types(stats, ('trailer',))
+
+    assert projected['avg_price_per_km'] == {'trailer': 1.2}
+    assert projected['offers_by_vehicle_type'] == {'trailer': 20}
+    assert projected['total_offers'] == 40
+    assert projected['percentiles_price_per_km'] == {}
+    # Wynik źródła w cache pozostaje pełny
+    assert set(stats['avg_price_per_km']) == {'trailer', '3_5t', '12t'}
+    assert app_secure._project_vehicle_types(None, ('trailer',)) is None
+
+
+def test_request_projection_skips_sources_and_vehicle_types(pricing_api):
+    response = pricing_api.post(vehicle_types=['trailer'])
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert pricing_api.calls['transeu'] == 0
+    assert set(data['pricing']) == {'timocom', 'historical'}
+    assert data['pricing']['timocom']['30d']['avg_price_per_km'] == {'trailer': 1.2}
+    assert data['pricing']['timocom']['30d']['total_price'] == {'trailer': 600.0}
+
+
+def test_request_defaults_do_not_fetch_orders_or_top_carriers(pricing_api):
+    assert pricing_api.post().status_code == 200
+    kwargs = pricing_api.fetch_kwargs['historical']
+    assert kwargs['include_orders'] is False
+    assert kwargs['include_top_carriers'] is False
+
+    pricing_api.post(include_orders=True, include_top_carriers=True, orders_format='columnar')
+    kwargs = pricing_api.fetch_kwargs['historical']
+    assert kwargs['include_orders'] is True
+    assert kwargs['include_top_carriers'] is True
+    assert kwargs['orders_format'] == 'columnar'
+
+
+def test_invalid_projection_is_bad_request(pricing_api):
+    response = pricing_api.post(sources=['transeu'], vehicle_type='naczepa')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Wybrane źródła nie obsługują wybranych typów pojazdów'
+    assert sum(pricing_api.calls.values()) == 0
@@ -0,0 +1,105 @@
+"""Testy szkicu kwantylowego (quantile_sketch.py): kwantyle, scalanie, serializacja"""
+
+import random
+
+import pytest
+
+from quantile_sketch import QuantileSketch, percentile_spread
+
+
+def _exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _sketch(values, compression=100):
+    sketch = QuantileSketch(compression)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_empty_sketch_has_no_quantiles():
+    sketch = QuantileSketch()
+    assert sketch.quantile(0.5) is None
+    assert sketch.percentiles() == {'p10': None, 'p25': None, 'p50': None, 'p75': None, 'p90': None}
+
+
+def test_single_value():
+    sketch = _sketch([1.25])
+    assert sketch.quantile(0.1) == pytest.approx(1.25)
+    assert sketch.quantile(0.9) == pytest.approx(1.25)
+
+
+@pytest.mark.parametrize('q', [0.10, 0.25, 0.50, 0.75, 0.90])
+def test_quantiles_close_to_exact(q):
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0.2, 0.3) for _ in range(20000)]
+    sketch = _sketch(values)
+    assert sketch.count == len(values)
+    assert sketch.quantile(q) == pytest.approx(_exact_quantile(values, q), rel=0.01)
+
+
+def test_weighted_values_count_as_repeats():
+    weighted = QuantileSketch()
+    weighted.add(1.0, weight=90)
+    weighted.add(2.0, weight=10)
+    assert weighted.count == 100
+    assert weighted.quantile(0.25) == pytest.approx(1.0)
+    assert weighted.quantile(0.99) == pytest.approx(2.0)
+
+
+def test_ignores_missing_values_and_non_positive_weights():
+    sketch = _sketch([1.0, 2.0])
+    sketch.add(None)
+    sketch.add(5.0, weight=0)
+    assert sketch.count == 2
+    assert sketch.max == 2.0
+
+
+def test_merge_matches_sketch_of_all_values():
+    rng = random.Random(11)
+    days = [[rng.gauss(1.3, 0.15) for _ in range(rng.randint(50, 400))] for _ in range(30)]
+    everything = [value for day in days for value in day]
+
+    merged = QuantileSketch.merge_all(_sketch(day) for day in days)
+
+    assert merged.count == len(everything)
+    assert merged.min == min(everything)
+    assert merged.max == max(everything)
+    for q in (0.10, 0.25, 0.50, 0.75, 0.90):
+        assert merged.quantile(q) == pytest.approx(_exact_quantile(everything, q), rel=0.01)
+
+
+def test_merge_is_in_place_and_skips_empty():
+    sketch = _sketch([1.0, 2.0, 3.0])
+    assert sketch.merge(QuantileSketch()) is sketch
+    assert sketch.count == 3
+    sketch.merge(_sketch([4.0]))
+    assert sketch.count == 4
+    assert sketch.max == 4.0
+
+
+def test_merge_keeps_size_bounded():
+    rng = random.Random(5)
+    merged = QuantileSketch.merge_all(_sketch(rng.random() for _ in range(1000)) for _ in range(50))
+    assert merged.count == 50000
+    # Limit wagi q(1-q) - liczba centroidów rośnie logarytmicznie, nie z liczbą wartości
+    assert len(merged.to_dict()['c']) <= 10 * merged.compression
+
+
+def test_dict_round_trip_keeps_percentiles():
+    rng = random.Random(3)
+    sketch = _sketch(rng.uniform(0.8, 2.0) for _ in range(5000))
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert restored.count == sketch.count
+    assert (restored.min, restored.max) == (sketch.min, sketch.max)
+    for key, value in sketch.percentiles().items():
+        assert restored.percentiles()[key] == pytest.approx(value, rel=1e-4)
+
+
+def test_percentile_spread():
+    assert percentile_spread({'p10': 1.0, 'p25': 1.2, 'p75': 1.5, 'p90': 1.9}) == {
+        'iqr': pytest.approx(0.3), 'p10_p90': pytest.approx(0.9)
+    }
+    assert percentile_spread({'p25': None, 'p75': 1.5}) == {'iqr': None, 'p10_p90': None}
@@ -0,0 +1,117 @@
+"""Testy modelu współczynnika drogi (road_factor.py): dopasowanie, szacowanie, zapis"""
+
+import time
+
+import pytest
+
+from road_factor import RoadFactorModel
+
+
+def _observe_corridor(model, keys, factor, n, start=0, haversine_km=300.0):
+    for i in range(start, start + n):
+        model.observe((f"{keys[0]}-{i}", 'X'), keys, haversine_km, haversine_km * factor)
+
+
+def test_default_factor_without_data():
+    model = RoadFactorModel(default_factor=1.3)
+    assert model.estimate(('135-98', 'PL-DE', '*'), 100.0) == {
+        'distance_km': 130.0, 'factor': 1.3, 'corridor': None, 'trusted': False, 'error_p90': None
+    }
+
+
+def test_uses_most_specific_corridor_with_enough_samples():
+    model = RoadFactorModel(min_samples=20, refit_every=10 ** 6)
+    _observe_corridor(model, ('135-98', 'PL-DE', '*'), 1.2, 25)
+    _observe_corridor(model, ('140-98', 'PL-DE', '*'), 1.4, 5, start=100)
+    model.fit()
+
+    dense = model.estimate(('135-98', 'PL-DE', '*'), 100.0)
+    assert (dense['corridor'], dense['factor'], dense['distance_km']) == ('135-98', 1.2, 120.0)
+    assert dense['trusted'] and dense['error_p90'] == 0
+
+    # Za mało obserwacji regionu - poziom kraju (mediana z obu regionów)
+    sparse = model.estimate(('140-98', 'PL-DE', '*'), 100.0)
+    assert (sparse['corridor'], sparse['factor']) == ('PL-DE', 1.2)
+    assert model.corridors()[0]['samples'] == 30
+
+
+def test_rejected_samples_count_as_estimation_error():
+    model = RoadFactorModel(min_samples=20, trust_max_error=0.05, refit_every=10 ** 6)
+    keys = ('DK-SE', '*')
+    _observe_corridor(model, keys, 1.2, 20)
+    _observe_corridor(model, keys, 4.0, 5, start=100)  # Prom - poza zakresem mediany
+    _observe_corridor(model, keys, 1.2, 5, start=200, haversine_km=5.0)  # Dojazd lokalny
+    model.fit()
+
+    corridor = model.corridors()[0]
+    assert corridor['factor'] == 1.2
+    assert (corridor['samples'], corridor['rejected']) == (20, 10)
+    assert corridor['error_p90'] > 0.5
+    assert not corridor['trusted']
+
+
+def test_error_is_measured_out_of_sample():
+    # Dwie obserwacje: w próbie mediana 1.2 "trafia" w p90 (0%), poza próbą każda ocenia drugą
+    model = RoadFactorModel(min_samples=2, trust_max_error=0.05, refit_every=10 ** 6)
+    _observe_corridor(model, ('PL-LT', '*'), 1.2, 1)
+    _observe_corridor(model, ('PL-LT', '*'), 1.5, 1, start=1)
+    model.fit()
+
+    corridor = model.corridors()[0]
+    assert corridor['error_p90'] == pytest.approx(0.2)
+    assert not corridor['trusted']
+
+
+def test_single_sample_corridor_is_not_trusted():
+    model = RoadFactorModel(min_samples=1, refit_every=10 ** 6)
+    _observe_corridor(model, ('PL-SK', '*'), 1.25, 1)
+    model.fit()
+
+    corridor = model.corridors()[0]
+    assert corridor['factor'] == 1.25
+    assert corridor['error_p90'] == 1.0
+    assert not corridor['trusted']
+
+
+def test_corridor_with_only_rejected_samples_is_skipped():
+    model = RoadFactorModel(refit_every=10 ** 6)
+    _observe_corridor(model, ('ferry', '*'), 4.0, 3)
+    _observe_corridor(model, ('PL-CZ', '*'), 1.3, 3, start=10)
+    model.fit()
+    assert {corridor['corridor'] for corridor in model.corridors()} == {'PL-CZ', '*'}
+
+
+def test_refit_runs_in_background_after_refit_every_samples():
+    model = RoadFactorModel(min_samples=5, refit_every=10)
+    _observe_corridor(model, ('PL-DE', '*'), 1.25, 9)
+    assert model.fitted_at is None
+
+    _observe_corridor(model, ('PL-DE', '*'), 1.25, 1, start=9)
+    deadline = time.monotonic() + 5
+    while model.fitted_at is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert model.estimate(('PL-DE', '*'), 100.0)['factor'] == 1.25
+
+
+def test_save_merges_with_other_worker_and_load_refits(tmp_path):
+    state_file = str(tmp_path / 'road_factor.json')
+    first = RoadFactorModel(min_samples=5, refit_every=10 ** 6, state_file=state_file)
+    second = RoadFactorModel(min_samples=5, refit_every=10 ** 6, state_file=state_file)
+    _observe_corridor(first, ('PL-DE', '*'), 1.25, 6)
+    _observe_corridor(second, ('PL-CZ', '*'), 1.35, 6)
+    first.save()
+    second.save()
+
+    restored = RoadFactorModel(min_samples=5, state_file=state_file)
+    assert restored.stats()['samples'] == 12
+    assert restored.estimate(('PL-DE', '*'), 100.0)['factor'] == 1.25
+    assert restored.estimate(('PL-CZ', '*'), 100.0)['factor'] == pytest.approx(1.35)
+
+
+def test_max_samples_drops_oldest():
+    model = RoadFactorModel(min_samples=5, max_samples=10, refit_every=10 ** 6)
+    _observe_corridor(model, ('PL-DE', '*'), 1.2, 10)
+    _observe_corridor(model, ('PL-DE', '*'), 1.5, 10, start=10)
+    model.fit()
+    assert model.stats()['samples'] == 10
+    assert model.estimate(('PL-DE',), 100.0)['factor'] == 1.5
@@ -0,0 +1,84 @@
+"""Testy geometrii trasy (route_geometry.py): upraszczanie i kodowanie polyline"""
+
+import math
+import random
+
+import pytest
+
+from route_geometry import decode_polyline, encode_polyline, simplify_path
+
+# Przykład ze specyfikacji Encoded Polyline Algorithm (Google)
+GOOGLE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+GOOGLE_ENCODED = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+def test_encode_matches_reference():
+    assert encode_polyline(GOOGLE_POINTS) == GOOGLE_ENCODED
+    assert decode_polyline(GOOGLE_ENCODED) == GOOGLE_POINTS
+
+
+@pytest.mark.parametrize('precision', [5, 6])
+def test_round_trip_within_precision(precision):
+    rng = random.Random(precision)
+    points = [(rng.uniform(35, 70), rng.uniform(-10, 40)) for _ in range(500)]
+
+    decoded = decode_polyline(encode_polyline(points, precision), precision)
+
+    assert len(decoded) == len(points)
+    tolerance = 0.5 / 10 ** precision + 1e-12
+    for (lat, lng), (decoded_lat, decoded_lng) in zip(points, decoded):
+        assert abs(lat - decoded_lat) <= tolerance
+        assert abs(lng - decoded_lng) <= tolerance
+
+
+def test_empty_polyline():
+    assert encode_polyline([]) == ''
+    assert decode_polyline('') == []
+
+
+def _offset_m(point, a, b):
+    """Odległość punktu od odcinka a-b w metrach (lokalne rzutowanie jak w simplify_path)"""
+    lat0 = math.radians((a[0] + b[0]) / 2)
+
+    def xy(p):
+        return math.radians(p[1]) * math.cos(lat0) * 6371000.0, math.radians(p[0]) * 6371000.0
+
+    (px, py), (ax, ay), (bx, by) = xy(point), xy(a), xy(b)
+    dx, dy = bx - ax, by - ay
+    t = 0.0 if dx == dy == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def test_simplify_keeps_deviation_within_tolerance():
+    rng = random.Random(3)
+    # Kręta trasa Warszawa -> Berlin z szumem kilkudziesięciu metrów
+    points = [(52.23 + 0.3 * math.sin(i / 80) + rng.gauss(0, 0.0003), 21.01 - 7.6 * i / 2000)
+              for i in range(2001)]
+
+    simplified = simplify_path(points, tolerance_m=100)
+
+    assert simplified[0] == points[0] and simplified[-1] == points[-1]
+    assert len(simplified) < len(points) / 10
+    segment = 0
+    for point in points:
+        # Punkt oryginału leży w zasięgu tolerancji od odcinka uproszczonej linii, który go obejmuje
+        # (długość geograficzna maleje wzdłuż trasy)
+        while segment < len(simplified) - 2 and point[1] < simplified[segment + 1][1]:
+            segment += 1
+        assert _offset_m(point, simplified[segment], simplified[segment + 1]) <= 100 + 1e-6
+
+
+def test_simplify_removes_duplicates_and_keeps_short_lines():
+    assert simplify_path([(52.0, 21.0), (52.0, 21.0), (52.1, 21.1)], tolerance_m=50) == [(52.0, 21.0), (52.1, 21.1)]
+    assert simplify_path([(52.0, 21.0)], tolerance_m=50) == [(52.0, 21.0)]
+    assert simplify_path([], tolerance_m=50) == []
+
+
+def test_simplify_zero_tolerance_keeps_all_distinct_points():
+    points = [(52.0, 21.0), (52.0001, 21.0001), (52.0002, 21.0002)]
+    assert simplify_path(points, tolerance_m=0) == points
+
+
+def test_simplify_drops_collinear_and_keeps_corner():
+    line = [(52.0, 21.0 + i * 0.01) for i in range(11)] + [(52.0 + i * 0.01, 21.1) for i in range(1, 11)]
+    assert simplify_path(line, tolerance_m=10) == [(52.0, 21.0), (52.0, 21.1), (52.1, 21.1)]